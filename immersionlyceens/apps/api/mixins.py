@@ -1,4 +1,5 @@
-from .utils import get_or_create_user
+from .utils import get_or_create_user, preload_speakers
+
 class ManyMixin:
     """
     Get 'single' or 'many' serializer depending on incoming data
@@ -28,8 +29,10 @@ class SpeakersManyMixin:
             many = isinstance(data, list)
 
             if many:
+                preloaded = preload_speakers(data)
+
                 for single_data in data:
-                    single_data = get_or_create_user(self.request, single_data)
+                    single_data = get_or_create_user(self.request, single_data, preloaded=preloaded)
             else:
                 data = get_or_create_user(self.request, data)
 
@@ -13,12 +13,13 @@ from unittest.mock import patch
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group, Permission
 from django.core.serializers.json import DjangoJSONEncoder
-from django.core import mail
+from django.core import mail, management
+from django.core.files.storage import default_storage
 from django.template.defaultfilters import date as _date
-from django.test import Client, RequestFactory, TestCase
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.formats import date_format
+from django.utils.formats import date_format, get_format
 from django.utils.translation import gettext_lazy as _, pgettext
 from rest_framework import serializers, status
 from rest_framework.authtoken.models import Token
@@ -26,12 +27,13 @@ from django.conf import settings
 
 from immersionlyceens.apps.core.models import (
     AccompanyingDocument, AttestationDocument, BachelorMention, BachelorType,
-    Building, Campus, CancelType, Course, CourseType, Establishment,
+    Building, Campus, CancelType, ChangeLog, Course, CourseType, Establishment,
     GeneralBachelorTeaching, GeneralSettings, HigherEducationInstitution,
     HighSchool, HighSchoolLevel, Immersion, ImmersionUser, MailTemplate,
     MailTemplateVars, OffOfferEvent, OffOfferEventType, Period,
     PostBachelorLevel, Profile, RefStructuresNotificationsSettings,
-    Slot, Structure, StudentLevel, Training,
+    ScheduledTask, ScheduledTaskLog,
+    Slot, Structure, StudentLevel, Training, TrainingQuotaLedger,
     TrainingDomain, TrainingSubdomain, UserCourseAlert, Vacation,
 )
 from immersionlyceens.apps.immersion.models import (
@@ -39,7 +41,9 @@ from immersionlyceens.apps.immersion.models import (
     HighSchoolStudentRecordQuota, StudentRecord, VisitorRecord,
     VisitorRecordDocument, VisitorRecordQuota,
 )
-from immersionlyceens.libs.utils import get_general_setting
+from immersionlyceens.apps.api.utils import MAILING_LISTS_PATH
+from immersionlyceens.exceptions import QueryBudgetExceeded
+from immersionlyceens.libs.utils import count_queries, get_general_setting
 from immersionlyceens.libs.api.accounts.rest import AccountAPI
 
 from .mocks import mocked_ldap_connection, mocked_search_user, mocked_ldap_bind
@@ -917,6 +921,70 @@ class APITestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertFalse(Slot.objects.filter(date=new_date, course=self.course.pk).exists())
 
+    def test_course_slots_bulk_creation(self):
+        """
+        Multiple course slots creation in a single request
+        """
+        self.api_user.user_permissions.add(Permission.objects.get(codename='add_slot'))
+        url = reverse("slot_list")
+        speaker = self.course.speakers.first()
+        slots_count = Slot.objects.count()
+
+        data = [{
+            "course": self.course.id,
+            "n_places": 30,
+            "course_type": self.course_type.id,
+            "building": self.building.pk,
+            "campus": self.campus.pk,
+            "date": (self.today + timedelta(days=10)).strftime("%Y-%m-%d"),
+            "period": self.period.pk,
+            "start_time": f"{hour:02d}:00",
+            "end_time": f"{hour + 1:02d}:00",
+            "place": Slot.FACE_TO_FACE,
+            "room": "salle 113",
+            "allowed_highschool_levels": [1],
+            "registration_limit_delay": 24,
+            "cancellation_limit_delay": 48,
+            "speakers": [speaker.pk],
+        } for hour in range(8, 12)]
+
+        # One invalid row : nothing is created, errors are reported per row
+        data[2]["speakers"] = [self.operator_user.pk]
+        response = self.api_client_token.post(url, json.dumps(data), content_type="application/json")
+        result = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(len(result['error']), 4)
+        self.assertEqual(result['error'][0], {})
+        self.assertEqual(
+            [f"Speaker '{self.operator_user}' is not linked to course '{self.course}'"],
+            result['error'][2]['speakers']
+        )
+        self.assertEqual(Slot.objects.count(), slots_count)
+
+        # Success
+        data[2]["speakers"] = [speaker.pk]
+        response = self.api_client_token.post(url, json.dumps(data), content_type="application/json")
+        result = json.loads(response.content.decode('utf-8'))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(result), 4)
+        self.assertEqual(Slot.objects.count(), slots_count + 4)
+
+        for slot_data in result:
+            slot = Slot.objects.get(pk=slot_data["id"])
+            self.assertEqual(slot_data["speakers"], [speaker.pk])
+            self.assertEqual(list(slot.speakers.all()), [speaker])
+            self.assertEqual(list(slot.allowed_highschool_levels.values_list('id', flat=True)), [1])
+            self.assertTrue(slot.levels_restrictions)
+            self.assertTrue(slot.restrictions["levels_restrictions"])
+            self.assertEqual(slot.restrictions["allowed_highschool_levels"], [1])
+            # Limit dates are computed as in Slot.save()
+            self.assertEqual(
+                slot.registration_limit_date,
+                timezone.make_aware(datetime.combine(slot.date, slot.start_time)) - timedelta(hours=24)
+            )
+
     def test_slot_detail(self):
         """
         Test get slot
@@ -1028,6 +1096,49 @@ class APITestCase(TestCase):
         hs_record = content['data'][0]
         self.assertEqual(hs_record['id'], self.hs_record.id)
 
+        # DataTables server-side processing
+        columns = ['highschool', 'with_convention', 'name', 'birth_date', 'rejected_date']
+        data = {
+            'action': 'REJECTED',
+            'draw': 1,
+            'start': 0,
+            'length': 10,
+            'search[value]': '',
+            'order[0][column]': 2,
+            'order[0][dir]': 'asc',
+        }
+        for index, name in enumerate(columns):
+            data.update({
+                f'columns[{index}][data]': name,
+                f'columns[{index}][name]': name,
+                f'columns[{index}][searchable]': 'true',
+                f'columns[{index}][orderable]': 'true',
+                f'columns[{index}][search][value]': '',
+                f'columns[{index}][search][regex]': 'false',
+            })
+
+        response = self.client.post(url, data, **self.header)
+        content = json.loads(response.content.decode())
+
+        self.assertEqual(content['draw'], 1)
+        self.assertEqual(content['recordsTotal'], 1)
+        self.assertEqual(content['data'][0]['id'], self.hs_record.id)
+        self.assertEqual(len(content['data'][0]['attestations']), 2)
+        self.assertIn(self.high_school.label, [v['value'] for v in content['yadcf_data_0']])
+
+        # Birth date typed in the localized format
+        input_format = [f for f in get_format('DATE_INPUT_FORMATS') if "/" in f][0]
+        data['columns[3][search][value]'] = self.hs_record.birth_date.strftime(input_format)
+        response = self.client.post(url, data, **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content['recordsFiltered'], 1)
+
+        data['columns[3][search][value]'] = "01/01/1900"
+        response = self.client.post(url, data, **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content['recordsFiltered'], 0)
+        self.assertEqual(content['data'], [])
+
     def test_API_ajax_get_reject_student(self):
         self.client.login(username='ref_etab', password='pass')
         url = "/api/reject_student/"
@@ -1128,6 +1239,38 @@ class APITestCase(TestCase):
         self.assertEqual(self.hs_record.validation, 2)  # validated
         self.assertEqual(self.hs_record.attestation.count(), 1)
 
+    def test_API_query_budget(self):
+        self.client.login(username='ref_master_etab', password='pass')
+        url = '/api/get_csv_structures/?type=course'
+
+        # Decorated view : within its budget
+        response = self.client.get(url, request)
+        self.assertEqual(response.status_code, 200)
+
+        # The setting overrides the decorator budget
+        with override_settings(QUERY_BUDGETS={'get_csv_structures': 1}):
+            with self.assertRaisesRegex(QueryBudgetExceeded, r"^get_csv_structures : [0-9]+ queries \(budget 1\)"):
+                self.client.get(url, request)
+
+            # Error responses are not checked
+            response = self.client.get('/api/get_csv_structures/', request)
+            self.assertEqual(response.status_code, 404)
+
+        # Test helper
+        with count_queries() as counter:
+            list(Slot.objects.all())
+            list(Slot.objects.all())
+
+        self.assertEqual(counter.queries, 2)
+        self.assertEqual(len(counter.duplicates), 1)
+        self.assertEqual(counter.duplicates[0][1], 2)
+        self.assertGreater(counter.duration, 0)
+
+        with self.assertRaises(QueryBudgetExceeded):
+            with count_queries("slots", budget=1):
+                list(Slot.objects.all())
+                list(Slot.objects.all())
+
     def test_API_get_csv_anonymous(self):
         # ref master etab
         self.client.login(username='ref_master_etab', password='pass')
@@ -2184,6 +2327,42 @@ class APITestCase(TestCase):
             'general_bachelor_teachings_ids': [None],
         })
 
+        # DataTables server-side processing : one page
+        columns = ['last_name', 'first_name', 'profile', 'institution']
+        params = {
+            'draw': 2,
+            'start': 1,
+            'length': 1,
+            'search[value]': '',
+            'order[0][column]': 0,
+            'order[0][dir]': 'asc',
+        }
+        for index, name in enumerate(columns):
+            params.update({
+                f'columns[{index}][data]': name,
+                f'columns[{index}][name]': name,
+                f'columns[{index}][searchable]': 'true',
+                f'columns[{index}][orderable]': 'true',
+                f'columns[{index}][search][value]': '',
+                f'columns[{index}][search][regex]': 'false',
+            })
+
+        response = self.client.get(url, params, **self.header)
+        content = json.loads(response.content.decode())
+
+        self.assertEqual(content['recordsTotal'], 2)
+        self.assertEqual([s['id'] for s in content['data']], [stu['id']])
+        self.assertIn('allowed_establishments', content['slot'])
+
+        # Column search on the institution
+        params['start'] = 0
+        params['columns[3][search][value]'] = self.hs_record2.highschool.label
+        response = self.client.get(url, params, **self.header)
+        content = json.loads(response.content.decode())
+
+        self.assertEqual(content['recordsFiltered'], 1)
+        self.assertEqual(content['data'][0]['id'], hs['id'])
+
         # Unknown slot
         url = f"/api/get_available_students/99999"
 
@@ -2256,6 +2435,55 @@ class APITestCase(TestCase):
                 break
         self.assertTrue(one)
 
+        # DataTables server-side processing : one page, ordered and filtered
+        columns = ['user_type', 'last_name', 'level', 'registered']
+        params = {
+            'draw': 3,
+            'start': 0,
+            'length': 2,
+            'search[value]': '',
+            'order[0][column]': 1,
+            'order[0][dir]': 'desc',
+        }
+        for index, name in enumerate(columns):
+            params.update({
+                f'columns[{index}][data]': name,
+                f'columns[{index}][name]': name,
+                f'columns[{index}][searchable]': 'true',
+                f'columns[{index}][orderable]': 'true',
+                f'columns[{index}][search][value]': '',
+                f'columns[{index}][search][regex]': 'false',
+            })
+
+        response = client.get(url, params, **self.header)
+        content = json.loads(response.content.decode())
+        last_names = sorted([h['last_name'] for h in content['data']], reverse=True)
+
+        self.assertEqual(content['draw'], 3)
+        self.assertEqual(content['recordsTotal'], 5)
+        self.assertEqual(content['recordsFiltered'], 5)
+        self.assertEqual(len(content['data']), 2)
+        self.assertEqual([h['last_name'] for h in content['data']], last_names)
+        self.assertIn(level.label, content['yadcf_data_2'])
+        self.assertEqual([v['value'] for v in content['yadcf_data_3']], ['1', '0'])
+
+        # yadcf exact filter
+        params['columns[2][search][value]'] = f'^{level.label}$'
+        params['columns[2][search][regex]'] = 'true'
+        response = client.get(url, params, **self.header)
+        content = json.loads(response.content.decode())
+
+        self.assertEqual(content['recordsFiltered'], 1)
+        self.assertEqual(content['data'][0]['id'], self.hs_record.student.id)
+
+        # Global search
+        params['columns[2][search][value]'] = ''
+        params['search[value]'] = self.hs_record.student.last_name.upper()
+        response = client.get(url, params, **self.header)
+        content = json.loads(response.content.decode())
+        self.assertGreaterEqual(content['recordsFiltered'], 1)
+        self.assertIn(self.hs_record.student.id, [h['id'] for h in content['data']])
+
         # Fail : as a high school manager with no high school
         """
         FIXME : this test will fail because the user will be redirected to the charter sign form
@@ -2270,6 +2498,113 @@ class APITestCase(TestCase):
         self.assertEqual(content['data'], [])
         """
 
+    def test_API_ajax_get_slot_restrictions(self):
+        self.client.login(username='ref_etab', password='pass')
+        other_level = HighSchoolLevel.objects.create(label="another level label")
+        self.highschool_level_restricted_slot.allowed_highschool_levels.add(other_level)
+
+        url = reverse("get_slot_restrictions", kwargs={"slot_id": self.highschool_level_restricted_slot.id})
+        response = self.client.get(url, **self.header)
+        content = json.loads(response.content.decode())
+
+        restrictions = content['data']['restrictions'][0]
+        self.assertTrue(restrictions['levels_restrictions'])
+        self.assertEqual(restrictions['allowed_highschool_levels_list'], ["another level label", "level label"])
+        self.assertEqual(restrictions['allowed_highschools_list'], [])
+        self.assertEqual(restrictions['allowed_student_levels_list'], [])
+
+        # Unknown slot
+        url = reverse("get_slot_restrictions", kwargs={"slot_id": 0})
+        response = self.client.get(url, **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content['msg'], "Error : missing slot id")
+
+    def test_API_ajax_can_register_slots(self):
+        url = reverse("can_register_slots")
+        self.client.login(username='hs', password='pass')
+        slot_ids = [
+            self.slot.id, self.slot2.id, self.full_slot.id, self.unpublished_slot.id,
+            self.highschool_level_restricted_slot.id, 0
+        ]
+
+        # Invalid record : no slot can be registered
+        response = self.client.post(url, {'slots[]': slot_ids}, **self.header)
+        content = json.loads(response.content.decode())
+
+        self.assertEqual(content['msg'], '')
+        self.assertEqual(len(content['data']), len(slot_ids))
+        self.assertFalse(any(status['can_register'] for status in content['data'].values()))
+        self.assertIn(
+            "Cannot register slot due to Highschool student record state",
+            content['data'][str(self.slot2.id)]['reasons']
+        )
+
+        self.hs_record.validation = 2
+        self.hs_record.save()
+        quota = self.hs_record.quota.get(period=self.period)
+        quota.allowed_immersions = 10
+        quota.save()
+
+        response = self.client.post(url, {'slots[]': slot_ids}, **self.header)
+        content = json.loads(response.content.decode())
+        data = content['data']
+
+        self.assertEqual(data[str(self.slot2.id)], {'can_register': True, 'already_registered': False, 'reasons': []})
+        self.assertTrue(data[str(self.slot.id)]['already_registered'])
+        self.assertFalse(data[str(self.slot.id)]['can_register'])
+        self.assertEqual(data[str(self.full_slot.id)]['reasons'], ["No seat available for selected slot"])
+        self.assertEqual(
+            data[str(self.unpublished_slot.id)]['reasons'], ["Registering an unpublished slot is forbidden"]
+        )
+        self.assertEqual(
+            data[str(self.highschool_level_restricted_slot.id)]['reasons'],
+            ["High school or post bachelor levels restrictions in effect"]
+        )
+        self.assertEqual(data['0']['reasons'], ["Error : slot not found"])
+
+        # Single slot version, same checks but quotas
+        response = self.client.get(reverse("can_register_slot", args=[self.slot2.id]), **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content, {'msg': '', 'data': [{'can_register': True, 'already_registered': False}]})
+
+        response = self.client.get(reverse("can_register_slot", args=[self.full_slot.id]), **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content, {'msg': "No seat available for selected slot", 'data': []})
+
+        response = self.client.get(reverse("can_register_slot", args=[self.slot.id]), **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content, {'msg': data[str(self.slot.id)]['reasons'][0], 'data': []})
+
+        # Passed registration date : a single reason
+        registration_limit_date = self.slot2.registration_limit_date
+        Slot.objects.filter(pk=self.slot2.pk).update(registration_limit_date=timezone.now() - timedelta(hours=1))
+
+        response = self.client.post(url, {'slots[]': [self.slot2.id]}, **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content['data'][str(self.slot2.id)]['reasons'], ["You can't register to this slot anymore"])
+
+        response = self.client.get(reverse("can_register_slot", args=[self.slot2.id]), **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content['msg'], "You can't register to this slot anymore")
+
+        Slot.objects.filter(pk=self.slot2.pk).update(registration_limit_date=registration_limit_date)
+
+        # Period quota
+        quota.allowed_immersions = 0
+        quota.save()
+        response = self.client.post(url, {'slots[]': [self.slot2.id]}, **self.header)
+        content = json.loads(response.content.decode())
+        self.assertFalse(content['data'][str(self.slot2.id)]['can_register'])
+
+        # Missing or invalid parameter
+        response = self.client.post(url, {}, **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content['msg'], "Error : missing slot id")
+
+        response = self.client.post(url, {'slots[]': ['abc']}, **self.header)
+        content = json.loads(response.content.decode())
+        self.assertEqual(content['msg'], "Invalid parameter")
+
     def test_API_validate_slot_date(self):
         request.user = self.ref_etab_user
         self.client.login(username='ref_etab', password='pass')
@@ -2640,7 +2975,9 @@ class APITestCase(TestCase):
             'reason_id': self.cancel_type.id,
             'slot_id': self.immersion.slot_id
         }
-        content = json.loads(self.client.post(url, data, **self.header).content.decode())
+        # Notifications are sent on commit
+        with self.captureOnCommitCallbacks(execute=True):
+            content = json.loads(self.client.post(url, data, **self.header).content.decode())
 
         # The following test may fail if template syntax has errors
         self.assertIn("1 immersion(s) cancelled", content['msg'])
@@ -2649,6 +2986,18 @@ class APITestCase(TestCase):
         # 3 mails sent : student, structure manager (with notification) and speaker
         self.assertEqual(len(mail.outbox), 3)
 
+        self.immersion.refresh_from_db()
+        self.assertEqual(self.immersion.cancellation_type, self.cancel_type)
+        self.assertIsNotNone(self.immersion.cancellation_date)
+
+        # Already cancelled and unknown immersions : nothing to cancel, no new mail
+        data['immersion_ids'] = json.dumps([self.immersion.id, 0])
+        content = json.loads(self.client.post(url, data, **self.header).content.decode())
+        self.assertIn("Immersion 0 not found", content['msg'])
+        self.assertIn(f"Immersion {self.immersion.id} already cancelled", content['msg'])
+        self.assertNotIn("immersion(s) cancelled", content['msg'])
+        self.assertEqual(len(mail.outbox), 3)
+
     def test_API_ajax_send_email_us(self):
         request.user = self.ref_etab_user
         self.client.login(username='ref_etab', password='pass')
@@ -3137,6 +3486,29 @@ class APITestCase(TestCase):
             }
         )
 
+        # Re-registration of a cancelled immersion : same object, logged in the change feed
+        cancelled = Immersion.objects.get(student=self.highschool_user, slot=self.slot3)
+        cancelled.cancellation_type = CancelType.objects.first()
+        cancelled.save()
+        last_change_id = ChangeLog.objects.order_by('id').values_list('id', flat=True).last()
+
+        response = client.post("/api/register", {'slot_id': self.slot3.id}, **self.header, follow=True)
+        content = json.loads(response.content.decode('utf-8'))
+        self.assertFalse(content['error'])
+
+        cancelled.refresh_from_db()
+        self.assertIsNone(cancelled.cancellation_type)
+        self.assertTrue(ChangeLog.objects.filter(
+            id__gt=last_change_id,
+            object_type='core.immersion',
+            object_id=cancelled.id,
+            action=ChangeLog.UPDATED,
+        ).exists())
+        self.assertEqual(
+            TrainingQuotaLedger.get_registrations(self.highschool_user.pk, self.period.pk, self.training.pk),
+            2
+        )
+
         # Todo : needs more tests with other users (ref-etab, ref-str, ...)
 
     def test_ajax_get_duplicates(self):
@@ -4139,6 +4511,50 @@ class APITestCase(TestCase):
         self.assertIn(self.highschool_user.email, str_list)
         self.assertIn(self.student.email, str_list)
 
+        # Conditional request : nothing changed
+        etag = response["ETag"]
+        response = self.client_token.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # New registration : new version
+        Immersion.objects.create(student=self.visitor, slot=self.slot)
+        response = self.client_token.get(url, HTTP_IF_NONE_MATCH=etag)
+        content = json.loads(response.content.decode("utf-8"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertIn(self.visitor.email, content["data"][self.structure.mailing_list])
+
+    def test_API_mailing_list_subscribers_files(self):
+        url = "/api/mailing_list/structures"
+        global_mail = get_general_setting("GLOBAL_MAILING_LIST")
+
+        ret = management.call_command("generate_mailing_list_subscribers_files", verbosity=0)
+        self.assertRegex(ret, r"^Generate mailing list subscribers files : \d+ updated file\(s\)$")
+
+        with default_storage.open(f"{MAILING_LISTS_PATH}/{self.structure.mailing_list}.txt", "r") as fd:
+            self.assertEqual(
+                fd.read().split("\n"),
+                sorted([self.highschool_user.email, self.student.email])
+            )
+
+        self.assertTrue(default_storage.exists(f"{MAILING_LISTS_PATH}/{global_mail}.txt"))
+
+        # Nothing changed : no file rewritten
+        ret = management.call_command("generate_mailing_list_subscribers_files", verbosity=0)
+        self.assertEqual(ret, "Generate mailing list subscribers files : 0 updated file(s)")
+
+        # Precomputed content is the same as the live one
+        live = json.loads(self.client_token.get(url).content.decode("utf-8"))
+        response = self.client_token.get(url, {"precomputed": 1})
+        self.assertEqual(json.loads(response.content.decode("utf-8")), live)
+
+        response = self.client_token.get(url, {"precomputed": 1}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        for filename in default_storage.listdir(MAILING_LISTS_PATH)[1]:
+            default_storage.delete(f"{MAILING_LISTS_PATH}/{filename}")
+
     def test_API_mailing_list_establishments(self):
         url = "/api/mailing_list/establishments"
 
@@ -4189,6 +4605,163 @@ class APITestCase(TestCase):
         self.assertEqual(len(str_list), 1)
         self.assertIn(self.highschool_user.email, str_list)
 
+    # Ignore the ids gaps left by the previous tests rollbacks
+    @override_settings(CHANGE_FEED_SAFETY_LAG=0)
+    def test_API_change_feed(self):
+        url = reverse("change_feed")
+
+        # No permission
+        response = self.api_client_token.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.api_user.user_permissions.add(
+            *Permission.objects.filter(
+                codename__in=['view_changelog', 'view_slot', 'view_course', 'view_immersion']
+            )
+        )
+
+        # Everything created in setUp
+        response = self.api_client_token.get(url)
+        content = json.loads(response.content.decode("utf-8"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(content["more"])
+        self.assertIn(
+            {"type": "core.slot", "id": self.slot.id, "action": "created"},
+            [{k: change[k] for k in ("type", "id", "action")} for change in content["data"]]
+        )
+
+        # Object types without the view permission are skipped
+        self.assertNotIn("immersion.highschoolstudentrecord", [change["type"] for change in content["data"]])
+
+        # Records : only the published fields
+        cursor = content["cursor"]
+        self.api_user.user_permissions.add(Permission.objects.get(codename='view_highschoolstudentrecord'))
+        self.hs_record.save()
+
+        response = self.api_client_token.get(url, {"cursor": cursor})
+        content = json.loads(response.content.decode("utf-8"))
+        record_change = content["data"][0]
+
+        self.assertEqual(record_change["type"], "immersion.highschoolstudentrecord")
+        self.assertEqual(record_change["object"]["student_id"], self.hs_record.student_id)
+        self.assertNotIn("birth_date", record_change["object"])
+        self.assertNotIn("phone", record_change["object"])
+
+        # Changes since the last call
+        cursor = content["cursor"]
+        self.slot.room = "New room"
+        self.slot.save()
+        self.slot.speakers.add(self.speaker1)
+
+        immersion = Immersion.objects.create(student=self.visitor, slot=self.slot)
+        immersion_id = immersion.id
+        immersion.delete()
+
+        response = self.api_client_token.get(url, {"cursor": cursor})
+        content = json.loads(response.content.decode("utf-8"))
+
+        self.assertEqual(len(content["data"]), 2)
+        slot_change, immersion_change = content["data"]
+
+        self.assertEqual(slot_change["type"], "core.slot")
+        self.assertEqual(slot_change["action"], "updated")
+        self.assertEqual(slot_change["object"]["room"], "New room")
+
+        self.assertEqual(immersion_change["type"], "core.immersion")
+        self.assertEqual(immersion_change["id"], immersion_id)
+        self.assertEqual(immersion_change["action"], "deleted")
+        self.assertIsNone(immersion_change["object"])
+
+        # Nothing new
+        cursor = content["cursor"]
+        response = self.api_client_token.get(url, {"cursor": cursor})
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(content["data"], [])
+        self.assertEqual(content["cursor"], cursor)
+
+        # Reverse many to many relation cleared
+        slots_ids = list(self.speaker1.slots.order_by('id').values_list('id', flat=True))
+        self.assertIn(self.slot.id, slots_ids)
+        self.speaker1.slots.clear()
+
+        response = self.api_client_token.get(url, {"cursor": cursor})
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertEqual(
+            sorted((change["type"], change["id"], change["action"]) for change in content["data"]),
+            [("core.slot", slot_id, "updated") for slot_id in slots_ids]
+        )
+
+        # Recent ids gap : the missing change may not be committed yet
+        cursor = content["cursor"]
+        uncommitted = ChangeLog.objects.create(object_type="core.slot", object_id=self.slot.id, action=ChangeLog.UPDATED)
+        ChangeLog.objects.create(object_type="core.course", object_id=self.course.id, action=ChangeLog.UPDATED)
+        uncommitted.delete()
+
+        with self.settings(CHANGE_FEED_SAFETY_LAG=300):
+            response = self.api_client_token.get(url, {"cursor": cursor})
+            content = json.loads(response.content.decode("utf-8"))
+            self.assertEqual(content["data"], [])
+            self.assertEqual(content["cursor"], cursor)
+            self.assertTrue(content["more"])
+
+            # Older gap : rolled back transaction
+            ChangeLog.objects.filter(id__gt=cursor).update(date=timezone.now() - timedelta(seconds=301))
+            response = self.api_client_token.get(url, {"cursor": cursor})
+            content = json.loads(response.content.decode("utf-8"))
+            self.assertEqual([change["type"] for change in content["data"]], ["core.course"])
+            self.assertFalse(content["more"])
+
+        # Paging
+        response = self.api_client_token.get(url, {"limit": 1})
+        content = json.loads(response.content.decode("utf-8"))
+        self.assertTrue(content["more"])
+
+        # Bad parameters
+        response = self.api_client_token.get(url, {"cursor": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.api_client_token.get(url, {"limit": 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_API_scheduled_tasks_metrics(self):
+        url = reverse("scheduled_tasks_metrics")
+        task = ScheduledTask.objects.create(
+            command_name='crontest', description='whatever', active=True, time=time(14, 0)
+        )
+
+        for duration, exit_status in [(1, ScheduledTaskLog.EXIT_SUCCESS), (3, ScheduledTaskLog.EXIT_ERROR)]:
+            ScheduledTaskLog.objects.create(
+                task=task, duration=duration, exit_status=exit_status, queries=10 * duration, rows=0, mails_sent=0
+            )
+
+        # Still running : ignored
+        ScheduledTaskLog.objects.create(task=task, success=None)
+
+        # No permission
+        response = self.api_client_token.get(url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        self.api_user.user_permissions.add(Permission.objects.get(codename='view_scheduledtasklog'))
+
+        response = self.api_client_token.get(url)
+        content = json.loads(response.content.decode("utf-8"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(content["data"]), 1)
+
+        metrics = content["data"][0]
+        self.assertEqual(metrics["command"], "crontest")
+        self.assertEqual(metrics["runs"], 2)
+        self.assertEqual(metrics["errors"], 1)
+        self.assertEqual(metrics["duration_p50"], 2)
+        self.assertEqual(metrics["duration_max"], 3)
+        self.assertEqual(metrics["queries_p95"], 29)
+
+        # Bad parameter
+        response = self.api_client_token.get(url, {"days": "all"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_structure_list(self):
         view_permission = Permission.objects.get(codename='view_structure')
         add_permission = Permission.objects.get(codename='add_structure')
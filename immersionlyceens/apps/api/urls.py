@@ -116,6 +116,12 @@ urlpatterns = [
     path("mailing_list/establishments", views.MailingListEstablishmentsView.as_view(), name="mailing_list_global"),
     path("mailing_list/high_schools", views.MailingListHighSchoolsView.as_view(), name="mailing_list_global"),
 
+    # Change feed
+    path("changes", views.ChangeFeedView.as_view(), name="change_feed"),
+
+    # Scheduled tasks metrics
+    path("scheduled_tasks/metrics", views.ScheduledTasksMetricsView.as_view(), name="scheduled_tasks_metrics"),
+
     # Mail template
     path("mail_template/<int:pk>/preview", views.MailTemplatePreviewAPI.as_view(), name="mail_template_preview"),
 
@@ -127,6 +133,7 @@ urlpatterns = [
 
     # Check if logged user can register a slot
     path('can_register_slot/<int:slot_id>', views.ajax_can_register_slot, name='can_register_slot'),
+    path('can_register_slots', views.ajax_can_register_slots, name='can_register_slots'),
 
     # Slots list for search slots page
     path('search_slots_list', views.ajax_search_slots_list, name='search_slots_list'),
@@ -1,16 +1,51 @@
+import hashlib
+import json
 import logging
 
 from typing import Any, Dict, List, Optional, Tuple, Union
 from rest_framework import generics, serializers, status
 from django.utils.translation import gettext, gettext_lazy as _
 from django.contrib.auth.models import Group
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Exists, F, Func, Max, OuterRef, Q, QuerySet, Subquery
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
 
-from immersionlyceens.apps.core.models import Structure, ImmersionUser
+from immersionlyceens.apps.core.models import (
+    ChangeLog, Establishment, GeneralSettings, HighSchool, Immersion, ImmersionGroupRecord,
+    ImmersionUser, Slot, Structure,
+)
 from immersionlyceens.libs.api.accounts import AccountAPI
 
 logger = logging.getLogger(__name__)
 
-def get_or_create_user(request, data):
+def preload_speakers(data_list):
+    """
+    Load once, for a list of courses data, the objects get_or_create_user needs for each item
+    :param data_list: list of POST data
+    :return: dict to be passed to get_or_create_user as 'preloaded' parameter
+    """
+    structures_ids = {data.get("structure") for data in data_list if data.get("structure")}
+    emails = {
+        email.strip().lower()
+        for data in data_list if data.get("highschool") or data.get("structure")
+        for email in data.get("emails", [])
+    }
+
+    users = {}
+    for user in ImmersionUser.objects.annotate(lower_email=Lower("email")).filter(lower_email__in=emails):
+        users.setdefault(user.lower_email, []).append(user)
+
+    return {
+        "structures": Structure.objects.select_related("establishment").in_bulk(structures_ids),
+        "users": users,
+        "inter_group": Group.objects.filter(name='INTER').first(),
+    }
+
+
+def get_or_create_user(request, data, preloaded=None):
     """
     When creating or updating a course :
     - if a highschool is present, look for existing ImmersionUsers
@@ -23,6 +58,7 @@ def get_or_create_user(request, data):
     look for these accounts in the establishment account provider in order to create new ImmersionUsers
     :param request: request object
     :param data: POST data
+    :param preloaded: optional objects loaded once for multiple calls (see preload_speakers)
     :return: speakers id
     """
     highschool_id = data.get("highschool")
@@ -41,7 +77,10 @@ def get_or_create_user(request, data):
         user_filter = {'highschool__id': highschool_id}
     elif structure_id:
         try:
-            structure = Structure.objects.get(pk=structure_id)
+            if preloaded and int(structure_id) in preloaded["structures"]:
+                structure = preloaded["structures"][int(structure_id)]
+            else:
+                structure = Structure.objects.get(pk=structure_id)
             establishment = structure.establishment
             user_filter = {'establishment__id': establishment.id}
         except Structure.DoesNotExist:
@@ -50,9 +89,16 @@ def get_or_create_user(request, data):
 
     for email in emails:
         try:
-            speaker_user = ImmersionUser.objects.get(email__iexact=email.strip(), **user_filter)
+            if preloaded:
+                speaker_user = next(
+                    user for user in preloaded["users"].get(email.strip().lower(), [])
+                    if (highschool_id and str(user.highschool_id) == str(highschool_id))
+                       or (not highschool_id and user.establishment_id == establishment.id)
+                )
+            else:
+                speaker_user = ImmersionUser.objects.get(email__iexact=email.strip(), **user_filter)
             data.get("speakers", []).append(speaker_user.id)
-        except ImmersionUser.DoesNotExist:
+        except (ImmersionUser.DoesNotExist, StopIteration):
             if not establishment or not establishment.provides_accounts():
                 # High school or establishment without account provider : reject
                 raise serializers.ValidationError(
@@ -86,9 +132,14 @@ def get_or_create_user(request, data):
             )
             send_creation_msg = True
 
+            # Same speaker may be used by next items
+            if preloaded:
+                preloaded["users"].setdefault(email.strip().lower(), []).append(speaker_user)
+
         # Add INTER group to speaker
         try:
-            Group.objects.get(name='INTER').user_set.add(speaker_user)
+            group = preloaded["inter_group"] if preloaded else None
+            (group or Group.objects.get(name='INTER')).user_set.add(speaker_user)
         except Exception as e:
             raise serializers.ValidationError(
                 detail=_("Couldn't add group 'INTER' to user '%(username)s' : %(exception)s")
@@ -107,4 +158,277 @@ def get_or_create_user(request, data):
 
         data.get("speakers", []).append(speaker_user.pk)
 
-    return data
\ No newline at end of file
+    return data
+
+# Precomputed subscribers files storage path (see generate_mailing_list_subscribers_files command) :
+# - <MAILING_LISTS_PATH>/<mailing list address>.txt : one email per line
+# - <MAILING_LISTS_PATH>/<mailing lists name>.json : same content as the mailing list API views
+MAILING_LISTS_PATH = "mailing_lists"
+
+# Mailing lists name => (list owners queryset function, immersion lookups to the owners)
+MAILING_LISTS = {
+    "structures": (
+        lambda: Structure.objects.all(),
+        ["slot__course__structure", "slot__event__structure"],
+    ),
+    "establishments": (
+        lambda: Establishment.objects.all(),
+        ["slot__course__structure__establishment", "slot__event__establishment"],
+    ),
+    "high_schools": (
+        lambda: HighSchool.agreed.all(),
+        ["slot__course__highschool", "slot__event__highschool"],
+    ),
+}
+
+
+def get_mailing_lists(name) -> Dict[str, List[str]]:
+    """
+    Emails of the students registered to the slots of each structure, establishment or high school
+    having a mailing list
+    :param name: see MAILING_LISTS
+    :return: dict {mailing list address: sorted emails}
+    """
+    owners, lookups = MAILING_LISTS[name]
+    mailing_lists = dict(owners().filter(mailing_list__isnull=False).values_list('pk', 'mailing_list'))
+
+    emails = dict(
+        Immersion.objects.filter(cancellation_type__isnull=True)
+        .annotate(owner=Coalesce(*[F(lookup) for lookup in lookups]))
+        .filter(owner__in=mailing_lists.keys())
+        .values('owner')
+        .annotate(emails=ArrayAgg('student__email', distinct=True, ordering='student__email'))
+        .values_list('owner', 'emails')
+    )
+
+    return {mailing_list: emails.get(pk, []) for pk, mailing_list in mailing_lists.items()}
+
+
+def get_mailing_lists_etag(name) -> str:
+    """
+    Mailing lists version : changes with registrations (latest Immersion or Slot change, see ChangeLog)
+    and with the mailing lists addresses
+    Student email updates are not part of it
+    """
+    owners, lookups = MAILING_LISTS[name]
+    mailing_lists = sorted(owners().filter(mailing_list__isnull=False).values_list('pk', 'mailing_list'))
+    last_change = ChangeLog.objects.filter(
+        object_type__in=[Immersion._meta.label_lower, "core.slot"]
+    ).aggregate(last=Max('id'))['last']
+
+    return hashlib.sha256(f"{name}:{last_change}:{mailing_lists}".encode("utf-8")).hexdigest()
+
+
+def get_global_mailing_list(extra_filter=None) -> List[str]:
+    """
+    Emails of the students and the validated high school students and visitors
+    :param extra_filter: additional ImmersionUser filters (ex: registrations period)
+    """
+    return list(
+        ImmersionUser.objects.filter(
+            Q(student_record__isnull=False)
+            | Q(high_school_student_record__validation=2, high_school_student_record__isnull=False)
+            | Q(visitor_record__validation=2, visitor_record__isnull=False)
+        )
+        .filter(**(extra_filter or {}))
+        .order_by('email')
+        .values_list('email', flat=True)
+        .distinct()
+    )
+
+
+def store_mailing_list_file(filename, content: str) -> bool:
+    """
+    Write a subscribers file in the default storage, if its content changed
+    :return: True if the file has been (re)written
+    """
+    path = f"{MAILING_LISTS_PATH}/{filename}"
+    data = content.encode("utf-8")
+
+    if default_storage.exists(path):
+        with default_storage.open(path, "rb") as fd:
+            if hashlib.sha256(fd.read()).digest() == hashlib.sha256(data).digest():
+                return False
+
+        default_storage.delete(path)
+
+    default_storage.save(path, ContentFile(data))
+    return True
+
+
+def read_mailing_lists_file(name) -> Optional[bytes]:
+    """
+    Precomputed content of a mailing lists API view, if any
+    """
+    path = f"{MAILING_LISTS_PATH}/{name}.json"
+
+    if not default_storage.exists(path):
+        return None
+
+    with default_storage.open(path, "rb") as fd:
+        return fd.read()
+
+
+def get_registration_slots(slot_ids) -> QuerySet:
+    """
+    Slots with the counts get_slot_registration_reasons needs (registered students and group persons)
+    """
+    registered_students_query = (
+        Immersion.objects.filter(slot=OuterRef("pk"), cancellation_type__isnull=True)
+        .annotate(total=Func('pk', function='COUNT'))
+        .values('total')
+    )
+
+    group_registrations_query = ImmersionGroupRecord.objects.filter(
+        slot=OuterRef("pk"), cancellation_type__isnull=True
+    )
+
+    group_registered_persons_query = (
+        group_registrations_query
+        .annotate(group_registered_persons=(F('students_count') + F('guides_count')))
+        .annotate(total=Coalesce(Func('group_registered_persons', function='SUM'), 0))
+        .values('total')
+    )
+
+    return (
+        Slot.objects.filter(pk__in=slot_ids)
+        .select_related('period', 'course__training')
+        .annotate(
+            registered_students_count=Coalesce(Subquery(registered_students_query), 0),
+            group_registered_persons=Coalesce(Subquery(group_registered_persons_query), 0),
+            has_group_registrations=Exists(group_registrations_query),
+        )
+    )
+
+
+def get_user_registration_data(user, slot_ids, check_quotas=True) -> Dict[str, Any]:
+    """
+    User data checked against each slot by get_slot_registration_reasons, loaded once for a list of slots
+    :param user: ImmersionUser object
+    :param slot_ids: ids of the slots to check
+    :param check_quotas: load the remaining registrations per period and per training
+    """
+    data = {
+        'now': timezone.localtime(),
+        'today': timezone.localdate(),
+        'is_group_manager': user.is_high_school_manager(),
+        'check_quotas': check_quotas and (user.is_high_school_student() or user.is_student() or user.is_visitor()),
+        'reasons': [],
+        'remaining_registrations': {},
+        'training_quota': {},
+        'training_registrations': {},
+        # Identical restrictions documents are checked once
+        'restrictions_checks': {},
+    }
+
+    # User checks, common to all slots
+    if user.is_high_school_student():
+        record = user.get_high_school_student_record()
+
+        if not user.is_valid():
+            data['reasons'].append(_("Cannot register slot due to Highschool student account state"))
+        elif not record or not record.is_valid():
+            data['reasons'].append(_("Cannot register slot due to Highschool student record state"))
+
+    if user.is_visitor():
+        record = user.get_visitor_record()
+
+        if not user.is_valid():
+            data['reasons'].append(_("Cannot register slot due to visitor account state"))
+        elif not record or not record.is_valid():
+            data['reasons'].append(_("Cannot register slot due to visitor record state"))
+
+    if user.has_obsolete_attestations():
+        data['reasons'].append(_("Cannot register slot due to out of date attestations"))
+
+    # Quotas : remaining registrations per period, registrations per period and training
+    if data['check_quotas']:
+        data['remaining_registrations'] = user.remaining_registrations_count()
+
+        try:
+            data['training_quota'] = GeneralSettings.get_setting("ACTIVATE_TRAINING_QUOTAS") or {}
+        except RuntimeError as e:
+            logger.warning(e)
+
+        if data['training_quota'].get('activate'):
+            data['training_registrations'] = {
+                (period_id, training_id): count
+                for period_id, training_id, count in user.training_quotas.values_list(
+                    'period_id', 'training_id', 'registrations'
+                )
+            }
+
+    data['registered_slots'] = set(
+        user.immersions.filter(slot_id__in=slot_ids, cancellation_type__isnull=True).values_list('slot_id', flat=True)
+    )
+
+    return data
+
+
+def get_slot_registration_reasons(user, slot, user_data) -> Tuple[List[str], bool]:
+    """
+    Reasons why a user can't register to a slot
+    :param user: ImmersionUser object
+    :param slot: Slot object, from get_registration_slots
+    :param user_data: see get_user_registration_data
+    :return: tuple (reasons in checks order, True if the user is already registered to the slot)
+    """
+    now = user_data['now']
+    period = slot.period
+    reasons = []
+
+    if not slot.published:
+        reasons.append(_("Registering an unpublished slot is forbidden"))
+
+    reasons.extend(user_data['reasons'])
+
+    # Registration dates : a single reason
+    if period and now < period.registration_start_date:
+        reasons.append(_("You can't register to this slot yet"))
+    elif period and (user_data['today'] > period.immersion_end_date or slot.registration_limit_date < now):
+        reasons.append(_("You can't register to this slot anymore"))
+    elif slot.registration_limit_date and now > slot.registration_limit_date:
+        reasons.append(_("Cannot register slot due to passed registration date"))
+
+    # High school managers register groups
+    if user_data['is_group_manager']:
+        if slot.group_mode == Slot.ONE_GROUP:
+            available_group_seats = not slot.has_group_registrations
+        else:
+            available_group_seats = slot.group_registered_persons < (slot.n_group_places or 0)
+
+        if not available_group_seats:
+            reasons.append(_("No group seat available for selected slot"))
+    elif not slot.n_places or slot.registered_students_count >= slot.n_places:
+        reasons.append(_("No seat available for selected slot"))
+
+    restrictions_checks = user_data['restrictions_checks']
+    key = json.dumps(slot.restrictions, sort_keys=True)
+
+    if key not in restrictions_checks:
+        restrictions_checks[key] = user.can_register_slot(slot.restrictions)
+
+    can_register_slot, restrictions_reasons = restrictions_checks[key]
+
+    if not can_register_slot:
+        reasons.extend(restrictions_reasons)
+
+    # Period and training quotas, courses slots only
+    if user_data['check_quotas'] and period and slot.course_id:
+        training_quota = user_data['training_quota']
+
+        if user_data['remaining_registrations'].get(period.pk, 0) <= 0:
+            reasons.append(_(
+                """You have no more remaining registration available for this period, """
+                """you should cancel an immersion or contact immersion service"""
+            ))
+        elif training_quota.get('activate'):
+            training = slot.course.training
+            allowed_immersions = training.allowed_immersions or training_quota.get('default_quota', 0)
+            if user_data['training_registrations'].get((period.pk, training.pk), 0) >= allowed_immersions:
+                reasons.append(_(
+                    """You have no more remaining registration available for this training and this period, """
+                    """you should cancel an immersion or contact immersion service"""
+                ))
+
+    return reasons, slot.pk in user_data['registered_slots']
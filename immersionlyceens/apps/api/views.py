@@ -5,16 +5,19 @@ API Views
 import csv
 import datetime
 import importlib
+import hashlib
 import json
 import logging
 import time
 import codecs
 
+from collections import defaultdict
 from functools import reduce
 from itertools import chain, permutations
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 import django_filters.rest_framework
+from django.apps import apps
 from django.conf import settings
 
 from django.contrib import messages
@@ -44,14 +47,15 @@ from django.db.models import (
     Value,
     When,
 )
-from django.db.models.functions import Coalesce, Concat, Greatest, JSONObject
-from django.http import Http404, HttpResponse, JsonResponse
+from django.db.models.functions import Coalesce, Concat, Greatest
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
 from django.template import TemplateSyntaxError
 from django.template.defaultfilters import date as _date
 from django.urls import resolve, reverse
 from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.utils.formats import date_format
+from django.utils.http import parse_etags, quote_etag
 from django.utils.translation import gettext, gettext_lazy as _, pgettext
 from django.views import View
 from faker import Faker
@@ -66,6 +70,7 @@ from immersionlyceens.apps.core.models import (
     Building,
     Campus,
     CancelType,
+    ChangeLog,
     Course,
     CourseType,
     Establishment,
@@ -84,10 +89,12 @@ from immersionlyceens.apps.core.models import (
     Period,
     PublicDocument,
     RefStructuresNotificationsSettings,
+    ScheduledTaskLog,
     Slot,
     Structure,
     Training,
     TrainingDomain,
+    TrainingQuotaLedger,
     TrainingSubdomain,
     UniversityYear,
     UserCourseAlert,
@@ -124,11 +131,13 @@ from immersionlyceens.decorators import (
     groups_required,
     is_ajax_request,
     is_post_request,
+    query_budget,
     timer,
 )
 from immersionlyceens.libs.api.accounts import AccountAPI
+from immersionlyceens.libs.datatables import DataTablesAdapter, date_filter, is_server_side
 from immersionlyceens.libs.mails.mail import Mail
-from immersionlyceens.libs.mails.utils import send_email
+from immersionlyceens.libs.mails.utils import send_email, send_emails
 from immersionlyceens.libs.utils import get_general_setting, render_text
 
 from . import filters
@@ -151,7 +160,11 @@ from .permissions import (
     IsRefLycPermissions,
 )
 
-from .utils import get_or_create_user
+from .utils import (
+    get_global_mailing_list, get_mailing_lists, get_mailing_lists_etag, get_or_create_user,
+    get_registration_slots, get_slot_registration_reasons, get_user_registration_data,
+    read_mailing_lists_file,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -505,6 +518,54 @@ def ajax_get_student_records(request):
         )
     )
 
+    if is_server_side(request):
+        highschools = (
+            records.order_by("highschool__city", "highschool__label")
+            .values_list("highschool__label", "highschool__city")
+            .distinct()
+        )
+
+        adapter = DataTablesAdapter(
+            request,
+            records,
+            columns={
+                'highschool': ['highschool__label', 'highschool__city'],
+                'with_convention': 'highschool__with_convention',
+                'name': ['user_last_name', 'user_first_name'],
+                'birth_date': 'birth_date',
+                'level': 'record_level',
+                'class_name': 'class_name',
+                'creation_date': 'creation_date',
+                'validation_date': 'validation_date',
+                'rejected_date': 'rejected_date',
+                'rejection_reason': 'rejection_reason',
+            },
+            filters={
+                'with_convention': lambda qs, value: qs.filter(highschool__with_convention=value == '1'),
+                'birth_date': date_filter('birth_date'),
+                'creation_date': date_filter('creation_date__date'),
+                'validation_date': date_filter('validation_date__date'),
+                'rejected_date': date_filter('rejected_date__date'),
+            },
+            yadcf_data={
+                'highschool': [
+                    {'value': label, 'label': f"{city or gettext('No city')}: {label}"}
+                    for label, city in highschools if label
+                ],
+                'with_convention': [
+                    {'value': '1', 'label': gettext('Yes')},
+                    {'value': '0', 'label': gettext('No')}
+                ],
+                'level': None,
+                'class_name': None,
+            }
+        )
+
+        response = adapter.get_response(response)
+        records = response['data']
+    else:
+        records = list(records)
+
     # List of the ids of the extracted records
     record_ids = [r['id'] for r in records]
 
@@ -531,7 +592,7 @@ def ajax_get_student_records(request):
     for rec in records:
         rec['attestations'] = attestations_by_record.get(rec['id'], [])
 
-    response['data'] = list(records)
+    response['data'] = records
 
     return JsonResponse(response, safe=False)
 
@@ -1409,31 +1470,7 @@ def ajax_set_group_attendance(request):
     return JsonResponse(response, safe=False)
 
 
-def create_slot_dict(slot):
-    slot_dict = {
-        'establishments_restrictions': slot.establishments_restrictions,
-        'levels_restrictions': slot.levels_restrictions,
-        'bachelors_restrictions': slot.bachelors_restrictions,
-        'allowed_highschools': slot.allowed_highschools,
-        'allowed_highschools_list': list(slot.allowed_highschools.all()),
-        'allowed_highschool_levels': slot.allowed_highschool_levels,
-        'allowed_highschool_levels_list': list(slot.allowed_highschool_levels.all()),
-        'allowed_post_bachelor_levels': slot.allowed_post_bachelor_levels,
-        'allowed_post_bachelor_levels_list': list(slot.allowed_post_bachelor_levels.all()),
-        'allowed_bachelor_types': slot.allowed_bachelor_types,
-        'allowed_bachelor_types_list': list(slot.allowed_bachelor_types.all()),
-        'allowed_bachelor_mentions': slot.allowed_bachelor_mentions,
-        'allowed_bachelor_mentions_list': list(slot.allowed_bachelor_mentions.all()),
-        'allowed_bachelor_teachings': slot.allowed_bachelor_teachings,
-        'allowed_bachelor_teachings_list': set(slot.allowed_bachelor_teachings.all()),
-        'allowed_establishments': slot.allowed_establishments,
-        'allowed_establishments_list': list(slot.allowed_establishments.all()),
-        'allowed_student_levels': slot.allowed_student_levels,
-        'allowed_student_levels_list': list(slot.allowed_student_levels.all()),
-    }
-
-    return slot_dict
-
+@query_budget(120)
 @is_ajax_request
 @login_required
 @is_post_request
@@ -1579,10 +1616,8 @@ def ajax_slot_registration(request):
             response = {'error': True, 'msg': _("Register to past slot is not possible")}
             return JsonResponse(response, safe=False)
 
-    slot_dict = create_slot_dict(slot)
-
     # Slot restrictions validation
-    can_register_slot, _obj = student.can_register_slot(slot_dict)
+    can_register_slot, _obj = student.can_register_slot(slot.restrictions)
     passed_registration_date = timezone.localtime() > slot.registration_limit_date
 
     if not can_register_slot or passed_registration_date:
@@ -1644,12 +1679,9 @@ def ajax_slot_registration(request):
             # If training quota is active, check registrations for this period/training
 
             if not off_offer and training_quota_active:
-                training_regs_count = student.immersions.filter(
-                    slot__date__gte=period.immersion_start_date,
-                    slot__date__lte=period.immersion_end_date,
-                    slot__course__training=slot.course.training,
-                    cancellation_type__isnull=True,
-                ).count()
+                training_regs_count = TrainingQuotaLedger.get_registrations(
+                    student.pk, period.pk, slot.course.training_id
+                )
 
                 # specific quota for this training ?
                 if slot.course.training.allowed_immersions:
@@ -1718,14 +1750,39 @@ def ajax_slot_registration(request):
 
             # Transaction should prevent multiple registrations to the same slot within a few milliseconds
             with transaction.atomic():
+                # Training quota check again, with the ledger entry locked : concurrent registrations
+                # of the student to the training wait for this one
+                if available_training_registrations is not None and not force:
+                    training_regs_count = TrainingQuotaLedger.get_registrations(
+                        student.pk, period.pk, slot.course.training_id, lock=True
+                    )
+
+                    if training_regs_count >= training_quota_count:
+                        if user.is_high_school_student() or user.is_student() or user.is_visitor():
+                            msg = _(
+                                """You have no more remaining registration available for this training and """
+                                """this period, you should cancel an immersion or contact immersion service"""
+                            )
+                        else:
+                            msg = _("This student is over training quota for this period")
+
+                        return JsonResponse({'error': True, 'msg': msg}, safe=False)
+
                 # Cancelled immersion exists : re-register
-                if student.immersions.filter(slot=slot, cancellation_type__isnull=False).exists():
-                    student.immersions.filter(slot=slot, cancellation_type__isnull=False).update(
-                        cancellation_type=None,
-                        attendance_status=0,
-                        cancellation_date=None
+                # (saved : the change log, training quota ledger and charts facts receivers are called)
+                cancelled_immersion = student.immersions\
+                    .select_for_update()\
+                    .filter(slot=slot, cancellation_type__isnull=False)\
+                    .first()
+
+                if cancelled_immersion:
+                    cancelled_immersion.cancellation_type = None
+                    cancelled_immersion.attendance_status = 0
+                    cancelled_immersion.cancellation_date = None
+                    cancelled_immersion.save(
+                        update_fields=['cancellation_type', 'attendance_status', 'cancellation_date']
                     )
-                    immersion = student.immersions.filter(slot=slot, cancellation_type__isnull=True).first()
+                    immersion = cancelled_immersion
                 elif not student.immersions.filter(slot=slot).exists():
                     try:
                         # New registration
@@ -1981,24 +2038,24 @@ def ajax_get_available_students(request, slot_id):
 
     try:
         slot = Slot.objects.get(pk=slot_id)
-        # Slot restrictions
-        response['slot'] = {
-            "establishments_restrictions": slot.establishments_restrictions,
-            "levels_restrictions": slot.levels_restrictions,
-            "bachelors_restrictions": slot.bachelors_restrictions,
-            "allowed_establishments": [e.uai_reference_id for e in slot.allowed_establishments.all()],
-            "allowed_highschools": [hs.id for hs in slot.allowed_highschools.all()],
-            "allowed_highschool_levels": [level.id for level in slot.allowed_highschool_levels.all()],
-            "allowed_student_levels": [level.id for level in slot.allowed_student_levels.all()],
-            "allowed_post_bachelor_levels": [level.id for level in slot.allowed_post_bachelor_levels.all()],
-            "allowed_bachelor_types": [bt.id for bt in slot.allowed_bachelor_types.all()],
-            "allowed_bachelor_mentions": [bm.id for bm in slot.allowed_bachelor_mentions.all()],
-            "allowed_bachelor_teachings": [bt.id for bt in slot.allowed_bachelor_teachings.all()],
-        }
     except Slot.DoesNotExist:
         response['msg'] = _("Error : slot not found")
         return JsonResponse(response, safe=False)
 
+    # Slot restrictions : flags and allowed objects ids
+    restrictions = {name: slot.restrictions.get(name, []) for name in Slot.RESTRICTIONS_RELATIONS}
+
+    response['slot'] = {
+        **{flag: getattr(slot, flag) for flag in Slot.RESTRICTIONS_FLAGS},
+        **restrictions,
+        # Students establishments are matched by UAI
+        "allowed_establishments": list(
+            Establishment.objects
+            .filter(pk__in=restrictions["allowed_establishments"])
+            .values_list("uai_reference_id", flat=True)
+        ) if restrictions["allowed_establishments"] else [],
+    }
+
     valid_high_school_record = HighSchoolStudentRecord.STATUSES["VALIDATED"]
     valid_visitor_record = VisitorRecord.STATUSES["VALIDATED"]
 
@@ -2034,11 +2091,13 @@ def ajax_get_available_students(request, slot_id):
         if slot.establishments_restrictions:
             establishment_filter = {}
 
-            if slot.allowed_establishments.exists():
-                establishment_filter['establishment__in'] = slot.allowed_establishments.all()
+            if restrictions["allowed_establishments"]:
+                establishment_filter['establishment__in'] = restrictions["allowed_establishments"]
 
-            if slot.allowed_highschools.exists():
-                establishment_filter['high_school_student_record__highschool__in'] = slot.allowed_highschools.all()
+            if restrictions["allowed_highschools"]:
+                establishment_filter['high_school_student_record__highschool__in'] = (
+                    restrictions["allowed_highschools"]
+                )
 
             if establishment_filter:
                 students = students.filter(
@@ -2048,16 +2107,18 @@ def ajax_get_available_students(request, slot_id):
         if slot.levels_restrictions:
             levels_restrictions = {}
 
-            if slot.allowed_highschool_levels.exists():
-                levels_restrictions['high_school_student_record__level__in'] = slot.allowed_highschool_levels.all()
+            if restrictions["allowed_highschool_levels"]:
+                levels_restrictions['high_school_student_record__level__in'] = (
+                    restrictions["allowed_highschool_levels"]
+                )
 
-            if slot.allowed_post_bachelor_levels.exists():
+            if restrictions["allowed_post_bachelor_levels"]:
                 levels_restrictions['high_school_student_record__post_bachelor_level__in'] = (
-                    slot.allowed_post_bachelor_levels.all()
+                    restrictions["allowed_post_bachelor_levels"]
                 )
 
-            if slot.allowed_student_levels.exists():
-                levels_restrictions['student_record__level__in'] = slot.allowed_student_levels.all()
+            if restrictions["allowed_student_levels"]:
+                levels_restrictions['student_record__level__in'] = restrictions["allowed_student_levels"]
 
             if levels_restrictions:
                 students = students.filter(
@@ -2068,19 +2129,19 @@ def ajax_get_available_students(request, slot_id):
             bachelor_type_filter = {}
             bachelors_restrictions = {}
 
-            if slot.allowed_bachelor_types.exists():
+            if restrictions["allowed_bachelor_types"]:
                 bachelor_type_filter = {
-                    'high_school_student_record__bachelor_type__in': slot.allowed_bachelor_types.all()
+                    'high_school_student_record__bachelor_type__in': restrictions["allowed_bachelor_types"]
                 }
 
-            if slot.allowed_bachelor_mentions.exists():
+            if restrictions["allowed_bachelor_mentions"]:
                 bachelors_restrictions['high_school_student_record__technological_bachelor_mention__in'] = (
-                    slot.allowed_bachelor_mentions.all()
+                    restrictions["allowed_bachelor_mentions"]
                 )
 
-            if slot.allowed_bachelor_teachings.exists():
+            if restrictions["allowed_bachelor_teachings"]:
                 bachelors_restrictions['high_school_student_record__general_bachelor_teachings__in'] = (
-                    slot.allowed_bachelor_teachings.all()
+                    restrictions["allowed_bachelor_teachings"]
                 )
 
             if bachelor_type_filter and bachelors_restrictions:
@@ -2165,6 +2226,23 @@ def ajax_get_available_students(request, slot_id):
         "bachelor_type_is_professional",
     )
 
+    if is_server_side(request):
+        adapter = DataTablesAdapter(
+            request,
+            students,
+            columns={
+                'last_name': 'last_name',
+                'first_name': 'first_name',
+                'profile': 'profile',
+                'level': 'level',
+                'class_name': 'class_name',
+                'institution': ['record_highschool_label', 'institution_label', 'institution_uai_code'],
+                'city': 'city',
+            },
+        )
+
+        return JsonResponse(adapter.get_response(response), safe=False)
+
     response['data'] = list(students)
 
     return JsonResponse(response, safe=False)
@@ -2304,6 +2382,42 @@ def ajax_get_highschool_students(request):
         )
     ).values()
 
+    if is_server_side(request):
+        yes_no = [{'value': '1', 'label': gettext('Yes')}, {'value': '0', 'label': gettext('No')}]
+
+        adapter = DataTablesAdapter(
+            request,
+            students,
+            columns={
+                'user_type': 'user_type',
+                'disabled': 'disabled',
+                'last_name': ['last_name', 'first_name'],
+                'birth_date': 'birth_date',
+                'institution': ['institution', 'uai_code'],
+                'level': 'level',
+                'class_name': 'class_name',
+                'bachelor': ['bachelor', 'student_origin_bachelor', 'hs_origin_bachelor'],
+                'record_status_display': 'record_status_display',
+                'registered': 'registered',
+            },
+            filters={
+                'disabled': lambda qs, value: qs.filter(disabled=True) if value == '1'
+                    else qs.filter(Q(disabled=False) | Q(disabled__isnull=True)),
+                'registered': lambda qs, value: qs.filter(registered__gt=0) if value == '1' else qs.filter(registered=0),
+            },
+            yadcf_data={
+                'user_type': None,
+                'disabled': yes_no,
+                'institution': None,
+                'level': None,
+                'bachelor': None,
+                'record_status_display': None,
+                'registered': yes_no,
+            }
+        )
+
+        return JsonResponse(adapter.get_response(response), safe=False)
+
     response['data'] = list(students)
 
     return JsonResponse(response, safe=False)
@@ -2479,29 +2593,25 @@ def ajax_batch_cancel_registration(request):
             response = {'error': True, 'msg': _("You can't use this cancellation reason")}
             return JsonResponse(response, safe=False)
 
-        for immersion_id in json_data:
-            try:
-                immersion = Immersion.objects.get(pk=immersion_id, slot=slot)
-                immersion.cancellation_type = cancellation_reason
-                immersion.cancellation_date = timezone.now()
-                immersion.save()
+        immersions = Immersion.objects.filter(pk__in=json_data, slot=slot)
+        found_ids = set(immersions.values_list('pk', flat=True))
 
-                cancelled_immersions += 1
+        for immersion_id in set(json_data) - found_ids:
+            immersion_errors.append(_("Immersion %s not found") % immersion_id)
 
-                ret = immersion.student.send_message(
-                    request, 'IMMERSION_ANNUL', immersion=immersion, slot=immersion.slot
-                )
-                if ret:
-                    mail_returns.add(ret)
+        cancelled, freed_seats, mail_errors = immersions.cancel(cancellation_reason, request=request)
+        cancelled_immersions = len(cancelled)
 
-            except Immersion.DoesNotExist:
-                immersion_errors.append(_("Immersion %s not found") % immersion_id)
+        for immersion_id in sorted(found_ids - {immersion.pk for immersion in cancelled}):
+            immersion_errors.append(_("Immersion %s already cancelled") % immersion_id)
+        mail_returns.update(mail_errors)
+        outbox = []
 
         # If slot registrations are over (check limit date), also send a message to speakers
         # and structure managers
-        if slot.registration_limit_date < now:
+        if cancelled_immersions and slot.registration_limit_date < now:
             for speaker in slot.speakers.all():
-                ret = speaker.send_message(request, 'IMMERSION_ANNULATION_INT', slot=slot)
+                ret = speaker.send_message(request, 'IMMERSION_ANNULATION_INT', outbox=outbox, slot=slot)
                 if ret:
                     mail_returns.add(ret)
 
@@ -2510,7 +2620,7 @@ def ajax_batch_cancel_registration(request):
 
             if slot_structure:
                 for notify in RefStructuresNotificationsSettings.objects.filter(structures=slot_structure):
-                    ret = notify.user.send_message(None, "IMMERSION_ANNULATION_STR", slot=slot)
+                    ret = notify.user.send_message(None, "IMMERSION_ANNULATION_STR", outbox=outbox, slot=slot)
                     if ret:
                         mail_returns.add(ret)
 
@@ -2523,10 +2633,14 @@ def ajax_batch_cancel_registration(request):
                 # Send the same message template
                 for manager in highschool.users.filter(groups__name='REF-LYC'):
                     if manager.get_preference("RECEIVE_REGISTERED_STUDENTS_LIST", False):
-                        ret = manager.send_message(None, "IMMERSION_ANNULATION_STR", slot=slot)
+                        ret = manager.send_message(None, "IMMERSION_ANNULATION_STR", outbox=outbox, slot=slot)
                         if ret:
                             mail_returns.add(ret)
 
+            ret = send_emails(outbox)
+            if ret:
+                mail_returns.add(ret)
+
         # Return warnings and errors
         if cancelled_immersions:
             msg = _("%s immersion(s) cancelled") % cancelled_immersions
@@ -2719,6 +2833,7 @@ def ajax_groups_batch_cancel_registration(request):
     return JsonResponse(response, safe=False)
 
 
+@query_budget(30)
 @groups_required('REF-ETAB', 'REF-STR', 'REF-ETAB-MAITRE', 'REF-LYC', 'REF-TEC')
 def get_csv_structures(request):
     filters = {}
@@ -3511,6 +3626,7 @@ def get_csv_highschool(request):
     return response
 
 
+@query_budget(30)
 @groups_required('REF-ETAB', 'REF-ETAB-MAITRE', 'REF-TEC')
 def get_csv_anonymous(request):
     response = HttpResponse(content_type='text/csv')
@@ -5478,91 +5594,222 @@ class MailingListGlobalView(APIView):
             except Period.DoesNotExist:
                 response["msg"] = f"Warning : invalid filter : period '{period_id}' not found"
 
-        mailing_list = list(
-            ImmersionUser.objects.prefetch_related(
-                "student_record",
-                "high_school_student_record",
-                "visitor_record",
-                "immersions__slot"
-            )
-            .filter(
-                Q(student_record__isnull=False)
-                | Q(high_school_student_record__validation=2, high_school_student_record__isnull=False)
-                | Q(visitor_record__validation=2, visitor_record__isnull=False)
-            )
-            .filter(**extra_filter)
-            .values_list('email', flat=True)
-            .distinct()
-        )
-
-        response["data"] = {global_mail: mailing_list}
+        response["data"] = {global_mail: get_global_mailing_list(extra_filter)}
         return JsonResponse(data=response)
 
 
-class MailingListStructuresView(APIView):
+class MailingListView(APIView):
+    """
+    Base view for structures, establishments and high schools mailing lists
+    Responses have an ETag : clients can poll with If-None-Match to get a 304 when nothing changed
+    GET param : precomputed=1 to get the subscribers file of the last generate_mailing_list_subscribers_files run
+    """
     authentication_classes = [
         TokenAuthentication,
     ]
+    mailing_lists = None
 
     def get(self, request, *args, **kwargs):
-        response: Dict[str, Any] = {"msg": "", "data": None}
-        response["data"] = {}
-        for structure in Structure.objects.filter(mailing_list__isnull=False):
-            mail = structure.mailing_list
-            mailing_list = list(
-                Immersion.objects.filter(cancellation_type__isnull=True)
-                .filter(Q(slot__course__structure=structure) | Q(slot__event__structure=structure))
-                .values_list('student__email', flat=True)
-                .distinct()
-            )
-            response["data"][mail] = mailing_list
+        if request.GET.get("precomputed") in ("1", "true", "True"):
+            content = read_mailing_lists_file(self.mailing_lists)
 
-        return JsonResponse(data=response)
+            if content is not None:
+                etag = quote_etag(hashlib.sha256(content).hexdigest())
+
+                if etag in parse_etags(request.headers.get("If-None-Match", "")):
+                    response = HttpResponseNotModified()
+                else:
+                    response = HttpResponse(content, content_type="application/json")
+
+                response["ETag"] = etag
+                return response
+
+        etag = quote_etag(get_mailing_lists_etag(self.mailing_lists))
+
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+            response["ETag"] = etag
+            return response
+
+        response: Dict[str, Any] = {"msg": "", "data": get_mailing_lists(self.mailing_lists)}
+        json_response = JsonResponse(data=response)
+        json_response["ETag"] = etag
+
+        return json_response
+
+
+class MailingListStructuresView(MailingListView):
+    mailing_lists = "structures"
+
+
+class MailingListEstablishmentsView(MailingListView):
+    mailing_lists = "establishments"
 
 
-class MailingListEstablishmentsView(APIView):
+class MailingListHighSchoolsView(MailingListView):
+    mailing_lists = "high_schools"
+
+
+class ChangeFeedView(APIView):
+    """
+    Slots, courses, immersions, group immersions and records inserted, updated or deleted since a cursor
+    Only the changes of the object types the user can view are returned, with the
+    fields published for each type (see track_changes)
+    GET parameters :
+    - cursor : last read change id (optional, default : all known changes)
+    - limit : max number of changes to read (optional, default : 1000)
+    Use the returned 'cursor' value for the next call
+    """
     authentication_classes = [
         TokenAuthentication,
     ]
+    permission_classes = [CustomDjangoModelPermissions]
+    queryset = ChangeLog.objects.all()
+
+    DEFAULT_LIMIT = 1000
+    ACTIONS = {
+        ChangeLog.CREATED: "created",
+        ChangeLog.UPDATED: "updated",
+        ChangeLog.DELETED: "deleted",
+    }
 
     def get(self, request, *args, **kwargs):
-        response: Dict[str, Any] = {"msg": "", "data": None}
-        response["data"] = {}
-        for establishment in Establishment.objects.filter(mailing_list__isnull=False):
-            mailing_list = list(
-                Immersion.objects.filter(cancellation_type__isnull=True)
-                .filter(
-                    Q(slot__course__structure__establishment=establishment)
-                    | Q(slot__event__establishment=establishment)
-                )
-                .values_list('student__email', flat=True)
-                .distinct()
-            )
-            response["data"][establishment.mailing_list] = mailing_list
+        response: Dict[str, Any] = {"msg": "", "cursor": None, "more": False, "data": []}
+        changes = ChangeLog.objects.order_by("id")
+
+        try:
+            limit = int(request.GET.get("limit", self.DEFAULT_LIMIT))
+            if limit <= 0:
+                raise ValueError
+        except ValueError:
+            response["msg"] = gettext("Invalid 'limit' value, positive integer expected")
+            return JsonResponse(data=response, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            cursor = request.GET.get("cursor")
+            cursor = int(cursor) if cursor else None
+            if cursor is not None and cursor < 0:
+                raise ValueError
+        except ValueError:
+            response["msg"] = gettext("Invalid 'cursor' value, positive integer expected")
+            return JsonResponse(data=response, status=status.HTTP_400_BAD_REQUEST)
+
+        if cursor is not None:
+            changes = changes.filter(id__gt=cursor)
+
+        page = list(changes[:limit + 1])
+        response["more"] = len(page) > limit
+        page = page[:limit]
+
+        # Ids are allocated at insertion but become visible at commit : a recent gap in the ids may be
+        # a transaction still running, stop before it and read it with the next call.
+        # Older gaps are rolled back transactions.
+        lag_date = timezone.now() - datetime.timedelta(seconds=settings.CHANGE_FEED_SAFETY_LAG)
+        last_id = cursor
+
+        for index, change in enumerate(page):
+            if last_id is not None and change.id != last_id + 1 and change.date > lag_date:
+                page = page[:index]
+                response["more"] = True
+                break
+            last_id = change.id
+
+        response["cursor"] = last_id
+
+        # Object types the user can view => published fields
+        object_types = {
+            model._meta.label_lower: fields
+            for model, fields in ChangeLog.tracked_models.items()
+            if request.user.has_perm(f"{model._meta.app_label}.view_{model._meta.model_name}")
+        }
+
+        # Keep one entry per object : its last action, except creations followed by updates
+        objects: Dict[Tuple[str, int], ChangeLog] = {}
+        created = set()
+
+        for change in page:
+            if change.object_type not in object_types:
+                continue
+
+            key = (change.object_type, change.object_id)
+            if change.action == ChangeLog.CREATED:
+                created.add(key)
+            objects.pop(key, None)
+            objects[key] = change
+
+        # Current values of non deleted objects, one query per object type
+        values: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        object_ids = defaultdict(set)
+
+        for (object_type, object_id), change in objects.items():
+            if change.action != ChangeLog.DELETED:
+                object_ids[object_type].add(object_id)
+
+        for object_type, ids in object_ids.items():
+            model = apps.get_model(object_type)
+            for obj in model.objects.filter(pk__in=ids).values(*object_types[object_type]):
+                values[(object_type, obj["id"])] = obj
+
+        for key, change in objects.items():
+            action = change.action
+
+            if action == ChangeLog.UPDATED and key in created:
+                action = ChangeLog.CREATED
+
+            # Object deleted in the meantime : its deletion will come with the next changes
+            if action != ChangeLog.DELETED and key not in values:
+                continue
+
+            response["data"].append({
+                "type": change.object_type,
+                "id": change.object_id,
+                "action": self.ACTIONS[action],
+                "date": change.date.isoformat(),
+                "object": values.get(key),
+            })
 
         return JsonResponse(data=response)
 
 
-class MailingListHighSchoolsView(APIView):
+class ScheduledTasksMetricsView(APIView):
+    """
+    Scheduled tasks executions metrics : runs, errors, durations, queries, written rows and
+    sent emails percentiles per command
+    GET parameters :
+    - days : number of days of executions to use (optional, default : ScheduledTaskLog.METRICS_DAYS)
+    """
     authentication_classes = [
         TokenAuthentication,
     ]
+    permission_classes = [CustomDjangoModelPermissions]
+    queryset = ScheduledTaskLog.objects.all()
 
     def get(self, request, *args, **kwargs):
-        response: Dict[str, Any] = {"msg": "", "data": None}
-        response["data"] = {}
-
-        for hs in HighSchool.agreed.filter(mailing_list__isnull=False):
-            mailing_list = list(
-                Immersion.objects.filter(cancellation_type__isnull=True)
-                .filter(
-                    Q(slot__course__highschool=hs)
-                    | Q(slot__event__highschool=hs)
-                )
-                .values_list('student__email', flat=True)
-                .distinct()
-            )
-            response["data"][hs.mailing_list] = mailing_list
+        response: Dict[str, Any] = {"msg": "", "since": None, "data": []}
+
+        try:
+            days = int(request.GET.get("days", ScheduledTaskLog.METRICS_DAYS))
+            if days <= 0:
+                raise ValueError
+        except ValueError:
+            response["msg"] = gettext("Invalid 'days' value, positive integer expected")
+            return JsonResponse(data=response, status=status.HTTP_400_BAD_REQUEST)
+
+        since = timezone.now() - datetime.timedelta(days=days)
+        response["since"] = since.isoformat()
+
+        metrics = (
+            ScheduledTaskLog.objects
+            .values(command=F("task__command_name"))
+            .annotate(**ScheduledTaskLog.get_metrics_annotations(since=since))
+            .filter(runs__gt=0)
+            .order_by("command")
+        )
+
+        for task_metrics in metrics:
+            if task_metrics["last_execution_date"]:
+                task_metrics["last_execution_date"] = task_metrics["last_execution_date"].isoformat()
+            response["data"].append(task_metrics)
 
         return JsonResponse(data=response)
 
@@ -5684,21 +5931,14 @@ def ajax_update_structures_notifications(request):
 @is_ajax_request
 def ajax_can_register_slot(request, slot_id=None):
     """
-    Returns registering slot status for a logged user
-    Warning not quota & remaining seats checking !
+    Returns registering slot status for a logged user (see get_slot_registration_reasons)
+    Warning not quota checking !
 
     GET parameters:
     slot_id
     """
-    now = timezone.localtime()
-    today = timezone.localdate()
-
     user = request.user
     response = {'msg': '', 'data': []}
-    slot_data = {
-        'can_register': False,
-        'already_registered': False,
-    }
 
     if not user.is_authenticated:
         response['msg'] = gettext("Error : user not authenticated")
@@ -5708,102 +5948,81 @@ def ajax_can_register_slot(request, slot_id=None):
         response['msg'] = gettext("Error : missing slot id")
         return JsonResponse(response, safe=False)
 
-    slot = Slot.objects.get(id=slot_id)
+    slot = get_registration_slots([slot_id]).first()
 
     if not slot:
         response['msg'] = gettext("Error : slot not found")
         return JsonResponse(response, safe=False)
 
-    slot_dict = create_slot_dict(slot)
-
-    can_register_slot, reason = user.can_register_slot(slot_dict)
+    user_data = get_user_registration_data(user, [slot.pk], check_quotas=False)
+    reasons, already_registered = get_slot_registration_reasons(user, slot, user_data)
 
-    # Should not happen !
-    if not slot.published:
-        response['msg'] = _("Registering an unpublished slot is forbidden")
+    if reasons:
+        response['msg'] = reasons[0]
         return JsonResponse(response, safe=False)
 
-    # Only valid Highschool students
-    if user.is_high_school_student():
-        if not user.is_valid():
-            response['msg'] = _("Cannot register slot due to Highschool student account state")
-            return JsonResponse(response, safe=False)
+    if already_registered:
+        response['msg'] = _("Already registered to this slot")
 
-        record = user.get_high_school_student_record()
-        if not record or not record.is_valid():
-            response['msg'] = _("Cannot register slot due to Highschool student record state")
-            return JsonResponse(response, safe=False)
+    response['data'].append({
+        'can_register': not already_registered,
+        'already_registered': already_registered,
+    })
 
-    # Only valid Visitors records
-    if user.is_visitor():
-        if not user.is_valid():
-            response['msg'] = _("Cannot register slot due to visitor account state")
-            return JsonResponse(response, safe=False)
+    return JsonResponse(response, safe=False)
 
-        record = user.get_visitor_record()
-        if not record or not record.is_valid():
-            response['msg'] = _("Cannot register slot due to visitor record state")
-            return JsonResponse(response, safe=False)
 
-    # Out of date mandatory attestations
-    if user.has_obsolete_attestations():
-        response['msg'] = _("Cannot register slot due to out of date attestations")
-        return JsonResponse(response, safe=False)
+@is_ajax_request
+@is_post_request
+def ajax_can_register_slots(request):
+    """
+    Batch version of ajax_can_register_slot : registering status of a list of slots for the logged user.
+    The user account, record, attestations and quotas are checked once, the slots with a single query.
 
-    # ==========================
-    # Period date
-    period = slot.period
+    POST parameters:
+    slots[] : slots ids
 
-    if period:
-        if now < period.registration_start_date:
-            response['msg'] = _("You can't register to this slot yet")
-            return JsonResponse(response, safe=False)
+    :return: {slot_id: {'can_register': bool, 'already_registered': bool, 'reasons': [messages]}}
+    """
+    user = request.user
+    response = {'msg': '', 'data': {}}
 
-        if today > period.immersion_end_date or slot.registration_limit_date < now:
-            response['msg'] = _("You can't register to this slot anymore")
-            return JsonResponse(response, safe=False)
-    # ========================
-
-    # If user == REF-LYC
-    # Need to test if I can register a group with the available seats for groups
-    # else
-    # Need to test if I can register someone with the individual seats
-    if request.user.is_high_school_manager():
-        if not slot.available_group_seats():
-            response['msg'] = _("No group seat available for selected slot")
-            return JsonResponse(response, safe=False)
-    elif slot.available_seats() == 0:
-        # Check free seat in slot for individual registration
-        response['msg'] = _("No seat available for selected slot")
+    if not user.is_authenticated:
+        response['msg'] = gettext("Error : user not authenticated")
         return JsonResponse(response, safe=False)
 
-    # Slot registration limit date
-    if timezone.localtime() > slot.registration_limit_date:
-        response['msg'] = _("Cannot register slot due to passed registration date")
+    try:
+        slot_ids = {int(slot_id) for slot_id in request.POST.getlist('slots[]', [])}
+    except ValueError:
+        response['msg'] = gettext("Invalid parameter")
         return JsonResponse(response, safe=False)
 
-    # Slot registration restrictions
-    if not can_register_slot:
-        response = {'error': True, 'msg': reason}
+    if not slot_ids:
+        response['msg'] = gettext("Error : missing slot id")
         return JsonResponse(response, safe=False)
 
-    # Check current student immersions and valid dates
-    if user.immersions.filter(slot=slot, cancellation_type__isnull=True).exists():
-        response['msg'] = _("Already registered to this slot")
-        slot_data['already_registered'] = True
-        slot_data['can_register'] = False
-        response['data'].append(slot_data.copy())
-        return JsonResponse(response, safe=False)
+    user_data = get_user_registration_data(user, slot_ids)
 
-    else:
+    for slot in get_registration_slots(slot_ids):
+        reasons, already_registered = get_slot_registration_reasons(user, slot, user_data)
 
-        slot_data['can_register'] = True
+        response['data'][slot.pk] = {
+            'can_register': not reasons and not already_registered,
+            'already_registered': already_registered,
+            'reasons': [str(reason) for reason in reasons],
+        }
 
-    response['data'].append(slot_data.copy())
+    for slot_id in slot_ids - set(response['data']):
+        response['data'][slot_id] = {
+            'can_register': False,
+            'already_registered': False,
+            'reasons': [gettext("Error : slot not found")],
+        }
 
     return JsonResponse(response, safe=False)
 
 
+@query_budget(15)
 @is_ajax_request
 def ajax_search_slots_list(request, slot_id=None):
 
@@ -6075,17 +6294,8 @@ def ajax_search_slots_list(request, slot_id=None):
                 ),
                 distinct=True,
             ),
-            speakers_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        last_name=F("speakers__last_name"),
-                        first_name=F("speakers__first_name"),
-                        email=F("speakers__email"),
-                    ),
-                    filter=Q(speakers__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            speakers_list=Slot.related_array(
+                'speakers', last_name='last_name', first_name='first_name', email='email'
             ),
             passed_registration_limit_date=ExpressionWrapper(
                 Q(registration_limit_date__lt=timezone.now()), output_field=CharField()
@@ -6129,66 +6339,14 @@ def ajax_get_slot_restrictions(request, slot_id=None):
     slot = (
         Slot.objects.filter(id=slot_id)
         .annotate(
-            allowed_establishments_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_establishments__short_label'),
-                    filter=Q(allowed_establishments__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschools_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(city=F('allowed_highschools__city'), label=F('allowed_highschools__label')),
-                    filter=Q(allowed_highschools__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschool_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_highschool_levels__label'),
-                    filter=Q(allowed_highschool_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_post_bachelor_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_post_bachelor_levels__label'),
-                    filter=Q(allowed_post_bachelor_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_student_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_student_levels__label'), filter=Q(allowed_student_levels__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_types_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_types__label'), filter=Q(allowed_bachelor_types__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_mentions_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_mentions__label'),
-                    filter=Q(allowed_bachelor_mentions__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_teachings_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_teachings__label'),
-                    filter=Q(allowed_bachelor_teachings__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
+            allowed_establishments_list=Slot.related_array('allowed_establishments', 'short_label'),
+            allowed_highschools_list=Slot.related_array('allowed_highschools', city='city', label='label'),
+            allowed_highschool_levels_list=Slot.related_array('allowed_highschool_levels', 'label'),
+            allowed_post_bachelor_levels_list=Slot.related_array('allowed_post_bachelor_levels', 'label'),
+            allowed_student_levels_list=Slot.related_array('allowed_student_levels', 'label'),
+            allowed_bachelor_types_list=Slot.related_array('allowed_bachelor_types', 'label'),
+            allowed_bachelor_mentions_list=Slot.related_array('allowed_bachelor_mentions', 'label'),
+            allowed_bachelor_teachings_list=Slot.related_array('allowed_bachelor_teachings', 'label'),
         )
         .values(
             'establishments_restrictions',
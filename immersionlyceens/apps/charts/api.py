@@ -9,20 +9,55 @@ from django.views.generic import TemplateView
 from django.http import HttpResponse, JsonResponse
 from django.utils.translation import gettext, gettext_lazy as _
 
-from immersionlyceens.decorators import groups_required, is_ajax_request, is_post_request
+from immersionlyceens.decorators import groups_required, is_ajax_request, is_post_request, query_budget
 
 from immersionlyceens.apps.core.models import (
-    Structure, Immersion, ImmersionUser, TrainingDomain, TrainingSubdomain, HigherEducationInstitution,
+    Structure, ImmersionUser, TrainingDomain, TrainingSubdomain, HigherEducationInstitution,
     HighSchool, Training, Slot, Course, HighSchoolLevel, PostBachelorLevel, StudentLevel, Establishment
 )
 
 from immersionlyceens.apps.immersion.models import HighSchoolStudentRecord, StudentRecord
 
+from .models import ImmersionFact
 from .utils import parse_median
 
 logger = logging.getLogger(__name__)
 
 
+def get_domains_datasets(immersions):
+    """
+    Domains registrations counts, with their subdomains counts
+    :param immersions: ImmersionFact queryset
+    :return: list of {domain, count, subData: [{name, count}, ...]} ordered by domain label
+    """
+    immersions = immersions.filter(domain__isnull=False)
+    subdomains = defaultdict(list)
+
+    subdomains_data = immersions\
+        .annotate(subdomain_label=F('subdomain__label'))\
+        .values('domain_id', 'subdomain_label')\
+        .annotate(cnt=Count('pk'))\
+        .order_by('subdomain_label')
+
+    for sub_d_data in subdomains_data:
+        subdomains[sub_d_data['domain_id']].append({
+            "name": sub_d_data['subdomain_label'],
+            "count": sub_d_data['cnt'],
+        })
+
+    domains_data = immersions\
+        .annotate(domain_label=F('domain__label'))\
+        .values('domain_label', 'domain_id')\
+        .annotate(cnt=Count('pk'))\
+        .order_by('domain_label')
+
+    return [{
+        "domain": d_data['domain_label'],
+        "count": d_data['cnt'],
+        "subData": subdomains[d_data['domain_id']],
+    } for d_data in domains_data]
+
+
 @is_post_request
 @groups_required('REF-ETAB', "REF-ETAB-MAITRE", "REF-TEC", "REF-LYC")
 def global_domains_charts_by_population(request):
@@ -65,34 +100,24 @@ def global_domains_charts_by_population(request):
         },
     ]
 
-    immersions = Immersion.objects.prefetch_related(
-        'slot__course__training__training_subdomains__training_domain',
-        'student__high_school_student_record__highschool'
-    ).filter(cancellation_type__isnull=True)
+    immersions = ImmersionFact.objects.filter(cancelled=False)
 
     # Level filter
     if level_value != 0:
         if level_value == 'visitors':
-            immersions = immersions.filter(student__visitor_record__validation=2)
+            immersions = immersions.filter(population=ImmersionFact.VISITOR, validated=True)
         elif level:
             if not level.is_post_bachelor:
-                immersions = immersions.filter(
-                    student__high_school_student_record__level=level,
-                    student__high_school_student_record__validation=2
-                )
+                immersions = immersions.filter(level=level, validated=True)
             else:
-                immersions = immersions.filter(
-                    Q(student__high_school_student_record__level=level,
-                      student__high_school_student_record__validation=2)
-                    | Q(student__student_record__level__in=StudentLevel.objects.all())
-                )
+                immersions = immersions.filter(Q(level=level, validated=True) | Q(student_level__isnull=False))
 
     # Filter on highschools or higher education institutions
     if _highschools_ids:
-        immersions_filter["student__high_school_student_record__highschool__id__in"] = _highschools_ids
+        immersions_filter["highschool__id__in"] = _highschools_ids
 
     if _higher_institutions_ids:
-        immersions_filter["student__student_record__uai_code__in"] = _higher_institutions_ids
+        immersions_filter["uai_code__in"] = _higher_institutions_ids
 
     # Apply high school or establishment selection filter, with Q
     if immersions_filter:
@@ -100,44 +125,7 @@ def global_domains_charts_by_population(request):
             reduce(lambda x, y: x | y, [Q(**{'%s' % k : v}) for k, v in immersions_filter.items()])
         )
 
-    # Get domains and subdomains label + subdomains registrations count
-    domains_data = immersions\
-        .annotate(
-            domain_label=F('slot__course__training__training_subdomains__training_domain__label'),
-            domain_id=F('slot__course__training__training_subdomains__training_domain__id'))\
-        .values(
-            'domain_label',
-            'domain_id')\
-        .annotate(cnt=Count('domain_id'))\
-        .order_by('domain_label')
-
-    for d_data in domains_data:
-        if d_data['cnt']:
-            data = {
-                "domain": d_data['domain_label'],
-                "count": d_data['cnt'],
-                "subData": [],
-            }
-
-            subdomains_data = immersions \
-                .filter(slot__course__training__training_subdomains__training_domain__id=d_data['domain_id'])\
-                .annotate(
-                    subdomain_label=F('slot__course__training__training_subdomains__label'),
-                    subdomain_id=F('slot__course__training__training_subdomains__training_domain__id')) \
-                .values(
-                    'subdomain_label',
-                    'subdomain_id')\
-                .annotate(cnt=Count('slot__course__training__training_subdomains'))\
-                .order_by('subdomain_label')
-
-            for sub_d_data in subdomains_data:
-                sub_data = {
-                    "name": sub_d_data['subdomain_label'],
-                    "count": sub_d_data['cnt'],
-                }
-                data['subData'].append(sub_data.copy())
-
-            datasets.append(data.copy())
+    datasets = get_domains_datasets(immersions)
 
 
     response = {
@@ -196,34 +184,28 @@ def global_domains_charts_by_trainings(request):
         },
     ]
 
-    immersions = Immersion.objects.prefetch_related(
-        'slot__course__training__training_subdomains__training_domain',
-        'student__high_school_student_record__highschool'
-    ).filter(cancellation_type__isnull=True)
+    immersions = ImmersionFact.objects.filter(cancelled=False)
 
     # Level filter
     if level_value != 0:
         if level_value == 'visitors':
-            immersions = immersions.filter(student__visitor_record__validation=2)
+            immersions = immersions.filter(population=ImmersionFact.VISITOR, validated=True)
         elif level:
             if not level.is_post_bachelor:
-                immersions = immersions.filter(student__high_school_student_record__level=level)
+                immersions = immersions.filter(level=level)
             else:
-                immersions = immersions.filter(
-                    Q(student__high_school_student_record__level=level)
-                    | Q(student__student_record__level__in=StudentLevel.objects.all())
-                )
+                immersions = immersions.filter(Q(level=level) | Q(student_level__isnull=False))
 
     # Filter on highschools or higher education institutions trainings/domains
     if _highschools_ids:
-        immersions_filter["slot__course__highschool__in"] = _highschools_ids
+        immersions_filter["course_highschool__in"] = _highschools_ids
 
     if _structures_ids:
-        immersions_filter["slot__course__structure__in"] = _structures_ids
+        immersions_filter["structure__in"] = _structures_ids
 
     if _higher_institutions_ids:
         structures = Structure.objects.filter(establishment__id__in=_higher_institutions_ids).distinct()
-        immersions_filter["slot__course__structure__in"] = structures
+        immersions_filter["structure__in"] = structures
 
     # Apply high school or establishment selection filter
     if immersions_filter:
@@ -232,43 +214,7 @@ def global_domains_charts_by_trainings(request):
         )
 
 
-    # Get domains and subdomains label + subdomains registrations count
-    domains_data = immersions \
-        .annotate(
-            domain_label=F('slot__course__training__training_subdomains__training_domain__label'),
-            domain_id=F('slot__course__training__training_subdomains__training_domain__id')) \
-        .values(
-            'domain_label',
-            'domain_id') \
-        .annotate(cnt=Count('domain_id')) \
-        .order_by('domain_label')
-
-    for d_data in domains_data:
-        if d_data['cnt']:
-            data = {
-                "domain": d_data['domain_label'],
-                "count": d_data['cnt'],
-                "subData": [],
-            }
-
-            subdomains_data = immersions \
-                .filter(slot__course__training__training_subdomains__training_domain__id=d_data['domain_id']) \
-                .annotate(
-                    subdomain_label=F('slot__course__training__training_subdomains__label'),
-                    subdomain_id=F('slot__course__training__training_subdomains__training_domain__id')) \
-                .values(
-                    'subdomain_label',
-                    'subdomain_id') \
-                .annotate(cnt=Count('slot__course__training__training_subdomains'))
-
-            for sub_d_data in subdomains_data:
-                sub_data = {
-                    "name": sub_d_data['subdomain_label'],
-                    "count": sub_d_data['cnt'],
-                }
-                data['subData'].append(sub_data.copy())
-
-            datasets.append(data.copy())
+    datasets = get_domains_datasets(immersions)
 
     response = {
         'datasets': datasets,
@@ -411,7 +357,6 @@ def get_global_trainings_charts(request):
     trainings_filter = {
         'active': True,
     }
-    students_filter = {}
     immersions_filter = {}
 
     if structure_id and user.is_structure_manager() and user.structures.exists():
@@ -422,8 +367,7 @@ def get_global_trainings_charts(request):
         highschool_id = user.highschool.id
 
     if highschool_id:
-        students_filter['high_school_student_record__highschool__id'] = highschool_id
-        immersions_filter['student__high_school_student_record__highschool__id'] = highschool_id
+        immersions_filter['highschool__id'] = highschool_id
 
         # Filter by the selected high school students
         if not filter_by_my_trainings:
@@ -602,11 +546,45 @@ def get_global_trainings_charts(request):
         }
     ]
 
-    trainings = Training.objects.prefetch_related(
+    trainings = list(Training.objects.prefetch_related(
         'training_subdomains__training_domain',
-        'structures',
+        'structures__establishment',
         'highschool',
-    ).filter(**trainings_filter).distinct()
+    ).filter(**trainings_filter).distinct())
+
+    # Persons and registrations counts of all the trainings, in a single query
+    post_bachelor_filter = (
+        Q(level__in=post_bachelor_levels)
+        | Q(student_level__in=list(StudentLevel.objects.filter(active=True).values_list('id', flat=True)))
+    )
+    visitors_filter = Q(population=ImmersionFact.VISITOR)
+
+    counts = {
+        # persons (pupils, students, visitors) registered to at least one immersion for this training
+        'unique_persons': Count('student', distinct=True),
+        # students registered to at least one immersion for this training
+        'unique_visitors': Count('student', distinct=True, filter=visitors_filter),
+        # registrations on all slots (not cancelled)
+        'all_registrations': Count('immersion', distinct=True),
+        # visitors registrations count
+        'visitors_registrations': Count('immersion', distinct=True, filter=visitors_filter),
+        # Post bachelor levels : include pupils + students
+        'unique_students': Count('student', distinct=True, filter=post_bachelor_filter),
+        'students_registrations': Count('immersion', distinct=True, filter=post_bachelor_filter),
+    }
+
+    # Pre-bachelor levels :
+    for level in pre_bachelor_levels:
+        counts[f"unique_students_lvl{level.id}"] = Count('student', distinct=True, filter=Q(level=level))
+        counts[f"registrations_lvl{level.id}"] = Count('immersion', distinct=True, filter=Q(level=level))
+
+    trainings_counts = {
+        training_counts.pop('training'): training_counts
+        for training_counts in ImmersionFact.objects
+            .filter(**immersions_filter, training__in=[training.id for training in trainings], cancelled=False)
+            .values('training')
+            .annotate(**counts)
+    }
 
     for training in trainings:
         structure = ""
@@ -615,23 +593,7 @@ def get_global_trainings_charts(request):
             establishment = _("High school") + f" {training.highschool.label} ({training.highschool.city})"
         else:
             establishment = "<br>".join(sorted({s.establishment.label for s in training.structures.all()}))
-            structure = "<br>".join(sorted([s.label for s in training.structures.filter(active=True)]))
-
-        base_persons_qs = ImmersionUser.objects\
-            .prefetch_related('immersions__slot__course__training', 'high_school_student_record__highschool')\
-            .filter(
-                **students_filter,
-                immersions__slot__course__training=training,
-                immersions__cancellation_type__isnull=True
-            )
-
-        base_immersions_qs = Immersion.objects\
-            .prefetch_related('slot__course__training', 'student__high_school_student_record__highschool')\
-            .filter(
-                **immersions_filter,
-                slot__course__training=training,
-                cancellation_type__isnull=True
-            )
+            structure = "<br>".join(sorted([s.label for s in training.structures.all() if s.active]))
 
         # Get domains and add subdomains as a list under each, will join them right below in "domain_label"
         domain_labels = defaultdict(list)
@@ -643,40 +605,16 @@ def get_global_trainings_charts(request):
             'structure': structure,
             'training_label': training.label,
             'domain_label': "<br>".join([x for dom, subs in sorted(domain_labels.items()) for x in [dom] + subs]),
-            # persons (pupils, students, visitors) registered to at least one immersion for this training
-            'unique_persons': base_persons_qs.distinct().count(),
-            # students registered to at least one immersion for this training
-            'unique_visitors': base_persons_qs.filter(visitor_record__isnull=False).distinct().count(),
-            # registrations on all slots (not cancelled)
-            'all_registrations': base_immersions_qs.count(),
-            # visitors registrations count
-            'visitors_registrations': base_immersions_qs.filter(student__visitor_record__isnull=False).count(),
+            **dict.fromkeys(counts, 0),
+            **trainings_counts.get(training.id, {}),
         }
 
-        # Pre-bachelor levels :
-        for level in pre_bachelor_levels:
-            row[f"unique_students_lvl{level.id}"] = base_persons_qs.filter(
-                high_school_student_record__level=level).distinct().count()
-
-            row[f"registrations_lvl{level.id}"] = base_immersions_qs.filter(
-                student__high_school_student_record__level=level).count()
-
-        # Post bachelor levels : include pupils + students
-        row["unique_students"] = base_persons_qs.filter(
-            Q(high_school_student_record__level__in=post_bachelor_levels) |
-            Q(student_record__level__in=[s.id for s in StudentLevel.objects.filter(active=True)]))\
-            .distinct().count()
-
-        row["students_registrations"] = base_immersions_qs.filter(
-            Q(student__high_school_student_record__level__in=post_bachelor_levels) |
-            Q(student__student_record__level__in=[s.id for s in StudentLevel.objects.filter(active=True)]))\
-            .count()
-
         response['data'].append(row.copy())
 
     return JsonResponse(response, safe=False)
 
 
+@query_budget(45)
 @groups_required("REF-ETAB", "REF-ETAB-MAITRE", "REF-TEC", "REF-LYC", "REF-STR")
 def get_registration_charts_by_population(request):
     """
@@ -698,7 +636,7 @@ def get_registration_charts_by_population(request):
         int(highschool_id)
         # Filter by the selected high school students
         high_school_user_filters['high_school_student_record__highschool__id'] = highschool_id
-        immersions_filter['student__high_school_student_record__highschool__id'] = highschool_id
+        immersions_filter['highschool__id'] = highschool_id
     except (TypeError, ValueError):
         pass
 
@@ -782,13 +720,8 @@ def get_registration_charts_by_population(request):
             'visitor_record')\
         .all()
 
-    immersions_queryset = Immersion.objects \
-        .prefetch_related(
-            'student__high_school_student_record__level',
-            'student__student_record__level',
-            'student__visitor_record',
-            'slot__course') \
-        .all()
+    # Courses slots only
+    immersions_queryset = ImmersionFact.objects.filter(course__isnull=False)
 
     if level_value == 0:
         levels = list(HighSchoolLevel.objects.filter(active=True).order_by('order'))
@@ -806,17 +739,14 @@ def get_registration_charts_by_population(request):
         if level == 'visitors':
             level_label = gettext("Visitors")
             users = user_queryset.filter(visitor_record__validation=2)
-            immersions = immersions_queryset.filter(student__visitor_record__validation=2)
+            immersions = immersions_queryset.filter(population=ImmersionFact.VISITOR, validated=True)
         elif not level.is_post_bachelor:
             level_label = level.label
             users = user_queryset.filter(
                 high_school_student_record__level=level.pk,
                 high_school_student_record__validation=2
             )
-            immersions = immersions_queryset.filter(
-                student__high_school_student_record__level=level.pk,
-                student__high_school_student_record__validation=2
-            )
+            immersions = immersions_queryset.filter(level=level.pk, validated=True)
         else: # post bachelor levels : highschool and higher education institutions levels
             level_label = level.label
             users = user_queryset.filter(
@@ -825,25 +755,17 @@ def get_registration_charts_by_population(request):
                 Q(student_record__level__isnull=False)
             )
             immersions = immersions_queryset.filter(
-                Q(student__high_school_student_record__level__is_post_bachelor=True,
-                  student__high_school_student_record__validation=2) |
-                Q(student__student_record__level__isnull=False)
+                Q(level__is_post_bachelor=True, validated=True) | Q(student_level__isnull=False)
             )
 
         # Attended to 1 at least immersion
-        datasets[0][level_label] = immersions.filter(
-            attendance_status=1,
-            slot__course__isnull=False,
-            **immersions_filter)\
+        datasets[0][level_label] = immersions.filter(attended=True, **immersions_filter)\
             .values('student')\
             .distinct()\
             .count()
 
         # Registered to one immersion
-        datasets[1][level_label] = immersions.filter(
-            cancellation_type__isnull=True,
-            slot__course__isnull=False,
-            **immersions_filter)\
+        datasets[1][level_label] = immersions.filter(cancelled=False, **immersions_filter)\
             .values('student')\
             .distinct()\
             .count()
@@ -856,25 +778,31 @@ def get_registration_charts_by_population(request):
         one_immersion_attendance_pupils_counts = []
         one_immersion_registration_pupils_counts = []
         all_registrations_pupils_counts = []
+        highschools_ids = list(HighSchool.agreed.values_list('id', flat=True))
 
-        for hs in HighSchool.agreed.all():
-            qs = Immersion.objects.filter(
-                slot__course__isnull=False,
-                student__high_school_student_record__highschool=hs,
-                student__high_school_student_record__validation=2
-            )
-
-            one_immersion_attendance_pupils_counts.append(
-                qs.filter(attendance_status=1).values('student').distinct().count()
-            )
+        highschools_counts = {
+            hs_counts['highschool']: hs_counts
+            for hs_counts in ImmersionFact.objects
+                .filter(course__isnull=False, highschool__in=highschools_ids, validated=True)
+                .values('highschool')
+                .annotate(
+                    attended=Count('student', distinct=True, filter=Q(attended=True)),
+                    registered=Count('student', distinct=True),
+                )
+        }
 
-            one_immersion_registration_pupils_counts.append(
-                qs.values('student').distinct().count()
-            )
+        highschools_records = dict(
+            HighSchoolStudentRecord.objects
+                .filter(highschool__in=highschools_ids, validation=2)
+                .values_list('highschool')
+                .annotate(cnt=Count('id'))
+        )
 
-            all_registrations_pupils_counts.append(
-                HighSchoolStudentRecord.objects.filter(highschool=hs, validation=2).count()
-            )
+        for hs_id in highschools_ids:
+            hs_counts = highschools_counts.get(hs_id, {})
+            one_immersion_attendance_pupils_counts.append(hs_counts.get('attended', 0))
+            one_immersion_registration_pupils_counts.append(hs_counts.get('registered', 0))
+            all_registrations_pupils_counts.append(highschools_records.get(hs_id, 0))
 
         median = parse_median(one_immersion_attendance_pupils_counts)
         if median is not None:
@@ -926,20 +854,20 @@ def get_registration_charts_by_trainings(request):
         highschool_id = user.highschool.id
 
     if highschool_id == "all":
-        immersions_filter['slot__course__highschool__isnull'] = False
+        immersions_filter['course_highschool__isnull'] = False
     else:
         try:
             int(highschool_id)
-            immersions_filter['slot__course__highschool__id'] = highschool_id
+            immersions_filter['course_highschool__id'] = highschool_id
         except (TypeError, ValueError):
             pass
 
     if user.is_high_school_manager():
-        immersions_filter['slot__course__highschool__id'] = highschool_id
+        immersions_filter['course_highschool__id'] = highschool_id
     elif user.is_establishment_manager():
-        immersions_filter['slot__course__structure__in'] = allowed_structures
+        immersions_filter['structure__in'] = allowed_structures
     elif user.is_structure_manager() and structure and structure in allowed_structures:
-        immersions_filter['slot__course__structure__id'] = structure_id
+        immersions_filter['structure__id'] = structure_id
 
     if level_value != "visitors":
         try:
@@ -1020,13 +948,8 @@ def get_registration_charts_by_trainings(request):
             'visitor_record')\
         .all()
 
-    immersions_queryset = Immersion.objects \
-        .prefetch_related(
-            'student__high_school_student_record__level',
-            'student__student_record__level',
-            'student__visitor_record',
-            'slot__course') \
-        .all()
+    # Courses slots only
+    immersions_queryset = ImmersionFact.objects.filter(course__isnull=False)
 
     if level_value == 0:
         levels = list(HighSchoolLevel.objects.filter(active=True).order_by('order')) + ['visitors']
@@ -1040,17 +963,14 @@ def get_registration_charts_by_trainings(request):
         if level == 'visitors':
             level_label = gettext("Visitors")
             users = user_queryset.filter(visitor_record__validation=2)
-            immersions = immersions_queryset.filter(student__visitor_record__validation=2)
+            immersions = immersions_queryset.filter(population=ImmersionFact.VISITOR, validated=True)
         elif not level.is_post_bachelor:
             level_label = level.label
             users = user_queryset.filter(
                 high_school_student_record__validation=2,
                 high_school_student_record__level=level.pk
             )
-            immersions = immersions_queryset.filter(
-                student__high_school_student_record__level=level.pk,
-                student__high_school_student_record__validation=2
-            )
+            immersions = immersions_queryset.filter(level=level.pk, validated=True)
         else: # post bachelor levels : highschool and higher education institutions levels
             level_label = level.label
             users = user_queryset.filter(
@@ -1059,24 +979,16 @@ def get_registration_charts_by_trainings(request):
                 Q(student_record__level__isnull=False)
             )
             immersions = immersions_queryset.filter(
-                Q(student__high_school_student_record__level__is_post_bachelor=True,
-                  student__high_school_student_record__validation=2) |
-                Q(student__student_record__level__isnull=False)
+                Q(level__is_post_bachelor=True, validated=True) | Q(student_level__isnull=False)
             )
         # Attended to 1 at least immersion
-        datasets[0][level_label] = immersions.filter(
-            attendance_status=1,
-            slot__course__isnull=False,
-            **immersions_filter)\
+        datasets[0][level_label] = immersions.filter(attended=True, **immersions_filter)\
             .values('student')\
             .distinct()\
             .count()
 
         # Registered to one immersion
-        datasets[1][level_label] = immersions.filter(
-            cancellation_type__isnull=True,
-            slot__course__isnull=False,
-            **immersions_filter)\
+        datasets[1][level_label] = immersions.filter(cancelled=False, **immersions_filter)\
             .values('student')\
             .distinct()\
             .count()
@@ -1089,23 +1001,21 @@ def get_registration_charts_by_trainings(request):
         # =======================================================
         # Attended to at least 1 immersion median
         # =======================================================
-        establishment_structures = Structure.objects.filter(establishment=structure.establishment).distinct()
-
         one_immersion_attendance_students_counts = []
         one_immersion_registration_students_counts = []
 
-        for establishment_structure in establishment_structures:
-            qs = Immersion.objects.filter(
-                slot__course__structure=establishment_structure
+        # Structures with at least one immersion
+        structures_counts = ImmersionFact.objects\
+            .filter(structure__establishment=structure.establishment)\
+            .values('structure')\
+            .annotate(
+                attended=Count('student', distinct=True, filter=Q(attended=True)),
+                registered=Count('student', distinct=True),
             )
-            if qs.count():
-                one_immersion_attendance_students_counts.append(
-                    qs.filter(attendance_status=1).values('student').distinct().count()
-                )
 
-                one_immersion_registration_students_counts.append(
-                    qs.values('student').distinct().count()
-                )
+        for structure_counts in structures_counts:
+            one_immersion_attendance_students_counts.append(structure_counts['attended'])
+            one_immersion_registration_students_counts.append(structure_counts['registered'])
 
         median = parse_median(one_immersion_attendance_students_counts)
         if median is not None:
@@ -1172,14 +1082,13 @@ def get_registration_charts_cats_by_trainings(request):
 
     # Filter on highschools, higher education institutions or structures
     if _highschools_ids:
-        immersions_filter["slot__course__highschool__in"] = _highschools_ids
+        immersions_filter["course_highschool__in"] = _highschools_ids
 
     if _structures_ids:
-        immersions_filter["slot__course__structures__in"] = _structures_ids
+        immersions_filter["structure__in"] = _structures_ids
 
     if _higher_institutions_ids:
-        structures = Structure.objects.filter(establishment__in=_higher_institutions_ids)
-        immersions_filter["slot__course__structure__in"] = structures
+        immersions_filter["establishment__in"] = _higher_institutions_ids
 
 
     # We need data for 2 or 3 graphs (3 if filter_by_my_trainings is False)
@@ -1226,14 +1135,11 @@ def get_registration_charts_cats_by_trainings(request):
         'attended_one': [],
     }
 
-    immersions_queryset = Immersion.objects.prefetch_related(
-        'student__high_school_record__level', 'student__student_record__level', 'student__visitor_record',
-        'slot__course__training__structure'
-    )
+    immersions_queryset = ImmersionFact.objects.all()
 
     # High schools
     for highschool in HighSchool.objects.filter(id__in=_highschools_ids):
-        hs_immersions = immersions_queryset.filter(slot__course__highschool=highschool)
+        hs_immersions = immersions_queryset.filter(course_highschool=highschool)
 
         dataset_one_immersion = { 'name': highschool.label, 'none': 0 }
         dataset_attended_one = { 'name': highschool.label, 'none': 0 }
@@ -1241,34 +1147,26 @@ def get_registration_charts_cats_by_trainings(request):
         for level in levels:
             if level == 'visitors':
                 level_label = gettext("Visitors")
-                immersions = hs_immersions.filter(
-                    student__visitor_record__isnull=False,
-                    student__visitor_record__validation=2
-                )
+                immersions = hs_immersions.filter(population=ImmersionFact.VISITOR, validated=True)
             elif not level.is_post_bachelor:
                 level_label = level.label
-                immersions = hs_immersions.filter(
-                    student__high_school_student_record__level=level,
-                    student__high_school_student_record__validation=2
-                )
+                immersions = hs_immersions.filter(level=level, validated=True)
             else: # is_post_bachelor : highschool and higher education institutions levels
                 level_label = level.label
 
                 # Filter by trainings of this high school : postbac pupils + students
                 immersions = hs_immersions.filter(
-                    Q(student__high_school_student_record__level=level,
-                      student__high_school_student_record__validation=2) |
-                    Q(student__student_record__level__in=StudentLevel.objects.all())
+                    Q(level=level, validated=True) | Q(student_level__isnull=False)
                 )
 
             dataset_one_immersion[level_label] = immersions\
-                .filter(cancellation_type__isnull=True)\
+                .filter(cancelled=False)\
                 .values('student')\
                 .distinct()\
                 .count()
 
             dataset_attended_one[level_label] = immersions\
-                .filter(attendance_status=1)\
+                .filter(attended=True)\
                 .values('student')\
                 .distinct()\
                 .count()
@@ -1278,8 +1176,7 @@ def get_registration_charts_cats_by_trainings(request):
 
     # Higher institutions
     for establishment_id in _higher_institutions_ids:
-        structures = Structure.objects.filter(establishment__id=establishment_id)
-        estab_immersions = immersions_queryset.filter(slot__course__structure__in=structures)
+        estab_immersions = immersions_queryset.filter(establishment__id=establishment_id)
 
         try:
             establishment = Establishment.objects.get(pk=establishment_id)
@@ -1293,35 +1190,26 @@ def get_registration_charts_cats_by_trainings(request):
         for level in levels:
             if level == 'visitors':
                 level_label = gettext("Visitors")
-                immersions = estab_immersions.filter(
-                    student__visitor_record__isnull=False,
-                    student__visitor_record__validation=2
-                )
+                immersions = estab_immersions.filter(population=ImmersionFact.VISITOR, validated=True)
             elif not level.is_post_bachelor:
                 level_label = level.label
-                immersions = estab_immersions.filter(
-                    student__high_school_student_record__level=level,
-                    student__high_school_student_record__validation=2
-                )
+                immersions = estab_immersions.filter(level=level, validated=True)
             else:  # post bachelor levels : include students
                 level_label = level.label
                 immersions = estab_immersions.filter(
-                    Q(student__student_record__isnull=False)
-                    | Q(student__high_school_student_record__validation=2,
-                        student__high_school_student_record__level__in=HighSchoolLevel.objects.filter(
-                            is_post_bachelor=True))
+                    Q(population=ImmersionFact.STUDENT) | Q(validated=True, level__is_post_bachelor=True)
                 )
 
             # registered to at least 1 immersion
             dataset_one_immersion[level_label] = immersions\
-                .filter(cancellation_type__isnull=True) \
+                .filter(cancelled=False) \
                 .values('student') \
                 .distinct()\
                 .count()
 
             # attended to 1 immersion
             dataset_attended_one[level_label] = immersions\
-                .filter(attendance_status=1)\
+                .filter(attended=True)\
                 .values('student')\
                 .distinct()\
                 .count()
@@ -1331,7 +1219,7 @@ def get_registration_charts_cats_by_trainings(request):
 
     # Structures when filtering on my trainings
     for structure_id in _structures_ids:
-        strs_immersions = immersions_queryset.filter(slot__course__structure__id=structure_id)
+        strs_immersions = immersions_queryset.filter(structure__id=structure_id)
 
         try:
             structure = Structure.objects.get(pk=structure_id)
@@ -1345,34 +1233,26 @@ def get_registration_charts_cats_by_trainings(request):
         for level in levels:
             if level == 'visitors':
                 level_label = gettext("Visitors")
-                immersions = strs_immersions.filter(
-                    student__visitor_record__isnull=False,
-                    student__visitor_record__validation=2
-                )
+                immersions = strs_immersions.filter(population=ImmersionFact.VISITOR, validated=True)
             elif not level.is_post_bachelor:
                 level_label = level.label
-                immersions = strs_immersions.filter(
-                    student__high_school_student_record__level=level,
-                    student__high_school_student_record__validation=2
-                )
+                immersions = strs_immersions.filter(level=level, validated=True)
             else:  # post bachelor levels : include students
                 level_label = level.label
                 immersions = strs_immersions.filter(
-                    Q(student__student_record__isnull=False)
-                    | Q(student__high_school_student_record__validation=2,
-                        student__high_school_student_record__level__in=HighSchoolLevel.objects.filter(is_post_bachelor=True))
+                    Q(population=ImmersionFact.STUDENT) | Q(validated=True, level__is_post_bachelor=True)
                 )
 
             # registered to at least 1 immersion
             dataset_one_immersion[level_label] = immersions\
-                .filter(cancellation_type__isnull=True)\
+                .filter(cancelled=False)\
                 .values('student')\
                 .distinct()\
                 .count()
 
             # attended to 1 immersion
             dataset_attended_one[level_label] = immersions\
-                .filter(attendance_status=1)\
+                .filter(attended=True)\
                 .values('student')\
                 .distinct()\
                 .count()
@@ -1451,10 +1331,10 @@ def get_registration_charts_cats_by_population(request):
 
     # Filter on highschools, higher education institutions or structures
     if _highschools_ids:
-        immersions_filter["student__high_school_student_record__highschool__id__in"] = _highschools_ids
+        immersions_filter["highschool__id__in"] = _highschools_ids
 
     if _higher_institutions_ids:
-        immersions_filter["student__student_record__uai_code__in"] = _higher_institutions_ids
+        immersions_filter["uai_code__in"] = _higher_institutions_ids
 
     # We need data for 2 or 3 graphs (3 if filter_by_my_trainings is False)
     # Axes are common, just make sure we always use 'name' as attribute name for category
@@ -1504,17 +1384,11 @@ def get_registration_charts_cats_by_population(request):
     users_queryset = ImmersionUser.objects.prefetch_related(
         "high_school_student_record__highschool", "student_record", "visitor_record").all()
 
-    immersions_queryset = Immersion.objects.prefetch_related(
-        'student__high_school_record__level', 'student__student_record__level', 'student__visitor_record',
-        'slot__course__training__structure'
-    )
+    immersions_queryset = ImmersionFact.objects.all()
 
     # High schools
     for highschool in HighSchool.objects.filter(id__in=_highschools_ids):
-        hs_immersions = immersions_queryset.filter(
-            student__high_school_student_record__highschool=highschool,
-            student__high_school_student_record__validation = 2
-        )
+        hs_immersions = immersions_queryset.filter(highschool=highschool, validated=True)
 
         dataset_platform_regs = { 'name': highschool.label, 'none': 0 }
         dataset_one_immersion = { 'name': highschool.label, 'none': 0 }
@@ -1525,9 +1399,7 @@ def get_registration_charts_cats_by_population(request):
                 continue
             else:
                 level_label = level.label
-                immersions = hs_immersions.filter(
-                    student__high_school_student_record__level=level
-                )
+                immersions = hs_immersions.filter(level=level)
                 users = users_queryset.filter(
                     high_school_student_record__highschool = highschool,
                     high_school_student_record__level = level,
@@ -1536,13 +1408,13 @@ def get_registration_charts_cats_by_population(request):
             dataset_platform_regs[level_label] = users.count()  # plaform
 
             dataset_one_immersion[level_label] = immersions\
-                .filter(cancellation_type__isnull=True)\
+                .filter(cancelled=False)\
                 .values('student')\
                 .distinct()\
                 .count()
 
             dataset_attended_one[level_label] = immersions\
-                .filter(attendance_status=1)\
+                .filter(attended=True)\
                 .values('student')\
                 .distinct()\
                 .count()
@@ -1554,7 +1426,7 @@ def get_registration_charts_cats_by_population(request):
     # Higher institutions
     for uai_code in _higher_institutions_ids:
         hii_qs = users_queryset.filter(student_record__uai_code=uai_code)
-        hii_immersions = immersions_queryset.filter(student__student_record__uai_code=uai_code)
+        hii_immersions = immersions_queryset.filter(uai_code=uai_code)
 
         try:
             hei = HigherEducationInstitution.objects.get(pk=uai_code)
@@ -1573,14 +1445,14 @@ def get_registration_charts_cats_by_population(request):
 
         # registered to at least one immersion
         dataset_one_immersion[level_label] = hii_immersions\
-            .filter(cancellation_type__isnull=True)\
+            .filter(cancelled=False)\
             .values('student')\
             .distinct()\
             .count()
 
         # attended to 1 immersion
         dataset_attended_one[level_label] = hii_immersions\
-            .filter(attendance_status=1) \
+            .filter(attended=True) \
             .values('student') \
             .distinct()\
             .count()
@@ -0,0 +1,101 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+VALIDATED = 2
+
+LOOKUPS = {
+    'immersion_id': 'pk',
+    'student_id': 'student',
+    'period_id': 'slot__period',
+    'course_id': 'slot__course',
+    'training_id': 'slot__course__training',
+    'subdomain_id': 'slot__course__training__training_subdomains',
+    'domain_id': 'slot__course__training__training_subdomains__training_domain',
+    'structure_id': 'slot__course__structure',
+    'establishment_id': 'slot__course__structure__establishment',
+    'course_highschool_id': 'slot__course__highschool',
+    'highschool_id': 'student__high_school_student_record__highschool',
+    'level_id': 'student__high_school_student_record__level',
+    'student_level_id': 'student__student_record__level',
+    'uai_code': 'student__student_record__uai_code',
+}
+
+
+def fill_immersion_facts(apps, schema_editor):
+    Immersion = apps.get_model('core', 'Immersion')
+    ImmersionFact = apps.get_model('charts', 'ImmersionFact')
+
+    rows = Immersion.objects.order_by().values_list(
+        *LOOKUPS.values(),
+        'student__high_school_student_record__validation',
+        'student__student_record__validation',
+        'student__visitor_record__validation',
+        'cancellation_type',
+        'attendance_status',
+    )
+    facts = []
+
+    for row in rows.iterator(chunk_size=5000):
+        fields = dict(zip(LOOKUPS.keys(), row))
+        validations = row[len(LOOKUPS):len(LOOKUPS) + 3]
+
+        # Population : pupil, student or visitor record
+        for population, validation in enumerate(validations):
+            if validation is not None:
+                fields['population'] = population
+                fields['validated'] = validation == VALIDATED
+                break
+
+        facts.append(ImmersionFact(**fields, cancelled=row[-2] is not None, attended=row[-1] == 1))
+
+        if len(facts) == 5000:
+            ImmersionFact.objects.bulk_create(facts)
+            facts = []
+
+    ImmersionFact.objects.bulk_create(facts)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('core', '0294_slow_requests'),
+        ('immersion', '0053_alter_highschoolstudentrecorddocument_validity_date'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImmersionFact',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('population', models.SmallIntegerField(blank=True, choices=[(0, 'High school pupil'), (1, 'Student'), (2, 'Visitor')], null=True, verbose_name='Population')),
+                ('uai_code', models.CharField(blank=True, max_length=256, null=True, verbose_name='Home institution code')),
+                ('validated', models.BooleanField(default=False, verbose_name='Validated record')),
+                ('cancelled', models.BooleanField(default=False, verbose_name='Cancelled')),
+                ('attended', models.BooleanField(default=False, verbose_name='Attended')),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.course')),
+                ('course_highschool', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.highschool')),
+                ('domain', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.trainingdomain')),
+                ('establishment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.establishment')),
+                ('highschool', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.highschool')),
+                ('immersion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='charts_facts', to='core.immersion')),
+                ('level', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.highschoollevel')),
+                ('period', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.period')),
+                ('structure', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.structure')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('student_level', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.studentlevel')),
+                ('subdomain', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.trainingsubdomain')),
+                ('training', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.training')),
+            ],
+            options={
+                'verbose_name': 'Immersion fact',
+                'verbose_name_plural': 'Immersions facts',
+            },
+        ),
+        migrations.RunPython(fill_immersion_facts, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,257 @@
+"""
+Charts data mart : the charts aggregate these denormalized immersions facts instead of joining
+immersion -> slot -> course -> training -> subdomains -> domain and student -> record -> high school / level
+"""
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils.translation import gettext_lazy as _
+
+from immersionlyceens.apps.core.models import (
+    Course, Establishment, HighSchool, HighSchoolLevel, Immersion, ImmersionUser, Period, Slot, Structure,
+    StudentLevel, Training, TrainingDomain, TrainingSubdomain,
+)
+from immersionlyceens.apps.core.signals import immersions_cancelled
+from immersionlyceens.apps.immersion.models import (
+    HighSchoolStudentRecord, StudentRecord, VisitorRecord, record_person_id,
+)
+
+
+class ImmersionFact(models.Model):
+    """
+    One row per immersion and training subdomain : a single row with empty subdomain and domain if
+    the training has no subdomain or if the slot is an off offer event.
+    Kept up to date by the signals below, see the rebuild_charts_facts command for a full rebuild
+    """
+    PUPIL = 0
+    STUDENT = 1
+    VISITOR = 2
+
+    POPULATIONS = [
+        (PUPIL, _('High school pupil')),
+        (STUDENT, _('Student')),
+        (VISITOR, _('Visitor')),
+    ]
+
+    # Facts fields : Immersion lookups
+    LOOKUPS = {
+        'immersion_id': 'pk',
+        'student_id': 'student',
+        'period_id': 'slot__period',
+        'course_id': 'slot__course',
+        'training_id': 'slot__course__training',
+        'subdomain_id': 'slot__course__training__training_subdomains',
+        'domain_id': 'slot__course__training__training_subdomains__training_domain',
+        'structure_id': 'slot__course__structure',
+        'establishment_id': 'slot__course__structure__establishment',
+        'course_highschool_id': 'slot__course__highschool',
+        'highschool_id': 'student__high_school_student_record__highschool',
+        'level_id': 'student__high_school_student_record__level',
+        'student_level_id': 'student__student_record__level',
+        'uai_code': 'student__student_record__uai_code',
+    }
+
+    # Used to compute the population, validated, cancelled and attended fields
+    STATUS_LOOKUPS = (
+        'student__high_school_student_record__validation',
+        'student__student_record__validation',
+        'student__visitor_record__validation',
+        'cancellation_type',
+        'attendance_status',
+    )
+
+    BATCH_SIZE = 5000
+
+    immersion = models.ForeignKey(Immersion, on_delete=models.CASCADE, related_name='charts_facts')
+    student = models.ForeignKey(ImmersionUser, on_delete=models.CASCADE, related_name='+')
+    period = models.ForeignKey(Period, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    # Course slots : the offer side
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    training = models.ForeignKey(Training, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    subdomain = models.ForeignKey(
+        TrainingSubdomain, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    domain = models.ForeignKey(TrainingDomain, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    structure = models.ForeignKey(Structure, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    establishment = models.ForeignKey(
+        Establishment, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    course_highschool = models.ForeignKey(
+        HighSchool, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+
+    # Registered person : the population side
+    population = models.SmallIntegerField(_("Population"), choices=POPULATIONS, null=True, blank=True)
+    highschool = models.ForeignKey(HighSchool, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    level = models.ForeignKey(HighSchoolLevel, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    student_level = models.ForeignKey(
+        StudentLevel, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    uai_code = models.CharField(_("Home institution code"), max_length=256, null=True, blank=True)
+    validated = models.BooleanField(_("Validated record"), default=False)
+
+    cancelled = models.BooleanField(_("Cancelled"), default=False)
+    attended = models.BooleanField(_("Attended"), default=False)
+
+    @staticmethod
+    def get_record_fields(record):
+        """
+        :return: population side fields of a record owner facts
+        """
+        if isinstance(record, HighSchoolStudentRecord):
+            population = ImmersionFact.PUPIL
+        elif isinstance(record, StudentRecord):
+            population = ImmersionFact.STUDENT
+        else:
+            population = ImmersionFact.VISITOR
+
+        return {
+            'population': population,
+            'highschool_id': record.highschool_id if population == ImmersionFact.PUPIL else None,
+            'level_id': record.level_id if population == ImmersionFact.PUPIL else None,
+            'student_level_id': record.level_id if population == ImmersionFact.STUDENT else None,
+            'uai_code': record.uai_code if population == ImmersionFact.STUDENT else None,
+            'validated': record.validation == record.VALIDATED,
+        }
+
+    @classmethod
+    def get_facts(cls, immersions):
+        """
+        :param immersions: Immersion queryset
+        :return: generator of the (unsaved) facts of the immersions
+        """
+        rows = immersions.order_by().values_list(*cls.LOOKUPS.values(), *cls.STATUS_LOOKUPS)
+
+        for row in rows.iterator(chunk_size=cls.BATCH_SIZE):
+            fields = dict(zip(cls.LOOKUPS.keys(), row))
+            hs_validation, student_validation, visitor_validation, cancellation_type_id, attendance_status = (
+                row[len(cls.LOOKUPS):]
+            )
+
+            # A person has a single record
+            if hs_validation is not None:
+                fields['population'] = cls.PUPIL
+                fields['validated'] = hs_validation == HighSchoolStudentRecord.VALIDATED
+            elif student_validation is not None:
+                fields['population'] = cls.STUDENT
+                fields['validated'] = student_validation == StudentRecord.VALIDATED
+            elif visitor_validation is not None:
+                fields['population'] = cls.VISITOR
+                fields['validated'] = visitor_validation == VisitorRecord.VALIDATED
+
+            yield cls(**fields, cancelled=cancellation_type_id is not None, attended=attendance_status == 1)
+
+    @classmethod
+    def create_facts(cls, immersions):
+        """
+        Bulk insert the facts of the immersions, by batches
+        :return: number of created facts
+        """
+        created = 0
+        batch = []
+
+        for fact in cls.get_facts(immersions):
+            batch.append(fact)
+
+            if len(batch) == cls.BATCH_SIZE:
+                created += len(cls.objects.bulk_create(batch))
+                batch = []
+
+        if batch:
+            created += len(cls.objects.bulk_create(batch))
+
+        return created
+
+    @classmethod
+    def refresh(cls, immersions):
+        """
+        Replace the facts of the immersions
+        :param immersions: Immersion queryset
+        """
+        with transaction.atomic():
+            cls.objects.filter(immersion__in=immersions.values('pk')).delete()
+            cls.create_facts(immersions)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute all the facts
+        :return: number of facts
+        """
+        with transaction.atomic():
+            cls.objects.all().delete()
+            return cls.create_facts(Immersion.objects.all())
+
+    def __str__(self):
+        return f"{self.immersion_id} - {self.subdomain_id}"
+
+    class Meta:
+        verbose_name = _('Immersion fact')
+        verbose_name_plural = _('Immersions facts')
+
+
+####### SIGNALS #########
+def refresh_facts_on_immersion_change(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        ImmersionFact.refresh(Immersion.objects.filter(pk=instance.pk))
+
+def update_facts_on_immersions_cancel(sender, immersions, **kwargs):
+    ImmersionFact.objects\
+        .filter(immersion__in=[immersion.pk for immersion in immersions])\
+        .update(cancelled=True)
+
+def refresh_facts_on_slot_change(sender, instance, created, raw=False, **kwargs):
+    # Course or period change
+    if not raw and not created:
+        ImmersionFact.refresh(Immersion.objects.filter(slot=instance))
+
+def refresh_facts_on_course_change(sender, instance, created, raw=False, **kwargs):
+    # Training, structure or high school change
+    if not raw and not created:
+        ImmersionFact.refresh(Immersion.objects.filter(slot__course=instance))
+
+def refresh_facts_on_training_subdomains_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        trainings_ids = [instance.pk]
+    elif pk_set is not None:
+        trainings_ids = pk_set
+    else:
+        # Subdomain cleared from all its trainings
+        trainings_ids = ImmersionFact.objects.filter(subdomain=instance).values('training')
+
+    ImmersionFact.refresh(Immersion.objects.filter(slot__course__training__in=trainings_ids))
+
+def update_facts_on_subdomain_change(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        ImmersionFact.objects.filter(subdomain=instance).update(domain=instance.training_domain_id)
+
+def update_facts_on_structure_change(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        ImmersionFact.objects.filter(structure=instance).update(establishment=instance.establishment_id)
+
+def update_facts_on_record_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ImmersionFact.objects\
+            .filter(student_id=record_person_id(instance))\
+            .update(**ImmersionFact.get_record_fields(instance))
+
+def update_facts_on_record_delete(sender, instance, **kwargs):
+    # Update only : the person immersions may be deleted in the same cascade
+    ImmersionFact.objects.filter(student_id=record_person_id(instance)).update(
+        population=None, highschool=None, level=None, student_level=None, uai_code=None, validated=False
+    )
+
+post_save.connect(refresh_facts_on_immersion_change, sender=Immersion)
+immersions_cancelled.connect(update_facts_on_immersions_cancel, sender=Immersion)
+post_save.connect(refresh_facts_on_slot_change, sender=Slot)
+post_save.connect(refresh_facts_on_course_change, sender=Course)
+m2m_changed.connect(refresh_facts_on_training_subdomains_change, sender=Training.training_subdomains.through)
+post_save.connect(update_facts_on_subdomain_change, sender=TrainingSubdomain)
+post_save.connect(update_facts_on_structure_change, sender=Structure)
+
+for model in (HighSchoolStudentRecord, StudentRecord, VisitorRecord):
+    post_save.connect(update_facts_on_record_change, sender=model)
+    post_delete.connect(update_facts_on_record_delete, sender=model)
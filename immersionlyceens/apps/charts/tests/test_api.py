@@ -14,6 +14,7 @@ from immersionlyceens.apps.core.models import (
 )
 
 from .. import api
+from ..models import ImmersionFact
 
 class ChartsAPITestCase(TestCase):
     """Tests for API"""
@@ -31,6 +32,9 @@ class ChartsAPITestCase(TestCase):
         """
         cls.factory = RequestFactory()
 
+        # Fixtures are loaded without signals : build the charts facts
+        ImmersionFact.rebuild()
+
         cls.master_establishment = Establishment.objects.filter(master=True).first()
 
         cls.ref_etab_user = get_user_model().objects.get(username='test-ref-etab')
@@ -1,13 +1,18 @@
 import logging
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from adminsortable2.admin import SortableAdminMixin
 from django import forms
 from django.conf import settings
 from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin
-from django.db.models import Case, CharField, F, JSONField, Q, Value, When
+from django.contrib.auth.models import Group
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import (
+    Case, CharField, F, JSONField, OuterRef, Prefetch, Q, Value, When,
+)
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.html import format_html, format_html_join
@@ -48,7 +53,7 @@ from .models import (
     HighSchoolLevel, History, Holiday, Immersion, ImmersionUser,
     InformationText, MailTemplate, MefStat, OffOfferEventType, Period,
     PostBachelorLevel, Profile, PublicDocument, PublicType,
-    ScheduledTask, ScheduledTaskLog, Slot, Structure, StudentLevel, Training,
+    ScheduledTask, ScheduledTaskLog, Slot, SlowRequest, Structure, StudentLevel, Training,
     TrainingDomain, TrainingSubdomain, UniversityYear, Vacation, VisitorType
 )
 
@@ -304,6 +309,29 @@ class StructureListFilter(admin.SimpleListFilter):
         else:
             return queryset
 
+class ImmersionUserChangeList(ChangeList):
+    """
+    Users changelist : everything displayed by CustomUserAdmin (and subclasses) columns
+    is loaded with the page, without per row queries
+    """
+    def get_queryset(self, request, exclude_parameters=None):
+        queryset = super().get_queryset(request, exclude_parameters)
+
+        return queryset.select_related(
+            'establishment',
+            'highschool',
+            'high_school_student_record__highschool',
+            'student_record__institution',
+            'visitor_record',
+        ).prefetch_related(
+            Prefetch('structures', queryset=Structure.objects.order_by('label')),
+        ).annotate(
+            group_names=ArraySubquery(
+                Group.objects.filter(user=OuterRef('pk')).order_by('name').values('name')
+            ),
+        )
+
+
 class CustomUserAdmin(AdminWithRequest, UserAdmin):
     form = ImmersionUserChangeForm
     add_form = ImmersionUserCreationForm
@@ -330,20 +358,46 @@ class CustomUserAdmin(AdminWithRequest, UserAdmin):
         HighschoolListFilter,
     )
 
+    # Groups that have a record
+    record_groups = {'LYC', 'ETU', 'VIS'}
+
+    def get_changelist(self, request, **kwargs):
+        return ImmersionUserChangeList
+
+    def get_group_names(self, obj):
+        """
+        User group names : annotated by the changelist, queried otherwise
+        """
+        try:
+            return obj.group_names
+        except AttributeError:
+            return list(obj.groups.order_by('name').values_list('name', flat=True))
+
+    def get_record(self, obj):
+        groups = self.get_group_names(obj)
+
+        if 'LYC' in groups:
+            return obj.get_high_school_student_record()
+        elif 'ETU' in groups:
+            return obj.get_student_record()
+        elif 'VIS' in groups:
+            return obj.get_visitor_record()
+
+        return None
+
     def get_activated_account(self, obj):
-        if not obj.is_superuser and (obj.is_high_school_student() or obj.is_student() or obj.is_visitor()):
+        if not obj.is_superuser and self.record_groups.intersection(self.get_group_names(obj)):
             return _('Yes') if obj.is_valid() else _('No')
         else:
             return ''
 
     def get_username(self, obj):
         # Display real username except for high school students using EduConnect
+        record = obj.get_high_school_student_record()
         exceptions = [
-            not obj.is_high_school_student(),
-            not obj.get_high_school_student_record(),
-            obj.get_high_school_student_record()
-                and obj.high_school_student_record.highschool
-                and not obj.high_school_student_record.highschool.uses_student_federation
+            'LYC' not in self.get_group_names(obj),
+            not record,
+            record and record.highschool and not record.highschool.uses_student_federation
         ]
 
         if any(exceptions):
@@ -352,33 +406,23 @@ class CustomUserAdmin(AdminWithRequest, UserAdmin):
         return _("<EduConnect id>")
 
     def get_edited_record(self, obj):
-        if not obj.is_superuser and (obj.is_high_school_student() or obj.is_student() or obj.is_visitor()):
-            if obj.is_high_school_student():
-                record = obj.get_high_school_student_record()
-            elif obj.is_student():
-                record = obj.get_student_record()
-            elif obj.is_visitor():
-                record = obj.get_visitor_record()
-                
+        if not obj.is_superuser and self.record_groups.intersection(self.get_group_names(obj)):
+            record = self.get_record(obj)
+
             if record:
                 if record.validation in [record.TO_COMPLETE, record.INIT]:
                     return _('No')
-                
+
                 # Validated, To validate, To revalidate, Rejected
                 return _('Yes')
-                
+
             return _('No')
         else:
             return ''
 
     def get_validated_record(self, obj):
-        if not obj.is_superuser and (obj.is_high_school_student() or obj.is_student() or obj.is_visitor()):
-            if obj.is_high_school_student():
-                record = obj.get_high_school_student_record()
-            elif obj.is_student():
-                record = obj.get_student_record()
-            elif obj.is_visitor():
-                record = obj.get_visitor_record()
+        if not obj.is_superuser and self.record_groups.intersection(self.get_group_names(obj)):
+            record = self.get_record(obj)
             return _('Yes') if record and record.is_valid() else _('No')
         else:
             return ''
@@ -387,19 +431,20 @@ class CustomUserAdmin(AdminWithRequest, UserAdmin):
         if obj.is_superuser:
             return ''
 
-        if obj.is_high_school_student():
+        groups = self.get_group_names(obj)
+        staff_groups = {'REF-STR', 'CONS-STR', 'INTER', 'REF-TEC', 'REF-ETAB-MAITRE', 'REF-ETAB', 'REF-LYC', 'SRV-JUR'}
+
+        if 'LYC' in groups:
             record = obj.get_high_school_student_record()
             if record and record.highschool:
                 return record.highschool
             else:
                 return ''
-        elif obj.is_student():
+        elif 'ETU' in groups:
             record = obj.get_student_record()
             if record and record.institution:
                 return record.institution.uai_code
-        elif obj.is_structure_manager() or obj.is_structure_consultant() or obj.is_speaker() or obj.is_operator() \
-            or obj.is_master_establishment_manager() or obj.is_establishment_manager() or obj.is_high_school_manager() \
-            or obj.is_legal_department_staff():
+        elif staff_groups.intersection(groups):
                 if obj.highschool:
                     return obj.highschool
                 elif obj.establishment:
@@ -415,13 +460,13 @@ class CustomUserAdmin(AdminWithRequest, UserAdmin):
 
     def get_structure(self, obj):
         try:
-            structures = ', '.join([s.label for s in obj.structures.all().order_by('label')])
+            structures = ', '.join([s.label for s in sorted(obj.structures.all(), key=lambda s: s.label)])
             return structures
         except AttributeError:
             return ''
 
     def get_groups_list(self, obj):
-        return [group.name for group in obj.groups.all().order_by('name')]
+        return self.get_group_names(obj)
 
     get_activated_account.short_description = _('Activated account')
     get_edited_record.short_description = _('Edited record')
@@ -2009,7 +2054,10 @@ class FaqEntryAdmin(AdminWithRequest, SortableAdminMixin, admin.ModelAdmin):
 
 class ScheduledTaskAdmin(AdminWithRequest, admin.ModelAdmin):
     form = ScheduledTaskForm
-    list_display = ('command_name', 'description', 'date', 'time', 'frequency', 'days', 'active')
+    list_display = (
+        'command_name', 'description', 'date', 'time', 'frequency', 'frequency_unit', 'days', 'active',
+        'runs', 'errors', 'duration_p50', 'duration_p95', 'duration_max', 'queries_p95',
+    )
     ordering = ('command_name', 'time', )
     list_filter = ('active', )
 
@@ -2021,6 +2069,7 @@ class ScheduledTaskAdmin(AdminWithRequest, admin.ModelAdmin):
             'date',
             'time',
             'frequency',
+            'frequency_unit',
             'monday',
             'tuesday',
             'wednesday',
@@ -2038,6 +2087,45 @@ class ScheduledTaskAdmin(AdminWithRequest, admin.ModelAdmin):
 
     days.short_description = _('Days')
 
+    def get_queryset(self, request):
+        # Metrics of the executions of the last days
+        since = timezone.now() - timedelta(days=ScheduledTaskLog.METRICS_DAYS)
+
+        return super().get_queryset(request).annotate(
+            **ScheduledTaskLog.get_metrics_annotations(prefix='logs__', since=since)
+        )
+
+    def runs(self, obj):
+        return obj.runs
+
+    def errors(self, obj):
+        return obj.errors
+
+    def duration_p50(self, obj):
+        return round(obj.duration_p50, 2) if obj.duration_p50 is not None else None
+
+    def duration_p95(self, obj):
+        return round(obj.duration_p95, 2) if obj.duration_p95 is not None else None
+
+    def duration_max(self, obj):
+        return obj.duration_max
+
+    def queries_p95(self, obj):
+        return round(obj.queries_p95) if obj.queries_p95 is not None else None
+
+    runs.short_description = _('Runs')
+    runs.admin_order_field = 'runs'
+    errors.short_description = _('Errors')
+    errors.admin_order_field = 'errors'
+    duration_p50.short_description = _('Median duration (s)')
+    duration_p50.admin_order_field = 'duration_p50'
+    duration_p95.short_description = _('95th percentile duration (s)')
+    duration_p95.admin_order_field = 'duration_p95'
+    duration_max.short_description = _('Max duration (s)')
+    duration_max.admin_order_field = 'duration_max'
+    queries_p95.short_description = _('95th percentile queries')
+    queries_p95.admin_order_field = 'queries_p95'
+
     def get_readonly_fields(self, request, obj=None):
         user = request.user
 
@@ -2048,13 +2136,16 @@ class ScheduledTaskAdmin(AdminWithRequest, admin.ModelAdmin):
 
 
 class ScheduledTaskLogAdmin(admin.ModelAdmin):
-    list_display = ('task', 'execution_date', 'success', 'format_message')
+    list_display = (
+        'task', 'execution_date', 'end_date', 'success', 'duration', 'exit_status', 'queries', 'rows',
+        'mails_sent', 'format_message'
+    )
     ordering = ('-execution_date', )
-    list_filter = ('task', 'success')
+    list_filter = ('task', 'success', 'exit_status')
     list_per_page = 25
 
     def format_message(self, obj):
-        return format_html(obj.message.replace("\n", "<br>"))
+        return format_html((obj.message or "").replace("\n", "<br>"))
 
     format_message.short_description = _('Message')
 
@@ -2071,6 +2162,39 @@ class ScheduledTaskLogAdmin(admin.ModelAdmin):
         return True
 
 
+class SlowRequestAdmin(admin.ModelAdmin):
+    list_display = (
+        'date', 'method', 'path', 'view_name', 'user', 'status_code', 'duration', 'queries', 'db_duration',
+        'template_duration', 'mail_duration', 'pdf_duration', 'external_duration',
+    )
+    list_filter = ('view_name', 'method', 'status_code')
+    ordering = ('-duration', )
+    list_per_page = 25
+    exclude = ('statements', )
+    readonly_fields = ('format_statements', )
+
+    def format_statements(self, obj):
+        return format_html_join(
+            "",
+            "<p><b>{} x, {} ms</b><br><code>{}</code></p>",
+            ((statement['executions'], statement['duration'], statement['sql']) for statement in obj.statements)
+        )
+
+    format_statements.short_description = _('Slowest SQL statements')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return request.user.is_superuser
+
+    def has_view_permission(self, request, obj=None):
+        return request.user.is_superuser or request.user.is_operator()
+
+
 class HistoryAdmin(admin.ModelAdmin):
     list_display = ('date', 'action', 'username', 'user', 'hijacked', 'ip')
     list_filter = ('action', )
@@ -2197,3 +2321,4 @@ admin.site.register(FaqEntry, FaqEntryAdmin)
 admin.site.register(ScheduledTask, ScheduledTaskAdmin)
 admin.site.register(ScheduledTaskLog, ScheduledTaskLogAdmin)
 admin.site.register(History, HistoryAdmin)
+admin.site.register(SlowRequest, SlowRequestAdmin)
@@ -2343,6 +2343,14 @@ class ScheduledTaskForm(forms.ModelForm):
         if cleaned_data.get("date") and cleaned_data.get("frequency"):
             raise forms.ValidationError(_("Date and frequency can't be both set"))
 
+        # The master cron runs every 5 minutes
+        if (
+            cleaned_data.get("frequency")
+            and cleaned_data.get("frequency_unit") == ScheduledTask.MINUTES
+            and cleaned_data["frequency"] % 5
+        ):
+            raise forms.ValidationError(_("A frequency in minutes must be a multiple of 5"))
+
         # Input format can take seconds and microseconds : force clean them
         # + force 5 min steps to avoid running master cron every minute
         if cleaned_data.get("time"):
@@ -1,21 +1,32 @@
 #!/usr/bin/env python
 """
-Delete unactivated accounts
+Annual purge : delete immersions, slots, periods and student / high school / visitor accounts,
+unpublish courses and events.
+
+Objects are deleted by batches (see core.purge.BatchDeleter) and each step progress is saved in
+AnnualPurgeCheckpoint : when interrupted, the next run resumes where the previous one stopped.
+Checkpoints belong to the active university year purge : the ones left by an unfinished purge
+of another year are deleted.
+Deletions don't send signals : the training quotas ledger is rebuilt after the immersions deletion.
 """
 import logging
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
+from django.conf import settings
 from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, F
+from django.utils import timezone
 from django.utils.translation import gettext as _
-from django.db.models import Count
 
 from . import Schedulable
 
 from ...models import (
-    Course, History, Holiday, Immersion, ImmersionUser, OffOfferEvent, Slot,
-    Period, UniversityYear, UserCourseAlert, Vacation
+    AnnualPurgeCheckpoint, ChangeLog, Course, History, Holiday, Immersion, ImmersionUser,
+    OffOfferEvent, Slot, Period, TrainingQuotaLedger, UniversityYear, UserCourseAlert, Vacation
 )
+from ...purge import BatchDeleter
 
 logger = logging.getLogger(__name__)
 
@@ -23,117 +34,154 @@ class Command(BaseCommand, Schedulable):
     """
     """
 
-    def handle(self, *args, **options):
-        today = datetime.today().date()
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help=_('Number of objects deleted per transaction (default: 1000)')
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help=_('Ignore the checkpoints of an interrupted purge')
+        )
+
+    def run_step(self, name, function):
+        """
+        Run a purge step unless it's already done according to its checkpoint
+        :param function: function(checkpoint) returning the step message
+        """
+        checkpoint, created = AnnualPurgeCheckpoint.objects.get_or_create(
+            university_year=self.university_year, step=name
+        )
+
+        if checkpoint.done:
+            logger.info("Annual purge : step '%s' already done, skipped", name)
+            return checkpoint.message
+
+        if not created:
+            logger.info("Annual purge : resuming step '%s' (%s object(s) already processed)", name, checkpoint.count)
+
+        start = time.perf_counter()
+        message = function(checkpoint)
+
+        checkpoint.duration += time.perf_counter() - start
+        checkpoint.done = True
+        checkpoint.message = message
+        checkpoint.save(update_fields=['duration', 'done', 'message'])
+
+        logger.info("Annual purge : step '%s' done in %.2fs", name, checkpoint.duration)
 
-        returns = []
+        return message
 
-        # Run annual stats first
+    def delete(self, checkpoint, queryset):
+        """
+        Delete a queryset by batches, saving the progress in the step checkpoint after each batch
+        :return: deleted objects count, including the ones deleted by an interrupted purge
+        """
+        def progress(count):
+            AnnualPurgeCheckpoint.objects.filter(pk=checkpoint.pk).update(count=F('count') + count)
+            checkpoint.count += count
+
+        self.deleter.delete(queryset, progress=progress)
+        return checkpoint.count
+
+    def annual_statistics(self, checkpoint):
         try:
             call_command('annual_statistics')
         except CommandError:
             logger.error(_("Could not finish 'annual_statistics' command, purge cancelled"))
             raise
 
-        # Delete user alerts
-        deleted = UserCourseAlert.objects.all().delete()
-        if deleted[0]:
-            returns.append(_('{} user alert(s) deleted').format(deleted[0]))
-        else:
-            returns.append(_("No user alert to delete"))
-
-        # Delete immersion
-        deleted = Immersion.objects.all().delete()
-        if deleted[0]:
-            returns.append(_('{} immersion(s) deleted').format(deleted[0]))
-        else:
-            returns.append(_("No immersion to delete"))
-
-        # Delete slot
-        deleted = Slot.objects.all().delete()
-        if deleted[0]:
-            try:
-                slots_deleted = deleted[1]["core.Slot"]
-                returns.append(_('{} slot(s) deleted').format(slots_deleted))
-            except (IndexError, KeyError):
-                returns.append(_('Slot(s) deleted'))
-        else:
-            returns.append(_("No slot to delete"))
+    def delete_user_alerts(self, checkpoint):
+        deleted = self.delete(checkpoint, UserCourseAlert.objects.all())
+        if deleted:
+            return _('{} user alert(s) deleted').format(deleted)
+        return _("No user alert to delete")
+
+    def delete_immersions(self, checkpoint):
+        deleted = self.delete(checkpoint, Immersion.objects.all())
+        TrainingQuotaLedger.rebuild()
+
+        if deleted:
+            return _('{} immersion(s) deleted').format(deleted)
+        return _("No immersion to delete")
 
+    def delete_slots(self, checkpoint):
+        deleted = self.delete(checkpoint, Slot.objects.all())
+        if deleted:
+            return _('{} slot(s) deleted').format(deleted)
+        return _("No slot to delete")
+
+    def delete_student_accounts(self, checkpoint):
         # Delete ENS, LYC, ETU ImmersionUser
-        deleted = ImmersionUser.objects.filter(
-            groups__name__in=['ETU', 'LYC', 'VIS'],
-            auth_token__isnull=True
-        ).delete()
-
-        if deleted[0]:
-            try:
-                accounts_deleted = deleted[1]["core.ImmersionUser"]
-                returns.append(_('{} student / high school / visitor account(s) deleted').format(accounts_deleted))
-            except (IndexError, KeyError):
-                returns.append(_('Student / high school / visitor account(s) deleted'))
-        else:
-            returns.append(_("No student / high school / visitor account to delete"))
-
-        # Delete periods, vacations and holidays
-        deleted = Period.objects.all().delete()
-        if deleted[0]:
-            try:
-                periods_deleted = deleted[1]["core.Period"]
-                returns.append(_('{} period(s) deleted').format(periods_deleted))
-            except (IndexError, KeyError):
-                returns.append(_('Period(s) deleted'))
-        else:
-            returns.append(_("No period to delete"))
-
-        deleted = Holiday.objects.all().delete()
-        if deleted[0]:
-            returns.append(_('{} holiday record(s) deleted').format(deleted[0]))
-        else:
-            returns.append(_("No holiday record to delete"))
-
-        deleted = Vacation.objects.all().delete()
-        if deleted[0]:
-            returns.append(_('{} vacation record(s) deleted').format(deleted[0]))
-        else:
-            returns.append(_("No vacation record to delete"))
+        deleted = self.delete(
+            checkpoint,
+            ImmersionUser.objects.filter(groups__name__in=['ETU', 'LYC', 'VIS'], auth_token__isnull=True)
+        )
+        if deleted:
+            return _('{} student / high school / visitor account(s) deleted').format(deleted)
+        return _("No student / high school / visitor account to delete")
+
+    def delete_periods(self, checkpoint):
+        deleted = self.delete(checkpoint, Period.objects.all())
+        if deleted:
+            return _('{} period(s) deleted').format(deleted)
+        return _("No period to delete")
+
+    def delete_holidays(self, checkpoint):
+        deleted = self.delete(checkpoint, Holiday.objects.all())
+        if deleted:
+            return _('{} holiday record(s) deleted').format(deleted)
+        return _("No holiday record to delete")
+
+    def delete_vacations(self, checkpoint):
+        deleted = self.delete(checkpoint, Vacation.objects.all())
+        if deleted:
+            return _('{} vacation record(s) deleted').format(deleted)
+        return _("No vacation record to delete")
 
+    def update_university_year(self, checkpoint):
         # Update purge date
+        today = datetime.today().date()
         updated = UniversityYear.objects.filter(active=True).update(purge_date=today)
         if updated == 0:
-            returns.append(_('No university year to update'))
-        else:
-            returns.append(_('University year updated'))
+            return _('No university year to update')
+        return _('University year updated')
 
+    def unpublish_courses(self, checkpoint):
+        courses = Course.objects.filter(published=True)
+        courses_ids = list(courses.values_list('id', flat=True))
+        updated = courses.update(published=False)
+        ChangeLog.log(Course, courses_ids, ChangeLog.UPDATED)
 
-        # Update course, and event publishement
-        updated = Course.objects.filter(published=True).update(published=False)
         if updated == 0:
-            returns.append(_('No course to update'))
-        else:
-            returns.append(_('{} course(s) updated').format(updated))
+            return _('No course to update')
+        return _('{} course(s) updated').format(updated)
 
+    def unpublish_events(self, checkpoint):
         updated = OffOfferEvent.objects.filter(published=True).update(published=False)
         if updated == 0:
-            returns.append(_('No event to update'))
-        else:
-            returns.append(_('{} event(s) updated').format(updated))
-
+            return _('No event to update')
+        return _('{} event(s) updated').format(updated)
 
+    def delete_inter_users(self, checkpoint):
         # delete immersion users with group INTER and in an establishment with plugin set
-        deleted = ImmersionUser.objects.annotate(cnt=Count('groups__name')).filter(
-            auth_token__isnull=True,
-            cnt=1,
-            groups__name='INTER',
-            establishment__data_source_plugin__isnull=False
-        ).delete()
-
-        if deleted[0]:
-            returns.append(_('{} user(s) with group INTER and with LDAP establishment deleted').format(deleted[0]))
-        else:
-            returns.append(_("no user with group INTER and with LDAP establishment to delete"))
-
+        deleted = self.delete(
+            checkpoint,
+            ImmersionUser.objects.annotate(cnt=Count('groups__name')).filter(
+                auth_token__isnull=True,
+                cnt=1,
+                groups__name='INTER',
+                establishment__data_source_plugin__isnull=False
+            )
+        )
+        if deleted:
+            return _('{} user(s) with group INTER and with LDAP establishment deleted').format(deleted)
+        return _("no user with group INTER and with LDAP establishment to delete")
 
+    def deactivate_inter_users(self, checkpoint):
         # Deactivate immersion user with group INTER and in an establishment without SI
         updated = ImmersionUser.objects.annotate(cnt=Count('groups__name')).filter(
             auth_token__isnull=True,
@@ -143,21 +191,78 @@ class Command(BaseCommand, Schedulable):
         ).update(is_active=False)
 
         if updated:
-            returns.append(_('{} user(s) with group INTER and with establishment without SI deactivated').format(updated))
-        else:
-            returns.append(_("no user with group INTER and with LDAP establishment to deactivate"))
+            return _('{} user(s) with group INTER and with establishment without SI deactivated').format(updated)
+        return _("no user with group INTER and with LDAP establishment to deactivate")
 
+    def delete_accounts_not_in_ldap(self, checkpoint):
         try:
             call_command('delete_account_not_in_ldap')
         except Exception as e:
-            returns.append(_("Could not finish 'delete_account_not_in_ldap' command : %s") % e)
+            return _("Could not finish 'delete_account_not_in_ldap' command : %s") % e
+
+    def clean_history(self, checkpoint):
+        self.delete(checkpoint, History.objects.all())
 
-        # Clean History
-        History.objects.all().delete()
+    def clean_change_log(self, checkpoint):
+        # Keep the recent changes (including this purge deletions) for the change feed API clients
+        deleted = self.delete(
+            checkpoint,
+            ChangeLog.objects.filter(
+                date__lt=timezone.now() - timedelta(days=settings.CHANGE_LOG_RETENTION_DAYS)
+            )
+        )
+        if deleted:
+            return _('{} change log entries deleted').format(deleted)
+        return _("No change log entry to delete")
+
+    def handle(self, *args, **options):
+        self.deleter = BatchDeleter(batch_size=options.get('batch_size') or 1000)
+
+        year = UniversityYear.get_active()
+        self.university_year = year.label if year else ''
+
+        stale_checkpoints = AnnualPurgeCheckpoint.objects.exclude(university_year=self.university_year)
+
+        if stale_checkpoints.exists():
+            logger.warning("Annual purge : checkpoints of an unfinished purge of another university year ignored")
+            stale_checkpoints.delete()
+
+        if options.get('restart'):
+            AnnualPurgeCheckpoint.objects.all().delete()
+
+        steps = [
+            # Run annual stats first
+            ('annual_statistics', self.annual_statistics),
+            ('user_alerts', self.delete_user_alerts),
+            ('immersions', self.delete_immersions),
+            ('slots', self.delete_slots),
+            ('student_accounts', self.delete_student_accounts),
+            # Delete periods, vacations and holidays
+            ('periods', self.delete_periods),
+            ('holidays', self.delete_holidays),
+            ('vacations', self.delete_vacations),
+            ('university_year', self.update_university_year),
+            # Update course, and event publishement
+            ('courses', self.unpublish_courses),
+            ('events', self.unpublish_events),
+            ('inter_users_deletion', self.delete_inter_users),
+            ('inter_users_deactivation', self.deactivate_inter_users),
+            ('accounts_not_in_ldap', self.delete_accounts_not_in_ldap),
+            # Clean History
+            ('history', self.clean_history),
+            ('change_log', self.clean_change_log),
+        ]
+
+        returns = [message for message in (self.run_step(name, function) for name, function in steps) if message]
+
+        # Purge complete
+        AnnualPurgeCheckpoint.objects.all().delete()
 
         # Log all
+        self.deleter.log_timings()
+
         for line in returns:
             logger.info(line)
 
         # Message return for scheduler logs
-        return "\n".join(returns)
\ No newline at end of file
+        return "\n".join(returns)
@@ -2,158 +2,140 @@
 """
 Update annual statistics data
 """
-import datetime
 import logging
-import sys
+from typing import Any, Dict
 
-from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
-from django.db.models import Count, Q, Sum
+from django.db.models import BooleanField, Count, ExpressionWrapper, Q, Sum
 from django.utils.translation import gettext_lazy as _
 
 from ...models import (
-    AnnualStatistics, Structure, Course, HighSchool, Immersion, ImmersionUser, Slot, Training, UniversityYear,
+    AnnualStatistics, Course, HighSchool, ImmersionUser, Slot, Training, UniversityYear,
 )
 
 logger = logging.getLogger(__name__)
 
-class Command(BaseCommand):
+def get_annual_statistics() -> Dict[str, Any]:
     """
+    Compute the AnnualStatistics values in a few aggregation passes :
+    - users : per user registrations/participations counts computed once, then summarized
+    - published course slots
+    - high schools
+    - trainings and courses
     """
-    def handle(self, *args, **options):
-        success = "%s : %s" % (_("Annual statistics"), _("success"))
-
-        try:
-            year = UniversityYear.objects.get(active=True)
-        except UniversityYear.DoesNotExist:
-            msg = _("No active year found, can't update statistics")
-            logger.error(msg)
-            raise CommandError(msg)
-
-        try:
-            annual_stats = AnnualStatistics.objects.get(year=year.label)
-        except AnnualStatistics.DoesNotExist:
-            annual_stats = AnnualStatistics.objects.create(year=year.label)
-
-        hs_queryset = HighSchool.objects\
-            .prefetch_related('student_records')\
-            .filter(convention_start_date__isnull=False, convention_end_date__isnull=False)
-
-        # Approved high schools
-        annual_stats.approved_highschools = hs_queryset.count()
-
-        # Approved high schools with no registered students
-        annual_stats.highschools_without_students = hs_queryset.filter(student_records__isnull=True).count()
+    stats = {}
+
+    # Per user counts
+    users = ImmersionUser.objects.annotate(
+        registered=ExpressionWrapper(
+            Q(student_record__isnull=False)
+            | Q(visitor_record__validation=2)
+            | Q(high_school_student_record__validation=2),
+            output_field=BooleanField()
+        ),
+        course_immersions=Count('immersions', filter=Q(immersions__slot__course__isnull=False)),
+        course_registrations=Count(
+            'immersions',
+            filter=Q(immersions__cancellation_type__isnull=True, immersions__slot__course__isnull=False)
+        ),
+        course_participations=Count(
+            'immersions',
+            filter=Q(
+                immersions__cancellation_type__isnull=True,
+                immersions__attendance_status=1,
+                immersions__slot__course__isnull=False
+            )
+        ),
+        participations=Count('immersions', filter=Q(immersions__attendance_status=1)),
+    )
 
+    users_stats = users.aggregate(
         # Total number of registered students + high school pupils
-        annual_stats.platform_registrations = ImmersionUser.objects\
-            .prefetch_related('student_record', 'high_school_student_record', 'visitor_record')\
-            .filter(
-                Q(student_record__isnull=False)
-                | Q(visitor_record__validation=2)
-                | Q(high_school_student_record__validation=2)
-            )\
-            .distinct()\
-            .count()
-
+        platform_registrations=Count('pk', filter=Q(registered=True)),
         # Number of registered students to at least one course immersion
-        annual_stats.one_immersion_registrations = ImmersionUser.objects \
-            .prefetch_related('immersions__slot__course')\
-            .filter(
-                immersions__isnull=False,
-                immersions__slot__course__isnull=False,
-                immersions__cancellation_type__isnull=True
-            )\
-            .distinct().count()
-
+        one_immersion_registrations=Count('pk', filter=Q(course_registrations__gt=0)),
         # Number of registered students to more than one immersion
-        annual_stats.multiple_immersions_registrations = ImmersionUser.objects\
-            .prefetch_related('immersions__slot__course')\
-            .annotate(
-                imm_count=Count(
-                    'immersions',
-                    filter=Q(immersions__cancellation_type__isnull=True, immersions__slot__course__isnull=False,))
-                )\
-            .filter(imm_count__gt=1).count()
-
+        multiple_immersions_registrations=Count('pk', filter=Q(course_registrations__gt=1)),
         # User with no course immersion registration
-        annual_stats.no_course_immersions_registrations = ImmersionUser.objects\
-            .prefetch_related('immersions__slot__course') \
-            .filter(
-                Q(student_record__isnull=False)
-                | Q(visitor_record__validation=2)
-                | Q(high_school_student_record__validation=2)
-            ) \
-            .annotate(
-                imm_count=Count(
-                    'immersions',
-                    filter=Q(immersions__slot__course__isnull=False))
-                )\
-            .filter(imm_count=0).count()
-
+        no_course_immersions_registrations=Count('pk', filter=Q(registered=True, course_immersions=0)),
         # Number of course immersions registrations
-        annual_stats.immersion_registrations = Immersion.objects.\
-            prefetch_related('slot__course')\
-            .filter(
-                cancellation_type__isnull=True,
-                slot__course__isnull=False,
-            ).count()
-
+        immersion_registrations=Sum('course_registrations'),
         # Number of participations to courses immersions
-        annual_stats.immersion_participations = Immersion.objects. \
-            prefetch_related('slot__course') \
-            .filter(
-                cancellation_type__isnull=True,
-                attendance_status=1,
-                slot__course__isnull=False,
-            ).count()
-
+        immersion_participations=Sum('course_participations'),
         # Number of participants in at least one immersion
-        annual_stats.participants_one_immersion = ImmersionUser.objects.filter(
-            immersions__attendance_status=1
-        ).distinct().count()
-
-        # Course immersions participations ratio
-        if annual_stats.immersion_registrations:
-            annual_stats.immersion_participation_ratio = round(
-                (annual_stats.immersion_participations / annual_stats.immersion_registrations) * 100,
-                2
-            )
-        else:
-            annual_stats.immersion_participation_ratio = 0
-
+        participants_one_immersion=Count('pk', filter=Q(participations__gt=0)),
         # Number of participants in more than one immersion
-        annual_stats.participants_multiple_immersions = ImmersionUser.objects.annotate(
-            imm_count=Count('immersions', filter=Q(immersions__attendance_status=1))).filter(
-            imm_count__gt=1).count()
-
+        participants_multiple_immersions=Count('pk', filter=Q(participations__gt=1)),
+    )
+
+    stats.update({key: value or 0 for key, value in users_stats.items()})
+
+    # Course immersions participations ratio
+    if stats['immersion_registrations']:
+        stats['immersion_participation_ratio'] = round(
+            (stats['immersion_participations'] / stats['immersion_registrations']) * 100,
+            2
+        )
+    else:
+        stats['immersion_participation_ratio'] = 0
+
+    # Published course slots
+    slots_stats = Slot.objects.filter(course__isnull=False, published=True).aggregate(
         # Structures with published slots
-        annual_stats.structures_count = Structure.objects.filter(active=True).annotate(
-            slot_nb=Count('courses__slots', filter=Q(courses__slots__published=True))) \
-            .filter(slot_nb__gt=0).count()
+        structures_count=Count(
+            'course__structure', distinct=True, filter=Q(course__structure__active=True)
+        ),
+        # Trainings with at least one slot
+        trainings_one_slot_count=Count(
+            'course__training', distinct=True, filter=Q(course__training__active=True)
+        ),
+        # Courses with at least one slot
+        courses_one_slot_count=Count('course', distinct=True),
+        # Published course slots
+        total_slots_count=Count('pk'),
+        # Number of offered seats of course slots
+        seats_count=Sum('n_places'),
+    )
 
-        # Active trainings
-        annual_stats.active_trainings_count = Training.objects.filter(active=True).count()
+    stats.update({key: value or 0 for key, value in slots_stats.items()})
 
-        # Trainings with at least one slot
-        annual_stats.trainings_one_slot_count = Training.objects.filter(active=True).annotate(
-            slot_nb=Count('courses__slots', filter=Q(courses__slots__published=True))) \
-            .filter(slot_nb__gt=0).count()
+    # Approved high schools, and approved high schools with no registered students
+    stats.update(
+        HighSchool.objects
+        .filter(convention_start_date__isnull=False, convention_end_date__isnull=False)
+        .aggregate(
+            approved_highschools=Count('pk', distinct=True),
+            highschools_without_students=Count('pk', filter=Q(student_records__isnull=True)),
+        )
+    )
 
-        # Active courses
-        annual_stats.active_courses_count = Course.objects.filter(published=True).count()
+    # Active trainings and courses
+    stats['active_trainings_count'] = Training.objects.filter(active=True).count()
+    stats['active_courses_count'] = Course.objects.filter(published=True).count()
 
-        # Courses with at least one slot
-        annual_stats.courses_one_slot_count = Course.objects.annotate(
-            slot_nb=Count('slots', filter=Q(slots__published=True))) \
-            .filter(slot_nb__gt=0).count()
+    return stats
 
-        # Published course slots
-        annual_stats.total_slots_count = Slot.objects.filter(course__isnull=False, published=True).count()
 
-        # Number of offered seats of course slots
-        annual_stats.seats_count = Slot.objects.filter(course__isnull=False, published=True).aggregate(
-            seats_count=Sum('n_places'))['seats_count'] or 0
+class Command(BaseCommand):
+    """
+    """
+    def handle(self, *args, **options):
+        success = "%s : %s" % (_("Annual statistics"), _("success"))
+
+        try:
+            year = UniversityYear.objects.get(active=True)
+        except UniversityYear.DoesNotExist:
+            msg = _("No active year found, can't update statistics")
+            logger.error(msg)
+            raise CommandError(msg)
+
+        try:
+            annual_stats = AnnualStatistics.objects.get(year=year.label)
+        except AnnualStatistics.DoesNotExist:
+            annual_stats = AnnualStatistics.objects.create(year=year.label)
+
+        for field, value in get_annual_statistics().items():
+            setattr(annual_stats, field, value)
 
         annual_stats.save()
 
@@ -27,7 +27,6 @@ class Command(BaseCommand, Schedulable):
     def handle(self, *args, **options):
         success = "%s : %s" % (_("Immersion cancellations"), _("success"))
         today = timezone.localdate()
-        now = timezone.now()
 
         try:
             slot_unsubscribe_delay = int(GeneralSettings.get_setting("AUTO_SLOT_UNSUBSCRIBE_DELAY"))
@@ -57,18 +56,18 @@ class Command(BaseCommand, Schedulable):
             ).distinct()
 
         # Cancel immersions
-        immersions = Immersion.objects.prefetch_related("slot").filter(
+        immersions = Immersion.objects.filter(
             student__in=users,
             slot__date__gte=today,
             slot__date__lte=max_unsubscribe_date,
             cancellation_type__isnull=True
         )
 
-        for immersion in immersions:
-            immersion.cancellation_type = cancellation_reason
-            immersion.cancellation_date = now
-            immersion.save()
-            immersion.student.send_message(None, 'IMMERSION_ANNUL', immersion=immersion, slot=immersion.slot)
+        cancelled, freed_seats, mail_errors = immersions.cancel(cancellation_reason)
+
+        for error in mail_errors:
+            logger.error(error)
 
         logger.info(success)
+        logger.info(_("%s immersion(s) cancelled") % len(cancelled))
         return success
\ No newline at end of file
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""
+Compare the annual statistics computation (see annual_statistics command) with the
+former one query per value implementation, on a generated dataset.
+Everything runs in a transaction that is rolled back : no data is kept.
+"""
+import datetime
+import logging
+import random
+import time
+import uuid
+from typing import Any, Dict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from django.utils.translation import gettext as _
+
+from immersionlyceens.apps.immersion.models import StudentRecord
+
+from ...models import (
+    CancelType, Course, Establishment, HighSchool, Immersion, ImmersionUser, Slot, Structure,
+    StudentLevel, Training, TrainingDomain, TrainingSubdomain,
+)
+from .annual_statistics import get_annual_statistics
+
+logger = logging.getLogger(__name__)
+
+
+def get_annual_statistics_legacy() -> Dict[str, Any]:
+    """
+    Former implementation : one query per value
+    """
+    stats = {}
+
+    hs_queryset = HighSchool.objects\
+        .prefetch_related('student_records')\
+        .filter(convention_start_date__isnull=False, convention_end_date__isnull=False)
+
+    stats['approved_highschools'] = hs_queryset.count()
+    stats['highschools_without_students'] = hs_queryset.filter(student_records__isnull=True).count()
+
+    stats['platform_registrations'] = ImmersionUser.objects\
+        .filter(
+            Q(student_record__isnull=False)
+            | Q(visitor_record__validation=2)
+            | Q(high_school_student_record__validation=2)
+        )\
+        .distinct()\
+        .count()
+
+    stats['one_immersion_registrations'] = ImmersionUser.objects \
+        .filter(
+            immersions__isnull=False,
+            immersions__slot__course__isnull=False,
+            immersions__cancellation_type__isnull=True
+        )\
+        .distinct().count()
+
+    stats['multiple_immersions_registrations'] = ImmersionUser.objects\
+        .annotate(
+            imm_count=Count(
+                'immersions',
+                filter=Q(immersions__cancellation_type__isnull=True, immersions__slot__course__isnull=False,))
+            )\
+        .filter(imm_count__gt=1).count()
+
+    stats['no_course_immersions_registrations'] = ImmersionUser.objects\
+        .filter(
+            Q(student_record__isnull=False)
+            | Q(visitor_record__validation=2)
+            | Q(high_school_student_record__validation=2)
+        ) \
+        .annotate(imm_count=Count('immersions', filter=Q(immersions__slot__course__isnull=False)))\
+        .filter(imm_count=0).count()
+
+    stats['immersion_registrations'] = Immersion.objects\
+        .filter(cancellation_type__isnull=True, slot__course__isnull=False).count()
+
+    stats['immersion_participations'] = Immersion.objects\
+        .filter(cancellation_type__isnull=True, attendance_status=1, slot__course__isnull=False).count()
+
+    stats['participants_one_immersion'] = ImmersionUser.objects.filter(
+        immersions__attendance_status=1
+    ).distinct().count()
+
+    if stats['immersion_registrations']:
+        stats['immersion_participation_ratio'] = round(
+            (stats['immersion_participations'] / stats['immersion_registrations']) * 100,
+            2
+        )
+    else:
+        stats['immersion_participation_ratio'] = 0
+
+    stats['participants_multiple_immersions'] = ImmersionUser.objects.annotate(
+        imm_count=Count('immersions', filter=Q(immersions__attendance_status=1))).filter(
+        imm_count__gt=1).count()
+
+    stats['structures_count'] = Structure.objects.filter(active=True).annotate(
+        slot_nb=Count('courses__slots', filter=Q(courses__slots__published=True))) \
+        .filter(slot_nb__gt=0).count()
+
+    stats['active_trainings_count'] = Training.objects.filter(active=True).count()
+
+    stats['trainings_one_slot_count'] = Training.objects.filter(active=True).annotate(
+        slot_nb=Count('courses__slots', filter=Q(courses__slots__published=True))) \
+        .filter(slot_nb__gt=0).count()
+
+    stats['active_courses_count'] = Course.objects.filter(published=True).count()
+
+    stats['courses_one_slot_count'] = Course.objects.annotate(
+        slot_nb=Count('slots', filter=Q(slots__published=True))) \
+        .filter(slot_nb__gt=0).count()
+
+    stats['total_slots_count'] = Slot.objects.filter(course__isnull=False, published=True).count()
+
+    stats['seats_count'] = Slot.objects.filter(course__isnull=False, published=True).aggregate(
+        seats_count=Sum('n_places'))['seats_count'] or 0
+
+    return stats
+
+
+class Command(BaseCommand):
+    """
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20000, help=_('Generated users (default: 20000)'))
+        parser.add_argument('--courses', type=int, default=300, help=_('Generated courses (default: 300)'))
+        parser.add_argument(
+            '--slots-per-course', type=int, default=10, help=_('Generated slots per course (default: 10)')
+        )
+        parser.add_argument(
+            '--immersions-per-user',
+            type=int,
+            default=3,
+            help=_('Maximum generated immersions per user (default: 3)'),
+        )
+
+    def generate_dataset(self, options):
+        rand = random.Random(0)
+        prefix = uuid.uuid4().hex[:8]
+        establishment = Establishment.objects.first()
+        level = StudentLevel.objects.first()
+        cancel_type = CancelType.objects.first()
+
+        if not establishment:
+            raise CommandError(_("At least one establishment is required"))
+
+        structure = Structure.objects.create(code=prefix, label=prefix, establishment=establishment)
+        domain = TrainingDomain.objects.create(label=f"bench {prefix}")
+        subdomain = TrainingSubdomain.objects.create(label=f"bench {prefix}", training_domain=domain)
+        training = Training.objects.create(label=f"bench {prefix}")
+        training.training_subdomains.add(subdomain)
+        training.structures.add(structure)
+
+        courses = Course.objects.bulk_create([
+            Course(label=f"bench {prefix} {i}", training=training, structure=structure)
+            for i in range(options["courses"])
+        ])
+
+        today = datetime.date.today()
+        slots = Slot.objects.bulk_create([
+            Slot(
+                course=course,
+                date=today + datetime.timedelta(days=i),
+                n_places=rand.randint(5, 30),
+                published=rand.random() < 0.9,
+            )
+            for course in courses for i in range(options["slots_per_course"])
+        ])
+
+        users = ImmersionUser.objects.bulk_create([
+            ImmersionUser(username=f"bench_{prefix}_{i}", email=f"bench_{prefix}_{i}@domain.tld")
+            for i in range(options["users"])
+        ])
+
+        if level:
+            StudentRecord.objects.bulk_create([
+                StudentRecord(student=user, uai_code="0000000A", level=level, validation=2)
+                for user in users if rand.random() < 0.7
+            ])
+
+        Immersion.objects.bulk_create([
+            Immersion(
+                student=user,
+                slot=slot,
+                attendance_status=rand.choice([0, 1, 1, 2]),
+                cancellation_type=cancel_type if cancel_type and rand.random() < 0.1 else None,
+            )
+            for user in users for slot in rand.sample(slots, rand.randint(0, options["immersions_per_user"]))
+        ])
+
+        # Refresh the planner statistics of the bulk inserted rows, as autovacuum would do
+        with connection.cursor() as cursor:
+            for model in (Course, Slot, ImmersionUser, StudentRecord, Immersion):
+                cursor.execute(f'ANALYZE "{model._meta.db_table}"')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            start = time.perf_counter()
+            self.generate_dataset(options)
+            self.stdout.write(_("Dataset generated in %.2fs") % (time.perf_counter() - start))
+
+            start = time.perf_counter()
+            legacy = get_annual_statistics_legacy()
+            legacy_duration = time.perf_counter() - start
+
+            start = time.perf_counter()
+            current = get_annual_statistics()
+            current_duration = time.perf_counter() - start
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(_("Former computation : %.3fs") % legacy_duration)
+        self.stdout.write(_("Current computation : %.3fs") % current_duration)
+
+        differences = {
+            field: (legacy[field], current.get(field))
+            for field in legacy if legacy[field] != current.get(field)
+        }
+
+        if differences:
+            raise CommandError(_("Statistics differ : %s") % differences)
+
+        return _("Benchmark annual statistics : identical results, %.1fx faster") % (
+            legacy_duration / current_duration if current_duration else 0
+        )
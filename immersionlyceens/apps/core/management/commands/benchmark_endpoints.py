@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+"""
+Measure the latency, queries and memory of the hot endpoints (registration, slots search,
+offer, charts, CSV exports) on a generated dataset, and compare them with a stored baseline.
+
+The dataset size is set with the options : ex. --students 100000 --slots 10000 --immersions-per-student 3
+for a full campaign. Everything runs in a transaction that is rolled back : no data is kept. Requests are
+sent one after the other with the test client, on the transaction connection.
+
+Baseline usage :
+    benchmark_endpoints --save-baseline benchmark.json  # on the reference version
+    benchmark_endpoints --baseline benchmark.json       # fails if p95 or queries counts regress
+"""
+import datetime
+import json
+import logging
+import random
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from immersionlyceens.apps.charts.models import ImmersionFact
+from immersionlyceens.apps.immersion.models import HighSchoolStudentRecord
+from immersionlyceens.libs.utils import QueryCounter
+
+from ...models import (
+    Course, CourseType, Establishment, HighSchool, HighSchoolLevel, Immersion, ImmersionUser, Period,
+    Slot, Structure, Training, TrainingDomain, TrainingQuotaLedger, TrainingSubdomain,
+)
+
+logger = logging.getLogger(__name__)
+
+AJAX_HEADERS = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+
+def percentile(values, percent):
+    """
+    :return: nearest-rank percentile of values
+    """
+    values = sorted(values)
+    rank = max(0, min(len(values) - 1, round(percent / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+class Command(BaseCommand):
+    """
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--highschools', type=int, default=20, help=_('Generated high schools (default: 20)')
+        )
+        parser.add_argument(
+            '--students', type=int, default=1000, help=_('Generated high school pupils (default: 1000)')
+        )
+        parser.add_argument('--slots', type=int, default=200, help=_('Generated slots (default: 200)'))
+        parser.add_argument(
+            '--immersions-per-student',
+            type=int,
+            default=3,
+            help=_('Generated immersions per pupil (default: 3)'),
+        )
+        parser.add_argument(
+            '--requests', type=int, default=20, help=_('Measured requests per endpoint (default: 20)')
+        )
+        parser.add_argument('--baseline', help=_('JSON baseline file to compare the results with'))
+        parser.add_argument('--save-baseline', help=_('Save the results as a JSON baseline file'))
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help=_('Allowed p95 latency increase over the baseline (default: 0.2, i.e. 20%%)'),
+        )
+
+    def generate_dataset(self, options):
+        """
+        :return: dict of the objects used by the requests
+        """
+        rand = random.Random(0)
+        prefix = uuid.uuid4().hex[:8]
+        establishment = Establishment.objects.first()
+        level = HighSchoolLevel.objects.first()
+        now = timezone.now()
+        today = timezone.localdate()
+
+        if not establishment or not level:
+            raise CommandError(_("At least one establishment and one high school level are required"))
+
+        structure = Structure.objects.create(code=prefix, label=prefix, establishment=establishment)
+        domain = TrainingDomain.objects.create(label=f"bench {prefix}")
+        subdomain = TrainingSubdomain.objects.create(label=f"bench {prefix}", training_domain=domain)
+        course_type = CourseType.objects.create(label=f"bench {prefix}")
+
+        trainings = Training.objects.bulk_create([
+            Training(label=f"bench {prefix} {i}") for i in range(max(1, options["slots"] // 50))
+        ])
+
+        for training in trainings:
+            training.training_subdomains.add(subdomain)
+            training.structures.add(structure)
+
+        courses = Course.objects.bulk_create([
+            Course(label=f"bench {prefix} {i}", training=trainings[i % len(trainings)], structure=structure)
+            for i in range(max(1, options["slots"] // 10))
+        ])
+
+        period = Period.objects.create(
+            label=f"bench {prefix}",
+            registration_start_date=now - datetime.timedelta(days=1),
+            registration_end_date=now + datetime.timedelta(days=100),
+            immersion_start_date=today,
+            immersion_end_date=today + datetime.timedelta(days=100),
+            allowed_immersions=options["immersions_per_student"] + options["requests"] + 1,
+        )
+
+        # Registration limit dates are computed in save() : the slots are created as far in the future
+        slots = Slot.objects.bulk_create([
+            Slot(
+                course=courses[i % len(courses)],
+                course_type=course_type,
+                period=period,
+                date=today + datetime.timedelta(days=1 + i % 90),
+                start_time=datetime.time(10, 0),
+                end_time=datetime.time(12, 0),
+                n_places=rand.randint(20, 40),
+                published=True,
+                registration_limit_date=now + datetime.timedelta(days=1),
+                cancellation_limit_date=now + datetime.timedelta(days=1),
+            )
+            for i in range(options["slots"])
+        ])
+
+        highschools = HighSchool.objects.bulk_create([
+            HighSchool(
+                label=f"bench {prefix} {i}",
+                city=f"city {i % 20}",
+                badge_html_color="#FFFFFF",
+                postbac_immersion=False,
+            )
+            for i in range(max(1, options["highschools"]))
+        ])
+
+        students = ImmersionUser.objects.bulk_create([
+            ImmersionUser(username=f"bench_{prefix}_{i}", email=f"bench_{prefix}_{i}@example.com")
+            for i in range(max(options["students"], options["requests"] + 2))
+        ])
+
+        lyc = Group.objects.get(name='LYC')
+        ImmersionUser.groups.through.objects.bulk_create([
+            ImmersionUser.groups.through(immersionuser_id=student.pk, group_id=lyc.pk) for student in students
+        ])
+
+        HighSchoolStudentRecord.objects.bulk_create([
+            HighSchoolStudentRecord(
+                student=student,
+                highschool=highschools[i % len(highschools)],
+                level=level,
+                class_name="bench",
+                birth_date=today - datetime.timedelta(days=6000),
+                validation=HighSchoolStudentRecord.VALIDATED,
+            )
+            for i, student in enumerate(students)
+        ])
+
+        Immersion.objects.bulk_create([
+            Immersion(student=student, slot=slot)
+            for student in students
+            for slot in rand.sample(slots, min(len(slots), options["immersions_per_student"]))
+        ])
+        TrainingQuotaLedger.rebuild()
+        ImmersionFact.rebuild()
+
+        manager = ImmersionUser.objects.create(
+            username=f"bench_{prefix}_manager", email=f"bench_{prefix}_manager@domain.tld", establishment=establishment
+        )
+        manager.groups.add(Group.objects.get(name='REF-ETAB-MAITRE'))
+
+        # Refresh the planner statistics of the bulk inserted rows, as autovacuum would do
+        with connection.cursor() as cursor:
+            for model in (Course, Slot, HighSchool, ImmersionUser, HighSchoolStudentRecord, Immersion, ImmersionFact):
+                cursor.execute(f'ANALYZE "{model._meta.db_table}"')
+
+        return {
+            'students': students,
+            'slots': slots,
+            'subdomain': subdomain,
+            'manager': manager,
+            'rand': rand,
+        }
+
+    def get_endpoints(self, dataset, requests):
+        """
+        :return: {name: function returning (user, method, url, data) for the i-th request}
+          requests + 2 requests are sent : a warm up one, the measured ones and the memory one
+        """
+        students, slots, rand = dataset['students'], dataset['slots'], dataset['rand']
+        manager = dataset['manager']
+
+        # Pupils registering to a slot they don't have yet : one pupil per request
+        registrations = []
+
+        for student in students[:requests + 2]:
+            registered = set(student.immersions.values_list('slot_id', flat=True))
+            registrations.append((student, rand.choice([slot for slot in slots if slot.pk not in registered])))
+
+        return {
+            'slot_registration': lambda i: (
+                registrations[i][0], 'post', reverse('SlotRegistration'), {'slot_id': registrations[i][1].pk}
+            ),
+            'search_slots_list': lambda i: (students[i], 'get', reverse('search_slots_list'), {}),
+            'offer_subdomain': lambda i: (
+                students[i], 'get', reverse('offer_subdomain', kwargs={'subdomain_id': dataset['subdomain'].pk}), {}
+            ),
+            'trainings_charts': lambda i: (
+                manager, 'get', reverse('charts:get_global_trainings_charts'), {'empty_trainings': 'true'}
+            ),
+            'registration_charts': lambda i: (
+                manager, 'get', reverse('charts:get_registration_charts_by_population'), {}
+            ),
+            'csv_structures_courses': lambda i: (manager, 'get', reverse('get_csv_structures'), {'type': 'course'}),
+            'csv_anonymous_registrations': lambda i: (
+                manager, 'get', reverse('get_csv_anonymous'), {'type': 'registration'}
+            ),
+        }
+
+    def measure(self, get_request, requests):
+        """
+        :return: dict of the endpoint latencies percentiles (ms), median queries and peak memory (KB)
+        """
+        durations, queries, errors = [], [], 0
+
+        for i in range(requests + 1):
+            user, method, url, data = get_request(i)
+            client = Client()
+            client.force_login(user)
+            counter = QueryCounter()
+
+            start = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                response = getattr(client, method)(url, data, **AJAX_HEADERS)
+            duration = (time.perf_counter() - start) * 1000
+
+            errors += response.status_code >= 400
+
+            # The first request warms up the caches and is not measured
+            if i:
+                durations.append(duration)
+                queries.append(counter.queries)
+
+        # Memory is measured apart : tracemalloc slows the requests down
+        user, method, url, data = get_request(requests + 1)
+        client = Client()
+        client.force_login(user)
+        tracemalloc.start()
+        getattr(client, method)(url, data, **AJAX_HEADERS)
+        _size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        return {
+            'p50': round(percentile(durations, 50), 1),
+            'p95': round(percentile(durations, 95), 1),
+            'p99': round(percentile(durations, 99), 1),
+            'queries': percentile(queries, 50),
+            'memory': round(peak / 1024),
+            'errors': errors,
+        }
+
+    def compare(self, results, baseline, tolerance):
+        """
+        :return: list of regressions messages
+        """
+        regressions = []
+
+        for name, result in results.items():
+            reference = baseline.get(name)
+
+            if not reference:
+                continue
+
+            if result['p95'] > reference['p95'] * (1 + tolerance):
+                regressions.append(
+                    _("%s : p95 %sms, baseline %sms") % (name, result['p95'], reference['p95'])
+                )
+
+            if result['queries'] > reference['queries']:
+                regressions.append(
+                    _("%s : %s queries, baseline %s") % (name, result['queries'], reference['queries'])
+                )
+
+        return regressions
+
+    def handle(self, *args, **options):
+        requests = max(options["requests"], 1)
+        baseline = None
+        results = {}
+
+        if options["baseline"]:
+            try:
+                with open(options["baseline"]) as baseline_file:
+                    baseline = json.load(baseline_file)
+            except (OSError, ValueError) as e:
+                raise CommandError(_("Cannot read the baseline file : %s") % e)
+
+        test_settings = override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        )
+
+        with transaction.atomic(), test_settings:
+            start = time.perf_counter()
+            dataset = self.generate_dataset(options)
+            self.stdout.write(_("Dataset generated in %.2fs") % (time.perf_counter() - start))
+
+            for name, get_request in self.get_endpoints(dataset, requests).items():
+                results[name] = self.measure(get_request, requests)
+                self.stdout.write(
+                    "%-28s p50 %8.1fms  p95 %8.1fms  p99 %8.1fms  %5d queries  %8d KB  %d errors" % (
+                        name, *[results[name][key] for key in ('p50', 'p95', 'p99', 'queries', 'memory', 'errors')]
+                    )
+                )
+
+            transaction.set_rollback(True)
+
+        if options["save_baseline"]:
+            with open(options["save_baseline"], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2)
+
+        failures = [
+            _("%s : %s error responses") % (name, result['errors']) for name, result in results.items()
+            if result['errors']
+        ]
+
+        if baseline is not None:
+            failures.extend(self.compare(results, baseline, options["tolerance"]))
+
+        if failures:
+            raise CommandError(_("Benchmark endpoints : regressions found\n%s") % "\n".join(failures))
+
+        return _("Benchmark endpoints : %s endpoints measured") % len(results)
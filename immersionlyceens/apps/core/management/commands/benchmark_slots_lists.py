@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+"""
+Compare the slots speakers and restrictions lists annotations (see Slot.related_array) with
+the former ArrayAgg ones, on a generated catalogue.
+Everything runs in a transaction that is rolled back : no data is kept.
+"""
+import datetime
+import logging
+import random
+import time
+import uuid
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, JSONObject
+from django.utils.translation import gettext as _
+
+from ...models import (
+    BachelorMention, BachelorType, Course, Establishment, GeneralBachelorTeaching, HighSchool,
+    HighSchoolLevel, ImmersionUser, PostBachelorLevel, Slot, Structure, StudentLevel, Training,
+)
+
+logger = logging.getLogger(__name__)
+
+# Annotation name : (Slot many to many field, related field or JSON objects fields)
+LISTS = {
+    'speaker_list': ('speakers', {'last_name': 'last_name', 'first_name': 'first_name', 'email': 'email'}),
+    'allowed_establishments_list': ('allowed_establishments', {'city': 'city', 'label': 'label'}),
+    'allowed_highschools_list': ('allowed_highschools', {'id': 'id', 'city': 'city', 'label': 'label'}),
+    'allowed_highschool_levels_list': ('allowed_highschool_levels', 'label'),
+    'allowed_post_bachelor_levels_list': ('allowed_post_bachelor_levels', 'label'),
+    'allowed_student_levels_list': ('allowed_student_levels', 'label'),
+    'allowed_bachelor_types_list': ('allowed_bachelor_types', 'label'),
+    'allowed_bachelor_mentions_list': ('allowed_bachelor_mentions', 'label'),
+    'allowed_bachelor_teachings_list': ('allowed_bachelor_teachings', 'label'),
+}
+
+
+def get_legacy_annotations():
+    """
+    Former implementation : one ArrayAgg per relation, all relations joined in the main query
+    """
+    annotations = {}
+
+    for name, (relation, fields) in LISTS.items():
+        if isinstance(fields, dict):
+            value = JSONObject(**{key: F(f"{relation}__{field}") for key, field in fields.items()})
+        else:
+            value = F(f"{relation}__{fields}")
+
+        annotations[name] = Coalesce(
+            ArrayAgg(value, filter=Q(**{f"{relation}__isnull": False}), distinct=True),
+            Value([]),
+        )
+
+    return annotations
+
+
+def get_annotations():
+    return {
+        name: Slot.related_array(relation, **fields) if isinstance(fields, dict)
+        else Slot.related_array(relation, fields)
+        for name, (relation, fields) in LISTS.items()
+    }
+
+
+class Command(BaseCommand):
+    """
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slots', type=int, default=100, help=_('Generated slots (default: 100)'))
+        parser.add_argument(
+            '--speakers-per-slot', type=int, default=5, help=_('Speakers per slot (default: 5)')
+        )
+        parser.add_argument(
+            '--highschools-per-slot',
+            type=int,
+            default=30,
+            help=_('Allowed high schools per slot (default: 30)'),
+        )
+        parser.add_argument('--repeat', type=int, default=1, help=_('Runs of each query (default: 1)'))
+
+    def generate_dataset(self, options):
+        rand = random.Random(0)
+        prefix = uuid.uuid4().hex[:8]
+        establishment = Establishment.objects.first()
+
+        if not establishment:
+            raise CommandError(_("At least one establishment is required"))
+
+        structure = Structure.objects.create(code=prefix, label=prefix, establishment=establishment)
+        training = Training.objects.create(label=f"bench {prefix}")
+        training.structures.add(structure)
+
+        courses = Course.objects.bulk_create([
+            Course(label=f"bench {prefix} {i}", training=training, structure=structure)
+            for i in range(max(1, options["slots"] // 10))
+        ])
+
+        today = datetime.date.today()
+        slots = Slot.objects.bulk_create([
+            Slot(
+                course=courses[i % len(courses)],
+                date=today + datetime.timedelta(days=i % 100),
+                n_places=20,
+                published=True,
+                establishments_restrictions=True,
+                levels_restrictions=True,
+                bachelors_restrictions=True,
+            )
+            for i in range(options["slots"])
+        ])
+
+        speakers = ImmersionUser.objects.bulk_create([
+            ImmersionUser(
+                username=f"bench_{prefix}_{i}",
+                email=f"bench_{prefix}_{i}@domain.tld",
+                last_name=f"bench {i}",
+                first_name=prefix,
+            )
+            for i in range(max(options["speakers_per_slot"] * 10, 1))
+        ])
+
+        highschools = HighSchool.objects.bulk_create([
+            HighSchool(label=f"bench {prefix} {i}", city=f"city {i % 20}", badge_html_color="#FFFFFF")
+            for i in range(max(options["highschools_per_slot"] * 3, 1))
+        ])
+
+        mentions = BachelorMention.objects.bulk_create([
+            BachelorMention(label=f"bench {prefix} {i}") for i in range(10)
+        ])
+
+        teachings = GeneralBachelorTeaching.objects.bulk_create([
+            GeneralBachelorTeaching(label=f"bench {prefix} {i}") for i in range(10)
+        ])
+
+        related_objects = {
+            'speakers': (speakers, options["speakers_per_slot"]),
+            'allowed_establishments': (list(Establishment.objects.all()), 1),
+            'allowed_highschools': (highschools, options["highschools_per_slot"]),
+            'allowed_highschool_levels': (list(HighSchoolLevel.objects.all()), 3),
+            'allowed_post_bachelor_levels': (list(PostBachelorLevel.objects.all()), 2),
+            'allowed_student_levels': (list(StudentLevel.objects.all()), 3),
+            'allowed_bachelor_types': (list(BachelorType.objects.all()), 2),
+            'allowed_bachelor_mentions': (mentions, 3),
+            'allowed_bachelor_teachings': (teachings, 3),
+        }
+
+        for relation, (objects, count) in related_objects.items():
+            m2m_field = Slot._meta.get_field(relation)
+            through = m2m_field.remote_field.through
+            source, target = m2m_field.m2m_field_name(), m2m_field.m2m_reverse_field_name()
+
+            through.objects.bulk_create([
+                through(**{f"{source}_id": slot.pk, f"{target}_id": obj.pk})
+                for slot in slots for obj in rand.sample(objects, min(count, len(objects)))
+            ])
+
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE "{through._meta.db_table}"')
+
+        with connection.cursor() as cursor:
+            for model in (Course, Slot, ImmersionUser, HighSchool):
+                cursor.execute(f'ANALYZE "{model._meta.db_table}"')
+
+        return Slot.objects.filter(course__training=training).order_by('pk')
+
+    def run(self, queryset, annotations, repeat):
+        """
+        :return: (best duration, results)
+        """
+        durations = []
+
+        for _i in range(repeat):
+            start = time.perf_counter()
+            results = list(queryset.annotate(**annotations).values('pk', *annotations.keys()))
+            durations.append(time.perf_counter() - start)
+
+        return min(durations), results
+
+    def handle(self, *args, **options):
+        repeat = max(options["repeat"], 1)
+
+        with transaction.atomic():
+            start = time.perf_counter()
+            slots = self.generate_dataset(options)
+            self.stdout.write(_("Dataset generated in %.2fs") % (time.perf_counter() - start))
+
+            legacy_duration, legacy = self.run(slots, get_legacy_annotations(), repeat)
+            current_duration, current = self.run(slots, get_annotations(), repeat)
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(_("Former annotations : %.3fs") % legacy_duration)
+        self.stdout.write(_("Current annotations : %.3fs") % current_duration)
+
+        if legacy != current:
+            differences = [slot["pk"] for slot, other in zip(legacy, current) if slot != other]
+            raise CommandError(_("Slots lists differ : %s") % differences[:20])
+
+        return _("Benchmark slots lists : identical results, %.1fx faster") % (
+            legacy_duration / current_duration if current_duration else 0
+        )
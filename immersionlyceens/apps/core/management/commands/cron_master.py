@@ -1,20 +1,155 @@
 """
 Run all Scheduled tasks
+
+Due tasks run one after the other, or concurrently with --processes.
+A PostgreSQL advisory lock per task prevents overlapping runs of the same task (ex: a slow
+task still running when cron_master is called again) and, with --catch-up, executions missed
+during the given number of minutes (server down, cron_master run too late, ...) are run.
+Runs killed before their end (their log is still 'Running' but the task lock is free) are
+marked as failed at start, so they can be caught up.
 """
 
 import logging
 import datetime
-import math
+import time as time_module
 
-from django.core.management import call_command
+from django.core.management import call_command, get_commands, load_command_class
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from immersionlyceens.apps.core.models import ScheduledTask, ScheduledTaskLog
+from immersionlyceens.libs.mails.utils import count_sent_emails
+from immersionlyceens.libs.utils import (
+    QueryCounter, check_query_budget, get_process_pool, get_query_budget,
+)
 
 logger = logging.getLogger(__name__)
 
+# First key of the tasks advisory locks, the second one is the task id
+TASK_LOCK_KEY = 8101
+
+WEEK_DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+def get_execution_times(task, date, tzinfo):
+    """
+    :return: list of the task scheduled datetimes on the given date
+    """
+    if not task.time or not (task.date == date or getattr(task, WEEK_DAYS[date.weekday()])):
+        return []
+
+    execution_time = datetime.datetime.combine(date, task.time).replace(tzinfo=tzinfo)
+
+    if not task.frequency:
+        return [execution_time]
+
+    execution_times = []
+
+    while execution_time.date() == date:
+        execution_times.append(execution_time)
+        execution_time += datetime.timedelta(**{task.frequency_unit: task.frequency})
+
+    return execution_times
+
+
+def get_command_budget(command_name):
+    """
+    :return: maximum queries count of a command (see the query_budget decorator), None for no budget
+    """
+    try:
+        command_class = type(load_command_class(get_commands()[command_name], command_name))
+    except (KeyError, ImportError):
+        command_class = None
+
+    return get_query_budget(command_name, command_class)
+
+
+def fail_interrupted_logs():
+    """
+    Mark as failed the 'Running' logs of the tasks that are not running anymore
+    (process killed, server restarted, ...) : a running task holds its advisory lock
+    :return: number of updated logs
+    """
+    updated = 0
+    task_ids = set(ScheduledTaskLog.objects.filter(success__isnull=True).values_list('task_id', flat=True))
+
+    for task_id in task_ids:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", [TASK_LOCK_KEY, task_id])
+
+            if not cursor.fetchone()[0]:
+                continue
+
+            try:
+                updated += ScheduledTaskLog.objects.filter(task_id=task_id, success__isnull=True).update(
+                    success=False,
+                    exit_status=ScheduledTaskLog.EXIT_ERROR,
+                    message=_("Interrupted"),
+                )
+            finally:
+                cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [TASK_LOCK_KEY, task_id])
+
+    if updated:
+        logger.warning("%s interrupted task run(s) marked as failed", updated)
+
+    return updated
+
+
+def run_task(task_id):
+    """
+    Run a scheduled task command, unless it's already running
+    :return: the task log, None if the task is already running
+    """
+    task = ScheduledTask.objects.get(pk=task_id)
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s, %s)", [TASK_LOCK_KEY, task.pk])
+        locked = cursor.fetchone()[0]
+
+    if not locked:
+        logger.warning("Command %s is already running, skipped", task.command_name)
+        return None
+
+    # Created first : the running task is visible and catch up won't run it again
+    log = ScheduledTaskLog.objects.create(task=task, success=None, message=_("Running"))
+    start = time_module.perf_counter()
+    query_counter = QueryCounter()
+
+    try:
+        with connection.execute_wrapper(query_counter), count_sent_emails() as mail_counter:
+            # Every command should have return values
+            log.message = call_command(task.command_name, verbosity=0)
+        check_query_budget(task.command_name, get_command_budget(task.command_name), query_counter)
+        log.success = True
+        log.exit_status = ScheduledTaskLog.EXIT_SUCCESS
+    except Exception as e:
+        logger.error("Cannot run command %s : %s" % (task.command_name, e))
+        log.message = str(e)
+        log.success = False
+        log.exit_status = ScheduledTaskLog.EXIT_ERROR
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_unlock(%s, %s)", [TASK_LOCK_KEY, task.pk])
+
+    log.duration = round(time_module.perf_counter() - start, 3)
+    log.end_date = timezone.now()
+    log.queries = query_counter.queries
+    log.rows = query_counter.rows
+    log.mails_sent = mail_counter['sent']
+    log.save(update_fields=[
+        'message', 'success', 'exit_status', 'duration', 'end_date', 'queries', 'rows', 'mails_sent'
+    ])
+
+    logger.info(
+        "%s : exit status %s in %ss, %s queries, %s written rows, %s email(s) sent",
+        task.command_name, log.exit_status, log.duration, log.queries, log.rows, log.mails_sent
+    )
+
+    return log
+
+
 class Command(BaseCommand):
     """
     """
@@ -30,6 +165,51 @@ class Command(BaseCommand):
             action='store',
             help=_('simulate cron running at <time> (for testing purpose). Format : HHMM'),
         )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help=_('run the due tasks concurrently in this number of processes (default: 1)'),
+        )
+        parser.add_argument(
+            '--catch-up',
+            type=int,
+            default=0,
+            help=_('also run the executions missed during the last <catch-up> minutes (default: 0)'),
+        )
+
+    def get_due_tasks(self, now, catch_up=0):
+        """
+        :param now: current (or simulated) datetime
+        :param catch_up: minutes to look back for missed executions
+        :return: list of tasks to run
+        """
+        tasks = []
+        start = now - datetime.timedelta(minutes=catch_up)
+
+        for task in ScheduledTask.objects.filter(active=True):
+            execution_times = [
+                execution_time
+                for day in range((now.date() - start.date()).days + 1)
+                for execution_time in get_execution_times(task, start.date() + datetime.timedelta(days=day), now.tzinfo)
+                if start <= execution_time <= now
+            ]
+
+            if not execution_times:
+                continue
+
+            last_execution_time = max(execution_times)
+
+            if last_execution_time == now:
+                tasks.append(task)
+            elif catch_up and not task.logs.filter(execution_date__gte=last_execution_time).exclude(
+                # Interrupted runs (see fail_interrupted_logs)
+                success=False, end_date__isnull=True
+            ).exists():
+                logger.info("Catching up %s (scheduled at %s)", task.command_name, last_execution_time)
+                tasks.append(task)
+
+        return tasks
 
     def handle(self, *args, **options):
 
@@ -48,6 +228,7 @@ class Command(BaseCommand):
                 month = int(date[0:2])
                 day = int(date[2:4])
                 today = datetime.date(today.year, month, day)
+                now = now.replace(year=today.year, month=today.month, day=today.day)
                 self.stdout.write(_("Using date : %s") % today)
             except Exception as e:
                 raise CommandError(_("date : bad argument format : %s") % e)
@@ -59,61 +240,23 @@ class Command(BaseCommand):
 
                 hours = int(time[0:2])
                 minutes = int(time[2:4])
-                now = datetime.datetime.combine(datetime.date.today(), datetime.time(hours, minutes))
-                now = now.replace(tzinfo=now.tzinfo)
+                now = now.replace(hour=hours, minute=minutes)
                 self.stdout.write(_("Using time : %s") % now)
             except Exception as e:
                 raise CommandError(_("time : bad argument format : %s") % e)
 
-        week_days = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+        fail_interrupted_logs()
 
-        for task in ScheduledTask.objects.filter(active=True):
-            time_run = False
-            freq_run = False
-
-            command_name = task.command_name
-            run_today = task.date == today or getattr(task, week_days[now.weekday()])
-
-            print(f"task.command_name: {task.command_name}")
-            print(f"task.time: {task.time}")
-            print(f"hour: {task.time.hour}")
-            print(f"minute: {task.time.minute}")
-            print(f"time_run: {now.hour == task.time.hour and now.minute == task.time.minute}")
-
-            if task.time:
-                hour = task.time.hour
-                minute = task.time.minute
-                time_run = now.hour == hour and now.minute == minute
-            else:
-                # No execution time
-                continue
+        tasks = self.get_due_tasks(now, catch_up=options.get("catch_up") or 0)
+
+        for task in tasks:
+            self.stdout.write(_("Running task : %s" % task.command_name))
+
+        processes = min(options.get("processes") or 1, len(tasks))
 
-            if task.frequency:
-                # Convert time to datetime
-                task_datetime = datetime.datetime.combine(datetime.date.today(), task.time)
-                # add same timezone to allow comparison
-                task_datetime = task_datetime.replace(tzinfo=now.tzinfo)
-                # Get time delta and convert it in hours
-                delta = (now - task_datetime).total_seconds()
-
-                if now >= task_datetime and (delta / 3600) % task.frequency == 0:
-                    freq_run = True
-
-            if all([run_today, time_run or freq_run]):
-                self.stdout.write(_("Running task : %s" % command_name))
-
-                try:
-                    # Every command should have return values
-                    ret = call_command(command_name, verbosity=0)
-                    ScheduledTaskLog.objects.create(
-                        task=task,
-                        success=True,
-                        message=ret
-                    )
-                except Exception as e:
-                    logger.error("Cannot run command %s : %s" % (command_name, e))
-                    ScheduledTaskLog.objects.create(
-                        task=task,
-                        success=False,
-                        message=str(e)
-                    )
+        if processes > 1:
+            with get_process_pool(processes) as executor:
+                list(executor.map(run_task, [task.pk for task in tasks]))
+        else:
+            for task in tasks:
+                run_task(task.pk)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Export the attendance certificates of a slot, a period or an establishment
+in a ZIP archive or a single merged pdf
+"""
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext as _
+
+from immersionlyceens.apps.immersion.utils import (
+    build_attestations_pdf, build_attestations_zip, get_attestations_immersions, get_base_url,
+)
+
+from ...models import Establishment, Period, Slot
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slot', type=int, help=_('Slot id'))
+        parser.add_argument('--period', type=int, help=_('Period id'))
+        parser.add_argument('--establishment', type=int, help=_('Establishment id'))
+        parser.add_argument(
+            '--format',
+            choices=['zip', 'pdf'],
+            default='zip',
+            help=_('ZIP archive of pdf files (default) or a single merged pdf'),
+        )
+        parser.add_argument('--output', required=True, help=_('Output file'))
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=1,
+            help=_('Number of rendering processes (zip format only, default: 1)'),
+        )
+
+    def progress(self, done, total):
+        self.stdout.write(f"{done}/{total}")
+
+    def handle(self, *args, **options):
+        filters = {}
+
+        try:
+            if options.get("slot"):
+                filters["slot"] = Slot.objects.get(pk=options["slot"])
+            if options.get("period"):
+                filters["period"] = Period.objects.get(pk=options["period"])
+            if options.get("establishment"):
+                filters["establishment"] = Establishment.objects.get(pk=options["establishment"])
+        except (Slot.DoesNotExist, Period.DoesNotExist, Establishment.DoesNotExist) as e:
+            raise CommandError(e) from e
+
+        if not filters:
+            raise CommandError(_("At least one of --slot, --period or --establishment is required"))
+
+        immersions = get_attestations_immersions(**filters)
+
+        if options["format"] == "pdf":
+            content = build_attestations_pdf(immersions, base_url=get_base_url(), progress=self.progress)
+        else:
+            content = build_attestations_zip(immersions, processes=options["processes"], progress=self.progress)
+
+        with open(options["output"], "wb") as fd:
+            fd.write(content)
+
+        success = _("Export attestations : %s attestation(s)") % immersions.count()
+        logger.info(success)
+        return success
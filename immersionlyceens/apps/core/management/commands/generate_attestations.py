@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Render and store attendance certificates of recent attended immersions,
+so the download views only have to read them from the storage
+"""
+import datetime
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils.translation import gettext as _
+
+from immersionlyceens.apps.immersion.utils import store_attestation
+
+from ...models import Immersion, Slot
+from . import Schedulable
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand, Schedulable):
+    """
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=7,
+            help=_('Only immersions of slots from the last <days> days (default: 7, 0 for all slots)'),
+        )
+
+    def handle(self, *args, **options):
+        today = datetime.datetime.today().date()
+        days = options.get("days")
+        returns = []
+        rendered = 0
+
+        immersions = Immersion.objects.select_related(
+            'student', 'slot__course__training', 'slot__course__structure__establishment',
+            'slot__course__highschool', 'slot__event__establishment', 'slot__event__highschool',
+            'slot__course_type', 'slot__campus', 'slot__building',
+        ).filter(
+            Q(attendance_status=1) | Q(slot__place=Slot.REMOTE),
+            cancellation_type__isnull=True,
+            slot__date__lte=today,
+        )
+
+        if days:
+            immersions = immersions.filter(slot__date__gte=today - datetime.timedelta(days=days))
+
+        for immersion in immersions:
+            try:
+                rendered += store_attestation(immersion)[1]
+            except Exception as e:
+                returns.append(_("Cannot generate attestation for immersion %(id)s : %(error)s") % {
+                    'id': immersion.pk,
+                    'error': e
+                })
+
+        if returns:
+            for line in returns:
+                logger.error(line)
+
+            return "\n".join(returns)
+
+        success = _("Generate attestations : %s new attestation(s)") % rendered
+        logger.info(success)
+        return success
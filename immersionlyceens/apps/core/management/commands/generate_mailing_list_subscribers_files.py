@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+"""
+Write the mailing lists subscribers files in the default storage :
+one file per mailing list address (one email per line) and one json file per
+mailing lists API view. Files are only rewritten when their content changed.
+"""
+import json
+import logging
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from immersionlyceens.apps.api.utils import (
+    MAILING_LISTS, MAILING_LISTS_PATH, get_global_mailing_list, get_mailing_lists,
+    store_mailing_list_file,
+)
+from immersionlyceens.libs.utils import get_general_setting
+
+from . import Schedulable
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand, Schedulable):
+    """
+    """
+
+    def handle(self, *args, **options):
+        returns = []
+        subscribers = {}
+        filenames = set()
+        updated = 0
+
+        try:
+            global_mail = get_general_setting('GLOBAL_MAILING_LIST')
+            subscribers[global_mail] = get_global_mailing_list()
+        except (ValueError, NameError):
+            returns.append(
+                _("Cannot find GLOBAL_MAILING_LIST address. Please check the General Settings in admin section.")
+            )
+
+        for name in MAILING_LISTS:
+            mailing_lists = get_mailing_lists(name)
+            subscribers.update(mailing_lists)
+
+            filenames.add(f"{name}.json")
+            updated += store_mailing_list_file(
+                f"{name}.json",
+                json.dumps({"msg": "", "data": mailing_lists}, sort_keys=True)
+            )
+
+        for address, emails in subscribers.items():
+            filenames.add(f"{address}.txt")
+            updated += store_mailing_list_file(f"{address}.txt", "\n".join(emails))
+
+        # Remove the files of deleted mailing lists
+        try:
+            for filename in default_storage.listdir(MAILING_LISTS_PATH)[1]:
+                if filename not in filenames:
+                    default_storage.delete(f"{MAILING_LISTS_PATH}/{filename}")
+        except FileNotFoundError:
+            pass
+
+        if returns:
+            for line in returns:
+                logger.error(line)
+
+            return "\n".join(returns)
+
+        success = _("Generate mailing list subscribers files : %s updated file(s)") % updated
+        logger.info(success)
+        return success
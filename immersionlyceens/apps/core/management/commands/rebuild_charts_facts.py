@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+"""
+Recompute the charts immersions facts table
+The facts are kept up to date by the models signals : this command is only needed after changes
+made without signals (bulk updates, raw SQL, fixtures loading, ...)
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from immersionlyceens.apps.charts.models import ImmersionFact
+
+from . import Schedulable
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand, Schedulable):
+    """
+    """
+    def handle(self, *args, **options):
+        facts = ImmersionFact.rebuild()
+
+        msg = _("Charts facts rebuilt : %s facts") % facts
+        logger.info(msg)
+        return msg
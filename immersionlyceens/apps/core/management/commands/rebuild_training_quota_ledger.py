@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+"""
+Recompute the training quotas ledger from the active immersions
+The ledger is kept up to date with the registrations : this command is only needed after changes
+the ledger can't follow (slots moved to another period or course, immersions modified in bulk, ...)
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from ...models import TrainingQuotaLedger
+from . import Schedulable
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand, Schedulable):
+    """
+    """
+    def handle(self, *args, **options):
+        entries = TrainingQuotaLedger.rebuild()
+
+        msg = _("Training quota ledger rebuilt : %s entries") % entries
+        logger.info(msg)
+        return msg
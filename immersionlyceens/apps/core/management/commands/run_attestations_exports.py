@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Build the pending attestations exports requested from the attestations download view
+
+Runs are serialized by a PostgreSQL advisory lock : 'Running' exports found once the lock
+is acquired belong to an interrupted run (process killed, server restarted, ...) and are
+marked as failed.
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from immersionlyceens.apps.immersion.utils import run_attestations_export
+
+from ...models import AttestationsExport
+from . import Schedulable
+
+logger = logging.getLogger(__name__)
+
+# Attestations exports advisory lock key
+EXPORTS_LOCK_KEY = 8103
+
+
+class Command(BaseCommand, Schedulable):
+    """
+    """
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(%s)", [EXPORTS_LOCK_KEY])
+            locked = cursor.fetchone()[0]
+
+        if not locked:
+            msg = _("Attestations exports already running")
+            logger.warning(msg)
+            return msg
+
+        try:
+            interrupted = AttestationsExport.objects.filter(status=AttestationsExport.RUNNING).update(
+                status=AttestationsExport.ERROR,
+                message=_("Interrupted"),
+                end_date=timezone.now(),
+            )
+
+            if interrupted:
+                logger.warning("%s interrupted attestations export(s) marked as failed", interrupted)
+
+            AttestationsExport.delete_expired()
+
+            exports = AttestationsExport.objects.select_related('user', 'period', 'establishment').filter(
+                status=AttestationsExport.PENDING
+            ).order_by('creation_date')
+
+            done = errors = 0
+
+            for export in exports:
+                run_attestations_export(export)
+
+                if export.status == AttestationsExport.DONE:
+                    done += 1
+                else:
+                    errors += 1
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(%s)", [EXPORTS_LOCK_KEY])
+
+        success = _("Attestations exports : %(done)s done, %(errors)s error(s), %(interrupted)s interrupted") % {
+            'done': done,
+            'errors': errors,
+            'interrupted': interrupted,
+        }
+        logger.info(success)
+        return success
@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+"""
+Send the alerts of courses where seats have been freed (see UserCourseAlert.dispatch)
+Meant to be run frequently, send_course_alerts remains the evening fallback
+"""
+import logging
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from ...models import UserCourseAlert
+from . import Schedulable
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand, Schedulable):
+    """
+    """
+    def handle(self, *args, **options):
+        success = "%s : %s" % (_("Send dispatched course alerts"), _("success"))
+
+        returns = UserCourseAlert.send_dispatched_alerts()
+
+        if returns:
+            for line in returns:
+                logger.error(line)
+
+            return "\n".join(returns)
+
+        logger.info(success)
+        return success
@@ -1,10 +1,16 @@
 import datetime
+from collections import Counter
+from typing import Optional
 
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q
 from django.utils import timezone
 from django.apps import apps
 
+from immersionlyceens.libs.mails.utils import send_emails
+
+from .signals import immersions_cancelled
+
 
 class ActiveManager(models.Manager):
     """
@@ -37,6 +43,100 @@ class StructureQuerySet(models.QuerySet):
         return self.filter(**str_filter)
 
 
+def get_user_slots_filter(user) -> Optional[Q]:
+    """
+    Slots a user can manage, as in the slots lists : the ones of their establishment, structures or
+    high school and the ones they speak at
+    :return: Slot filter, None for users managing all the slots
+    """
+    if user.is_superuser or user.is_master_establishment_manager() or user.is_operator():
+        return None
+
+    slots_filter = Q(speakers__in=user.linked_users())
+
+    if user.is_establishment_manager() and user.establishment:
+        slots_filter |= Q(course__training__structures__establishment=user.establishment)
+        slots_filter |= Q(event__establishment=user.establishment)
+
+    if user.is_structure_manager() or user.is_structure_consultant():
+        slots_filter |= Q(course__training__structures__in=user.structures.all())
+        slots_filter |= Q(event__structure__in=user.structures.all())
+
+    if user.is_high_school_manager() and user.highschool:
+        slots_filter |= Q(course__highschool=user.highschool) | Q(event__highschool=user.highschool)
+
+    return slots_filter
+
+
+class ImmersionQuerySet(models.QuerySet):
+    def user_immersions(self, user):
+        """
+        Immersions of the slots a user can manage (see get_user_slots_filter)
+        """
+        slots_filter = get_user_slots_filter(user)
+
+        if slots_filter is None:
+            return self
+
+        return self.filter(slot__in=apps.get_model('core', 'Slot').objects.filter(slots_filter))
+
+    def cancel(self, cancellation_type, request=None, notify=True):
+        """
+        Cancel the active immersions of the queryset with a single UPDATE, send the immersions_cancelled
+        signal, then send the IMMERSION_ANNUL notifications to the students in one mail batch
+        Notifications are sent once the transaction is committed : within an outer transaction,
+        their errors are only logged
+        :param cancellation_type: CancelType object
+        :param notify: send the notifications
+        :return: tuple (cancelled immersions, {slot id: freed seats}, set of mail errors)
+        """
+        change_log = apps.get_model('core', 'ChangeLog')
+        now = timezone.now()
+
+        with transaction.atomic():
+            immersions = list(
+                self.filter(cancellation_type__isnull=True)
+                    .select_for_update(of=('self',))
+                    .select_related('student', 'slot__course')
+            )
+            immersions_ids = [immersion.pk for immersion in immersions]
+
+            self.model.objects\
+                .filter(pk__in=immersions_ids)\
+                .update(cancellation_type=cancellation_type, cancellation_date=now)
+
+            change_log.log(self.model, immersions_ids, change_log.UPDATED)
+            # Quotas, charts facts, course alerts : see the immersions_cancelled receivers
+            immersions_cancelled.send(sender=self.model, immersions=immersions)
+
+        for immersion in immersions:
+            immersion.cancellation_type = cancellation_type
+            immersion.cancellation_date = now
+            immersion._loaded_cancellation_type_id = cancellation_type.pk
+
+        freed_seats = Counter(immersion.slot_id for immersion in immersions)
+        mail_errors = set()
+
+        if notify:
+            outbox = []
+
+            for immersion in immersions:
+                ret = immersion.student.send_message(
+                    request, 'IMMERSION_ANNUL', outbox=outbox, immersion=immersion, slot=immersion.slot
+                )
+                if ret:
+                    mail_errors.add(ret)
+
+            def send_notifications():
+                ret = send_emails(outbox)
+                if ret:
+                    mail_errors.add(ret)
+
+            transaction.on_commit(send_notifications)
+
+        return immersions, dict(freed_seats), mail_errors
+
+
 class HighSchoolAgreedManager(models.Manager):
     """
     Return all the 'valid' high schools:
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.14 on 2026-10-19 13:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0284_uai_update_scheduled_tasks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('object_type', models.CharField(max_length=128, verbose_name='Object type')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Object id')),
+                ('action', models.SmallIntegerField(choices=[(0, 'Created'), (1, 'Updated'), (2, 'Deleted')], verbose_name='Action')),
+                ('date', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Date')),
+            ],
+            options={
+                'verbose_name': 'Change log',
+                'verbose_name_plural': 'Change logs',
+                'ordering': ['date', 'id'],
+            },
+        ),
+    ]
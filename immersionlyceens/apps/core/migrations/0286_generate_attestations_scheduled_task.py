@@ -0,0 +1,31 @@
+from django.db import migrations
+
+def load_scheduled_tasks(apps, schema_editor):
+    ScheduledTask = apps.get_model('core', 'ScheduledTask')
+
+    if not ScheduledTask.objects.filter(command_name='generate_attestations').exists():
+        ScheduledTask.objects.create(
+            command_name="generate_attestations",
+            description="Génération des attestations de présence",
+            active=False,
+            date=None,
+            time="00:30",
+            frequency=1,
+            monday=True,
+            tuesday=True,
+            wednesday=True,
+            thursday=True,
+            friday=True,
+            saturday=True,
+            sunday=True
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0285_changelog'),
+    ]
+
+    operations = [
+        migrations.RunPython(load_scheduled_tasks, migrations.RunPython.noop)
+    ]
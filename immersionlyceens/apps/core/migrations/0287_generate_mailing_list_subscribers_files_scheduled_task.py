@@ -0,0 +1,31 @@
+from django.db import migrations
+
+def load_scheduled_tasks(apps, schema_editor):
+    ScheduledTask = apps.get_model('core', 'ScheduledTask')
+
+    if not ScheduledTask.objects.filter(command_name='generate_mailing_list_subscribers_files').exists():
+        ScheduledTask.objects.create(
+            command_name="generate_mailing_list_subscribers_files",
+            description="Génération des fichiers d'abonnés des listes de diffusion",
+            active=False,
+            date=None,
+            time="00:15",
+            frequency=1,
+            monday=True,
+            tuesday=True,
+            wednesday=True,
+            thursday=True,
+            friday=True,
+            saturday=True,
+            sunday=True
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0286_generate_attestations_scheduled_task'),
+    ]
+
+    operations = [
+        migrations.RunPython(load_scheduled_tasks, migrations.RunPython.noop)
+    ]
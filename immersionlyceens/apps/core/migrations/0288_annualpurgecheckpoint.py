@@ -0,0 +1,30 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0287_generate_mailing_list_subscribers_files_scheduled_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnnualPurgeCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('step', models.CharField(max_length=64, unique=True, verbose_name='Step')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Processed objects')),
+                ('duration', models.FloatField(default=0, verbose_name='Duration (seconds)')),
+                ('done', models.BooleanField(default=False, verbose_name='Done')),
+                ('message', models.TextField(blank=True, null=True, verbose_name='Message')),
+                ('start_date', models.DateTimeField(auto_now_add=True, verbose_name='Start date')),
+            ],
+            options={
+                'verbose_name': 'Annual purge checkpoint',
+                'verbose_name_plural': 'Annual purge checkpoints',
+                'ordering': ['id'],
+            },
+        ),
+    ]
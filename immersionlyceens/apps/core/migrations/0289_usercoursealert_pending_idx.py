@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-19 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0288_annualpurgecheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usercoursealert',
+            index=models.Index(condition=models.Q(('email_sent', False)), fields=['course'], name='usercoursealert_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0289_usercoursealert_pending_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledtasklog',
+            name='duration',
+            field=models.FloatField(blank=True, null=True, verbose_name='Duration (seconds)'),
+        ),
+        migrations.AddField(
+            model_name='scheduledtasklog',
+            name='exit_status',
+            field=models.SmallIntegerField(blank=True, choices=[(0, 'Success'), (1, 'Error')], null=True, verbose_name='Exit status'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0290_scheduledtasklog_duration_exit_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scheduledtasklog',
+            name='end_date',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='End date'),
+        ),
+        migrations.AddField(
+            model_name='scheduledtasklog',
+            name='mails_sent',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Sent emails'),
+        ),
+        migrations.AddField(
+            model_name='scheduledtasklog',
+            name='queries',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Database queries'),
+        ),
+        migrations.AddField(
+            model_name='scheduledtasklog',
+            name='rows',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Written rows'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.0.14 on 2026-10-19 15:49
+
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import migrations, models
+from django.db.models import F, OuterRef
+from django.db.models.functions import JSONObject
+
+RESTRICTIONS_FLAGS = ('establishments_restrictions', 'levels_restrictions', 'bachelors_restrictions')
+RESTRICTIONS_RELATIONS = (
+    'allowed_establishments',
+    'allowed_highschools',
+    'allowed_highschool_levels',
+    'allowed_student_levels',
+    'allowed_post_bachelor_levels',
+    'allowed_bachelor_types',
+    'allowed_bachelor_mentions',
+    'allowed_bachelor_teachings',
+)
+
+
+def fill_slots_restrictions(apps, schema_editor):
+    Slot = apps.get_model('core', 'Slot')
+    document = {flag: F(flag) for flag in RESTRICTIONS_FLAGS}
+
+    for relation in RESTRICTIONS_RELATIONS:
+        field = Slot._meta.get_field(relation)
+        target = f"{field.m2m_reverse_field_name()}_id"
+
+        document[relation] = ArraySubquery(
+            field.remote_field.through.objects
+            .filter(**{field.m2m_field_name(): OuterRef('pk')})
+            .order_by(target)
+            .values(target)
+        )
+
+    Slot.objects.update(restrictions=JSONObject(**document))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0291_scheduledtasklog_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='slot',
+            name='restrictions',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Restrictions'),
+        ),
+        migrations.RunPython(fill_slots_restrictions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.14 on 2026-10-19 16:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_training_quota_ledger(apps, schema_editor):
+    Immersion = apps.get_model('core', 'Immersion')
+    TrainingQuotaLedger = apps.get_model('core', 'TrainingQuotaLedger')
+
+    counts = (
+        Immersion.objects.filter(
+            cancellation_type__isnull=True,
+            slot__period__isnull=False,
+            slot__course__isnull=False,
+        )
+        .values('student', 'slot__period', 'slot__course__training')
+        .annotate(count=Count('pk'))
+        .values_list('student', 'slot__period', 'slot__course__training', 'count')
+    )
+
+    TrainingQuotaLedger.objects.bulk_create([
+        TrainingQuotaLedger(student_id=student_id, period_id=period_id, training_id=training_id, registrations=count)
+        for student_id, period_id, training_id, count in counts
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0292_slot_restrictions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrainingQuotaLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('registrations', models.PositiveIntegerField(default=0, verbose_name='Registrations')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.period', verbose_name='Period')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='training_quotas', to=settings.AUTH_USER_MODEL, verbose_name='Student')),
+                ('training', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.training', verbose_name='Training')),
+            ],
+            options={
+                'verbose_name': 'Training quota ledger entry',
+                'verbose_name_plural': 'Training quota ledger',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='trainingquotaledger',
+            constraint=models.UniqueConstraint(fields=('student', 'period', 'training'), name='unique_training_quota_ledger_entry'),
+        ),
+        migrations.RunPython(fill_training_quota_ledger, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.14 on 2026-10-19 17:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+data = {
+    'REQUESTS_PROFILING': {
+        'type': 'integer',
+        'value': 0,
+        'description': "Pourcentage des requêtes profilées (0 : profilage désactivé). "
+                       "Les requêtes les plus lentes sont consultables dans l'administration (Requêtes lentes)",
+    },
+}
+
+
+def create_general_settings(apps, schema_editor):
+    general_settings = apps.get_model('core', 'GeneralSettings')
+
+    for setting_name, parameters in data.items():
+        if not general_settings.objects.filter(setting=setting_name).exists():
+            general_settings.objects.create(setting=setting_name, parameters=parameters)
+
+
+def remove_general_settings(apps, schema_editor):
+    general_settings = apps.get_model('core', 'GeneralSettings')
+    general_settings.objects.filter(setting__in=data.keys()).delete()
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0293_training_quota_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowRequest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(auto_now_add=True, verbose_name='Date')),
+                ('method', models.CharField(max_length=16, verbose_name='Method')),
+                ('path', models.CharField(max_length=2048, verbose_name='Path')),
+                ('view_name', models.CharField(blank=True, max_length=256, null=True, verbose_name='View')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Status code')),
+                ('duration', models.FloatField(db_index=True, verbose_name='Duration (ms)')),
+                ('queries', models.PositiveIntegerField(verbose_name='Database queries')),
+                ('db_duration', models.FloatField(verbose_name='Database (ms)')),
+                ('template_duration', models.FloatField(verbose_name='Templates (ms)')),
+                ('mail_duration', models.FloatField(verbose_name='Emails (ms)')),
+                ('pdf_duration', models.FloatField(verbose_name='PDF (ms)')),
+                ('external_duration', models.FloatField(verbose_name='External services (ms)')),
+                ('statements', models.JSONField(blank=True, default=list, verbose_name='Slowest SQL statements')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Slow request',
+                'verbose_name_plural': 'Slow requests',
+                'ordering': ['-duration'],
+            },
+        ),
+        migrations.RunPython(create_general_settings, reverse_code=remove_general_settings),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.14 on 2026-10-19 19:02
+
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db import migrations
+from django.db.models import Exists, F, OuterRef
+from django.db.models.functions import JSONObject
+
+RESTRICTIONS_FLAGS = ('establishments_restrictions', 'levels_restrictions', 'bachelors_restrictions')
+RESTRICTIONS_RELATIONS = (
+    'allowed_establishments',
+    'allowed_highschools',
+    'allowed_highschool_levels',
+    'allowed_student_levels',
+    'allowed_post_bachelor_levels',
+    'allowed_bachelor_types',
+    'allowed_bachelor_mentions',
+    'allowed_bachelor_teachings',
+)
+
+
+def fill_slots_restrictions(apps, schema_editor):
+    """
+    Add the allowed bachelor types kinds to the restrictions documents
+    """
+    Slot = apps.get_model('core', 'Slot')
+    document = {flag: F(flag) for flag in RESTRICTIONS_FLAGS}
+
+    for relation in RESTRICTIONS_RELATIONS:
+        field = Slot._meta.get_field(relation)
+        target = f"{field.m2m_reverse_field_name()}_id"
+
+        document[relation] = ArraySubquery(
+            field.remote_field.through.objects
+            .filter(**{field.m2m_field_name(): OuterRef('pk')})
+            .order_by(target)
+            .values(target)
+        )
+
+    field = Slot._meta.get_field('allowed_bachelor_types')
+    allowed_bachelor_types = field.remote_field.through.objects.filter(**{field.m2m_field_name(): OuterRef('pk')})
+
+    for kind in ('general', 'technological'):
+        document[f"allowed_{kind}_bachelor_types"] = Exists(
+            allowed_bachelor_types.filter(**{f"{field.m2m_reverse_field_name()}__{kind}": True})
+        )
+
+    Slot.objects.update(restrictions=JSONObject(**document))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0294_slow_requests'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_slots_restrictions, migrations.RunPython.noop),
+    ]
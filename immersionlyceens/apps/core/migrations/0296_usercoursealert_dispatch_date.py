@@ -0,0 +1,46 @@
+from django.db import migrations, models
+
+
+def load_scheduled_tasks(apps, schema_editor):
+    ScheduledTask = apps.get_model('core', 'ScheduledTask')
+
+    if not ScheduledTask.objects.filter(command_name='send_dispatched_course_alerts').exists():
+        ScheduledTask.objects.create(
+            command_name="send_dispatched_course_alerts",
+            description="Envoi des alertes de places libérées",
+            active=True,
+            date=None,
+            time="00:05",
+            frequency=1,
+            monday=True,
+            tuesday=True,
+            wednesday=True,
+            thursday=True,
+            friday=True,
+            saturday=True,
+            sunday=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0295_slot_restrictions_bachelor_types'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercoursealert',
+            name='dispatch_date',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Dispatch request date'),
+        ),
+        migrations.AddIndex(
+            model_name='usercoursealert',
+            index=models.Index(
+                condition=models.Q(('dispatch_date__isnull', False), ('email_sent', False)),
+                fields=['dispatch_date'],
+                name='usercoursealert_dispatch_idx'
+            ),
+        ),
+        migrations.RunPython(load_scheduled_tasks, migrations.RunPython.noop),
+    ]
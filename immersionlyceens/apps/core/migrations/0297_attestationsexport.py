@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0296_usercoursealert_dispatch_date'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttestationsExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('format', models.CharField(choices=[('zip', 'ZIP archive'), ('pdf', 'Single pdf')], default='zip', max_length=8, verbose_name='Format')),
+                ('status', models.SmallIntegerField(choices=[(0, 'Pending'), (1, 'Running'), (2, 'Done'), (3, 'Error')], default=0, verbose_name='Status')),
+                ('done', models.PositiveIntegerField(default=0, verbose_name='Rendered attestations')),
+                ('total', models.PositiveIntegerField(blank=True, null=True, verbose_name='Attestations')),
+                ('path', models.CharField(blank=True, max_length=256, null=True, verbose_name='File path')),
+                ('message', models.TextField(blank=True, null=True, verbose_name='Message')),
+                ('creation_date', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('end_date', models.DateTimeField(blank=True, null=True, verbose_name='End date')),
+                ('establishment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.establishment', verbose_name='Establishment')),
+                ('period', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.period', verbose_name='Period')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Attestations export',
+                'verbose_name_plural': 'Attestations exports',
+                'ordering': ['-creation_date'],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0297_attestationsexport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='annualpurgecheckpoint',
+            name='university_year',
+            field=models.CharField(default='', max_length=256, verbose_name='University year'),
+        ),
+        migrations.AlterField(
+            model_name='annualpurgecheckpoint',
+            name='step',
+            field=models.CharField(max_length=64, verbose_name='Step'),
+        ),
+        migrations.AddConstraint(
+            model_name='annualpurgecheckpoint',
+            constraint=models.UniqueConstraint(
+                fields=('university_year', 'step'), name='unique_annual_purge_checkpoint_step'
+            ),
+        ),
+    ]
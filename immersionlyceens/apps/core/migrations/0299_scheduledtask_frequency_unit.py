@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+def update_scheduled_tasks(apps, schema_editor):
+    ScheduledTask = apps.get_model('core', 'ScheduledTask')
+
+    # Free seats alerts sent within minutes
+    ScheduledTask.objects.filter(command_name='send_dispatched_course_alerts').update(
+        time="00:00",
+        frequency=5,
+        frequency_unit='minutes',
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0298_annualpurgecheckpoint_university_year'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='scheduledtask',
+            name='frequency',
+            field=models.SmallIntegerField(blank=True, null=True, verbose_name='Frequency'),
+        ),
+        migrations.AddField(
+            model_name='scheduledtask',
+            name='frequency_unit',
+            field=models.CharField(
+                choices=[('hours', 'Hours'), ('minutes', 'Minutes')],
+                default='hours',
+                max_length=16,
+                verbose_name='Frequency unit'
+            ),
+        ),
+        migrations.RunPython(update_scheduled_tasks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+def load_scheduled_tasks(apps, schema_editor):
+    ScheduledTask = apps.get_model('core', 'ScheduledTask')
+
+    if not ScheduledTask.objects.filter(command_name='run_attestations_exports').exists():
+        ScheduledTask.objects.create(
+            command_name="run_attestations_exports",
+            description="Exports des attestations de présence demandés par les utilisateurs",
+            active=True,
+            date=None,
+            time="00:00",
+            frequency=5,
+            frequency_unit="minutes",
+            monday=True,
+            tuesday=True,
+            wednesday=True,
+            thursday=True,
+            friday=True,
+            saturday=True,
+            sunday=True
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0299_scheduledtask_frequency_unit'),
+    ]
+
+    operations = [
+        migrations.RunPython(load_scheduled_tasks, migrations.RunPython.noop)
+    ]
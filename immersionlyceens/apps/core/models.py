@@ -14,6 +14,7 @@ import logging
 import os
 import re
 import uuid
+from collections import Counter
 from functools import partial
 from os.path import dirname, join
 from typing import Any, Optional, List
@@ -25,11 +26,14 @@ from django.apps import apps
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, Group
 from django.contrib.auth.signals import user_logged_in, user_logged_out, user_login_failed
+from django.contrib.postgres.expressions import ArraySubquery
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.files.storage import default_storage
 from django.core.validators import RegexValidator
-from django.db import models
-from django.db.models import Max, Q, Sum, Case, When, Value, BooleanField
-from django.db.models.functions import Coalesce
+from django.db import models, transaction
+from django.db.models import Max, Q, Sum, Case, When, Value, BooleanField, Count, Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, JSONObject
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.template.defaultfilters import date as _date, filesizeformat
 from django.utils import timezone
@@ -39,14 +43,15 @@ from django_countries.fields import CountryField
 
 from immersionlyceens.apps.core.managers import PostBacImmersionManager
 from immersionlyceens.fields import UpperCharField
-from immersionlyceens.libs.mails.utils import send_email
+from immersionlyceens.libs.mails.utils import send_email, send_emails
 from immersionlyceens.libs.validators import JsonSchemaValidator
 
 from ...libs.utils import get_general_setting
 from .managers import (
     ActiveManager, CustomDeleteManager, EstablishmentQuerySet,
-    HighSchoolAgreedManager, StructureQuerySet,
+    HighSchoolAgreedManager, ImmersionQuerySet, StructureQuerySet,
 )
+from .signals import immersions_cancelled
 
 logger = logging.getLogger(__name__)
 
@@ -459,6 +464,115 @@ class StudentLevel(models.Model):
         ordering = ['order']
 
 
+class RegistrationProfile:
+    """
+    User facts needed by the slots restrictions checks (see ImmersionUser.can_register_slot),
+    computed with a few queries and reused for every checked slot
+    """
+
+    def __init__(self, user):
+        groups = set(user.groups.values_list('name', flat=True))
+
+        self.is_high_school_student = 'LYC' in groups
+        self.is_student = 'ETU' in groups
+        self.is_visitor = 'VIS' in groups
+
+        if self.is_high_school_student:
+            record = user.get_high_school_student_record()
+            self.high_school_record_valid = bool(record and record.is_valid())
+
+            if self.high_school_record_valid:
+                bachelor_type = record.bachelor_type
+                self.highschool_id = record.highschool_id
+                self.level_id = record.level_id
+                self.post_bachelor_level_id = record.post_bachelor_level_id
+                self.bachelor_type_id = record.bachelor_type_id
+                self.bachelor_type_flags = (
+                    (bachelor_type.professional, bachelor_type.general, bachelor_type.technological)
+                    if bachelor_type else (False, False, False)
+                )
+                self.technological_bachelor_mention_id = record.technological_bachelor_mention_id
+                self.general_bachelor_teachings = frozenset(
+                    record.general_bachelor_teachings.values_list('id', flat=True)
+                )
+
+        if self.is_student:
+            record = user.get_student_record()
+            establishment = user.get_student_establishment() if record else None
+            self.student_record_found = record is not None
+            self.student_establishment_id = establishment.pk if establishment else None
+            self.student_level_id = record.level_id if record else None
+
+        if self.is_visitor:
+            record = user.get_visitor_record()
+            self.visitor_record_valid = bool(record and record.is_valid())
+
+
+class SlotRestrictions:
+    """
+    Slot restrictions document (see Slot.restrictions) with frozensets of allowed ids
+    """
+
+    def __init__(self, document):
+        self.establishments_restrictions = bool(document.get('establishments_restrictions', False))
+        self.levels_restrictions = bool(document.get('levels_restrictions', False))
+        self.bachelors_restrictions = bool(document.get('bachelors_restrictions', False))
+
+        for relation in Slot.RESTRICTIONS_RELATIONS:
+            setattr(self, relation, frozenset(document.get(relation) or []))
+
+        for flag in Slot.RESTRICTIONS_BACHELOR_TYPES_FLAGS:
+            setattr(self, flag, bool(document.get(flag, False)))
+
+    def has_restrictions(self):
+        return self.establishments_restrictions or self.levels_restrictions or self.bachelors_restrictions
+
+    def high_school_student_errors(self, profile):
+        errors = []
+
+        if self.establishments_restrictions and profile.highschool_id not in self.allowed_highschools:
+            errors.append(_('High schools restrictions in effect'))
+
+        if self.levels_restrictions and not (
+            profile.level_id in self.allowed_highschool_levels
+            or profile.post_bachelor_level_id in self.allowed_post_bachelor_levels
+        ):
+            errors.append(_('High school or post bachelor levels restrictions in effect'))
+
+        if self.bachelors_restrictions:
+            professional = profile.bachelor_type_flags[0]
+
+            bachelor_allowed = profile.bachelor_type_id in self.allowed_bachelor_types and any([
+                not any(profile.bachelor_type_flags),
+                professional,
+                self.allowed_technological_bachelor_types
+                and (not self.allowed_bachelor_mentions
+                     or profile.technological_bachelor_mention_id in self.allowed_bachelor_mentions),
+                self.allowed_general_bachelor_types
+                and (not self.allowed_bachelor_teachings
+                     or bool(self.allowed_bachelor_teachings & profile.general_bachelor_teachings)),
+            ])
+
+            if not bachelor_allowed:
+                errors.append(_('Bachelors restrictions in effect'))
+
+        return errors
+
+    def student_errors(self, profile):
+        errors = []
+
+        if self.establishments_restrictions and profile.student_establishment_id not in self.allowed_establishments:
+            errors.append(_('Establishments restrictions in effect'))
+
+        if self.levels_restrictions and profile.student_level_id not in self.allowed_student_levels:
+            errors.append(_('Student levels restrictions in effect'))
+
+        if self.bachelors_restrictions:
+            errors.append(_('Bachelors restrictions in effect'))
+
+        return errors
+
+
 class ImmersionUser(AbstractUser):
     """
     Main user class
@@ -650,10 +764,11 @@ class ImmersionUser(AbstractUser):
         user_filter = {'user__id': self.pk}
         return Group.objects.filter(**user_filter)
 
-    def send_message(self, request, template_code, copies=None, recipient='user', **kwargs):
+    def send_message(self, request, template_code, copies=None, recipient='user', outbox=None, **kwargs):
         """
         Get a MailTemplate by its code, replace variables and send
         :param template_code: Code of message to send
+        :param outbox: if set, list the message is appended to instead of being sent (see send_emails)
         :return: None if message sent else error msg
         """
         try:
@@ -671,7 +786,11 @@ class ImmersionUser(AbstractUser):
             message_body = template.parse_vars(user=self, request=request, recipient=recipient, **kwargs)
             from immersionlyceens.libs.mails.variables_parser import Parser
             logger.debug("Message body : %s" % message_body)
-            send_email(self.email, template.subject, message_body, copies=other_recipients)
+
+            if outbox is not None:
+                outbox.append((self.email, template.subject, message_body, other_recipients))
+            else:
+                send_email(self.email, template.subject, message_body, copies=other_recipients)
         except Exception as e:
             logger.exception(e)
             msg = gettext("Couldn't send email : %s" % e)
@@ -788,16 +907,11 @@ class ImmersionUser(AbstractUser):
         """
         Returns a dictionary with remaining registrations count for each period
         If the current user is not a student, return 0 for each period
+        All the periods are computed with a single query
 
         It does NOT check the training quota per period
         """
-        from immersionlyceens.apps.immersion.models import (
-            HighSchoolStudentRecordQuota, StudentRecordQuota,
-            VisitorRecordQuota,
-        )
-
         record = None
-        remaining = { period.pk: 0 for period in Period.objects.all() }
 
         # Not a student or no record yet : no registration
         if self.is_high_school_student():
@@ -808,27 +922,31 @@ class ImmersionUser(AbstractUser):
             record = self.get_visitor_record()
 
         if not record or not record.is_valid():
-            return remaining
-
-        for period in Period.objects.all():
-            registrations = self.immersions.filter(
-                slot__date__gte=period.immersion_start_date,
-                slot__date__lte=period.immersion_end_date,
-                cancellation_type__isnull=True,
-                slot__event__isnull=True,
-            ).count()
+            remaining = {pk: 0 for pk in Period.objects.values_list('pk', flat=True)}
+        else:
+            registrations = (
+                Immersion.objects.filter(
+                    student=self,
+                    slot__date__gte=OuterRef('immersion_start_date'),
+                    slot__date__lte=OuterRef('immersion_end_date'),
+                    cancellation_type__isnull=True,
+                    slot__event__isnull=True,
+                )
+                .values('student')
+                .annotate(total=Count('pk'))
+                .values('total')
+            )
 
             # Default period quota or student record quota
             # FIXME : what if custom_quota.allowed_immersions < period.allowed_immersions ?
-            try:
-                custom_quota = record.quota.get(period=period)
-                allowed_immersions = custom_quota.allowed_immersions
-            except (HighSchoolStudentRecordQuota.DoesNotExist, StudentRecordQuota.DoesNotExist,
-                    VisitorRecordQuota.DoesNotExist):
-                logger.debug("%s : record not found" % self)
-                allowed_immersions = period.allowed_immersions
+            custom_quota = record.quota.filter(period=OuterRef('pk')).values('allowed_immersions')[:1]
 
-            remaining[period.pk] = allowed_immersions - registrations
+            remaining = dict(
+                Period.objects.annotate(
+                    remaining=Coalesce(Subquery(custom_quota), F('allowed_immersions'))
+                        - Coalesce(Subquery(registrations), 0)
+                ).values_list('pk', 'remaining')
+            )
 
         return remaining
 
@@ -864,116 +982,63 @@ class ImmersionUser(AbstractUser):
         return
 
 
+    def get_registration_profile(self):
+        """
+        :return: the user RegistrationProfile, computed on first call
+        """
+        if getattr(self, '_registration_profile', None) is None:
+            self._registration_profile = RegistrationProfile(self)
+
+        return self._registration_profile
+
     def can_register_slot(self, slot=None):
         """
         Slot registration check : validate only User vs Slot restrictions here,
         - NOT slot registration delay
         - NOT registrations quotas
+        :param slot: slot restrictions document (see Slot.restrictions) or SlotRestrictions object
         """
         errors = []
 
-        slot_has_restrictions = any([
-            slot.get('establishments_restrictions', False),
-            slot.get('levels_restrictions', False),
-            slot.get('bachelors_restrictions', False),
-        ])
+        if not slot:
+            return True, errors
+
+        restrictions = slot if isinstance(slot, SlotRestrictions) else SlotRestrictions(slot)
 
         # Returns True if no restrictions are found
-        if not slot or not slot_has_restrictions:
+        if not restrictions.has_restrictions():
             return True, errors
 
-        if self.is_high_school_student():
-            record = self.get_high_school_student_record()
+        profile = self.get_registration_profile()
 
-            if not record or not record.is_valid():
+        if profile.is_high_school_student:
+            if not profile.high_school_record_valid:
                 errors.append(_("High school record not found or not valid"))
                 return False, errors
 
-            high_school_conditions = [
-                slot.get('allowed_highschools', False),
-                record.highschool in slot.get('allowed_highschools_list', [])
-            ]
-
-            levels_conditions = [
-                slot.get('allowed_highschool_levels', False) and record.level in slot.get('allowed_highschool_levels_list', []),
-                slot.get('allowed_post_bachelor_levels', False) and
-                    record.post_bachelor_level in slot.get('allowed_post_bachelor_levels_list', [])
-            ]
-
-            bachelor_restrictions = [
-                slot.get('allowed_bachelor_types', False) and record.bachelor_type in slot.get('allowed_bachelor_types_list', []),
-                any([
-                    not record.bachelor_type or not any([
-                        record.bachelor_type.professional,
-                        record.bachelor_type.general,
-                        record.bachelor_type.technological
-                    ]),
-                    record.bachelor_type and record.bachelor_type.professional,
-                    any(b_type.technological for b_type in slot.get('allowed_bachelor_types_list', []))
-                    and (not slot.get('allowed_bachelor_mentions', False) or
-                         record.technological_bachelor_mention in slot['allowed_bachelor_mentions_list']),
-                    any(b_type.general for b_type in slot.get('allowed_bachelor_types_list', []))
-                    and (not slot.get('allowed_bachelor_teachings', False) or
-                         set(slot.get('allowed_bachelor_teachings_list', [])).intersection(
-                             set(record.general_bachelor_teachings.all()))
-                    )
-                ])
-            ]
-
-            if slot.get('establishments_restrictions', False) and not all(high_school_conditions):
-                errors.append(_('High schools restrictions in effect'))
-            if slot.get('levels_restrictions', False) and not any(levels_conditions):
-                errors.append(_('High school or post bachelor levels restrictions in effect'))
-            if slot.get('bachelors_restrictions', False) and not all(bachelor_restrictions):
-                errors.append(_('Bachelors restrictions in effect'))
+            errors = restrictions.high_school_student_errors(profile)
 
             if errors:
                 return False, errors
 
-        if self.is_student():
-            establishment = self.get_student_establishment()
-            record = self.get_student_record()
-
-            if not record:
+        if profile.is_student:
+            if not profile.student_record_found:
                 errors.append(_("Student record not found"))
                 return False, errors
 
-            # record.home_institution()[0] in slot['allowed_establishments'].values_list('label', flat=True)
-            establishment_conditions = [
-                slot.get('allowed_establishments', False),
-                establishment and establishment in slot.get('allowed_establishments_list', []),
-            ]
-
-            levels_conditions = [
-                slot.get('allowed_student_levels', False),
-                record.level in slot.get('allowed_student_levels_list', []),
-            ]
-
-            if slot.get('establishments_restrictions', False) and not all(establishment_conditions):
-                errors.append(_('Establishments restrictions in effect'))
-
-            if slot.get('levels_restrictions', False) and not all(levels_conditions):
-                errors.append(_('Student levels restrictions in effect'))
-
-            if slot.get('bachelors_restrictions', False):
-                errors.append(_('Bachelors restrictions in effect'))
+            errors = restrictions.student_errors(profile)
 
             if errors:
                 return False, errors
 
-        # Restrictions checks for visitors
-        if self.is_visitor():
-            record = self.get_visitor_record()
-
-            if not record or not record.is_valid():
+        # Restrictions checks for visitors : they can register to "open to all" slots only
+        if profile.is_visitor:
+            if not profile.visitor_record_valid:
                 errors.append(_("Visitor record not found or not valid"))
 
-            # visitors can register to "open to all" slots
-            if slot_has_restrictions:
-                errors.append(_('Slot restrictions in effect'))
+            errors.append(_('Slot restrictions in effect'))
 
-            if errors:
-                return False, errors
+            return False, errors
 
         return True, errors
 
@@ -2893,6 +2958,21 @@ class Slot(models.Model):
         (OUTSIDE, _("Outside of host establishment")),
     ]
 
+    # Restrictions document content
+    RESTRICTIONS_FLAGS = ('establishments_restrictions', 'levels_restrictions', 'bachelors_restrictions')
+    RESTRICTIONS_RELATIONS = (
+        'allowed_establishments',
+        'allowed_highschools',
+        'allowed_highschool_levels',
+        'allowed_student_levels',
+        'allowed_post_bachelor_levels',
+        'allowed_bachelor_types',
+        'allowed_bachelor_mentions',
+        'allowed_bachelor_teachings',
+    )
+    # True if at least one of the allowed bachelor types is general / technological
+    RESTRICTIONS_BACHELOR_TYPES_FLAGS = ('allowed_general_bachelor_types', 'allowed_technological_bachelor_types')
+
     period = models.ForeignKey(
         Period, verbose_name=_("Period"), null=True, blank=True, on_delete=models.CASCADE, related_name="slots",
     )
@@ -2989,6 +3069,9 @@ class Slot(models.Model):
         GeneralBachelorTeaching, verbose_name=_("Allowed bachelor teachings"), related_name='+', blank=True
     )
 
+    # Restrictions flags and allowed objects ids, maintained on write (see Slot.update_restrictions)
+    restrictions = models.JSONField(_("Restrictions"), default=dict, blank=True, editable=False)
+
     registration_limit_delay = models.PositiveSmallIntegerField(
         _('Registration limit delay'), null=True, blank=True, default=0
     )
@@ -3252,7 +3335,7 @@ class Slot(models.Model):
     def get_establishment_or_highschool(self):
         return self.get_establishment() or self.get_highschool()
 
-    def save(self, *args, **kwargs):
+    def set_limit_dates(self):
         """
         Parse registration and cancellation dates based on :
           - period registration policy & period registrations end date
@@ -3299,8 +3382,94 @@ class Slot(models.Model):
             self.registration_limit_date = None
             self.cancellation_limit_date = None
 
+    def set_restrictions_flags(self):
+        """
+        Copy the restrictions flags in the restrictions document. The allowed objects ids are
+        updated in the database by the m2m_changed receivers (see update_slot_restrictions) : they are
+        read again, the instance document may predate these updates
+        """
+        allowed = {}
+
+        # New slots (or duplicated ones) don't have allowed objects yet
+        if self.pk and not self._state.adding:
+            allowed = Slot.objects.filter(pk=self.pk).values_list('restrictions', flat=True).first() or {}
+
+        self.restrictions = {
+            **{relation: allowed.get(relation, []) for relation in self.RESTRICTIONS_RELATIONS},
+            **{flag: allowed.get(flag, False) for flag in self.RESTRICTIONS_BACHELOR_TYPES_FLAGS},
+            **{flag: getattr(self, flag) for flag in self.RESTRICTIONS_FLAGS},
+        }
+
+    def save(self, *args, **kwargs):
+        self.set_limit_dates()
+        self.set_restrictions_flags()
         return super().save(*args, **kwargs)
 
+    @staticmethod
+    def restrictions_document():
+        """
+        Restrictions document expression : flags, sorted ids of the allowed objects and allowed bachelor
+        types kinds
+        ex: {"levels_restrictions": true, "allowed_highschool_levels": [1, 3], "allowed_highschools": [], ...}
+        """
+        bachelor_types = Slot._meta.get_field('allowed_bachelor_types')
+        allowed_bachelor_types = bachelor_types.remote_field.through.objects.filter(
+            **{bachelor_types.m2m_field_name(): OuterRef('pk')}
+        )
+        target = bachelor_types.m2m_reverse_field_name()
+
+        return JSONObject(
+            **{flag: F(flag) for flag in Slot.RESTRICTIONS_FLAGS},
+            **{relation: Slot.related_array(relation, 'id') for relation in Slot.RESTRICTIONS_RELATIONS},
+            allowed_general_bachelor_types=Exists(allowed_bachelor_types.filter(**{f"{target}__general": True})),
+            allowed_technological_bachelor_types=Exists(
+                allowed_bachelor_types.filter(**{f"{target}__technological": True})
+            ),
+        )
+
+    @classmethod
+    def update_restrictions(cls, pks):
+        """
+        Rebuild the restrictions document of slots with a single query
+        :param pks: slots ids (or a values('pk') queryset)
+        """
+        return cls.objects.filter(pk__in=pks).update(restrictions=cls.restrictions_document())
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the loaded seats number to detect increases (see dispatch_course_alerts_on_slot_change)
+        instance._loaded_n_places = instance.__dict__.get('n_places')
+        return instance
+
+    @staticmethod
+    def related_array(relation, field=None, **json_fields):
+        """
+        Correlated ARRAY(SELECT ...) subquery of a many to many relation values, for Slot querysets annotations.
+        Unlike ArrayAgg, several relations can be annotated without joining them all in the main query (the
+        cartesian product of the joined rows would be built for each slot before the aggregation)
+        :param relation: Slot many to many field name (ex: 'allowed_highschools')
+        :param field: related model field returned in the array (ex: 'label')
+        :param json_fields: or JSON objects keys and related model fields (ex: city='city', label='label')
+        :return: ArraySubquery of the distinct sorted values, empty array if there is none
+        """
+        m2m_field = Slot._meta.get_field(relation)
+        target = m2m_field.m2m_reverse_field_name()
+
+        if json_fields:
+            value = JSONObject(**{key: F(f"{target}__{name}") for key, name in json_fields.items()})
+        else:
+            value = F(f"{target}__{field}")
+
+        return ArraySubquery(
+            m2m_field.remote_field.through.objects
+            .filter(**{m2m_field.m2m_field_name(): OuterRef('pk')})
+            .annotate(value=value)
+            .values('value')
+            .distinct()
+            .order_by('value')
+        )
+
 
     class Meta:
         verbose_name = _('Slot')
@@ -3346,6 +3515,15 @@ class Immersion(models.Model):
     registration_date = models.DateTimeField(_("Registration date"), auto_now_add=True)
     cancellation_date = models.DateTimeField(_("Cancellation date"), null=True, blank=True)
 
+    objects = ImmersionQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Keep the loaded cancellation to detect registrations changes (see update_training_quota_ledger)
+        instance._loaded_cancellation_type_id = instance.__dict__.get('cancellation_type_id')
+        return instance
+
     def get_attendance_status(self) -> str:
         """
         get attendance status
@@ -3455,6 +3633,118 @@ class Immersion(models.Model):
         ]
 
 
+class TrainingQuotaLedger(models.Model):
+    """
+    Active registrations of a user to the courses slots of a training during a period, for the
+    training quotas (see ACTIVATE_TRAINING_QUOTAS). Kept up to date with the immersions in the same
+    transaction, see TrainingQuotaLedger.add_registrations and the Immersion signals
+    """
+    student = models.ForeignKey(
+        ImmersionUser, verbose_name=_("Student"), on_delete=models.CASCADE, related_name="training_quotas"
+    )
+    period = models.ForeignKey(Period, verbose_name=_("Period"), on_delete=models.CASCADE, related_name="+")
+    training = models.ForeignKey(Training, verbose_name=_("Training"), on_delete=models.CASCADE, related_name="+")
+    registrations = models.PositiveIntegerField(_("Registrations"), default=0)
+
+    @classmethod
+    def get_registrations(cls, student_id, period_id, training_id, lock=False):
+        """
+        :param lock: lock the entry until the end of the transaction, so that concurrent registrations
+          of the student to the training are checked one after the other
+        :return: active registrations count
+        """
+        if not lock:
+            return (
+                cls.objects.filter(student_id=student_id, period_id=period_id, training_id=training_id)
+                .values_list('registrations', flat=True)
+                .first()
+            ) or 0
+
+        cls.objects.get_or_create(student_id=student_id, period_id=period_id, training_id=training_id)
+
+        return (
+            cls.objects.select_for_update()
+            .filter(student_id=student_id, period_id=period_id, training_id=training_id)
+            .values_list('registrations', flat=True)
+            .get()
+        )
+
+    @classmethod
+    def add_registrations(cls, counts):
+        """
+        :param counts: {(student id, period id, training id): registrations to add (negative to remove)}
+        """
+        for (student_id, period_id, training_id), count in counts.items():
+            if not count or not period_id or not training_id:
+                continue
+
+            # No entry creation on removals : the student, period or training may be being deleted
+            if count > 0:
+                cls.objects.get_or_create(student_id=student_id, period_id=period_id, training_id=training_id)
+
+            cls.objects.filter(student_id=student_id, period_id=period_id, training_id=training_id).update(
+                registrations=Greatest(F('registrations') + count, 0)
+            )
+
+    @classmethod
+    def recount(cls, student_id, period_id, training_id):
+        """
+        Recompute an entry from the active immersions
+        """
+        registrations = Immersion.objects.filter(
+            student_id=student_id,
+            slot__period_id=period_id,
+            slot__course__training_id=training_id,
+            cancellation_type__isnull=True,
+        ).count()
+
+        cls.objects.update_or_create(
+            student_id=student_id,
+            period_id=period_id,
+            training_id=training_id,
+            defaults={'registrations': registrations}
+        )
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recompute all the entries from the active immersions
+        :return: number of entries
+        """
+        counts = (
+            Immersion.objects.filter(
+                cancellation_type__isnull=True,
+                slot__period__isnull=False,
+                slot__course__isnull=False,
+            )
+            .values('student', 'slot__period', 'slot__course__training')
+            .annotate(count=Count('pk'))
+            .values_list('student', 'slot__period', 'slot__course__training', 'count')
+        )
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            entries = cls.objects.bulk_create([
+                cls(student_id=student_id, period_id=period_id, training_id=training_id, registrations=count)
+                for student_id, period_id, training_id, count in counts
+            ])
+
+        return len(entries)
+
+    def __str__(self):
+        return f"{self.student} - {self.period} - {self.training} : {self.registrations}"
+
+    class Meta:
+        verbose_name = _('Training quota ledger entry')
+        verbose_name_plural = _('Training quota ledger')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['student', 'period', 'training'],
+                name='unique_training_quota_ledger_entry',
+            )
+        ]
+
+
 class ImmersionGroupRecord(models.Model):
     """
     Group registration to a slot
@@ -3631,15 +3921,139 @@ class UserCourseAlert(models.Model):
     email = models.EmailField(_('Recipient'), blank=False, null=False)
     email_sent = models.BooleanField(_("Alert sent status"), default=False, blank=False, null=False)
     alert_date = models.DateField(_("Date"), auto_now_add=True)
+    dispatch_date = models.DateTimeField(_("Dispatch request date"), null=True, blank=True)
     course = models.ForeignKey(
         Course, verbose_name=_("Course"), null=False, blank=False, on_delete=models.CASCADE, related_name="alerts",
     )
 
+    @classmethod
+    def send_alerts(cls, course_ids=None):
+        """
+        Send the ALERTE_DISPO message to the pending alerts of courses having available slots
+        The message is parsed once per course and all emails are sent in one batch
+        :param course_ids: courses to check, None for all courses
+        :return: list of errors
+        """
+        template_code = 'ALERTE_DISPO'
+        today = timezone.localdate()
+        now = timezone.now()
+
+        alerts = cls.objects.filter(email_sent=False)
+
+        if course_ids is not None:
+            alerts = alerts.filter(course_id__in=course_ids)
+
+        # Pending alerts lookup first (see 'usercoursealert_pending_idx' index)
+        alerts_course_ids = set(alerts.values_list('course_id', flat=True))
+
+        if not alerts_course_ids:
+            return []
+
+        try:
+            template = MailTemplate.objects.get(code=template_code, active=True)
+        except MailTemplate.DoesNotExist:
+            return [
+                gettext("Cannot find an active template named '%s'. "
+                        "Please check the Messages Templates in admin section.") % template_code
+            ]
+
+        courses = Course.objects.filter(
+            id__in=alerts_course_ids,
+            slots__date__gt=today,
+            slots__registration_limit_date__gt=now,
+            slots__allow_individual_registrations=True,
+        ).distinct()
+
+        slots = Slot.objects\
+            .filter(course__in=courses, date__gt=today, registration_limit_date__gt=now)\
+            .annotate(
+                available_places=F('n_places') - Count('immersions', filter=Q(immersions__cancellation_type__isnull=True))
+            )\
+            .filter(available_places__gt=0)\
+            .order_by('date', 'start_time')
+
+        courses_slots = {}
+        for slot in slots:
+            courses_slots.setdefault(slot.course_id, []).append(slot)
+
+        errors = []
+        outbox = []
+        alerts_ids = []
+
+        for course in Course.objects.filter(id__in=courses_slots.keys()):
+            try:
+                message_body = template.parse_vars(
+                    user=None, request=None, slot_list=courses_slots[course.id], course=course
+                )
+            except Exception as e:
+                logger.exception(e)
+                errors.append(gettext("Cannot parse template for course %s : '%s'") % (course, e))
+                continue
+
+            for alert in alerts.filter(course=course):
+                outbox.append((alert.email, template.subject, message_body, []))
+                alerts_ids.append(alert.id)
+
+        failed = set()
+        ret = send_emails(outbox, failed=failed)
+
+        if ret:
+            errors.append(ret)
+
+        cls.objects\
+            .filter(id__in=[alert_id for index, alert_id in enumerate(alerts_ids) if index not in failed])\
+            .update(email_sent=True)
+
+        return errors
+
+    @classmethod
+    def dispatch(cls, course_ids):
+        """
+        Request the alerts of courses where seats may have been freed, they are sent by the
+        send_dispatched_course_alerts command (see send_dispatched_alerts)
+        The request is part of the current transaction : a rollback cancels it
+        """
+        course_ids = {course_id for course_id in course_ids if course_id}
+
+        if course_ids:
+            cls.objects\
+                .filter(course_id__in=course_ids, email_sent=False, dispatch_date__isnull=True)\
+                .update(dispatch_date=timezone.now())
+
+    @classmethod
+    def send_dispatched_alerts(cls):
+        """
+        Send the alerts of courses requested by dispatch() at least COURSE_ALERTS_DEBOUNCE seconds ago :
+        the requests made in the meantime for the same courses are sent together
+        :return: list of errors
+        """
+        dispatch_date = timezone.now() - datetime.timedelta(seconds=settings.COURSE_ALERTS_DEBOUNCE)
+        course_ids = set(
+            cls.objects
+                .filter(email_sent=False, dispatch_date__lte=dispatch_date)
+                .values_list('course_id', flat=True)
+        )
+
+        if not course_ids:
+            return []
+
+        cls.objects.filter(course_id__in=course_ids, email_sent=False).update(dispatch_date=None)
+
+        return cls.send_alerts(course_ids)
+
     class Meta:
         unique_together = ('email', 'course')
         verbose_name = _('Course free slot alert')
         verbose_name_plural = _('Course free slot alerts')
         ordering = ['-alert_date', ]
+        indexes = [
+            models.Index(fields=['course'], condition=Q(email_sent=False), name='usercoursealert_pending_idx'),
+            models.Index(
+                fields=['dispatch_date'],
+                condition=Q(email_sent=False, dispatch_date__isnull=False),
+                name='usercoursealert_dispatch_idx'
+            ),
+        ]
 
 
 class AnnualStatistics(models.Model):
@@ -3677,6 +4091,100 @@ class AnnualStatistics(models.Model):
         ordering = ['-year']
 
 
+class AnnualPurgeCheckpoint(models.Model):
+    """
+    Annual purge progress, one row per started step of the active university year purge.
+    Rows are deleted when the purge is complete : an interrupted purge resumes from them.
+    """
+    university_year = models.CharField(_("University year"), max_length=256, default='')
+    step = models.CharField(_("Step"), max_length=64)
+    count = models.PositiveIntegerField(_("Processed objects"), default=0)
+    duration = models.FloatField(_("Duration (seconds)"), default=0)
+    done = models.BooleanField(_("Done"), default=False)
+    message = models.TextField(_("Message"), blank=True, null=True)
+    start_date = models.DateTimeField(_("Start date"), auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.step} : {self.count}"
+
+    class Meta:
+        verbose_name = _('Annual purge checkpoint')
+        verbose_name_plural = _('Annual purge checkpoints')
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['university_year', 'step'], name='unique_annual_purge_checkpoint_step'
+            )
+        ]
+
+
+class AttestationsExport(models.Model):
+    """
+    Attendance certificates of a period or an establishment, built in the background for a user
+    (see immersion_attestations_download view). Exports are deleted after RETENTION_DAYS.
+    """
+    PENDING = 0
+    RUNNING = 1
+    DONE = 2
+    ERROR = 3
+
+    STATUSES = [
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (ERROR, _('Error')),
+    ]
+
+    FORMATS = [
+        ('zip', _('ZIP archive')),
+        ('pdf', _('Single pdf')),
+    ]
+
+    RETENTION_DAYS = 1
+
+    user = models.ForeignKey(
+        ImmersionUser, verbose_name=_("User"), on_delete=models.CASCADE, blank=False, null=False, related_name='+'
+    )
+    period = models.ForeignKey(
+        Period, verbose_name=_("Period"), on_delete=models.CASCADE, blank=True, null=True, related_name='+'
+    )
+    establishment = models.ForeignKey(
+        Establishment, verbose_name=_("Establishment"), on_delete=models.CASCADE, blank=True, null=True,
+        related_name='+'
+    )
+    format = models.CharField(_("Format"), max_length=8, choices=FORMATS, default='zip')
+    status = models.SmallIntegerField(_("Status"), choices=STATUSES, default=PENDING)
+    done = models.PositiveIntegerField(_("Rendered attestations"), default=0)
+    total = models.PositiveIntegerField(_("Attestations"), blank=True, null=True)
+    path = models.CharField(_("File path"), max_length=256, blank=True, null=True)
+    message = models.TextField(_("Message"), blank=True, null=True)
+    creation_date = models.DateTimeField(_("Creation date"), auto_now_add=True)
+    end_date = models.DateTimeField(_("End date"), blank=True, null=True)
+
+    def get_filename(self):
+        pks = [str(obj.pk) for obj in (self.period, self.establishment) if obj]
+        return f"attestations_{'_'.join(pks)}.{self.format}"
+
+    @classmethod
+    def delete_expired(cls):
+        expired = cls.objects.filter(
+            creation_date__lt=timezone.now() - datetime.timedelta(days=cls.RETENTION_DAYS)
+        )
+
+        for path in expired.filter(path__isnull=False).values_list('path', flat=True):
+            default_storage.delete(path)
+
+        expired.delete()
+
+    def __str__(self):
+        return f"{self.user} - {self.get_filename()} - {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = _('Attestations export')
+        verbose_name_plural = _('Attestations exports')
+        ordering = ['-creation_date']
+
+
 class CertificateLogo(models.Model):
 
     """
@@ -3887,12 +4395,24 @@ class RefStructuresNotificationsSettings(models.Model):
 
 
 class ScheduledTask(models.Model):
+    # Frequency units (datetime.timedelta arguments)
+    HOURS = 'hours'
+    MINUTES = 'minutes'
+
+    FREQUENCY_UNITS = [
+        (HOURS, _('Hours')),
+        (MINUTES, _('Minutes')),
+    ]
+
     command_name = models.CharField(_("Django command name"), max_length=128, unique=True)
     description = models.CharField(_("Description"), max_length=256)
     active = models.BooleanField(_("Active"), blank=False, null=False, default=True)
     date = models.DateField(_("Execution Date"), blank=True, null=True)
     time = models.TimeField(_("Execution time"), auto_now=False, auto_now_add=False, blank=False, null=False)
-    frequency = models.SmallIntegerField(_("Frequency (in hours)"), blank=True, null=True)
+    frequency = models.SmallIntegerField(_("Frequency"), blank=True, null=True)
+    frequency_unit = models.CharField(
+        _("Frequency unit"), max_length=16, choices=FREQUENCY_UNITS, blank=False, null=False, default=HOURS
+    )
     monday = models.BooleanField(_("Monday"), blank=True, null=False, default=False)
     tuesday = models.BooleanField(_("Tuesday"), blank=True, null=False, default=False)
     wednesday = models.BooleanField(_("Wednesday"), blank=True, null=False, default=False)
@@ -3909,16 +4429,74 @@ class ScheduledTask(models.Model):
         verbose_name_plural = _('Scheduled tasks')
 
 
+class Percentile(models.Aggregate):
+    """
+    PostgreSQL continuous percentile
+    """
+    function = 'PERCENTILE_CONT'
+    name = 'Percentile'
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = models.FloatField()
+
+    def __init__(self, expression, percentile, **extra):
+        super().__init__(expression, percentile=float(percentile), **extra)
+
+
 class ScheduledTaskLog(models.Model):
     """
     Logs for Scheduled tasks
     """
+    EXIT_SUCCESS = 0
+    EXIT_ERROR = 1
+
+    # Default period of the executions metrics (admin and API)
+    METRICS_DAYS = 30
+
+    EXIT_STATUSES = [
+        (EXIT_SUCCESS, _('Success')),
+        (EXIT_ERROR, _('Error')),
+    ]
+
     task = models.ForeignKey(ScheduledTask, verbose_name=_("Task"), on_delete=models.CASCADE,
         blank=False, null=False, related_name='logs')
 
     execution_date = models.DateTimeField(_("Date"), auto_now_add=True)
     success = models.BooleanField(_("Success"), blank=True, null=True, default=True)
     message = models.TextField(_('Message'), blank=True, null=True)
+    duration = models.FloatField(_("Duration (seconds)"), blank=True, null=True)
+    # Empty while the task is running
+    exit_status = models.SmallIntegerField(_("Exit status"), choices=EXIT_STATUSES, blank=True, null=True)
+    end_date = models.DateTimeField(_("End date"), blank=True, null=True)
+    queries = models.PositiveIntegerField(_("Database queries"), blank=True, null=True)
+    rows = models.PositiveIntegerField(_("Written rows"), blank=True, null=True)
+    mails_sent = models.PositiveIntegerField(_("Sent emails"), blank=True, null=True)
+
+    @staticmethod
+    def get_metrics_annotations(prefix='', since=None):
+        """
+        Executions metrics aggregations : runs count, durations percentiles and queries, rows and emails
+        95th percentiles of the finished executions
+        :param prefix: lookup prefix ('logs__' to annotate ScheduledTask objects)
+        :param since: only use the executions started since this date
+        """
+        executions = Q(**{f"{prefix}duration__isnull": False})
+
+        if since:
+            executions &= Q(**{f"{prefix}execution_date__gte": since})
+
+        return {
+            'runs': Count(f'{prefix}id', filter=executions),
+            'errors': Count(
+                f'{prefix}id', filter=executions & Q(**{f"{prefix}exit_status": ScheduledTaskLog.EXIT_ERROR})
+            ),
+            'duration_p50': Percentile(f'{prefix}duration', percentile=0.5, filter=executions),
+            'duration_p95': Percentile(f'{prefix}duration', percentile=0.95, filter=executions),
+            'duration_max': Max(f'{prefix}duration', filter=executions),
+            'queries_p95': Percentile(f'{prefix}queries', percentile=0.95, filter=executions),
+            'rows_p95': Percentile(f'{prefix}rows', percentile=0.95, filter=executions),
+            'mails_sent_p95': Percentile(f'{prefix}mails_sent', percentile=0.95, filter=executions),
+            'last_execution_date': Max(f'{prefix}execution_date', filter=executions),
+        }
 
     class Meta:
         verbose_name = _('Scheduled task log')
@@ -3926,6 +4504,57 @@ class ScheduledTaskLog(models.Model):
         ordering = ['-execution_date', ]
 
 
+class SlowRequest(models.Model):
+    """
+    Slowest profiled requests (see the RequestsProfiling middleware) : only the
+    settings.SLOW_REQUESTS_COUNT slowest ones are kept.
+    Durations in milliseconds, sections durations include their database queries.
+    """
+    date = models.DateTimeField(_("Date"), auto_now_add=True)
+    method = models.CharField(_("Method"), max_length=16)
+    path = models.CharField(_("Path"), max_length=2048)
+    view_name = models.CharField(_("View"), max_length=256, blank=True, null=True)
+    user = models.ForeignKey(
+        ImmersionUser, verbose_name=_("User"), on_delete=models.SET_NULL, blank=True, null=True,
+        related_name='+'
+    )
+    status_code = models.PositiveSmallIntegerField(_("Status code"))
+    duration = models.FloatField(_("Duration (ms)"), db_index=True)
+    queries = models.PositiveIntegerField(_("Database queries"))
+    db_duration = models.FloatField(_("Database (ms)"))
+    template_duration = models.FloatField(_("Templates (ms)"))
+    mail_duration = models.FloatField(_("Emails (ms)"))
+    pdf_duration = models.FloatField(_("PDF (ms)"))
+    external_duration = models.FloatField(_("External services (ms)"))
+    # [{sql, executions, duration}, ...] : statements with the highest total duration
+    statements = models.JSONField(_("Slowest SQL statements"), default=list, blank=True)
+
+    @classmethod
+    def record(cls, **kwargs):
+        """
+        Store a request if it's among the slowest ones and drop the faster ones
+        :return: the new SlowRequest, None if faster than all the kept ones
+        """
+        keep = settings.SLOW_REQUESTS_COUNT
+        kept = cls.objects.order_by('-duration').values_list('duration', flat=True)[keep - 1:keep]
+
+        if kept and kwargs['duration'] <= kept[0]:
+            return None
+
+        slow_request = cls.objects.create(**kwargs)
+        cls.objects.filter(pk__in=cls.objects.order_by('-duration').values('pk')[keep:]).delete()
+
+        return slow_request
+
+    def __str__(self):
+        return f"{self.method} {self.path} - {self.duration}ms"
+
+    class Meta:
+        verbose_name = _('Slow request')
+        verbose_name_plural = _('Slow requests')
+        ordering = ['-duration', ]
+
+
 class History(models.Model):
     """
     Store various events like account creations or login, logout, failures, ...
@@ -3945,6 +4574,49 @@ class History(models.Model):
         verbose_name = _('History')
         verbose_name_plural = _('History')
 
+class ChangeLog(models.Model):
+    """
+    Insertions, updates and deletions of tracked objects (see track_changes), used by the change feed API
+    """
+    CREATED = 0
+    UPDATED = 1
+    DELETED = 2
+
+    ACTIONS = [
+        (CREATED, _('Created')),
+        (UPDATED, _('Updated')),
+        (DELETED, _('Deleted')),
+    ]
+
+    object_type = models.CharField(_("Object type"), max_length=128, null=False, blank=False)
+    object_id = models.PositiveIntegerField(_("Object id"), null=False, blank=False)
+    action = models.SmallIntegerField(_("Action"), choices=ACTIONS, null=False, blank=False)
+    date = models.DateTimeField(_("Date"), auto_now_add=True, db_index=True)
+
+    # Models registered with track_changes => fields published in the change feed
+    tracked_models = {}
+
+    @classmethod
+    def log(cls, model, pks, action):
+        """
+        Log the same action for multiple objects of a model (for bulk operations that don't send signals)
+        :param model: model class
+        :param pks: objects primary keys
+        :param action: CREATED, UPDATED or DELETED
+        """
+        cls.objects.bulk_create([
+            cls(object_type=model._meta.label_lower, object_id=pk, action=action) for pk in pks
+        ])
+
+    def __str__(self):
+        return f"{self.date} - {self.object_type} #{self.object_id} - {self.get_action_display()}"
+
+    class Meta:
+        verbose_name = _('Change log')
+        verbose_name_plural = _('Change logs')
+        ordering = ['date', 'id']
+
+
 class MefStat(models.Model):
     """
     Mef Stat 4 nomenclature for high school students levels from EduConnect
@@ -4086,3 +4758,198 @@ def user_hijack_end(sender, hijacker, hijacked, request, **kwargs):
 
 hijack_started.connect(user_hijack_start)
 hijack_ended.connect(user_hijack_end)
+
+
+def log_saved_object(sender, instance, created, raw=False, **kwargs):
+    # Ignore fixtures loading
+    if not raw:
+        ChangeLog.log(sender, [instance.pk], ChangeLog.CREATED if created else ChangeLog.UPDATED)
+
+def log_deleted_object(sender, instance, **kwargs):
+    ChangeLog.log(sender, [instance.pk], ChangeLog.DELETED)
+
+def log_m2m_changed_object(sender, instance, action, reverse, model, pk_set, **kwargs):
+    if reverse and action == "pre_clear":
+        # eg. user.slots.clear() : pk_set is None, read the tracked objects before they are removed
+        field = next(field for field in model._meta.many_to_many if field.remote_field.through is sender)
+        pk_set = model.objects.filter(**{field.name: instance.pk}).values_list('pk', flat=True)
+        ChangeLog.log(model, pk_set, ChangeLog.UPDATED)
+        return
+
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        ChangeLog.log(instance.__class__, [instance.pk], ChangeLog.UPDATED)
+    elif pk_set:
+        # eg. user.slots.add(slot) : the tracked objects are in pk_set
+        ChangeLog.log(model, pk_set, ChangeLog.UPDATED)
+
+def track_changes(models_fields):
+    """
+    Feed ChangeLog with saves, deletions and many to many relations changes of the given models
+    Note : bulk operations (bulk_create, QuerySet.update/delete) don't send signals and have to use ChangeLog.log()
+    :param models_fields: model => fields published in the change feed (no personal data)
+    """
+    for model, fields in models_fields.items():
+        ChangeLog.tracked_models[model] = tuple(fields)
+        post_save.connect(log_saved_object, sender=model, dispatch_uid=f"changelog_save_{model._meta.label}")
+        post_delete.connect(log_deleted_object, sender=model, dispatch_uid=f"changelog_delete_{model._meta.label}")
+
+        for field in model._meta.many_to_many:
+            m2m_changed.connect(
+                log_m2m_changed_object,
+                sender=field.remote_field.through,
+                dispatch_uid=f"changelog_m2m_{model._meta.label}_{field.name}"
+            )
+
+track_changes({
+    Slot: (
+        'id', 'period_id', 'course_id', 'course_type_id', 'event_id', 'campus_id', 'building_id', 'room',
+        'date', 'start_time', 'end_time', 'n_places', 'n_group_places', 'published', 'place', 'url',
+        'establishments_restrictions', 'levels_restrictions', 'bachelors_restrictions',
+        'registration_limit_date', 'cancellation_limit_date', 'allow_individual_registrations',
+        'allow_group_registrations', 'group_mode', 'public_group',
+    ),
+    Course: (
+        'id', 'label', 'training_id', 'structure_id', 'highschool_id', 'published', 'url', 'start_date', 'end_date',
+    ),
+    Immersion: (
+        'id', 'student_id', 'slot_id', 'cancellation_type_id', 'attendance_status', 'registration_date',
+        'cancellation_date',
+    ),
+    ImmersionGroupRecord: (
+        'id', 'slot_id', 'highschool_id', 'students_count', 'guides_count', 'cancellation_type_id',
+        'attendance_status', 'registration_date', 'cancellation_date', 'last_updated',
+    ),
+})
+
+
+def dispatch_course_alerts_on_immersion_change(sender, instance, raw=False, **kwargs):
+    # An active immersion cancelled or deleted frees a seat (unknown previous state : active)
+    was_active = getattr(instance, '_loaded_cancellation_type_id', None) is None
+    deleted = kwargs.get('signal') is post_delete
+
+    if raw or kwargs.get('created') or not was_active or not (deleted or instance.cancellation_type_id):
+        return
+
+    course_id = Slot.objects.filter(pk=instance.slot_id).values_list('course_id', flat=True).first()
+    UserCourseAlert.dispatch([course_id])
+
+def dispatch_course_alerts_on_slot_change(sender, instance, created, raw=False, **kwargs):
+    loaded_n_places = getattr(instance, '_loaded_n_places', None)
+
+    if raw or not instance.course_id or not instance.n_places:
+        return
+
+    if created or loaded_n_places is None or instance.n_places > loaded_n_places:
+        UserCourseAlert.dispatch([instance.course_id])
+
+    instance._loaded_n_places = instance.n_places
+
+def dispatch_course_alerts_on_immersions_cancel(sender, immersions, **kwargs):
+    UserCourseAlert.dispatch({immersion.slot.course_id for immersion in immersions})
+
+post_save.connect(dispatch_course_alerts_on_immersion_change, sender=Immersion)
+post_delete.connect(dispatch_course_alerts_on_immersion_change, sender=Immersion)
+post_save.connect(dispatch_course_alerts_on_slot_change, sender=Slot)
+immersions_cancelled.connect(dispatch_course_alerts_on_immersions_cancel, sender=Immersion)
+
+
+def update_training_quota_ledger(sender, instance, raw=False, **kwargs):
+    """
+    Count the immersion registration, cancellation or deletion in the TrainingQuotaLedger
+    """
+    if raw:
+        return
+
+    deleted = kwargs.get('signal') is post_delete
+    active = not deleted and instance.cancellation_type_id is None
+
+    if kwargs.get('created'):
+        was_active = False
+    elif hasattr(instance, '_loaded_cancellation_type_id'):
+        was_active = instance._loaded_cancellation_type_id is None
+    elif deleted:
+        was_active = instance.cancellation_type_id is None
+    else:
+        # Unknown previous state
+        was_active = None
+
+    if was_active is not None and active == was_active:
+        return
+
+    slot = Slot.objects.filter(pk=instance.slot_id).values_list('period_id', 'course__training_id').first()
+
+    if not slot or not all(slot):
+        return
+
+    key = (instance.student_id, *slot)
+
+    if was_active is None:
+        TrainingQuotaLedger.recount(*key)
+    else:
+        TrainingQuotaLedger.add_registrations({key: int(active) - int(was_active)})
+
+def update_loaded_cancellation_type(sender, instance, raw=False, **kwargs):
+    # Cancellation state now in the database, used by the previous receivers on the next save
+    instance._loaded_cancellation_type_id = instance.cancellation_type_id
+
+def update_training_quota_ledger_on_immersions_cancel(sender, immersions, **kwargs):
+    # Active immersions only (see ImmersionQuerySet.cancel)
+    cancelled_registrations = Counter(
+        (immersion.student_id, immersion.slot.period_id, immersion.slot.course.training_id)
+        for immersion in immersions if immersion.slot.course
+    )
+    TrainingQuotaLedger.add_registrations({key: -count for key, count in cancelled_registrations.items()})
+
+post_save.connect(update_training_quota_ledger, sender=Immersion)
+post_delete.connect(update_training_quota_ledger, sender=Immersion)
+post_save.connect(update_loaded_cancellation_type, sender=Immersion)
+immersions_cancelled.connect(update_training_quota_ledger_on_immersions_cancel, sender=Immersion)
+
+
+def update_slot_restrictions(sender, instance, action, reverse, pk_set, **kwargs):
+    # Keep Slot.restrictions up to date with the allowed objects
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if not reverse:
+        Slot.update_restrictions([instance.pk])
+    else:
+        relation = next(
+            relation for relation in Slot.RESTRICTIONS_RELATIONS
+            if getattr(Slot, relation).through is sender
+        )
+        update_slots_restrictions_of(relation, instance.pk)
+
+def update_slots_restrictions_of(relation, pk):
+    """
+    Rebuild the restrictions document of the slots allowing an object
+    :param relation: Slot restrictions relation (ex: 'allowed_highschools')
+    :param pk: allowed object id
+    """
+    Slot.update_restrictions(
+        Slot.objects.filter(**{f"restrictions__{relation}__contains": [pk]}).values('pk')
+    )
+
+def update_slots_restrictions_on_delete(sender, instance, **kwargs):
+    # Many to many rows of deleted objects are removed without m2m_changed signal
+    for relation in Slot.RESTRICTIONS_RELATIONS:
+        if Slot._meta.get_field(relation).remote_field.model is sender:
+            update_slots_restrictions_of(relation, instance.pk)
+
+def update_slots_restrictions_on_bachelor_type_change(sender, instance, created, raw=False, **kwargs):
+    # General / technological flags of the allowed bachelor types
+    if not raw and not created:
+        update_slots_restrictions_of('allowed_bachelor_types', instance.pk)
+
+post_save.connect(update_slots_restrictions_on_bachelor_type_change, sender=BachelorType)
+
+for relation in Slot.RESTRICTIONS_RELATIONS:
+    m2m_changed.connect(update_slot_restrictions, sender=getattr(Slot, relation).through)
+    post_delete.connect(
+        update_slots_restrictions_on_delete,
+        sender=Slot._meta.get_field(relation).remote_field.model,
+        dispatch_uid=f"slot_restrictions_delete_{relation}",
+    )
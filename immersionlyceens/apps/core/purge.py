@@ -0,0 +1,167 @@
+"""
+Batched deletions for the annual purge
+
+QuerySet.delete() collects every related object in memory and sends signals for each
+of them. Here, objects are deleted by batches of primary keys, each batch in its own
+transaction : relations are cascaded with raw DELETE queries and the ChangeLog entries of
+tracked models are created in bulk.
+
+The raw path doesn't send pre_delete / post_delete signals : the purge does the work of the
+receivers in bulk (ChangeLog entries here, training quotas ledger rebuild in annual_purge, charts
+facts cascaded with the immersions) and doesn't send free seats alerts.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from typing import Callable, Dict, Optional
+
+from django.db import connection, transaction
+from django.db.models import CASCADE, DO_NOTHING, SET_NULL, QuerySet
+
+from .models import ChangeLog
+
+logger = logging.getLogger(__name__)
+
+
+def get_delete_relations(model) -> list:
+    """
+    Relations to the model objects (foreign keys, one to one fields and many to many tables)
+    that have to be cascaded or updated when they are deleted
+    """
+    return [
+        field for field in model._meta.get_fields(include_hidden=True)
+        if field.auto_created and not field.concrete and (field.one_to_one or field.one_to_many)
+    ]
+
+
+class BatchDeleter:
+    """
+    Delete querysets by batches and keep per table counters and timings
+
+    :param batch_size: number of objects of the deleted queryset model per transaction
+    """
+    def __init__(self, batch_size: int = 1000):
+        self.batch_size = batch_size
+        self.counts: Dict[str, int] = Counter()
+        self.durations: Dict[str, float] = defaultdict(float)
+        self._raw_delete_cache = {}
+
+    def can_raw_delete(self, model) -> bool:
+        """
+        True if the model objects and their cascaded relations can be deleted with raw queries :
+        no multi-table inheritance, no generic relation and only CASCADE, SET_NULL or DO_NOTHING
+        relations
+        """
+        if model in self._raw_delete_cache:
+            return self._raw_delete_cache[model]
+
+        # Relations cycles are left to Django collector
+        self._raw_delete_cache[model] = False
+        opts = model._meta
+
+        allowed = not opts.parents and not any(
+            hasattr(field, "bulk_related_objects") for field in opts.private_fields
+        )
+
+        for related in get_delete_relations(model):
+            on_delete = related.field.remote_field.on_delete
+
+            if not allowed:
+                break
+            if on_delete is CASCADE:
+                allowed = self.can_raw_delete(related.related_model)
+            elif on_delete not in (SET_NULL, DO_NOTHING):
+                allowed = False
+
+        self._raw_delete_cache[model] = allowed
+        return allowed
+
+    def _add(self, model, count: int, start: float):
+        label = model._meta.label
+        self.counts[label] += count
+        self.durations[label] += time.perf_counter() - start
+
+    def raw_delete(self, model, pks: list) -> int:
+        """
+        Delete the model objects, their cascaded relations first, with raw queries
+        :param pks: deleted objects primary keys
+        """
+        if not pks:
+            return 0
+
+        for related in get_delete_relations(model):
+            field = related.field
+            related_model = related.related_model
+            related_queryset = related_model._base_manager.filter(**{f"{field.name}__in": pks})
+
+            if field.remote_field.on_delete is CASCADE:
+                self.raw_delete(related_model, list(related_queryset.values_list("pk", flat=True)))
+            elif field.remote_field.on_delete is SET_NULL:
+                start = time.perf_counter()
+                related_queryset.update(**{field.name: None})
+                self.durations[related_model._meta.label] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        opts = model._meta
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "DELETE FROM {} WHERE {} = ANY(%s)".format(
+                    connection.ops.quote_name(opts.db_table), connection.ops.quote_name(opts.pk.column)
+                ),
+                [list(pks)]
+            )
+            deleted = cursor.rowcount
+
+        if model in ChangeLog.tracked_models:
+            ChangeLog.log(model, pks, ChangeLog.DELETED)
+
+        self._add(model, deleted, start)
+        return deleted
+
+    def delete(self, queryset: QuerySet, progress: Optional[Callable[[int], None]] = None) -> int:
+        """
+        Delete the queryset objects by batches of primary keys
+        :param progress: function called after each batch with the number of deleted objects
+        :return: number of deleted objects of the queryset model
+        """
+        model = queryset.model
+        raw = self.can_raw_delete(model)
+        deleted = 0
+        last_pk = None
+
+        while True:
+            batch = queryset.order_by("pk")
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+
+            # distinct() is not enough for annotated querysets
+            pks = sorted(set(batch.values_list("pk", flat=True)[:self.batch_size]))
+
+            if not pks:
+                break
+
+            last_pk = pks[-1]
+
+            with transaction.atomic():
+                if raw:
+                    count = self.raw_delete(model, pks)
+                else:
+                    start = time.perf_counter()
+                    count, per_model = model._base_manager.filter(pk__in=pks).delete()
+                    count = per_model.get(model._meta.label, 0)
+                    for label, value in per_model.items():
+                        if label != model._meta.label:
+                            self.counts[label] += value
+                    self._add(model, count, start)
+
+            deleted += count
+
+            if progress:
+                progress(count)
+
+        return deleted
+
+    def log_timings(self):
+        for label, duration in sorted(self.durations.items(), key=lambda item: -item[1]):
+            logger.info("%s : %s row(s) deleted in %.2fs", label, self.counts.get(label, 0), duration)
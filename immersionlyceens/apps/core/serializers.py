@@ -3,7 +3,7 @@
 import datetime
 import logging
 
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 from django_countries.serializers import CountryFieldMixin
 from rest_framework import serializers, status
 from rest_framework.validators import UniqueTogetherValidator
@@ -13,13 +13,14 @@ from typing import Any, Dict, List, Optional, Tuple, Union
 from django.contrib.auth.models import Group
 from django.utils.translation import gettext, gettext_lazy as _
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q
 from django.conf import settings
 
 from immersionlyceens.libs.api.accounts import AccountAPI
 from immersionlyceens.libs.utils import get_general_setting
 
-from .models import (Campus, Establishment, Training, TrainingDomain, TrainingSubdomain,
+from .models import (Campus, ChangeLog, Establishment, Training, TrainingDomain, TrainingSubdomain,
     HighSchool, Course, Structure, Building, OffOfferEvent, ImmersionUser,
     HighSchoolLevel, UserCourseAlert, Slot, CourseType, Period, UAI
 )
@@ -63,6 +64,24 @@ class AsymetricRelatedField(serializers.PrimaryKeyRelatedField):
         return type(name, (cls,), {"serializer_class": serializer})
 
 
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key related field that first looks for the object in the 'preloaded_objects'
+    context entry ({model: {pk: object}}) filled by bulk list serializers (see SlotListSerializer)
+    Falls back to the usual single query if the object has not been preloaded
+    """
+    def to_internal_value(self, data):
+        preloaded = self.context.get("preloaded_objects", {}).get(self.get_queryset().model)
+
+        if preloaded:
+            try:
+                return preloaded[int(data)]
+            except (KeyError, TypeError, ValueError):
+                pass
+
+        return super().to_internal_value(data)
+
+
 class ImmersionUserSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         if not validated_data.get('username'):
@@ -699,10 +718,118 @@ class CourseSerializer(serializers.ModelSerializer):
         validators = []
 
 
+class SlotListSerializer(serializers.ListSerializer):
+    """
+    Bulk slots creation :
+    - related objects (courses with their speakers, periods, speakers, restrictions, ...) and general settings
+      are loaded once for the whole payload, then each slot is validated in memory
+    - slots and their m2m relations are inserted with bulk queries in a single transaction
+    Validation errors are still reported per row (one dict per slot, in payload order)
+    """
+    def preload_related_objects(self, data):
+        """
+        Load all objects referenced by the payload with one query per related model
+        :param data: list of slots data
+        :return: {model: {pk: object}}
+        """
+        fields = {}
+        pks = defaultdict(set)
+
+        for name, field in self.child.fields.items():
+            if isinstance(field, serializers.ManyRelatedField):
+                field = field.child_relation
+
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and not field.read_only:
+                fields[name] = field
+
+        for row in data:
+            if not isinstance(row, dict):
+                continue
+
+            for name, field in fields.items():
+                values = row.get(name)
+                model = field.get_queryset().model
+
+                for value in values if isinstance(values, (list, tuple)) else [values]:
+                    try:
+                        pks[model].add(int(value))
+                    except (TypeError, ValueError):
+                        pass
+
+        preloaded = {}
+
+        for model, model_pks in pks.items():
+            queryset = model.objects.all()
+
+            # Courses speakers are checked against each slot speakers in SlotSerializer.validate
+            if model is Course:
+                queryset = queryset.prefetch_related("speakers")
+
+            preloaded[model] = queryset.in_bulk(model_pks)
+
+        return preloaded
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self._context.update({
+                "preloaded_objects": self.preload_related_objects(data),
+                "enabled_groups": get_general_setting("ACTIVATE_COHORT"),
+            })
+
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        m2m_fields = model._meta.many_to_many
+        slots = []
+        relations = []
+
+        for attrs in validated_data:
+            attrs = dict(attrs)
+            relations.append({field.name: attrs.pop(field.name, []) for field in m2m_fields})
+
+            # bulk_create doesn't call Slot.save()
+            slot = model(**attrs)
+            slot.set_limit_dates()
+            slots.append(slot)
+
+        with transaction.atomic():
+            model.objects.bulk_create(slots)
+
+            for field in m2m_fields:
+                through = field.remote_field.through
+                source = f"{field.m2m_field_name()}_id"
+                target = f"{field.m2m_reverse_field_name()}_id"
+
+                through.objects.bulk_create(
+                    [
+                        through(**{source: slot.pk, target: obj.pk})
+                        for slot, slot_relations in zip(slots, relations)
+                        for obj in slot_relations[field.name]
+                    ],
+                    ignore_conflicts=True
+                )
+
+            # No m2m_changed signal with bulk_create
+            model.update_restrictions([slot.pk for slot in slots])
+
+            # No post_save signal with bulk_create
+            ChangeLog.log(model, [slot.pk for slot in slots], ChangeLog.CREATED)
+
+        # Reload with prefetched m2m relations for the response
+        return list(
+            model.objects
+                .filter(pk__in=[slot.pk for slot in slots])
+                .prefetch_related(*[field.name for field in m2m_fields])
+                .order_by("pk")
+        )
+
+
 class SlotSerializer(serializers.ModelSerializer):
     """
     Slot serializer
     """
+    serializer_related_field = PreloadedPrimaryKeyRelatedField
 
     def validate(self, data):
         """
@@ -732,7 +859,11 @@ class SlotSerializer(serializers.ModelSerializer):
         allow_group_registrations = data.get('allow_group_registrations')
         details = {}
 
-        enabled_groups = get_general_setting("ACTIVATE_COHORT")
+        # Already loaded by SlotListSerializer for bulk creations
+        if "enabled_groups" in self.context:
+            enabled_groups = self.context["enabled_groups"]
+        else:
+            enabled_groups = get_general_setting("ACTIVATE_COHORT")
 
         # Slot type
         if not any([course, event]):
@@ -817,8 +948,10 @@ class SlotSerializer(serializers.ModelSerializer):
                     details["building"] = \
                         _("The building field is forbidden when creating a new slot for a high school course")
 
-            for speaker in speakers:
-                if speaker not in course.speakers.all():
+            course_speakers = course.speakers.all()
+
+            for speaker in speakers or []:
+                if speaker not in course_speakers:
                     if not details.get('speakers'):
                         details["speakers"] = []
 
@@ -851,7 +984,9 @@ class SlotSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Slot
-        fields = "__all__"
+        # Restrictions document : internal, maintained from the restrictions fields
+        exclude = ("restrictions", )
+        list_serializer_class = SlotListSerializer
 
 
 class UserCourseAlertSerializer(serializers.ModelSerializer):
@@ -0,0 +1,8 @@
+"""
+Custom signals of the core application
+"""
+from django.dispatch import Signal
+
+# Sent by ImmersionQuerySet.cancel() in its transaction, as the single UPDATE doesn't send post_save
+# sender: Immersion class, immersions: list of the cancelled Immersion objects (with their slots)
+immersions_cancelled = Signal()
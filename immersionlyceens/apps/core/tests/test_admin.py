@@ -2,6 +2,7 @@
 Django Admin Forms tests suite
 """
 import datetime
+from unittest.mock import patch
 
 from django.conf import settings
 from django.contrib.admin.sites import AdminSite
@@ -10,16 +11,19 @@ from django.contrib.auth.models import Group
 from django.contrib.messages import get_messages
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.core import management
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import RequestFactory, TestCase
 from django.utils import timezone
+from django.utils.html import escape
 
 from immersionlyceens.apps.immersion.models import HighSchoolStudentRecord
+from middlewares.requests_profiling.RequestsProfiling import SAMPLING_RATE_CACHE_KEY
 
 from ..admin import (
     AttestationDocumentAdmin, CampusAdmin, CustomAdminSite, CustomUserAdmin,
-    EstablishmentAdmin, PeriodAdmin, StructureAdmin, TrainingAdmin, VisitorTypeAdmin
+    EstablishmentAdmin, PeriodAdmin, SlowRequestAdmin, StructureAdmin, TrainingAdmin, VisitorTypeAdmin
 )
 from ..admin_forms import (
     AccompanyingDocumentForm, BachelorMentionForm, BuildingForm, CampusForm,
@@ -37,7 +41,7 @@ from ..models import (
     EvaluationFormLink, EvaluationType, GeneralBachelorTeaching, GeneralSettings,
     HigherEducationInstitution, HighSchool, HighSchoolLevel, Holiday, ImmersionUser,
     InformationText, MailTemplate, MailTemplateVars, Period,
-    PublicDocument, PublicType, Structure, Training, TrainingDomain,
+    PublicDocument, PublicType, SlowRequest, Structure, Training, TrainingDomain,
     TrainingSubdomain, UniversityYear, Vacation, VisitorType
 )
 from ...user.admin import VisitorAdmin
@@ -2082,6 +2086,40 @@ class AdminFormsTestCase(TestCase):
         self.assertTrue(new_speaker.has_groups('INTER'))
 
 
+    def test_admin_immersionuser_changelist(self):
+        """
+        Changelist columns must not run per row queries
+        """
+        adminsite = CustomAdminSite(name='Repositories')
+        user_admin = CustomUserAdmin(admin_site=adminsite, model=ImmersionUser)
+        columns = [
+            'get_username', 'get_groups_list', 'get_activated_account', 'get_edited_record',
+            'get_validated_record', 'get_establishment', 'get_highschool', 'get_structure',
+        ]
+
+        changelist_request = request_factory.get('/admin/core/immersionuser/')
+        changelist_request.user = self.superuser
+        changelist = user_admin.get_changelist_instance(changelist_request)
+        users = list(changelist.result_list)
+
+        self.assertGreater(len(users), 5)
+
+        with self.assertNumQueries(0):
+            values = {
+                user.pk: {column: getattr(user_admin, column)(user) for column in columns}
+                for user in users
+            }
+
+        # Same values without the changelist annotations
+        for user in ImmersionUser.objects.filter(pk__in=[self.highschool_user.pk, self.student.pk, self.ref_str_user.pk]):
+            self.assertEqual(
+                {column: getattr(user_admin, column)(user) for column in columns},
+                values[user.pk]
+            )
+
+        self.assertEqual(values[self.highschool_user.pk]['get_groups_list'], ['LYC'])
+
+
     def test_admin_immersionuser_change_form(self):
         structure_1_data = {'code': 'A', 'label': 'test 1', 'active': True, 'establishment': self.master_establishment}
         structure_2_data = {'code': 'B', 'label': 'test 2', 'active': True, 'establishment': self.establishment}
@@ -2670,4 +2708,62 @@ class AdminFormsTestCase(TestCase):
             # All should be False
             self.assertFalse(visitor_type_admin.has_add_permission(request=request))
             self.assertFalse(visitor_type_admin.has_delete_permission(request=request, obj=visitor_type))
-            self.assertFalse(visitor_type_admin.has_change_permission(request=request, obj=visitor_type))
\ No newline at end of file
+            self.assertFalse(visitor_type_admin.has_change_permission(request=request, obj=visitor_type))
+
+    def test_slow_request_admin(self):
+        adminsite = CustomAdminSite(name='Repositories')
+        slow_request_admin = SlowRequestAdmin(admin_site=adminsite, model=SlowRequest)
+
+        # Profiling disabled by default
+        cache.delete(SAMPLING_RATE_CACHE_KEY)
+        self.client.force_login(self.superuser)
+        self.client.get('/admin/')
+        self.assertFalse(SlowRequest.objects.exists())
+
+        # All requests profiled
+        GeneralSettings.objects.update_or_create(
+            setting='REQUESTS_PROFILING',
+            defaults={'parameters': {'type': 'integer', 'value': 100, 'description': 'Profiling'}}
+        )
+        cache.delete(SAMPLING_RATE_CACHE_KEY)
+
+        response = self.client.get('/admin/')
+        self.assertEqual(response.status_code, 200)
+
+        slow_request = SlowRequest.objects.get()
+        self.assertEqual(slow_request.view_name, 'Repositories:index')
+        self.assertEqual(slow_request.user, self.superuser)
+        self.assertEqual(slow_request.status_code, 200)
+        self.assertGreater(slow_request.queries, 0)
+        self.assertGreater(slow_request.template_duration, 0)
+        self.assertGreaterEqual(slow_request.duration, slow_request.db_duration)
+        self.assertTrue(slow_request.statements)
+
+        # Only the slowest requests are kept
+        with self.settings(SLOW_REQUESTS_COUNT=1):
+            response = self.client.get(f'/admin/core/slowrequest/{slow_request.pk}/change/')
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, escape(slow_request.statements[0]['sql']))
+
+        self.assertEqual(SlowRequest.objects.count(), 1)
+
+        # A recording error doesn't break the request
+        with patch.object(SlowRequest, 'record', side_effect=ValueError("record error")), \
+                self.assertLogs('middlewares.requests_profiling.RequestsProfiling', level='ERROR') as logs:
+            response = self.client.get('/admin/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("record error", logs.output[0])
+
+        # Permissions : superuser and operators only, read only
+        for user in [self.superuser, self.operator_user]:
+            request.user = user
+            self.assertTrue(slow_request_admin.has_view_permission(request=request))
+            self.assertFalse(slow_request_admin.has_add_permission(request=request))
+            self.assertFalse(slow_request_admin.has_change_permission(request=request, obj=slow_request))
+
+        for user in [self.ref_master_etab_user, self.ref_etab_user, self.ref_str_user]:
+            request.user = user
+            self.assertFalse(slow_request_admin.has_view_permission(request=request))
+
+        cache.delete(SAMPLING_RATE_CACHE_KEY)
@@ -2,25 +2,36 @@
 Core commands tests
 """
 import datetime
+import json
+import os
+import tempfile
 import uuid
+from io import StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 from django.core import mail, management
+from django.core.management.base import CommandError
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete
 from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.formats import date_format
 
+from immersionlyceens.apps.charts.models import ImmersionFact
+from immersionlyceens.apps.core.management.commands.cron_master import TASK_LOCK_KEY
+from immersionlyceens.apps.core.purge import BatchDeleter
 from immersionlyceens.apps.core.models import (
-    AttestationDocument, BachelorType, Building, Campus, CancelType, Course,
-    CourseType, Establishment, EvaluationFormLink, EvaluationType,
+    AnnualPurgeCheckpoint, AnnualStatistics, AttestationDocument, BachelorType, Building, Campus,
+    CancelType, ChangeLog, Course, CourseType, Establishment, EvaluationFormLink, EvaluationType,
     GeneralSettings, HigherEducationInstitution, HighSchool, HighSchoolLevel,
-    Immersion, MailTemplate, PendingUserGroup, Period, PostBachelorLevel,
+    Immersion, ImmersionUser, MailTemplate, PendingUserGroup, Period, PostBachelorLevel,
     Profile, RefStructuresNotificationsSettings, ScheduledTask,
     ScheduledTaskLog, Slot, Structure, StudentLevel, Training, TrainingDomain,
-    TrainingSubdomain, UniversityYear, UserCourseAlert, Vacation)
+    TrainingQuotaLedger, TrainingSubdomain, UniversityYear, UserCourseAlert, Vacation)
 from immersionlyceens.apps.immersion.models import (
     HighSchoolStudentRecord, HighSchoolStudentRecordDocument)
 from immersionlyceens.libs.mails.variables_parser import parser
@@ -330,10 +341,19 @@ class CommandsTestCase(TestCase):
             Immersion.objects.filter(student=self.highschool_user, cancellation_type__isnull=False).exists()
         )
 
+        # Rolled back cancellation : no notification
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                Immersion.objects.filter(student=self.highschool_user).cancel(CancelType.objects.first())
+                transaction.set_rollback(True)
+
+        self.assertEqual(len(mail.outbox), 0)
+
         # manually expires student attestations and run the command
         self.hs_record.attestation.all().update(validity_date=self.today - datetime.timedelta(days=3))
 
-        management.call_command("auto_immersion_cancellation", verbosity=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            management.call_command("auto_immersion_cancellation", verbosity=0)
 
         # Result : 2 cancelled immersions, 1 remains active (beyond the cancellation delay)
         self.assertEqual(
@@ -348,6 +368,12 @@ class CommandsTestCase(TestCase):
         # 2 Cancellation email sent
         self.assertEqual(len(mail.outbox), 2)
 
+        # Bulk update : changes are logged
+        self.assertEqual(
+            ChangeLog.objects.filter(object_type="core.immersion", action=ChangeLog.UPDATED).count(),
+            2
+        )
+
     def test_send_course_alerts(self):
         """
         Test course alerts
@@ -381,13 +407,237 @@ class CommandsTestCase(TestCase):
         alert.save()
         self.slot4.registration_limit_delay = 0
         self.slot4.save()
-        Immersion.objects.create(slot=self.slot4, student=self.highschool_user)
+        immersion = Immersion.objects.create(slot=self.slot4, student=self.highschool_user)
         management.call_command("send_course_alerts", verbosity=0)
 
         alert.refresh_from_db()
         self.assertEqual(len(mail.outbox), 1) # no change
         self.assertFalse(alert.email_sent) # not sent
 
+        # Cancel the immersion : the course alerts are requested, then sent after the debounce delay
+        immersion.cancellation_type = CancelType.objects.first()
+        immersion.save()
+
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.dispatch_date)
+
+        management.call_command("send_dispatched_course_alerts", verbosity=0)
+        self.assertEqual(len(mail.outbox), 1)
+
+        UserCourseAlert.objects.filter(pk=alert.pk).update(
+            dispatch_date=F('dispatch_date') - datetime.timedelta(seconds=settings.COURSE_ALERTS_DEBOUNCE)
+        )
+        management.call_command("send_dispatched_course_alerts", verbosity=0)
+
+        alert.refresh_from_db()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertTrue(alert.email_sent)
+        self.assertIsNone(alert.dispatch_date)
+
+        # Already cancelled immersion saved again : no freed seat
+        alert.email_sent = False
+        alert.save()
+        immersion.save()
+
+        alert.refresh_from_db()
+        self.assertIsNone(alert.dispatch_date)
+
+        # Rolled back seats increase : no request
+        with transaction.atomic():
+            self.slot4.n_places += 1
+            self.slot4.save()
+            transaction.set_rollback(True)
+
+        alert.refresh_from_db()
+        self.assertIsNone(alert.dispatch_date)
+
+        # More seats
+        slot = Slot.objects.get(pk=self.slot4.pk)
+        slot.n_places += 1
+        slot.save()
+
+        alert.refresh_from_db()
+        self.assertIsNotNone(alert.dispatch_date)
+
+
+    def test_annual_statistics(self):
+        year = UniversityYear.objects.get(active=True)
+
+        ret = management.call_command("annual_statistics", verbosity=0, stdout=StringIO())
+        self.assertEqual(ret, "Annual statistics : success")
+        self.assertTrue(AnnualStatistics.objects.filter(year=year.label).exists())
+
+        # Same results as the former implementation, on a generated dataset (rolled back)
+        ret = management.call_command(
+            "benchmark_annual_statistics", users=200, courses=10, slots_per_course=3, stdout=StringIO()
+        )
+        self.assertRegex(ret, r"^Benchmark annual statistics : identical results")
+        self.assertFalse(ImmersionUser.objects.filter(username__startswith="bench_").exists())
+
+    def test_benchmark_slots_lists(self):
+        # Same lists as the former ArrayAgg annotations, on a generated catalogue (rolled back)
+        slots_count = Slot.objects.count()
+        ret = management.call_command(
+            "benchmark_slots_lists", slots=5, speakers_per_slot=2, highschools_per_slot=3, stdout=StringIO()
+        )
+        self.assertRegex(ret, r"^Benchmark slots lists : identical results")
+        self.assertEqual(Slot.objects.count(), slots_count)
+
+    def test_benchmark_endpoints(self):
+        users_count = ImmersionUser.objects.count()
+
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, "baseline.json")
+            ret = management.call_command(
+                "benchmark_endpoints", students=10, slots=10, requests=2, save_baseline=baseline, stdout=StringIO()
+            )
+            self.assertEqual(ret, "Benchmark endpoints : 7 endpoints measured")
+
+            with open(baseline) as baseline_file:
+                results = json.load(baseline_file)
+
+            self.assertEqual(len(results), 7)
+            self.assertEqual(sum(result['errors'] for result in results.values()), 0)
+
+            # Query counts above the baseline are regressions
+            results['slot_registration']['queries'] = 0
+
+            with open(baseline, 'w') as baseline_file:
+                json.dump(results, baseline_file)
+
+            with self.assertRaisesRegex(CommandError, "slot_registration : [0-9]+ queries, baseline 0"):
+                management.call_command(
+                    "benchmark_endpoints", students=10, slots=10, requests=2, baseline=baseline, tolerance=100,
+                    stdout=StringIO()
+                )
+
+        # Generated data is rolled back
+        self.assertEqual(ImmersionUser.objects.count(), users_count)
+
+    def test_rebuild_training_quota_ledger(self):
+        # The ledger is up to date with the immersions created in setUp
+        entries = {
+            (entry.student_id, entry.period_id, entry.training_id): entry.registrations
+            for entry in TrainingQuotaLedger.objects.filter(registrations__gt=0)
+        }
+        TrainingQuotaLedger.objects.all().delete()
+
+        ret = management.call_command("rebuild_training_quota_ledger", stdout=StringIO())
+        self.assertEqual(ret, f"Training quota ledger rebuilt : {len(entries)} entries")
+        self.assertEqual(
+            {
+                (entry.student_id, entry.period_id, entry.training_id): entry.registrations
+                for entry in TrainingQuotaLedger.objects.all()
+            },
+            entries
+        )
+
+    def test_rebuild_charts_facts(self):
+        # The facts follow the immersions created in setUp, the records and the offer changes
+        facts = ImmersionFact.objects.filter(student=self.highschool_user)
+
+        self.assertEqual(
+            list(facts.values_list('domain', 'structure', 'highschool', 'population', 'validated', 'cancelled')),
+            [(self.t_domain.id, self.structure.id, self.high_school.id, ImmersionFact.PUPIL, False, False)] * 3
+        )
+
+        self.hs_record.validation = HighSchoolStudentRecord.VALIDATED
+        self.hs_record.save()
+        self.assertEqual(facts.filter(validated=True).count(), 3)
+
+        Immersion.objects.filter(pk=self.immersion.pk).cancel(CancelType.objects.first(), notify=False)
+        self.assertEqual(list(facts.filter(cancelled=True).values_list('immersion', flat=True)), [self.immersion.pk])
+
+        self.course.structure = Structure.objects.create(
+            code="other", label="other structure", establishment=self.establishment
+        )
+        self.course.save()
+        self.assertEqual(facts.filter(structure=self.course.structure).count(), 3)
+
+        t_sub_domain = TrainingSubdomain.objects.create(label="other t_sub_domain", training_domain=self.t_domain)
+        self.training.training_subdomains.add(t_sub_domain)
+        self.assertEqual(facts.count(), 6)
+
+        # Full rebuild
+        expected = set(ImmersionFact.objects.values_list(*ImmersionFact.LOOKUPS, 'cancelled', 'validated'))
+        ImmersionFact.objects.all().delete()
+
+        ret = management.call_command("rebuild_charts_facts", stdout=StringIO())
+        self.assertEqual(ret, f"Charts facts rebuilt : {len(expected)} facts")
+        self.assertEqual(
+            set(ImmersionFact.objects.values_list(*ImmersionFact.LOOKUPS, 'cancelled', 'validated')),
+            expected
+        )
+
+    def test_annual_purge(self):
+        year = UniversityYear.objects.get(active=True)
+        Group.objects.get(name='LYC').user_set.add(self.highschool_user)
+        immersions_ids = list(Immersion.objects.values_list('id', flat=True))
+
+        # Interrupted purge : statistics done, immersions partially deleted
+        AnnualPurgeCheckpoint.objects.create(university_year=year.label, step='annual_statistics', done=True)
+        AnnualPurgeCheckpoint.objects.create(university_year=year.label, step='immersions', count=2)
+
+        # Unfinished purge of a previous year : ignored
+        AnnualPurgeCheckpoint.objects.create(university_year='2000-2001', step='slots', done=True)
+
+        # Expired change log entry
+        old_change = ChangeLog.objects.create(object_type="core.slot", object_id=self.slot.pk, action=ChangeLog.UPDATED)
+        ChangeLog.objects.filter(pk=old_change.pk).update(
+            date=timezone.now() - datetime.timedelta(days=settings.CHANGE_LOG_RETENTION_DAYS + 1)
+        )
+
+        # Immersions, slots and accounts are deleted with raw queries : no signal
+        for model in (Immersion, Slot, ImmersionUser):
+            self.assertTrue(BatchDeleter().can_raw_delete(model))
+
+        deleted_signals = []
+        receiver = lambda sender, **kwargs: deleted_signals.append(sender)
+        post_delete.connect(receiver, sender=Immersion, weak=False)
+
+        try:
+            ret = management.call_command("annual_purge", batch_size=1, verbosity=0, stdout=StringIO())
+        finally:
+            post_delete.disconnect(receiver, sender=Immersion)
+
+        self.assertEqual(deleted_signals, [])
+
+        self.assertIn(f"{len(immersions_ids) + 2} immersion(s) deleted", ret)
+        self.assertIn("4 slot(s) deleted", ret)
+        self.assertIn("1 student / high school / visitor account(s) deleted", ret)
+        self.assertFalse(AnnualStatistics.objects.filter(year=year.label).exists())
+
+        self.assertFalse(Immersion.objects.exists())
+        self.assertFalse(Slot.objects.exists())
+        self.assertFalse(Period.objects.exists())
+        self.assertFalse(Vacation.objects.exists())
+        self.assertFalse(ImmersionUser.objects.filter(pk=self.highschool_user.pk).exists())
+        self.assertFalse(HighSchoolStudentRecord.objects.filter(pk=self.hs_record.pk).exists())
+        self.assertFalse(HighSchoolStudentRecordDocument.objects.exists())
+        self.assertTrue(ImmersionUser.objects.filter(pk=self.speaker1.pk).exists())
+        self.assertFalse(Course.objects.filter(published=True).exists())
+        self.assertFalse(TrainingQuotaLedger.objects.exists())
+        self.assertFalse(ImmersionFact.objects.exists())
+
+        # Tracked deletions are logged and checkpoints removed
+        self.assertEqual(
+            set(ChangeLog.objects.filter(object_type="core.immersion", action=ChangeLog.DELETED)
+                .values_list('object_id', flat=True)),
+            set(immersions_ids)
+        )
+        self.assertTrue(
+            ChangeLog.objects.filter(
+                object_type="immersion.highschoolstudentrecord", object_id=self.hs_record.pk, action=ChangeLog.DELETED
+            ).exists()
+        )
+        self.assertFalse(ChangeLog.objects.filter(pk=old_change.pk).exists())
+        self.assertFalse(AnnualPurgeCheckpoint.objects.exists())
+
+        # Complete purge
+        ret = management.call_command("annual_purge", verbosity=0, stdout=StringIO())
+        self.assertIn("No immersion to delete", ret)
+        self.assertTrue(AnnualStatistics.objects.filter(year=year.label).exists())
+
 
     def test_cron_master(self):
         """
@@ -399,6 +649,9 @@ class CommandsTestCase(TestCase):
 
         self.assertFalse(ScheduledTaskLog.objects.exists())
 
+        # Only the tasks created here
+        ScheduledTask.objects.update(active=False)
+
         # Inactive task
         task = ScheduledTask.objects.create(
             command_name='crontest',
@@ -446,6 +699,21 @@ class CommandsTestCase(TestCase):
             1
         )
 
+        # Execution metrics
+        log = ScheduledTaskLog.objects.get(task=task)
+        self.assertIsNotNone(log.end_date)
+        self.assertGreaterEqual(log.end_date, log.execution_date)
+        self.assertEqual(log.mails_sent, 0)
+        self.assertIsNotNone(log.queries)
+        self.assertIsNotNone(log.rows)
+
+        metrics = ScheduledTask.objects.annotate(
+            **ScheduledTaskLog.get_metrics_annotations(prefix='logs__')
+        ).get(pk=task.pk)
+        self.assertEqual(metrics.runs, 1)
+        self.assertEqual(metrics.errors, 0)
+        self.assertEqual(metrics.duration_p50, log.duration)
+
         # =========================================
         # With a day of the week
         # =========================================
@@ -494,6 +762,101 @@ class CommandsTestCase(TestCase):
             5
         )
 
+        log = ScheduledTaskLog.objects.filter(task=task).first()
+        self.assertEqual(log.exit_status, ScheduledTaskLog.EXIT_SUCCESS)
+        self.assertIsNotNone(log.duration)
+
+        # Frequency in minutes : 14h00, 14h20, 14h40, ...
+        ScheduledTaskLog.objects.all().delete()
+        task.frequency = 20
+        task.frequency_unit = ScheduledTask.MINUTES
+        task.save()
+
+        for minutes in ("1410", "1420", "1440"):
+            management.call_command("cron_master", time=minutes, stdout=devnull)
+
+        self.assertEqual(ScheduledTaskLog.objects.filter(task=task).count(), 2)
+
+        task.frequency = 2
+        task.frequency_unit = ScheduledTask.HOURS
+        task.save()
+
+        # =========================================
+        # Catch up
+        # =========================================
+        ScheduledTaskLog.objects.all().delete()
+
+        # 16h00 execution missed
+        management.call_command("cron_master", time="1630", stdout=devnull)
+        self.assertFalse(ScheduledTaskLog.objects.exists())
+
+        management.call_command("cron_master", time="1630", catch_up=60, stdout=devnull)
+        self.assertEqual(ScheduledTaskLog.objects.filter(task=task, success=True).count(), 1)
+
+        # Not twice
+        ScheduledTaskLog.objects.update(
+            execution_date=timezone.localtime().replace(hour=16, minute=31)
+        )
+        management.call_command("cron_master", time="1640", catch_up=60, stdout=devnull)
+        self.assertEqual(ScheduledTaskLog.objects.filter(task=task).count(), 1)
+
+        # =========================================
+        # Already running task (lock held by another connection)
+        # =========================================
+        ScheduledTaskLog.objects.all().delete()
+        other_connection = connections.create_connection('default')
+
+        with other_connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s, %s)", [TASK_LOCK_KEY, task.pk])
+
+        management.call_command("cron_master", time="1400", stdout=devnull)
+        self.assertFalse(ScheduledTaskLog.objects.exists())
+
+        other_connection.close()
+
+        management.call_command("cron_master", time="1400", stdout=devnull)
+        self.assertEqual(ScheduledTaskLog.objects.filter(task=task, success=True).count(), 1)
+
+        # =========================================
+        # Interrupted run : failed, then caught up
+        # =========================================
+        ScheduledTaskLog.objects.all().delete()
+        log = ScheduledTaskLog.objects.create(task=task, success=None, message="Running")
+        ScheduledTaskLog.objects.update(execution_date=timezone.localtime().replace(hour=16, minute=1))
+        other_connection = connections.create_connection('default')
+
+        with other_connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_lock(%s, %s)", [TASK_LOCK_KEY, task.pk])
+
+        # Still running
+        management.call_command("cron_master", time="1630", catch_up=60, stdout=devnull)
+        log.refresh_from_db()
+        self.assertIsNone(log.success)
+        self.assertEqual(ScheduledTaskLog.objects.filter(task=task).count(), 1)
+
+        other_connection.close()
+
+        management.call_command("cron_master", time="1630", catch_up=60, stdout=devnull)
+        log.refresh_from_db()
+        self.assertFalse(log.success)
+        self.assertEqual(log.exit_status, ScheduledTaskLog.EXIT_ERROR)
+        self.assertEqual(log.message, "Interrupted")
+        self.assertEqual(ScheduledTaskLog.objects.filter(task=task, success=True).count(), 1)
+
+        # =========================================
+        # Over the command query budget
+        # =========================================
+        ScheduledTaskLog.objects.all().delete()
+        task.command_name = 'rebuild_training_quota_ledger'
+        task.save()
+
+        with override_settings(QUERY_BUDGETS={'rebuild_training_quota_ledger': 1}):
+            management.call_command("cron_master", time="1400", stdout=devnull)
+
+        log = ScheduledTaskLog.objects.get(task=task)
+        self.assertFalse(log.success)
+        self.assertRegex(log.message, r"^rebuild_training_quota_ledger : [0-9]+ queries \(budget 1\)")
+
         devnull.close()
 
 
@@ -8,7 +8,7 @@ from django.test import TestCase
 from django.utils import timezone
 
 from immersionlyceens.apps.immersion.models import (
-    HighSchoolStudentRecord, StudentRecord,
+    HighSchoolStudentRecord, HighSchoolStudentRecordQuota, StudentRecord,
 )
 
 from ..models import (
@@ -16,9 +16,10 @@ from ..models import (
     Building, Campus, CancelType, Course, CourseType, CustomThemeFile,
     Establishment, EvaluationFormLink, EvaluationType, GeneralBachelorTeaching,
     GeneralSettings, HigherEducationInstitution, HighSchool, HighSchoolLevel,
-    Holiday, ImmersionUser, Period, PublicDocument, PublicType,
+    Holiday, Immersion, ImmersionUser, Period, PublicDocument, PublicType,
     RefStructuresNotificationsSettings, Slot, Structure, StudentLevel,
-    Training, TrainingDomain, TrainingSubdomain, UAI, UniversityYear, Vacation,
+    Training, TrainingDomain, TrainingQuotaLedger, TrainingSubdomain, UAI,
+    UniversityYear, Vacation,
 )
 
 
@@ -292,6 +293,121 @@ class TestSlotCase(TestCase):
         s.save()
         self.assertTrue(Slot.objects.filter(id=s.id).count() > 0)
 
+    def test_slot__restrictions_document(self):
+        slot = Slot.objects.create(date=self.today + timedelta(days=1), n_places=10, levels_restrictions=True)
+        self.assertTrue(slot.restrictions['levels_restrictions'])
+        self.assertEqual(slot.restrictions['allowed_highschool_levels'], [])
+
+        level_1 = HighSchoolLevel.objects.create(label='level 1')
+        level_2 = HighSchoolLevel.objects.create(label='level 2')
+
+        # m2m_changed updates
+        slot.allowed_highschool_levels.add(level_2, level_1)
+        slot.refresh_from_db()
+        self.assertEqual(slot.restrictions['allowed_highschool_levels'], sorted([level_1.pk, level_2.pk]))
+
+        slot.allowed_highschool_levels.remove(level_1)
+        slot.refresh_from_db()
+        self.assertEqual(slot.restrictions['allowed_highschool_levels'], [level_2.pk])
+
+        # Deleted allowed object
+        level_2.delete()
+        slot.refresh_from_db()
+        self.assertEqual(slot.restrictions['allowed_highschool_levels'], [])
+
+        # Flags
+        slot.levels_restrictions = False
+        slot.establishments_restrictions = True
+        slot.save()
+        slot.refresh_from_db()
+        self.assertFalse(slot.restrictions['levels_restrictions'])
+        self.assertTrue(slot.restrictions['establishments_restrictions'])
+
+        # Allowed objects changed, then save() on the same instance (ex: slots mass update)
+        level_3 = HighSchoolLevel.objects.create(label='level 3')
+        slot = Slot.objects.get(pk=slot.pk)
+        slot.allowed_highschool_levels.set([level_3])
+        slot.levels_restrictions = True
+        slot.save()
+        slot.refresh_from_db()
+        self.assertTrue(slot.restrictions['levels_restrictions'])
+        self.assertEqual(slot.restrictions['allowed_highschool_levels'], [level_3.pk])
+
+        # Bulk rebuild
+        Slot.objects.filter(pk=slot.pk).update(restrictions={})
+        Slot.update_restrictions([slot.pk])
+        slot.refresh_from_db()
+        self.assertEqual(
+            set(slot.restrictions.keys()),
+            set(Slot.RESTRICTIONS_FLAGS) | set(Slot.RESTRICTIONS_RELATIONS) | set(Slot.RESTRICTIONS_BACHELOR_TYPES_FLAGS)
+        )
+
+        # Allowed bachelor types kinds
+        bachelor_type = BachelorType.objects.create(label='bachelor type', general=True)
+        slot.allowed_bachelor_types.add(bachelor_type)
+        slot.refresh_from_db()
+        self.assertTrue(slot.restrictions['allowed_general_bachelor_types'])
+        self.assertFalse(slot.restrictions['allowed_technological_bachelor_types'])
+
+        bachelor_type.general = False
+        bachelor_type.technological = True
+        bachelor_type.save()
+        slot.refresh_from_db()
+        self.assertFalse(slot.restrictions['allowed_general_bachelor_types'])
+        self.assertTrue(slot.restrictions['allowed_technological_bachelor_types'])
+
+    def test_training_quota_ledger(self):
+        structure = Structure.objects.create(label='my structure', code='R2D2', establishment=self.establishment)
+        training = Training.objects.create(label='training')
+        training.structures.add(structure)
+        course = Course.objects.create(label='my course', training=training, structure=structure)
+        period = Period.objects.create(
+            label='Period 1',
+            immersion_start_date=self.today.date() + timedelta(days=1),
+            immersion_end_date=self.today.date() + timedelta(days=10),
+            registration_start_date=self.today - timedelta(days=2),
+            registration_end_date=self.today + timedelta(days=4),
+            allowed_immersions=4
+        )
+        slots = [
+            Slot.objects.create(
+                course=course, period=period, date=self.today + timedelta(days=i + 1), n_places=10,
+                start_time=time(12, 0), end_time=time(14, 0)
+            )
+            for i in range(3)
+        ]
+        student = ImmersionUser.objects.create_user(username='student', email='student@test.com', password='pass')
+        cancel_type = CancelType.objects.create(label='cancelled')
+
+        def registrations():
+            return TrainingQuotaLedger.get_registrations(student.pk, period.pk, training.pk)
+
+        immersions = [Immersion.objects.create(student=student, slot=slot) for slot in slots]
+        self.assertEqual(registrations(), 3)
+
+        # Single and bulk cancellations, re-registration
+        immersions[0].cancellation_type = cancel_type
+        immersions[0].save()
+        self.assertEqual(registrations(), 2)
+
+        Immersion.objects.filter(pk=immersions[1].pk).cancel(cancel_type, notify=False)
+        self.assertEqual(registrations(), 1)
+
+        immersion = Immersion.objects.get(pk=immersions[0].pk)
+        immersion.cancellation_type = None
+        immersion.save()
+        self.assertEqual(registrations(), 2)
+
+        # Deletions : cancelled then active immersion
+        Immersion.objects.get(pk=immersions[1].pk).delete()
+        self.assertEqual(registrations(), 2)
+        immersions[2].delete()
+        self.assertEqual(registrations(), 1)
+
+        TrainingQuotaLedger.objects.all().delete()
+        self.assertEqual(TrainingQuotaLedger.rebuild(), 1)
+        self.assertEqual(registrations(), 1)
+
 
 class TrainingCase(TestCase):
     fixtures = ['higher']
@@ -618,6 +734,42 @@ class ImmersionUserTestCase(TestCase):
         self.assertEqual(user.get_high_school_or_student_establishment().label, self.hs.label)
 
 
+    def test_remaining_registrations_count(self):
+        user = get_user_model().objects.create_user(username="hs_student", email="hs@test.fr", password="pass")
+        Group.objects.get(name='LYC').user_set.add(user)
+
+        period = Period.objects.create(
+            label='Period 1',
+            immersion_start_date=self.today.date() + timedelta(days=5),
+            immersion_end_date=self.today.date() + timedelta(days=10),
+            registration_start_date=self.today - timedelta(days=2),
+            registration_end_date=self.today + timedelta(days=4),
+            allowed_immersions=4
+        )
+
+        # No record : no registration
+        self.assertEqual(user.remaining_registrations_count()[period.pk], 0)
+
+        record = HighSchoolStudentRecord.objects.create(
+            student=user,
+            highschool=self.hs,
+            birth_date=datetime.today(),
+            phone='0123456789',
+            level=HighSchoolLevel.objects.order_by('order').first(),
+            class_name='1ere S 3',
+            validation=HighSchoolStudentRecord.STATUSES["VALIDATED"],
+        )
+        self.assertEqual(user.remaining_registrations_count()[period.pk], 4)
+
+        # Custom quota and period changes
+        quota = HighSchoolStudentRecordQuota.objects.create(record=record, period=period, allowed_immersions=2)
+        self.assertEqual(user.remaining_registrations_count()[period.pk], 2)
+
+        quota.delete()
+        period.allowed_immersions = 3
+        period.save()
+        self.assertEqual(user.remaining_registrations_count()[period.pk], 3)
+
     def test_can_register(self):
         # Create all objects we need
         speaker1 = get_user_model().objects.create_user(
@@ -699,7 +851,72 @@ class ImmersionUserTestCase(TestCase):
         self.assertFalse(can_register)
         self.assertEqual(errors, ['Establishments restrictions in effect'])
 
-        # Todo : test other restrictions here
+        # Levels restrictions
+        slot['establishments_restrictions'] = False
+        slot['levels_restrictions'] = True
+        slot['allowed_student_levels'] = [student_record.level_id]
+
+        self.assertEqual(student.can_register_slot(slot), (True, []))
+
+        slot['bachelors_restrictions'] = True
+        can_register, errors = student.can_register_slot(slot)
+        self.assertFalse(can_register)
+        self.assertEqual(errors, ['Bachelors restrictions in effect'])
+
+    def test_can_register__high_school_student(self):
+        user = get_user_model().objects.create_user(username="hs_student", email="hs@test.fr", password="pass")
+        Group.objects.get(name='LYC').user_set.add(user)
+
+        general = BachelorType.objects.get(label__iexact='général')
+        teachings = [GeneralBachelorTeaching.objects.create(label=f"teaching {i}") for i in range(2)]
+        level = HighSchoolLevel.objects.order_by('order').first()
+
+        slot = {
+            'establishments_restrictions': True,
+            'allowed_highschools': [self.hs.pk],
+        }
+
+        # No record
+        self.assertEqual(user.can_register_slot(slot), (False, ["High school record not found or not valid"]))
+
+        record = HighSchoolStudentRecord.objects.create(
+            student=user,
+            highschool=self.hs,
+            birth_date=datetime.today(),
+            phone='0123456789',
+            level=level,
+            class_name='1ere S 3',
+            bachelor_type=general,
+            validation=HighSchoolStudentRecord.STATUSES["VALIDATED"],
+        )
+        record.general_bachelor_teachings.add(teachings[0])
+
+        # Fresh instance : the registration profile is computed once per user object
+        user = ImmersionUser.objects.get(pk=user.pk)
+        self.assertEqual(user.can_register_slot({}), (True, []))
+        self.assertEqual(user.can_register_slot(slot), (True, []))
+
+        slot.update({
+            'levels_restrictions': True,
+            'allowed_highschool_levels': [],
+            'bachelors_restrictions': True,
+            'allowed_bachelor_types': [general.pk],
+            'allowed_general_bachelor_types': True,
+            'allowed_bachelor_teachings': [teachings[1].pk],
+        })
+
+        can_register, errors = user.can_register_slot(slot)
+        self.assertFalse(can_register)
+        self.assertEqual(
+            errors, ['High school or post bachelor levels restrictions in effect', 'Bachelors restrictions in effect']
+        )
+
+        slot['allowed_highschool_levels'] = [level.pk]
+        slot['allowed_bachelor_teachings'] = [teaching.pk for teaching in teachings]
+        self.assertEqual(user.can_register_slot(slot), (True, []))
+
+        slot['allowed_highschools'] = []
+        self.assertEqual(user.can_register_slot(slot), (False, ['High schools restrictions in effect']))
 
 
 class TrainingDomainTestCase(TestCase):
@@ -34,8 +34,7 @@ from django.db.models import (
     Value,
     When,
 )
-from django.db.models.functions import Coalesce, JSONObject, Now
-from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models.functions import Coalesce, Now
 from django.http import JsonResponse
 from django.utils import timezone
 from django.utils.translation import gettext, gettext_lazy as _
@@ -508,82 +507,19 @@ def slots(request):
             registration_limit_date_is_past=Q(registration_limit_date__lte=Now()),
             valid_registration_start_date=Q(period__registration_start_date__lte=Now()),
             registration_start_date=F('period__registration_start_date'),
-            speaker_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        last_name=F('speakers__last_name'),
-                        first_name=F('speakers__first_name'),
-                        email=F('speakers__email'),
-                    ),
-                    filter=Q(speakers__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_establishments_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_establishments__short_label'),
-                    filter=Q(allowed_establishments__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschools_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        id=F('allowed_highschools__id'),
-                        city=F('allowed_highschools__city'),
-                        label=F('allowed_highschools__label')
-                    ),
-                    filter=Q(allowed_highschools__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschool_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_highschool_levels__label'),
-                    filter=Q(allowed_highschool_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            speaker_list=Slot.related_array(
+                'speakers', last_name='last_name', first_name='first_name', email='email'
             ),
-            allowed_post_bachelor_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_post_bachelor_levels__label'),
-                    filter=Q(allowed_post_bachelor_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_student_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_student_levels__label'), filter=Q(allowed_student_levels__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_types_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_types__label'), filter=Q(allowed_bachelor_types__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_mentions_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_mentions__label'),
-                    filter=Q(allowed_bachelor_mentions__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_teachings_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_teachings__label'),
-                    filter=Q(allowed_bachelor_teachings__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_establishments_list=Slot.related_array('allowed_establishments', 'short_label'),
+            allowed_highschools_list=Slot.related_array(
+                'allowed_highschools', id='id', city='city', label='label'
             ),
+            allowed_highschool_levels_list=Slot.related_array('allowed_highschool_levels', 'label'),
+            allowed_post_bachelor_levels_list=Slot.related_array('allowed_post_bachelor_levels', 'label'),
+            allowed_student_levels_list=Slot.related_array('allowed_student_levels', 'label'),
+            allowed_bachelor_types_list=Slot.related_array('allowed_bachelor_types', 'label'),
+            allowed_bachelor_mentions_list=Slot.related_array('allowed_bachelor_mentions', 'label'),
+            allowed_bachelor_teachings_list=Slot.related_array('allowed_bachelor_teachings', 'label'),
             group_immersions_count=Count(
                 'group_immersions',
                 filter=Q(
@@ -1635,38 +1635,30 @@ def course_slot_mass_update(request):
                                 # M2M updates
 
                                 # Restrictions
-                                if update_establishments_restrictions:
-                                    slot.allowed_establishments.clear()
-                                    slot.allowed_highschools.clear()
-                                    if establishments_restrictions:
-                                        for e in mass_update_form.cleaned_data.get("allowed_establishments"):
-                                            slot.allowed_establishments.add(e)
-                                        for e in mass_update_form.cleaned_data.get("allowed_highschools"):
-                                            slot.allowed_highschools.add(e)
+                                # set() only sends m2m_changed signals (restrictions document updates) on changes
+                                restrictions_updates = {
+                                    'allowed_establishments': establishments_restrictions,
+                                    'allowed_highschools': establishments_restrictions,
+                                } if update_establishments_restrictions else {}
 
                                 if update_levels_restrictions:
-                                    slot.allowed_highschool_levels.clear()
-                                    slot.allowed_student_levels.clear()
-                                    slot.allowed_post_bachelor_levels.clear()
-                                    if levels_restrictions:
-                                        for e in mass_update_form.cleaned_data.get("allowed_highschool_levels"):
-                                            slot.allowed_highschool_levels.add(e)
-                                        for e in mass_update_form.cleaned_data.get("allowed_student_levels"):
-                                            slot.allowed_student_levels.add(e)
-                                        for e in mass_update_form.cleaned_data.get("allowed_post_bachelor_levels"):
-                                            slot.allowed_post_bachelor_levels.add(e)
+                                    restrictions_updates.update({
+                                        'allowed_highschool_levels': levels_restrictions,
+                                        'allowed_student_levels': levels_restrictions,
+                                        'allowed_post_bachelor_levels': levels_restrictions,
+                                    })
 
                                 if update_bachelors_restrictions:
-                                    slot.allowed_bachelor_types.clear()
-                                    slot.allowed_bachelor_mentions.clear()
-                                    slot.allowed_bachelor_teachings.clear()
-                                    if bachelors_restrictions:
-                                        for e in mass_update_form.cleaned_data.get("allowed_bachelor_types"):
-                                            slot.allowed_bachelor_types.add(e)
-                                        for e in mass_update_form.cleaned_data.get("allowed_bachelor_mentions"):
-                                            slot.allowed_bachelor_mentions.add(e)
-                                        for e in mass_update_form.cleaned_data.get("allowed_bachelor_teachings"):
-                                            slot.allowed_bachelor_teachings.add(e)
+                                    restrictions_updates.update({
+                                        'allowed_bachelor_types': bachelors_restrictions,
+                                        'allowed_bachelor_mentions': bachelors_restrictions,
+                                        'allowed_bachelor_teachings': bachelors_restrictions,
+                                    })
+
+                                for relation, enabled in restrictions_updates.items():
+                                    getattr(slot, relation).set(
+                                        (mass_update_form.cleaned_data.get(relation) or []) if enabled else []
+                                    )
 
                                 # Speakers
                                 # Can only update if selected slots have only one common course
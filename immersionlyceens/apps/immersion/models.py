@@ -681,4 +681,24 @@ class VisitorRecordDocument(RecordDocument):
                 condition=Q(archive=False),
                 name='unique_visitor_record_document'
             )
-        ]
\ No newline at end of file
+        ]
+
+####### SIGNALS #########
+core_models.track_changes({
+    HighSchoolStudentRecord: (
+        'id', 'student_id', 'highschool_id', 'level_id', 'post_bachelor_level_id', 'bachelor_type_id',
+        'validation', 'creation_date', 'updated_date', 'validation_date', 'rejected_date',
+    ),
+    StudentRecord: (
+        'id', 'student_id', 'institution_id', 'uai_code', 'level_id', 'validation', 'creation_date',
+        'updated_date', 'validation_date',
+    ),
+    VisitorRecord: (
+        'id', 'visitor_id', 'visitor_type_id', 'validation', 'creation_date', 'updated_date', 'validation_date',
+        'rejected_date',
+    ),
+})
+
+
+def record_person_id(record):
+    return record.visitor_id if isinstance(record, VisitorRecord) else record.student_id
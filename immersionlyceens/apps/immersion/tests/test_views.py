@@ -2,10 +2,17 @@
 Immersion app forms tests
 """
 import datetime
+import tempfile
+import zipfile
+from io import BytesIO, StringIO
 from os.path import abspath, dirname, join
+from unittest.mock import patch
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.core import management
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, RequestFactory, TestCase
 from django.urls import reverse
@@ -13,7 +20,7 @@ from django.utils import timezone
 from rest_framework import status
 
 from immersionlyceens.apps.core.models import (
-    AttestationDocument, BachelorMention, BachelorType, Building, Campus,
+    AttestationDocument, AttestationsExport, BachelorMention, BachelorType, Building, Campus,
     CertificateLogo, Course, CourseType, Establishment, GeneralBachelorTeaching,
     HigherEducationInstitution, HighSchool, HighSchoolLevel,
     Immersion, ImmersionUser, ImmersionUserGroup, PendingUserGroup,
@@ -27,6 +34,10 @@ from immersionlyceens.apps.immersion.models import (
     HighSchoolStudentRecordQuota, StudentRecord, StudentRecordQuota,
     VisitorRecord, VisitorRecordDocument, VisitorRecordQuota
 )
+from immersionlyceens.apps.immersion.utils import (
+    ATTESTATIONS_PATH, LocalUrlFetcher, get_attestation_filename, get_font_config, get_stylesheets,
+    store_attestation,
+)
 
 from ..models import HighSchoolStudentRecord
 
@@ -965,18 +976,178 @@ class ImmersionViewsTestCase(TestCase):
 
 
     def test_immersion_attestation_download(self):
+        attestations_dir = f"{ATTESTATIONS_PATH}/{self.immersion.id}"
+
         # as a student
         self.client.login(username='hs', password='pass')
         response = self.client.get('/immersion/dl/attestation/%s' % self.immersion.id)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.headers['content-type'], 'application/pdf')
 
+        # The pdf has been stored
+        files = default_storage.listdir(attestations_dir)[1]
+        self.assertEqual(len(files), 1)
+
         # as a ref-etab manager
         self.client.login(username='ref_etab', password='pass')
         response = self.client.get('/immersion/dl/attestation/%s' % self.immersion.id, follow=True)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.headers['content-type'], 'application/pdf')
 
+        # Same inputs : no new rendering
+        self.assertEqual(store_attestation(self.immersion), (f"{attestations_dir}/{files[0]}", False))
+
+        # Inputs change : new rendering by the command, the obsolete pdf is removed
+        establishment = self.immersion.slot.get_establishment()
+        establishment.certificate_footer = "New footer"
+        establishment.save()
+
+        ret = management.call_command("generate_attestations", verbosity=0)
+        self.assertEqual(ret, "Generate attestations : 1 new attestation(s)")
+        files = default_storage.listdir(attestations_dir)[1]
+        self.assertEqual(len(files), 1)
+
+        # Logo replaced by another content with the same name : new rendering
+        establishment.logo.save("logo.png", ContentFile(b"logo"))
+        path, rendered = store_attestation(self.immersion)
+        self.assertTrue(rendered)
+
+        with default_storage.open(establishment.logo.name, "wb") as fd:
+            fd.write(b"new logo")
+
+        path, rendered = store_attestation(self.immersion)
+        self.assertTrue(rendered)
+        self.assertEqual(default_storage.listdir(attestations_dir)[1], [path.split("/")[-1]])
+
+        # Same content written again : the stored pdf is kept
+        with default_storage.open(establishment.logo.name, "wb") as fd:
+            fd.write(b"new logo")
+
+        self.assertEqual(store_attestation(self.immersion), (path, False))
+
+        establishment.logo.delete()
+        default_storage.delete(path)
+
+
+    def test_immersion_attestations_download(self):
+        slot = self.immersion.slot
+        establishment = slot.get_establishment()
+        attestations_dir = f"{ATTESTATIONS_PATH}/{self.immersion.id}"
+
+        # Students can't download
+        self.client.login(username='hs', password='pass')
+        response = self.client.get('/immersion/dl/attestations', {'slot': slot.id})
+        self.assertNotEqual(response.status_code, 200)
+
+        # Speakers : only their slots
+        self.client.login(username='speaker2', password='pass')
+        response = self.client.get('/immersion/dl/attestations', {'slot': slot.id})
+        self.assertEqual(response.status_code, 403)
+
+        self.client.login(username='speaker1', password='pass')
+        response = self.client.get('/immersion/dl/attestations', {'slot': slot.id})
+        self.assertEqual(response.status_code, 200)
+
+        # ZIP archive of a slot
+        self.client.login(username='ref_etab', password='pass')
+        response = self.client.get('/immersion/dl/attestations', {'slot': slot.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['content-type'], 'application/zip')
+
+        with zipfile.ZipFile(BytesIO(response.content)) as zip_file:
+            self.assertEqual(
+                zip_file.namelist(),
+                [f"{self.immersion.id}_{get_attestation_filename(self.immersion)}"]
+            )
+
+        # Merged pdf of an establishment : background export
+        response = self.client.get(
+            '/immersion/dl/attestations', {'establishment': establishment.id, 'format': 'pdf'}
+        )
+
+        self.assertEqual(response.status_code, 202)
+        export_url = response.json()['url']
+        export = AttestationsExport.objects.get(pk=response.json()['id'])
+
+        response = self.client.get(export_url)
+        self.assertEqual(response.json()['status'], AttestationsExport.PENDING)
+        self.assertIsNone(response.json()['url'])
+
+        # Export interrupted by a process restart : marked as failed by the next run
+        interrupted = AttestationsExport.objects.create(
+            user=export.user, establishment=establishment, status=AttestationsExport.RUNNING
+        )
+
+        ret = management.call_command("run_attestations_exports", verbosity=0)
+        self.assertIn("1 done, 0 error(s), 1 interrupted", ret)
+        interrupted.refresh_from_db()
+        self.assertEqual(interrupted.status, AttestationsExport.ERROR)
+        export.refresh_from_db()
+
+        content = self.client.get(export_url).json()
+        self.assertEqual(content['status'], AttestationsExport.DONE)
+        self.assertEqual((content['done'], content['total']), (1, 1))
+
+        response = self.client.get(content['url'])
+        self.assertEqual(response.headers['content-type'], 'application/pdf')
+
+        # Other users exports
+        self.client.login(username='speaker1', password='pass')
+        response = self.client.get(export_url)
+        self.assertNotEqual(response.status_code, 200)
+
+        self.client.login(username='ref_etab', password='pass')
+        AttestationsExport.objects.update(creation_date=timezone.now() - datetime.timedelta(days=2))
+        AttestationsExport.delete_expired()
+        self.assertFalse(default_storage.exists(export.path))
+
+        # Another establishment
+        response = self.client.get('/immersion/dl/attestations', {'establishment': establishment.id + 1})
+        self.assertEqual(response.status_code, 403)
+
+        # Nothing to filter on
+        response = self.client.get('/immersion/dl/attestations')
+        self.assertEqual(response.status_code, 404)
+
+        # Command
+        output = tempfile.NamedTemporaryFile(suffix=".zip")
+        ret = management.call_command(
+            "export_attestations", slot=slot.id, output=output.name, stdout=StringIO()
+        )
+        self.assertEqual(ret, "Export attestations : 1 attestation(s)")
+        self.assertTrue(zipfile.is_zipfile(output.name))
+        output.close()
+
+        for filename in default_storage.listdir(attestations_dir)[1]:
+            default_storage.delete(f"{attestations_dir}/{filename}")
+
+
+    def test_pdf_local_url_fetcher(self):
+        fetcher = LocalUrlFetcher("https://immersion.domain.tld/")
+
+        # Static file : no http request
+        with patch("weasyprint.default_url_fetcher") as default_fetcher:
+            result = fetcher("https://immersion.domain.tld/site_media/css/bootstrap.min.css")
+            self.assertEqual(result['mime_type'], 'text/css')
+            self.assertTrue(result['string'])
+
+            # Media
+            path = default_storage.save("fetcher_test.txt", ContentFile(b"media content"))
+            result = fetcher(f"file:///media/{path}")
+            self.assertEqual(result['string'], b"media content")
+            default_storage.delete(path)
+
+            default_fetcher.assert_not_called()
+
+            # Other hosts and unknown files : default fetcher
+            fetcher("https://other.domain.tld/site_media/css/bootstrap.min.css")
+            fetcher("https://immersion.domain.tld/site_media/css/unknown.css")
+            self.assertEqual(default_fetcher.call_count, 2)
+
+        # Stylesheets and fonts configuration are shared
+        self.assertIs(get_stylesheets(['css/bootstrap.min.css'])[0], get_stylesheets(['css/bootstrap.min.css'])[0])
+        self.assertIs(get_font_config(), get_font_config())
+
 
     def test_immersion_attendance_list_download(self):
         # as a ref-etab manager
@@ -11,6 +11,8 @@ app_name = 'immersion'
 urlpatterns = [
     path('activate/<hash>', views.ActivateView.as_view(), name='activate'),
     path('dl/attestation/<int:immersion_id>', views.immersion_attestation_download, name='attestation_download'),
+    path('dl/attestations', views.immersion_attestations_download, name='attestations_download'),
+    path('dl/attestations/<int:export_id>', views.immersion_attestations_export, name='attestations_export'),
     path('dl/attendance_list/<int:slot_id>', views.immersion_attendance_students_list_download, name='attendance_list_download'),
     path('change_password', views.change_password, name='change_password'),
     path('hs_record', views.high_school_student_record, name='hs_record'),
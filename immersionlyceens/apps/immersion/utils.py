@@ -1,14 +1,46 @@
+import hashlib
 import logging
+import mimetypes
+import os
+import zipfile
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urljoin, urlparse
 
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Q, QuerySet
 from django.forms.models import model_to_dict
 from django.http import HttpResponse
 from django.http.response import HttpResponseNotFound
 from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.formats import date_format
 
 import weasyprint
+from weasyprint.text.fonts import FontConfiguration
+
+from immersionlyceens.apps.core.models import (
+    AttestationsExport, CertificateLogo, CertificateSignature, Immersion, MailTemplate, Slot,
+)
+from immersionlyceens.libs.mails.variables_parser import parser
+from immersionlyceens.libs.profiling import profiled
+from immersionlyceens.libs.utils import get_general_setting, get_process_pool
 
 logger = logging.getLogger(__name__)
 
+# Rendered attestations storage path : <ATTESTATIONS_PATH>/<immersion id>/<inputs hash>.pdf
+ATTESTATIONS_PATH = "attestations"
+
+# First key of the attestations advisory locks, the second one is the immersion id
+ATTESTATION_LOCK_KEY = 8102
+# Attestations exports (see AttestationsExport) storage path
+ATTESTATIONS_EXPORTS_PATH = "attestations_exports"
+
 
 # class DocxMergeError(Exception):
 #     pass
@@ -49,6 +81,131 @@ logger = logging.getLogger(__name__)
 #         raise DocxMergeError("Failed to merge document")
 
 
+def get_base_url(request=None) -> Optional[str]:
+    """
+    Base url used to resolve relative urls (static files, media) in pdf templates
+    Commands have no request : use the PLATFORM_URL general setting
+    """
+    if request:
+        return request.build_absolute_uri("/")
+
+    try:
+        return get_general_setting("PLATFORM_URL") or None
+    except (ValueError, NameError):
+        return None
+
+
+# Used to resolve relative urls when there is no request nor PLATFORM_URL setting
+LOCAL_BASE_URL = "file:///"
+
+# Per process rendering resources (see get_font_config and get_stylesheets)
+_font_configs: Dict[int, FontConfiguration] = {}
+_stylesheets: Dict[Tuple[int, str], weasyprint.CSS] = {}
+
+
+class LocalUrlFetcher:
+    """
+    Weasyprint url fetcher reading static files and media from the storages
+    instead of http requests to our own server
+    Other urls (other hosts, files not found locally) are fetched by the default weasyprint fetcher
+    """
+    def __init__(self, base_url=None):
+        self.netloc = urlparse(base_url).netloc if base_url else ""
+
+    def read_local_file(self, path) -> Optional[bytes]:
+        if path.startswith(settings.STATIC_URL):
+            name = path[len(settings.STATIC_URL):]
+
+            if staticfiles_storage.exists(name):
+                with staticfiles_storage.open(name, "rb") as fd:
+                    return fd.read()
+
+            found = finders.find(name)
+            if found:
+                with open(found, "rb") as fd:
+                    return fd.read()
+        elif path.startswith(settings.MEDIA_URL):
+            name = path[len(settings.MEDIA_URL):]
+
+            if default_storage.exists(name):
+                with default_storage.open(name, "rb") as fd:
+                    return fd.read()
+
+        return None
+
+    def __call__(self, url, timeout=10, ssl_context=None):
+        parsed = urlparse(url)
+
+        if parsed.netloc in ("", self.netloc):
+            content = self.read_local_file(unquote(parsed.path))
+
+            if content is not None:
+                return {
+                    'string': content,
+                    'mime_type': mimetypes.guess_type(parsed.path)[0],
+                    'redirected_url': url,
+                }
+
+        return weasyprint.default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+
+
+def get_font_config() -> FontConfiguration:
+    """
+    Fonts configuration shared by all the documents rendered by the current process
+    """
+    pid = os.getpid()
+
+    if pid not in _font_configs:
+        _font_configs[pid] = FontConfiguration()
+
+    return _font_configs[pid]
+
+
+def get_stylesheets(names=None) -> List[weasyprint.CSS]:
+    """
+    Static css files, parsed once per process
+    :param names: static file names (ex: 'css/bootstrap.min.css')
+    """
+    pid = os.getpid()
+    stylesheets = []
+
+    for name in names or []:
+        if (pid, name) not in _stylesheets:
+            url = urljoin(LOCAL_BASE_URL, settings.STATIC_URL + name)
+            _stylesheets[(pid, name)] = weasyprint.CSS(
+                url=url,
+                url_fetcher=LocalUrlFetcher(),
+                font_config=get_font_config()
+            )
+
+        stylesheets.append(_stylesheets[(pid, name)])
+
+    return stylesheets
+
+
+def get_pdf_document(template_name, context, base_url=None) -> weasyprint.HTML:
+    """
+    Weasyprint document of a template, with local static files and media
+    """
+    template = get_template(template_name)
+    html = template.render({'tpl_vars': context})
+    base_url = base_url or LOCAL_BASE_URL
+
+    return weasyprint.HTML(string=html, base_url=base_url, url_fetcher=LocalUrlFetcher(base_url))
+
+
+@profiled('pdf')
+def render_pdf(template_name, context, base_url=None, stylesheets=None) -> bytes:
+    """
+    Returns pdf content based on
+        template_name : path of html template
+        context : vars used in the template
+        stylesheets : static css files names
+    """
+    document = get_pdf_document(template_name, context, base_url)
+    return document.write_pdf(stylesheets=get_stylesheets(stylesheets), font_config=get_font_config())
+
+
 def generate_pdf(request, template_name, context, **kwargs):
     """
     Returns a pdf based on
@@ -56,11 +213,264 @@ def generate_pdf(request, template_name, context, **kwargs):
         context : vars used in the template
     """
     filename = kwargs.get('filename', 'doc.pdf')
-    base_url = request.build_absolute_uri("/")
-    template = get_template(template_name)
-    context = {'tpl_vars': context}
-    html = template.render(context)
     response = HttpResponse(content_type="application/pdf")
     response['Content-Disposition'] = f'attachment; filename={filename}'
-    weasyprint.HTML(string=html, base_url=base_url).write_pdf(response)
+    response.write(
+        render_pdf(template_name, context, base_url=get_base_url(request), stylesheets=kwargs.get('stylesheets'))
+    )
     return response
+
+
+def get_attestation_context(immersion, cache=None) -> Dict[str, Any]:
+    """
+    Attendance certificate template context for an immersion
+    No request here : the same context (and pdf) must be built by the views and the commands
+    :param immersion: Immersion object
+    :param cache: optional dict shared by multiple calls to load the template, logo and signature only once
+    """
+    cache = cache if cache is not None else {}
+    student = immersion.student
+
+    if "template" not in cache:
+        cache["template"] = MailTemplate.objects.get(code='CERTIFICATE_BODY', active=True)
+        cache["vars"] = list(cache["template"].available_vars.all())
+
+    certificate_body = parser(
+        user=student,
+        request=None,
+        message_body=cache["template"].body,
+        vars=cache["vars"],
+        immersion=immersion,
+        slot=immersion.slot,
+    )
+
+    slot_entity = immersion.slot.get_establishment() or immersion.slot.get_highschool()
+
+    if slot_entity and slot_entity.logo:
+        certificate_logo = slot_entity
+    else:
+        if "logo" not in cache:
+            cache["logo"] = CertificateLogo.objects.get(pk=1)
+        certificate_logo = cache["logo"]
+
+    if slot_entity and slot_entity.signature:
+        certificate_sig = slot_entity
+    else:
+        if "signature" not in cache:
+            cache["signature"] = CertificateSignature.objects.get(pk=1)
+        certificate_sig = cache["signature"]
+
+    return {
+        'city': slot_entity.city.capitalize() if slot_entity else '',
+        'certificate_header': slot_entity.certificate_header if slot_entity and slot_entity.certificate_header else '',
+        'certificate_body': certificate_body,
+        'certificate_footer': slot_entity.certificate_footer if slot_entity and slot_entity.certificate_footer else '',
+        'certificate_logo': certificate_logo,
+        'certificate_sig': certificate_sig,
+    }
+
+
+def get_file_fingerprint(field_file) -> str:
+    """
+    Identity of a file content : sha256 hash of the content
+    """
+    if not field_file:
+        return ''
+    try:
+        with field_file.storage.open(field_file.name, "rb") as fd:
+            return hashlib.sha256(fd.read()).hexdigest()
+    except OSError:
+        # Missing file
+        return field_file.name
+
+
+def get_attestation_hash(context) -> str:
+    """
+    Hash of the attestation inputs : texts, logo and signature files (see get_file_fingerprint)
+    """
+    inputs = [
+        context['city'],
+        context['certificate_header'],
+        context['certificate_body'],
+        context['certificate_footer'],
+        get_file_fingerprint(context['certificate_logo'].logo),
+        get_file_fingerprint(context['certificate_sig'].signature),
+    ]
+
+    return hashlib.sha256("\0".join(str(value) for value in inputs).encode("utf-8")).hexdigest()
+
+
+def get_attestation_filename(immersion) -> str:
+    student = immersion.student
+    return f'immersion_{date_format(immersion.slot.date,"dmY")}_{student.last_name}_{student.first_name}.pdf'
+
+
+def store_attestation(immersion, request=None, cache=None) -> Tuple[str, bool]:
+    """
+    Render the attendance certificate pdf of an immersion and store it in the default storage
+    The pdf is rendered only once for a given set of inputs (see get_attestation_hash)
+    :param immersion: Immersion object
+    :param request: request object, if any (used to resolve relative urls)
+    :param cache: see get_attestation_context
+    :return: tuple (storage path, True if the pdf has just been rendered)
+    """
+    context = get_attestation_context(immersion, cache)
+    directory = f"{ATTESTATIONS_PATH}/{immersion.pk}"
+    attestation_hash = get_attestation_hash(context)
+    path = f"{directory}/{attestation_hash}.pdf"
+
+    # One rendering at a time per immersion (concurrent downloads and exports) : the lock is
+    # released with the transaction and the next caller finds the stored pdf
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)", [ATTESTATION_LOCK_KEY, immersion.pk])
+
+        if default_storage.exists(path):
+            return path, False
+
+        pdf = render_pdf('export/pdf/attendance_certificate.html', context, base_url=get_base_url(request))
+        path = default_storage.save(path, ContentFile(pdf))
+
+        # Remove obsolete versions once the new one is stored : downloads in progress always find a pdf
+        for filename in default_storage.listdir(directory)[1]:
+            if not filename.startswith(attestation_hash):
+                default_storage.delete(f"{directory}/{filename}")
+
+    return path, True
+
+
+def get_attestations_immersions(slot=None, period=None, establishment=None, user=None) -> QuerySet:
+    """
+    Immersions having an attendance certificate, for a slot, a period or an establishment
+    :param user: if set, only the immersions of the slots this user can manage
+    """
+    immersions = Immersion.objects.select_related(
+        'student', 'slot__course__training', 'slot__course__structure__establishment',
+        'slot__course__highschool', 'slot__event__establishment', 'slot__event__highschool',
+        'slot__course_type', 'slot__campus', 'slot__building',
+    ).filter(
+        Q(attendance_status=1) | Q(slot__place=Slot.REMOTE),
+        cancellation_type__isnull=True,
+    )
+
+    if slot:
+        immersions = immersions.filter(slot=slot)
+    if period:
+        immersions = immersions.filter(slot__period=period)
+    if establishment:
+        immersions = immersions.filter(
+            Q(slot__course__structure__establishment=establishment) | Q(slot__event__establishment=establishment)
+        )
+    if user:
+        immersions = immersions.user_immersions(user)
+
+    return immersions.order_by('slot__date', 'slot__start_time', 'student__last_name', 'student__first_name')
+
+
+# Attestation inputs loaded once per pool process
+_worker_cache: Dict[str, Any] = {}
+
+def _store_attestation_worker(immersion_id) -> str:
+    immersion = get_attestations_immersions().get(pk=immersion_id)
+    return store_attestation(immersion, cache=_worker_cache)[0]
+
+
+def build_attestations_zip(immersions, processes=1, progress: Optional[Callable[[int, int], None]] = None) -> bytes:
+    """
+    ZIP archive of the attendance certificates of the given immersions
+    Missing pdfs are rendered and stored (see store_attestation), in a pool of processes if processes > 1
+    :param immersions: Immersion objects list or queryset
+    :param processes: number of rendering processes
+    :param progress: optional callback(done, total)
+    :return: ZIP file content
+    """
+    immersions: List[Immersion] = list(immersions)
+    total = len(immersions)
+    paths: List[str] = []
+
+    if processes > 1 and total > 1:
+        with get_process_pool(processes) as executor:
+            for path in executor.map(_store_attestation_worker, [immersion.pk for immersion in immersions]):
+                paths.append(path)
+                if progress:
+                    progress(len(paths), total)
+    else:
+        cache = {}
+        for immersion in immersions:
+            paths.append(store_attestation(immersion, cache=cache)[0])
+            if progress:
+                progress(len(paths), total)
+
+    archive = BytesIO()
+
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for immersion, path in zip(immersions, paths):
+            with default_storage.open(path, "rb") as fd:
+                zip_file.writestr(f"{immersion.pk}_{get_attestation_filename(immersion)}", fd.read())
+
+    return archive.getvalue()
+
+
+def build_attestations_pdf(immersions, base_url=None, progress: Optional[Callable[[int, int], None]] = None) -> bytes:
+    """
+    Single pdf containing the attendance certificates of the given immersions
+    Documents are rendered in the current process, then their pages are merged
+    :param immersions: Immersion objects list or queryset
+    :param base_url: base url to resolve relative urls
+    :param progress: optional callback(done, total)
+    :return: pdf content
+    """
+    immersions: List[Immersion] = list(immersions)
+    font_config = get_font_config()
+    cache = {}
+    documents = []
+
+    for immersion in immersions:
+        document = get_pdf_document(
+            'export/pdf/attendance_certificate.html', get_attestation_context(immersion, cache), base_url
+        )
+        documents.append(document.render(font_config=font_config))
+
+        if progress:
+            progress(len(documents), len(immersions))
+
+    if not documents:
+        return b""
+
+    pages = [page for document in documents for page in document.pages]
+    return documents[0].copy(pages).write_pdf()
+
+
+def run_attestations_export(export):
+    """
+    Build the file of an attestations export, its progress is saved after each attestation
+    :param export: AttestationsExport object
+    """
+    def progress(done, total):
+        AttestationsExport.objects.filter(pk=export.pk).update(done=done, total=total)
+
+    export.status = AttestationsExport.RUNNING
+    export.save(update_fields=['status'])
+
+    try:
+        immersions = get_attestations_immersions(
+            period=export.period, establishment=export.establishment, user=export.user
+        )
+
+        if export.format == "pdf":
+            content = build_attestations_pdf(immersions, base_url=get_base_url(), progress=progress)
+        else:
+            content = build_attestations_zip(immersions, progress=progress)
+
+        export.path = default_storage.save(
+            f"{ATTESTATIONS_EXPORTS_PATH}/{export.pk}/{export.get_filename()}", ContentFile(content)
+        )
+        export.status = AttestationsExport.DONE
+    except Exception as e:
+        logger.exception("Attestations export %s error", export.pk)
+        export.status = AttestationsExport.ERROR
+        export.message = str(e)
+
+    export.end_date = timezone.now()
+    export.save(update_fields=['path', 'status', 'message', 'end_date'])
+
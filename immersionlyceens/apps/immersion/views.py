@@ -22,9 +22,10 @@ from django.contrib.auth.password_validation import (
 )
 from django.contrib.sessions.models import Session
 from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
 from django.core.validators import validate_email
 from django.db.models import Q, QuerySet
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import resolve, reverse
 from django.utils import timezone
@@ -45,16 +46,19 @@ except ImportError:
 from shibboleth.app_settings import LOGOUT_URL, LOGOUT_REDIRECT_URL
 
 
+from immersionlyceens.apps.core.managers import get_user_slots_filter
 from immersionlyceens.apps.core.models import (
-    AttestationDocument, BachelorType, CancelType, CertificateLogo,
-    CertificateSignature, Establishment, GeneralSettings, HigherEducationInstitution,
+    AttestationDocument, AttestationsExport, BachelorType, CancelType, CertificateLogo,
+    Establishment, GeneralSettings, HigherEducationInstitution,
     HighSchool, HighSchoolLevel, Immersion, ImmersionUser, InformationText,
     MailTemplate, MefStat, PendingUserGroup, Period, Slot, UniversityYear,
     UserCourseAlert,
 )
-from immersionlyceens.apps.immersion.utils import generate_pdf
+from immersionlyceens.apps.immersion.utils import (
+    build_attestations_pdf, build_attestations_zip, generate_pdf, get_attestation_filename,
+    get_attestations_immersions, get_base_url, store_attestation,
+)
 from immersionlyceens.decorators import groups_required
-from immersionlyceens.libs.mails.variables_parser import parser
 from immersionlyceens.libs.utils import check_active_year, get_general_setting
 
 from .forms import (
@@ -1908,46 +1912,122 @@ def immersion_attestation_download(request, immersion_id):
             'slot__course__training', 'slot__course_type', 'slot__campus', 'slot__building', 'slot__speakers',
         ).get(Q(attendance_status=1) | Q(slot__place=Slot.REMOTE), pk=immersion_id)
 
-        student = immersion.student
+        # Already rendered pdfs (see generate_attestations command) are served from storage
+        path = store_attestation(immersion, request)[0]
 
-        tpl = MailTemplate.objects.get(code='CERTIFICATE_BODY', active=True)
+        response = HttpResponse(content_type="application/pdf")
+        response['Content-Disposition'] = f'attachment; filename={get_attestation_filename(immersion)}'
 
-        certificate_body = parser(
-            user=student,
-            request=request,
-            message_body=tpl.body,
-            vars=list(tpl.available_vars.all()),
-            immersion=immersion,
-            slot=immersion.slot,
-        )
+        with default_storage.open(path, "rb") as fd:
+            response.write(fd.read())
 
-        slot_entity = immersion.slot.get_establishment() \
-            if immersion.slot.get_establishment() else immersion.slot.get_highschool()
+        return response
+    # TODO: Manage Mailtemplate not found (?) anyway returns 404
+    except Exception as e:
+        logger.error('Certificate download error', exc_info=e)
+        raise Http404() from e
 
-        certificate_logo = slot_entity if slot_entity and slot_entity.logo \
-            else CertificateLogo.objects.get(pk=1)
-        certificate_sig = slot_entity if slot_entity and slot_entity.signature \
-            else CertificateSignature.objects.get(pk=1)
 
-        context = {
-            'city': slot_entity.city.capitalize() if slot_entity else '',
-            'certificate_header': slot_entity.certificate_header if slot_entity and slot_entity.certificate_header else '',
-            'certificate_body': certificate_body,
-            'certificate_footer': slot_entity.certificate_footer if slot_entity and slot_entity.certificate_footer else '',
-            'certificate_logo': certificate_logo,
-            'certificate_sig': certificate_sig,
-        }
+@login_required
+@groups_required('REF-ETAB', 'REF-ETAB-MAITRE', 'REF-STR', 'INTER', 'REF-TEC', 'REF-LYC', 'CONS-STR')
+def immersion_attestations_download(request):
+    """
+    Attendance certificates of a slot, a period or an establishment
+    GET parameters : slot, period or establishment id, format ('zip' (default) or 'pdf' for a single merged pdf)
+    Only the slots the user can manage are exported (see get_user_slots_filter)
+    Periods and establishments are restricted to establishment managers and operators : they are exported
+    by the run_attestations_exports scheduled task and the response gives the export progress url
+    (see immersion_attestations_export)
+    """
+    slot_id = request.GET.get("slot")
+    period_id = request.GET.get("period")
+    establishment_id = request.GET.get("establishment")
+    output_format = "pdf" if request.GET.get("format") == "pdf" else "zip"
+    user = request.user
 
-        filename = f'immersion_{date_format(immersion.slot.date,"dmY")}_{student.last_name}_{student.first_name}.pdf'
-        response = generate_pdf(request, 'export/pdf/attendance_certificate.html', context, filename=filename)
+    try:
+        if slot_id:
+            slot = Slot.objects.get(pk=slot_id)
+            slots_filter = get_user_slots_filter(user)
+
+            if slots_filter is not None and not Slot.objects.filter(slots_filter, pk=slot.pk).exists():
+                raise PermissionError()
+
+            immersions = get_attestations_immersions(slot=slot)
+            filename = f'attestations_{date_format(slot.date,"dmY")}_{slot_id}'
+        elif period_id or establishment_id:
+            if not user.is_master_establishment_manager() and not user.is_operator():
+                if not user.is_establishment_manager():
+                    raise PermissionError()
+                if establishment_id and int(establishment_id) != user.establishment.pk:
+                    raise PermissionError()
+                establishment_id = user.establishment.pk
+
+            AttestationsExport.delete_expired()
+
+            export = AttestationsExport.objects.create(
+                user=user,
+                period=Period.objects.get(pk=period_id) if period_id else None,
+                establishment=Establishment.objects.get(pk=establishment_id) if establishment_id else None,
+                format=output_format,
+            )
+
+            return JsonResponse(
+                {"id": export.pk, "url": reverse("immersion:attestations_export", args=[export.pk])},
+                status=202
+            )
+        else:
+            raise Http404()
+
+        if output_format == "pdf":
+            response = HttpResponse(content_type="application/pdf")
+            response['Content-Disposition'] = f'attachment; filename={filename}.pdf'
+            response.write(build_attestations_pdf(immersions, base_url=get_base_url(request)))
+        else:
+            response = HttpResponse(content_type="application/zip")
+            response['Content-Disposition'] = f'attachment; filename={filename}.zip'
+            response.write(build_attestations_zip(immersions))
 
         return response
-    # TODO: Manage Mailtemplate not found (?) anyway returns 404
+    except PermissionError:
+        return HttpResponse(status=403)
+    except Http404:
+        raise
     except Exception as e:
-        logger.error('Certificate download error', exc_info=e)
+        logger.error('Certificates download error', exc_info=e)
         raise Http404() from e
 
 
+@login_required
+@groups_required('REF-ETAB', 'REF-ETAB-MAITRE', 'REF-TEC')
+def immersion_attestations_export(request, export_id):
+    """
+    Progress of an attestations export of the user, or its file once done ('download' GET parameter)
+    """
+    export = get_object_or_404(AttestationsExport, pk=export_id, user=request.user)
+    url = reverse("immersion:attestations_export", args=[export.pk])
+
+    if request.GET.get("download"):
+        if export.status != AttestationsExport.DONE:
+            raise Http404()
+
+        response = HttpResponse(content_type="application/pdf" if export.format == "pdf" else "application/zip")
+        response['Content-Disposition'] = f'attachment; filename={export.get_filename()}'
+
+        with default_storage.open(export.path, "rb") as fd:
+            response.write(fd.read())
+
+        return response
+
+    return JsonResponse({
+        "status": export.status,
+        "done": export.done,
+        "total": export.total,
+        "msg": export.message or "",
+        "url": f"{url}?download=1" if export.status == AttestationsExport.DONE else None,
+    })
+
+
 @login_required
 @groups_required('REF-ETAB', 'REF-ETAB-MAITRE', 'REF-STR', 'INTER', 'REF-TEC', 'REF-LYC', 'CONS-STR')
 def immersion_attendance_students_list_download(request, slot_id):
@@ -1981,7 +2061,13 @@ def immersion_attendance_students_list_download(request, slot_id):
             }
 
             filename = f'{date_format(slot.date,"dmY")}.pdf'
-            response = generate_pdf(request, 'export/pdf/attendance_students_list.html', context, filename=filename)
+            response = generate_pdf(
+                request,
+                'export/pdf/attendance_students_list.html',
+                context,
+                filename=filename,
+                stylesheets=['css/bootstrap.min.css'],
+            )
 
             return response
     # TODO: Manage Mailtemplate not found (?) anyway returns 404
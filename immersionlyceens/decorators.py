@@ -41,6 +41,20 @@ def groups_required(*groups, login_url='/'):
     return user_passes_test(in_groups, login_url=login_url)
 
 
+def query_budget(max_queries):
+    """
+    Set the maximum queries count of a view (function or class) or a management command class.
+    Checked by the QueryBudget middleware and the scheduled tasks runner : over budget runs are
+    logged, and fail when the QUERY_BUDGET_RAISE setting is True (tests).
+    The QUERY_BUDGETS setting ({url or command name: max queries}) overrides it.
+    """
+    def decorator(obj):
+        obj.query_budget = max_queries
+        return obj
+
+    return decorator
+
+
 def timer(func):
     """helper function to display execution time"""
 
@@ -5,4 +5,10 @@ class DisplayException(Exception):
     """
     def __init__(self, *args, **kwargs):
         self.display = kwargs.pop("display", False)
-        super().__init__(*args)
\ No newline at end of file
+        super().__init__(*args)
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    A view or a command ran more queries than its budget (see the query_budget decorator)
+    """
@@ -7,6 +7,7 @@ from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import gettext, gettext_lazy as _
 from immersionlyceens.apps.core.models import Establishment
+from immersionlyceens.libs.profiling import profiled
 from ldap3 import ALL, SUBTREE, Connection, Server, SIMPLE, Tls
 from ldap3.core.exceptions import LDAPBindError
 
@@ -140,6 +141,7 @@ class AccountAPI(BaseAccountsAPI):
     def decode_value(self, value: Union[bytes, str]) -> str:
         return value.decode("utf8") if isinstance(value, bytes) else value
 
+    @profiled('external')
     def search_user(self, search_value: str, search_attr: Optional[str] = None) -> Union[bool, List[Dict[str, Any]]]:
         if search_attr is None:
             search_attr = self.SEARCH_ATTR
@@ -9,6 +9,7 @@ from typing import Any, Dict, List, Optional, Union
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.translation import gettext, gettext_lazy as _
 from immersionlyceens.apps.core.models import Establishment
+from immersionlyceens.libs.profiling import profiled
 
 from .base import BaseAccountsAPI
 
@@ -113,6 +114,7 @@ class AccountAPI(BaseAccountsAPI):
     def decode_value(self, value: Union[bytes, str]) -> str:
         return value.decode("utf8") if isinstance(value, bytes) else value
 
+    @profiled('external')
     def search_user(self, search_value: str, search_attr: Optional[str] = None) -> Union[bool, List[Dict[str, Any]]]:
         response = None
         self.search_value = search_value
@@ -3,9 +3,12 @@ import requests
 import sys
 from typing import Optional
 
+from .profiling import profiled
+
 logger = logging.getLogger(__name__)
 
 
+@profiled('external')
 def get_json_from_url(url, headers: Optional[dict] = {}):
     connect_timeout = 1.0
     read_timeout = 10.0
@@ -0,0 +1,242 @@
+"""
+DataTables server-side processing (https://datatables.net/manual/server-side)
+
+Paging, ordering, global and column searches (including yadcf filters) sent by
+DataTables are translated to ORM queries, so responses only contain one page of results.
+"""
+import re
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+from django.db.models import Q, QuerySet
+from django.utils import formats
+
+# yadcf range filters values delimiter
+YADCF_DELIMITER = "-yadcf_delim-"
+
+# yadcf 'exact' filters are sent as escaped regular expressions : ^value$
+EXACT_REGEX = re.compile(r"^\^(?P<value>.*)\$$")
+ESCAPED_CHAR = re.compile(r"\\(.)")
+
+
+def is_server_side(request) -> bool:
+    """
+    True if the request has been sent by a DataTable with serverSide processing
+    """
+    return "draw" in request.GET or "draw" in request.POST
+
+
+def parse_request(data) -> Dict[str, Any]:
+    """
+    Parse the DataTables parameters (columns[0][name], order[0][dir], ...)
+    :param data: request.GET or request.POST
+    :return: dict with draw, start, length, search, columns and order
+    """
+    columns = defaultdict(lambda: {"search": {}})
+    orders = defaultdict(dict)
+
+    for key, value in data.items():
+        match = re.match(r"^columns\[(\d+)\]\[(\w+)\](?:\[(\w+)\])?$", key)
+        if match:
+            index, attr, sub_attr = match.groups()
+            if sub_attr:
+                columns[int(index)][attr][sub_attr] = value
+            else:
+                columns[int(index)][attr] = value
+            continue
+
+        match = re.match(r"^order\[(\d+)\]\[(\w+)\]$", key)
+        if match:
+            orders[int(match.group(1))][match.group(2)] = value
+
+    def to_int(value, default):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return default
+
+    return {
+        "draw": to_int(data.get("draw"), 0),
+        "start": max(to_int(data.get("start"), 0), 0),
+        "length": to_int(data.get("length"), -1),
+        "search": data.get("search[value]", ""),
+        "columns": [columns[index] for index in sorted(columns)],
+        "order": [orders[index] for index in sorted(orders)],
+    }
+
+
+def date_filter(lookup: str) -> Callable[[QuerySet, str], QuerySet]:
+    """
+    Column search on a date (see DataTablesAdapter filters) : a complete date typed
+    in one of the DATE_INPUT_FORMATS is matched exactly, other values partially match the ISO format
+    :param lookup: date lookup ('creation_date__date' for a datetime field)
+    """
+    def search(queryset: QuerySet, value: str) -> QuerySet:
+        for date_format in formats.get_format("DATE_INPUT_FORMATS"):
+            try:
+                date = datetime.strptime(value.strip(), date_format).date()
+            except ValueError:
+                continue
+
+            return queryset.filter(**{lookup: date})
+
+        return queryset.filter(**{f"{lookup}__icontains": value})
+
+    return search
+
+
+class DataTablesAdapter:
+    """
+    Apply DataTables server-side parameters to a queryset
+
+    :param columns: DataTables column name (columns.name option) => ORM lookup(s).
+        Only these columns can be searched and ordered, the first lookup is used for ordering.
+    :param filters: column name => function(queryset, value) for column searches
+        that can't be translated to a simple lookup (booleans, aggregations, ...)
+    :param yadcf_data: column name => list of values for yadcf select filters,
+        or None to use the distinct values of the column in the queryset
+    :param max_length: page size upper bound ('All' included)
+    """
+    def __init__(
+        self,
+        request,
+        queryset: QuerySet,
+        columns: Dict[str, Union[str, Iterable[str]]],
+        filters: Optional[Dict[str, Callable[[QuerySet, str], QuerySet]]] = None,
+        yadcf_data: Optional[Dict[str, Optional[List[Any]]]] = None,
+        max_length: int = 1000,
+    ):
+        self.params = parse_request(request.POST if request.method == "POST" else request.GET)
+        self.queryset = queryset
+        self.columns = {
+            name: [lookups] if isinstance(lookups, str) else list(lookups)
+            for name, lookups in columns.items()
+        }
+        self.filters = filters or {}
+        self.yadcf_data = yadcf_data or {}
+        self.max_length = max_length
+
+    @staticmethod
+    def get_search_value(search: Dict[str, str]) -> str:
+        value = search.get("value", "")
+
+        if search.get("regex") == "true":
+            match = EXACT_REGEX.match(value)
+            if match:
+                value = ESCAPED_CHAR.sub(r"\1", match.group("value"))
+
+        return value
+
+    def search_column(self, queryset: QuerySet, name: str, search: Dict[str, str]) -> QuerySet:
+        value = self.get_search_value(search)
+
+        if not value:
+            return queryset
+
+        if name in self.filters:
+            return self.filters[name](queryset, value)
+
+        lookups = self.columns[name]
+        exact = search.get("regex") == "true" and EXACT_REGEX.match(search.get("value", ""))
+
+        if YADCF_DELIMITER in value:
+            low, high = value.split(YADCF_DELIMITER, 1)
+            if low:
+                queryset = queryset.filter(**{f"{lookups[0]}__gte": low})
+            if high:
+                queryset = queryset.filter(**{f"{lookups[0]}__lte": high})
+            return queryset
+
+        operator = "iexact" if exact else "icontains"
+        search_filter = Q()
+
+        for lookup in lookups:
+            search_filter |= Q(**{f"{lookup}__{operator}": value})
+
+        return queryset.filter(search_filter)
+
+    def filter(self, queryset: QuerySet) -> QuerySet:
+        for column in self.params["columns"]:
+            name = column.get("name")
+            if name in self.columns and column.get("searchable", "true") == "true":
+                queryset = self.search_column(queryset, name, column["search"])
+
+        value = self.params["search"]
+
+        if value:
+            search_filter = Q()
+            for column in self.params["columns"]:
+                name = column.get("name")
+                if name in self.columns and column.get("searchable", "true") == "true":
+                    for lookup in self.columns[name]:
+                        search_filter |= Q(**{f"{lookup}__icontains": value})
+
+            queryset = queryset.filter(search_filter)
+
+        return queryset
+
+    def order(self, queryset: QuerySet) -> QuerySet:
+        ordering = []
+
+        for order in self.params["order"]:
+            try:
+                column = self.params["columns"][int(order.get("column"))]
+            except (TypeError, ValueError, IndexError):
+                continue
+
+            name = column.get("name")
+            if name in self.columns and column.get("orderable", "true") == "true":
+                lookup = self.columns[name][0]
+                ordering.append(f"-{lookup}" if order.get("dir") == "desc" else lookup)
+
+        # Stable pagination
+        ordering.append("pk")
+
+        return queryset.order_by(*ordering)
+
+    def get_yadcf_data(self) -> Dict[str, List[Any]]:
+        data = {}
+
+        for index, column in enumerate(self.params["columns"]):
+            name = column.get("name")
+
+            if name not in self.yadcf_data:
+                continue
+
+            values = self.yadcf_data[name]
+
+            if values is None:
+                values = [
+                    value for value in self.queryset.order_by(self.columns[name][0])
+                        .values_list(self.columns[name][0], flat=True)
+                        .distinct()
+                    if value not in (None, "")
+                ]
+
+            data[f"yadcf_data_{index}"] = list(values)
+
+        return data
+
+    def get_response(self, response: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        DataTables server-side response : the current page in 'data', with the counters and the yadcf filters values
+        :param response: dict to update (ex: {'data': [], 'msg': ''})
+        """
+        response = response if response is not None else {}
+        filtered = self.filter(self.queryset)
+        start = self.params["start"]
+        length = self.params["length"]
+
+        if length < 0 or length > self.max_length:
+            length = self.max_length
+
+        response.update({
+            "draw": self.params["draw"],
+            "recordsTotal": self.queryset.count(),
+            "recordsFiltered": filtered.count(),
+            "data": list(self.order(filtered)[start:start + length]),
+            **self.get_yadcf_data(),
+        })
+
+        return response
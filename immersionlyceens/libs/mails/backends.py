@@ -9,6 +9,20 @@ from django.conf import settings
 logger = logging.getLogger(__name__)
 
 
+class EmailBatchError(Exception):
+    """
+    Some messages of a send_messages() batch couldn't be sent, the other ones have been sent
+    """
+    def __init__(self, failures, sent):
+        """
+        :param failures: list of (message, exception) tuples
+        :param sent: number of sent messages
+        """
+        self.failures = failures
+        self.sent = sent
+        super().__init__(", ".join(f"{message['To']} : {error}" for message, error in failures))
+
+
 class BaseEmailBackend:
     def __init__(self, fail_silently=False, **kwargs):
         self.fail_silently = fail_silently
@@ -16,6 +30,33 @@ class BaseEmailBackend:
     def send_message(self, email_message):
         raise NotImplementedError
 
+    def send_messages(self, email_messages):
+        """
+        Send multiple messages, backends may override it to reuse a single connection
+        A failure doesn't stop the batch : EmailBatchError lists the failed messages at the end
+        :return: number of sent messages
+        """
+        sent = 0
+        failures = []
+
+        for email_message in email_messages:
+            try:
+                self.send_message(email_message)
+                sent += 1
+            except Exception as e:
+                failures.append((email_message, e))
+
+        return self.batch_result(sent, failures)
+
+    def batch_result(self, sent, failures):
+        if failures:
+            logger.error("Cannot send %s email(s) : %s", len(failures), EmailBatchError(failures, sent))
+
+            if not self.fail_silently:
+                raise EmailBatchError(failures, sent)
+
+        return sent
+
 
 class EmailBackend(BaseEmailBackend):
 
@@ -52,6 +93,34 @@ class EmailBackend(BaseEmailBackend):
 
         return sent
 
+    def send_messages(self, email_messages):
+        """
+        Send multiple messages within a single SMTP session
+        """
+        sent = 0
+        failures = []
+
+        if not email_messages:
+            return sent
+
+        smtp_func = smtplib.SMTP_SSL if self.ssl_on_connect else smtplib.SMTP
+
+        with smtp_func(host=self.host, port=self.port) as s:
+            if self.use_tls and not self.ssl_on_connect:
+                s.starttls()
+
+            if self.host_user and self.host_password:
+                s.login(self.host_user, self.host_password)
+
+            for email_message in email_messages:
+                try:
+                    s.send_message(email_message, from_addr=email_message["From"])
+                    sent += 1
+                except Exception as e:
+                    failures.append((email_message, e))
+
+        return self.batch_result(sent, failures)
+
 
 class ConsoleBackend(BaseEmailBackend):
     def send_message(self, email_message):
@@ -1,5 +1,6 @@
 import logging
 import sys
+from contextlib import contextmanager
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from importlib import import_module
@@ -7,8 +8,13 @@ from importlib import import_module
 from django.conf import settings
 from django.core.mail import EmailMessage
 from django.core.mail.message import sanitize_address
+from django.utils.translation import gettext
+
+from immersionlyceens.libs.profiling import profiled
 from immersionlyceens.libs.utils import get_general_setting
 
+from .backends import BaseEmailBackend, EmailBatchError
+
 logger = logging.getLogger(__name__)
 
 
@@ -20,9 +26,37 @@ def import_mail_backend():
 
 mail_backend = import_mail_backend()
 
+# Active sent emails counters (see count_sent_emails)
+_sent_emails_counters = []
 
-def send_email(address, subject, body, from_addr=None, reply_to=None, copies=()):
+
+@contextmanager
+def count_sent_emails():
+    """
+    Count the emails sent within the block
+    Usage :
+        with count_sent_emails() as counter:
+            ...
+        counter['sent']
+    """
+    counter = {'sent': 0}
+    _sent_emails_counters.append(counter)
+
+    try:
+        yield counter
+    finally:
+        _sent_emails_counters.remove(counter)
+
+
+def add_sent_emails(count):
+    for counter in _sent_emails_counters:
+        counter['sent'] += count
+
+
+def get_email_message(address, subject, body, from_addr=None, reply_to=None, copies=()):
     """
+    Build the MIME message sent by the mail backend
+    :return: message, or None if there's no recipient
     """
     # Get configured 'from' address or the default settings/<env>.py one
     encoding = settings.DEFAULT_CHARSET
@@ -39,7 +73,7 @@ def send_email(address, subject, body, from_addr=None, reply_to=None, copies=())
     else:
         recipient = address
         cc = [sanitize_address(a, encoding) for a in copies]
-        
+
     if not recipient:
         logger.warning("Cannot send mail (no email address specified)")
         return
@@ -58,17 +92,39 @@ def send_email(address, subject, body, from_addr=None, reply_to=None, copies=())
 
     part2 = MIMEText(html, 'html')
     msg.attach(part2)
+
+    return msg
+
+
+def get_django_email_message(msg):
+    """
+    For unittests, convert a MIME message to a Django Email Backend message
+    """
+    return EmailMessage(
+        msg['Subject'],
+        msg.get_payload()[0].get_payload(decode=True).decode(),
+        settings.DEFAULT_FROM_EMAIL,
+        [msg['To']]
+    )
+
+
+@profiled('mail')
+def send_email(address, subject, body, from_addr=None, reply_to=None, copies=()):
+    """
+    """
+    msg = get_email_message(address, subject, body, from_addr=from_addr, reply_to=reply_to, copies=copies)
+
+    if msg is None:
+        return
+
+    recipient = msg['To']
+
     try:
         mail_backend().send_message(msg)
     except AttributeError:
         # For unittests, use Django Email Backend
-        email = EmailMessage(
-            subject,
-            html,
-            settings.DEFAULT_FROM_EMAIL,
-            [sanitize_address(recipient, encoding)]
-        )
-        email.send()
+        get_django_email_message(msg).send()
+        add_sent_emails(1)
     except Exception as e:
         logger.error(
             f"Cannot send message to {recipient} : unexpected error: {e} - {sys.exc_info()[0]}",
@@ -76,4 +132,47 @@ def send_email(address, subject, body, from_addr=None, reply_to=None, copies=())
         )
         raise
     else:
+        add_sent_emails(1)
         logger.info("Mail sent to %s", recipient)
+
+
+@profiled('mail')
+def send_emails(messages, failed=None):
+    """
+    Send multiple emails with a single mail backend connection
+    A failed email doesn't prevent the other ones from being sent
+    :param messages: list of (address, subject, body, copies) tuples
+    :param failed: if set, the indexes (in messages) of the emails that couldn't be sent are added to it
+    :return: error message or None if all emails have been sent
+    """
+    msgs = {}
+
+    for index, (address, subject, body, copies) in enumerate(messages):
+        msg = get_email_message(address, subject, body, copies=copies)
+        if msg is not None:
+            msgs[index] = msg
+
+    if not msgs:
+        return
+
+    backend = mail_backend()
+    failed = set() if failed is None else failed
+
+    try:
+        if isinstance(backend, BaseEmailBackend):
+            backend.send_messages(list(msgs.values()))
+        else:
+            # For unittests, use Django Email Backend
+            backend.send_messages([get_django_email_message(msg) for msg in msgs.values()])
+    except EmailBatchError as e:
+        failed_msgs = {id(msg) for msg, error in e.failures}
+        failed.update(index for index, msg in msgs.items() if id(msg) in failed_msgs)
+        add_sent_emails(e.sent)
+        return gettext("Couldn't send email : %s") % e
+    except Exception as e:
+        logger.error(f"Cannot send messages : unexpected error: {e} - {sys.exc_info()[0]}")
+        failed.update(msgs)
+        return gettext("Couldn't send email : %s") % e
+
+    add_sent_emails(len(msgs))
+    logger.info("%s mail(s) sent", len(msgs))
@@ -0,0 +1,104 @@
+"""
+Requests profiling : time spent in templates, mails, PDF and external services (LDAP, REST, geoapi)
+during a profiled request (see the RequestsProfiling middleware and the REQUESTS_PROFILING general setting)
+
+Usage :
+    @profiled('external')
+    def search_user(...):
+        ...
+
+    with profiling() as profile:
+        ...
+    profile.durations
+
+Templates are timed by the ProfiledDjangoTemplates backend (TEMPLATES setting)
+"""
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+_current_profile = ContextVar('profile', default=None)
+
+
+class Profile:
+    """
+    Durations (seconds) of the profiled sections of a request
+    Nested sections of the same kind (ex. template includes) are timed once
+    """
+    SECTIONS = ('template', 'mail', 'pdf', 'external')
+
+    def __init__(self):
+        self.durations = dict.fromkeys(self.SECTIONS, 0)
+        self._depth = Counter()
+
+    @contextmanager
+    def section(self, name):
+        self._depth[name] += 1
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self._depth[name] -= 1
+
+            if not self._depth[name]:
+                self.durations[name] += time.perf_counter() - start
+
+
+@contextmanager
+def profiling():
+    """
+    Profile the sections run in the block
+    """
+    profile = Profile()
+    token = _current_profile.set(profile)
+
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+def profiled(section):
+    """
+    Time the decorated function in the given section of the current profile, if any
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = _current_profile.get()
+
+            if profile is None:
+                return func(*args, **kwargs)
+
+            with profile.section(section):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ProfiledTemplate(Template):
+    @profiled('template')
+    def render(self, context=None, request=None):
+        return super().render(context, request)
+
+
+class ProfiledDjangoTemplates(DjangoTemplates):
+    """
+    Django templates backend timing the renderings in the 'template' section of the current profile
+    """
+    def from_string(self, template_code):
+        return ProfiledTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return ProfiledTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
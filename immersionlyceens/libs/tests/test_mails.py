@@ -3,6 +3,7 @@ Mails tests
 """
 import datetime
 import uuid
+from unittest.mock import patch
 
 from django.core import management
 from django.contrib.auth import get_user_model
@@ -14,6 +15,8 @@ from django.conf import settings
 from django.contrib.auth.models import Group
 
 from immersionlyceens.libs.utils import get_general_setting
+from ..mails.backends import BaseEmailBackend
+from ..mails.utils import count_sent_emails, send_emails
 from ..mails.variables_parser import parser
 
 from immersionlyceens.apps.core.models import (
@@ -375,3 +378,28 @@ class MailsTestCase(TestCase):
         self.highschool_user.first_name = "dsfgfd"
         parsed_body = parser(message_body, user=self.highschool_user)
         self.assertEqual("World", parsed_body)
+
+    def test_send_emails_failures(self):
+        sent = []
+
+        class FailingBackend(BaseEmailBackend):
+            def send_message(self, email_message):
+                if email_message['To'] == 'fail@test.com':
+                    raise ConnectionError("refused")
+                sent.append(email_message['To'])
+
+        messages = [
+            (address, "Subject", "Body", [])
+            for address in ['first@test.com', 'fail@test.com', 'last@test.com']
+        ]
+        failed = set()
+
+        # A failure doesn't stop the batch
+        with patch('immersionlyceens.libs.mails.utils.mail_backend', FailingBackend),\
+                count_sent_emails() as counter:
+            error = send_emails(messages, failed=failed)
+
+        self.assertEqual(sent, ['first@test.com', 'last@test.com'])
+        self.assertEqual(failed, {1})
+        self.assertEqual(counter['sent'], 2)
+        self.assertIn("fail@test.com : refused", error)
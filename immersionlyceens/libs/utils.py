@@ -1,10 +1,21 @@
 # pylint: disable=E1101
 """File for utils content"""
+import logging
+import multiprocessing
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Any, Dict
 
+from django.conf import settings
+from django.db import connection, connections
 from django.template import Engine, Template, engines
 from immersionlyceens.apps.core import models as core_models
+from immersionlyceens.exceptions import QueryBudgetExceeded
+
+logger = logging.getLogger(__name__)
 
 
 def check_active_year():
@@ -108,3 +119,135 @@ def get_custom_theme_files(type=None):
         raise ValueError
 
     return files
+
+
+class QueryCounter:
+    """
+    Database execute wrapper counting the queries, the rows written by INSERT, UPDATE and DELETE queries,
+    the time spent in the database (seconds) and the executions and duration of each SQL statement
+    Usage :
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            ...
+    """
+    WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE')
+
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.duration = 0
+        self.statements = Counter()
+        self.statements_durations = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+
+        try:
+            result = execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.duration += duration
+            self.statements_durations[sql] += duration
+
+        self.queries += 1
+        self.statements[sql] += 1
+
+        if sql.lstrip()[:6].upper() in self.WRITE_STATEMENTS:
+            rowcount = context['cursor'].rowcount
+            if rowcount and rowcount > 0:
+                self.rows += rowcount
+
+        return result
+
+    @property
+    def duplicates(self):
+        """
+        :return: list of (sql, executions) of the statements run more than once, most executed first.
+          Many executions of the same statement are usually an N+1 pattern
+        """
+        return [(sql, count) for sql, count in self.statements.most_common() if count > 1]
+
+    def get_slowest_statements(self, count=10):
+        """
+        :return: list of {sql, executions, duration (ms)} of the statements with the highest total duration
+        """
+        return [
+            {'sql': sql, 'executions': self.statements[sql], 'duration': round(duration * 1000, 1)}
+            for sql, duration in self.statements_durations.most_common(count)
+        ]
+
+
+def check_query_budget(name, budget, counter, raise_exception=None):
+    """
+    Log (and raise in tests, see QUERY_BUDGET_RAISE setting) when a view or command runs more
+    queries than its budget
+    :param name: view or command name
+    :param budget: maximum queries count, None for no budget
+    :param counter: QueryCounter
+    :param raise_exception: raise QueryBudgetExceeded, defaults to the QUERY_BUDGET_RAISE setting
+    :return: True if the queries count is within the budget
+    """
+    if budget is None or counter.queries <= budget:
+        return True
+
+    if raise_exception is None:
+        raise_exception = getattr(settings, 'QUERY_BUDGET_RAISE', False)
+
+    message = "%s : %s queries (budget %s) in %.1fms, duplicated statements : %s" % (
+        name,
+        counter.queries,
+        budget,
+        counter.duration * 1000,
+        "; ".join(f"{count}x {sql[:200]}" for sql, count in counter.duplicates[:5]) or "none",
+    )
+
+    if raise_exception:
+        raise QueryBudgetExceeded(message)
+
+    logger.warning(message)
+    return False
+
+
+def get_query_budget(name, obj=None):
+    """
+    :param name: url or command name, looked up in the QUERY_BUDGETS setting first
+    :param obj: view function or class, command class : budget set with the query_budget decorator
+    :return: maximum queries count, None for no budget
+    """
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+
+    if name in budgets:
+        return budgets[name]
+
+    # Class based views
+    obj = getattr(obj, 'view_class', obj)
+
+    return getattr(obj, 'query_budget', None)
+
+
+@contextmanager
+def count_queries(name="queries", budget=None, raise_exception=None):
+    """
+    Count the queries run in the block and check them against a budget
+    Usage (ex. in tests) :
+        with count_queries("charts", budget=20, raise_exception=True) as counter:
+            ...
+        counter.queries, counter.duration, counter.duplicates
+    """
+    counter = QueryCounter()
+
+    with connection.execute_wrapper(counter):
+        yield counter
+
+    check_query_budget(name, budget, counter, raise_exception=raise_exception)
+
+
+def get_process_pool(processes) -> ProcessPoolExecutor:
+    """
+    Pool of processes for Django code (commands, rendering, ...)
+    Processes are explicitly forked : they inherit the loaded Django setup, while the 'spawn' and
+    'forkserver' start methods (the default one since Python 3.14) would start without it
+    The database connections are closed first : each process has to open its own
+    """
+    connections.close_all()
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('fork'))
@@ -166,7 +166,9 @@ SECRET_KEY = 'ma8r116)33!-#pty4!sht8tsa(1bfe%(+!&9xfack+2e9alah!'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates with the requests profiling of the renderings (see libs.profiling)
+        'BACKEND': 'immersionlyceens.libs.profiling.ProfiledDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [join(DJANGO_ROOT, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -192,6 +194,8 @@ TEMPLATES = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'middlewares.requests_profiling.RequestsProfiling.RequestsProfiling',
+    'middlewares.query_budget.QueryBudget.QueryBudget',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -646,6 +650,26 @@ DEFAULT_NB_DAYS_SLOT_REMINDER = 4
 DEFAULT_NB_DAYS_SPEAKER_SLOT_REMINDER = 4
 DEFAULT_NB_WEEKS_STRUCTURES_SLOT_REMINDER = 1
 
+# Free seats alerts : delay (in seconds) before sending the alerts of a course where seats have been freed,
+# the seats freed in the meantime are notified together (see send_dispatched_course_alerts command,
+# scheduled every 5 minutes)
+COURSE_ALERTS_DEBOUNCE = 60
+
+# Maximum queries count per view (url name) or management command name, overrides the query_budget decorator
+QUERY_BUDGETS = {}
+
+# Over budget requests and commands raise QueryBudgetExceeded instead of being logged
+QUERY_BUDGET_RAISE = False
+
+# Requests profiling (see REQUESTS_PROFILING general setting) : number of slowest requests kept
+SLOW_REQUESTS_COUNT = 50
+
+# Change feed API : changes ids gaps younger than this delay (in seconds) may be uncommitted transactions
+CHANGE_FEED_SAFETY_LAG = 300
+
+# Change feed API : changes older than this number of days are deleted by the annual purge
+CHANGE_LOG_RETENTION_DAYS = 90
+
 # Opendata
 # This should be a stable URL according to this site :
 # https://www.data.gouv.fr/fr/datasets/etablissements-denseignement-superieur-2
@@ -1,3 +1,4 @@
+import tempfile
 from os import environ
 from os.path import normpath
 
@@ -41,6 +42,9 @@ ALLOWED_HOSTS = [
 # Language code for unit tests
 del(LANGUAGE_CODE)
 
+# Files uploaded and generated by the tests are kept out of the source tree
+MEDIA_ROOT = environ.get('MEDIA_ROOT', tempfile.mkdtemp(prefix='test_%s_media_' % SITE_NAME))
+
 #####################
 # Log configuration #
 #####################
@@ -70,3 +74,6 @@ HOLIDAY_API_DATE_FORMAT = '%Y-%m-%d'
 EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
 
 MIGRATE = False
+
+# New N+1 queries patterns fail the tests
+QUERY_BUDGET_RAISE = True
@@ -10,12 +10,12 @@ from wsgiref.util import FileWrapper
 
 import requests
 from django.conf import settings
-from django.contrib.postgres.aggregates import ArrayAgg, StringAgg
+from django.contrib.postgres.aggregates import StringAgg
 from django.core.files.storage import default_storage
 from django.db.models import (BooleanField, Case, CharField, Count, DateField,
                               Exists, ExpressionWrapper, F, Func, OuterRef, Q,
                               QuerySet, Subquery, Value, When, Sum, IntegerField)
-from django.db.models.functions import Coalesce, Concat, Greatest, JSONObject
+from django.db.models.functions import Coalesce, Concat, Greatest
 from django.http import (FileResponse, HttpResponse, HttpResponseBadRequest,
                          HttpResponseForbidden, HttpResponseNotFound,
                          StreamingHttpResponse)
@@ -369,85 +369,21 @@ def offer_subdomain(request, subdomain_id):
             course_type_label=F('course_type__label'),
 
             period_pk=F('period__pk'),
-            speaker_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        last_name=F('speakers__last_name'),
-                        first_name=F('speakers__first_name'),
-                        email=F('speakers__email'),
-                    ),
-                    filter=Q(speakers__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_establishments_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        city=F('allowed_establishments__city'),
-                        label=F('allowed_establishments__label')
-                    ),
-                    filter=Q(allowed_establishments__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschools_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        id=F('allowed_highschools__id'),
-                        city=F('allowed_highschools__city'),
-                        label=F('allowed_highschools__label')
-                    ),
-                    filter=Q(allowed_highschools__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschool_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_highschool_levels__label'),
-                    filter=Q(allowed_highschool_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            speaker_list=Slot.related_array(
+                'speakers', last_name='last_name', first_name='first_name', email='email'
             ),
-            allowed_post_bachelor_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_post_bachelor_levels__label'),
-                    filter=Q(allowed_post_bachelor_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_establishments_list=Slot.related_array(
+                'allowed_establishments', city='city', label='label'
             ),
-            allowed_student_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_student_levels__label'), filter=Q(allowed_student_levels__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_types_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_types__label'), filter=Q(allowed_bachelor_types__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_mentions_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_mentions__label'),
-                    filter=Q(allowed_bachelor_mentions__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_teachings_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_teachings__label'),
-                    filter=Q(allowed_bachelor_teachings__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_highschools_list=Slot.related_array(
+                'allowed_highschools', id='id', city='city', label='label'
             ),
+            allowed_highschool_levels_list=Slot.related_array('allowed_highschool_levels', 'label'),
+            allowed_post_bachelor_levels_list=Slot.related_array('allowed_post_bachelor_levels', 'label'),
+            allowed_student_levels_list=Slot.related_array('allowed_student_levels', 'label'),
+            allowed_bachelor_types_list=Slot.related_array('allowed_bachelor_types', 'label'),
+            allowed_bachelor_mentions_list=Slot.related_array('allowed_bachelor_mentions', 'label'),
+            allowed_bachelor_teachings_list=Slot.related_array('allowed_bachelor_teachings', 'label'),
             passed_registration_limit_date=Case(
                 When(
                     registration_limit_date__isnull=False,
@@ -520,6 +456,7 @@ def offer_subdomain(request, subdomain_id):
             'establishments_restrictions',
             'levels_restrictions',
             'bachelors_restrictions',
+            'restrictions',
 
             'allowed_establishments_list',
             'allowed_highschools_list',
@@ -573,7 +510,7 @@ def offer_subdomain(request, subdomain_id):
             # Can register ?
             # not registered + free seats + dates in range + cancelled to register again
             if not slot['already_registered'] or slot['cancelled']:
-                can_register, _obj = student.can_register_slot(slot)
+                can_register, _obj = student.can_register_slot(slot['restrictions'])
 
                 if slot['final_available_seats'] > 0 and can_register:
                     immersion_end_datetime = datetime.datetime.combine(
@@ -751,85 +688,21 @@ def offer_off_offer_events(request):
             event_type_id=F('event__event_type__id'),
             event_type_label=F('event__event_type__label'),
             period_pk=F('period__pk'),
-            speaker_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        last_name=F('speakers__last_name'),
-                        first_name=F('speakers__first_name'),
-                        email=F('speakers__email'),
-                    ),
-                    filter=Q(speakers__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_establishments_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        city=F('allowed_establishments__city'),
-                        label=F('allowed_establishments__label')
-                    ),
-                    filter=Q(allowed_establishments__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschools_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        id=F('allowed_highschools__id'),
-                        city=F('allowed_highschools__city'),
-                        label=F('allowed_highschools__label')
-                    ),
-                    filter=Q(allowed_highschools__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschool_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_highschool_levels__label'),
-                    filter=Q(allowed_highschool_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            speaker_list=Slot.related_array(
+                'speakers', last_name='last_name', first_name='first_name', email='email'
             ),
-            allowed_post_bachelor_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_post_bachelor_levels__label'),
-                    filter=Q(allowed_post_bachelor_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_establishments_list=Slot.related_array(
+                'allowed_establishments', city='city', label='label'
             ),
-            allowed_student_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_student_levels__label'), filter=Q(allowed_student_levels__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_types_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_types__label'), filter=Q(allowed_bachelor_types__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_mentions_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_mentions__label'),
-                    filter=Q(allowed_bachelor_mentions__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_teachings_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_teachings__label'),
-                    filter=Q(allowed_bachelor_teachings__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_highschools_list=Slot.related_array(
+                'allowed_highschools', id='id', city='city', label='label'
             ),
+            allowed_highschool_levels_list=Slot.related_array('allowed_highschool_levels', 'label'),
+            allowed_post_bachelor_levels_list=Slot.related_array('allowed_post_bachelor_levels', 'label'),
+            allowed_student_levels_list=Slot.related_array('allowed_student_levels', 'label'),
+            allowed_bachelor_types_list=Slot.related_array('allowed_bachelor_types', 'label'),
+            allowed_bachelor_mentions_list=Slot.related_array('allowed_bachelor_mentions', 'label'),
+            allowed_bachelor_teachings_list=Slot.related_array('allowed_bachelor_teachings', 'label'),
 
             passed_registration_limit_date=Case(
                 When(
@@ -916,6 +789,7 @@ def offer_off_offer_events(request):
             'establishments_restrictions',
             'levels_restrictions',
             'bachelors_restrictions',
+            'restrictions',
 
             'allow_group_registrations',
             'allow_individual_registrations',
@@ -962,7 +836,7 @@ def offer_off_offer_events(request):
             # Can register ?
             # not registered + free seats + dates in range + cancelled to register again
             if not slot['already_registered'] or slot['cancelled']:
-                can_register, _obj = student.can_register_slot(slot)
+                can_register, _obj = student.can_register_slot(slot['restrictions'])
 
                 try:
                     period = Period.from_date(pk=slot['period_pk'], date=slot['date'])
@@ -1175,85 +1049,21 @@ def cohort_offer(request):
             event_type_label=F('event__event_type__label'),
             event_type_id=F('event__event_type__id'),
 
-            speaker_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        last_name=F('speakers__last_name'),
-                        first_name=F('speakers__first_name'),
-                        email=F('speakers__email'),
-                    ),
-                    filter=Q(speakers__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_establishments_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        city=F('allowed_establishments__city'),
-                        label=F('allowed_establishments__label')
-                    ),
-                    filter=Q(allowed_establishments__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschools_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        id=F('allowed_highschools__id'),
-                        city=F('allowed_highschools__city'),
-                        label=F('allowed_highschools__label')
-                    ),
-                    filter=Q(allowed_highschools__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschool_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_highschool_levels__label'),
-                    filter=Q(allowed_highschool_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            speaker_list=Slot.related_array(
+                'speakers', last_name='last_name', first_name='first_name', email='email'
             ),
-            allowed_post_bachelor_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_post_bachelor_levels__label'),
-                    filter=Q(allowed_post_bachelor_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_establishments_list=Slot.related_array(
+                'allowed_establishments', city='city', label='label'
             ),
-            allowed_student_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_student_levels__label'), filter=Q(allowed_student_levels__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_types_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_types__label'), filter=Q(allowed_bachelor_types__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_mentions_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_mentions__label'),
-                    filter=Q(allowed_bachelor_mentions__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_teachings_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_teachings__label'),
-                    filter=Q(allowed_bachelor_teachings__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_highschools_list=Slot.related_array(
+                'allowed_highschools', id='id', city='city', label='label'
             ),
+            allowed_highschool_levels_list=Slot.related_array('allowed_highschool_levels', 'label'),
+            allowed_post_bachelor_levels_list=Slot.related_array('allowed_post_bachelor_levels', 'label'),
+            allowed_student_levels_list=Slot.related_array('allowed_student_levels', 'label'),
+            allowed_bachelor_types_list=Slot.related_array('allowed_bachelor_types', 'label'),
+            allowed_bachelor_mentions_list=Slot.related_array('allowed_bachelor_mentions', 'label'),
+            allowed_bachelor_teachings_list=Slot.related_array('allowed_bachelor_teachings', 'label'),
 
             passed_registration_limit_date=Case(
                 When(
@@ -1446,85 +1256,21 @@ def cohort_offer_subdomain(request, subdomain_id):
             course_structure_label=F('course__structure__label'),
             course_type_label=F('course_type__label'),
 
-            speaker_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        last_name=F('speakers__last_name'),
-                        first_name=F('speakers__first_name'),
-                        email=F('speakers__email'),
-                    ),
-                    filter=Q(speakers__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_establishments_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        city=F('allowed_establishments__city'),
-                        label=F('allowed_establishments__label')
-                    ),
-                    filter=Q(allowed_establishments__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschools_list=Coalesce(
-                ArrayAgg(
-                    JSONObject(
-                        id=F('allowed_highschools__id'),
-                        city=F('allowed_highschools__city'),
-                        label=F('allowed_highschools__label')
-                    ),
-                    filter=Q(allowed_highschools__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_highschool_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_highschool_levels__label'),
-                    filter=Q(allowed_highschool_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            speaker_list=Slot.related_array(
+                'speakers', last_name='last_name', first_name='first_name', email='email'
             ),
-            allowed_post_bachelor_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_post_bachelor_levels__label'),
-                    filter=Q(allowed_post_bachelor_levels__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_establishments_list=Slot.related_array(
+                'allowed_establishments', city='city', label='label'
             ),
-            allowed_student_levels_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_student_levels__label'), filter=Q(allowed_student_levels__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_types_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_types__label'), filter=Q(allowed_bachelor_types__isnull=False), distinct=True
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_mentions_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_mentions__label'),
-                    filter=Q(allowed_bachelor_mentions__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
-            ),
-            allowed_bachelor_teachings_list=Coalesce(
-                ArrayAgg(
-                    F('allowed_bachelor_teachings__label'),
-                    filter=Q(allowed_bachelor_teachings__isnull=False),
-                    distinct=True,
-                ),
-                Value([]),
+            allowed_highschools_list=Slot.related_array(
+                'allowed_highschools', id='id', city='city', label='label'
             ),
+            allowed_highschool_levels_list=Slot.related_array('allowed_highschool_levels', 'label'),
+            allowed_post_bachelor_levels_list=Slot.related_array('allowed_post_bachelor_levels', 'label'),
+            allowed_student_levels_list=Slot.related_array('allowed_student_levels', 'label'),
+            allowed_bachelor_types_list=Slot.related_array('allowed_bachelor_types', 'label'),
+            allowed_bachelor_mentions_list=Slot.related_array('allowed_bachelor_mentions', 'label'),
+            allowed_bachelor_teachings_list=Slot.related_array('allowed_bachelor_teachings', 'label'),
             passed_registration_limit_date=Case(
                 When(
                     registration_limit_date__isnull=False,
@@ -0,0 +1,30 @@
+"""
+Count the queries of each request and check them against the view query budget
+(see immersionlyceens.decorators.query_budget and the QUERY_BUDGETS setting)
+"""
+
+from django.db import connection
+
+from immersionlyceens.libs.utils import QueryCounter, check_query_budget, get_query_budget
+
+
+class QueryBudget:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        request.query_budget = None
+
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        # Error pages (404 templates, ...) are not the view work
+        if response.status_code < 400:
+            name = request.resolver_match.view_name if request.resolver_match else request.path
+            check_query_budget(name, request.query_budget, counter)
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = get_query_budget(request.resolver_match.view_name, view_func)
@@ -0,0 +1,87 @@
+"""
+Profile a sample of the requests (REQUESTS_PROFILING general setting : percentage of profiled requests,
+0 to disable) and keep the slowest ones with their timings split into database, templates, emails, PDF
+and external services (see the SlowRequest admin page)
+"""
+import logging
+import random
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from immersionlyceens.apps.core.models import SlowRequest
+from immersionlyceens.libs.profiling import profiling
+from immersionlyceens.libs.utils import QueryCounter, get_general_setting
+
+logger = logging.getLogger(__name__)
+
+# The general setting is read again after this delay (seconds)
+SAMPLING_RATE_CACHE_TIMEOUT = 60
+SAMPLING_RATE_CACHE_KEY = 'requests_profiling_sampling_rate'
+
+
+def get_sampling_rate():
+    """
+    :return: percentage of the requests to profile
+    """
+    rate = cache.get(SAMPLING_RATE_CACHE_KEY)
+
+    if rate is None:
+        try:
+            rate = int(get_general_setting('REQUESTS_PROFILING') or 0)
+        except (NameError, ValueError, TypeError):
+            rate = 0
+
+        cache.set(SAMPLING_RATE_CACHE_KEY, rate, SAMPLING_RATE_CACHE_TIMEOUT)
+
+    return rate
+
+
+class RequestsProfiling:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        rate = get_sampling_rate()
+
+        if rate <= 0 or random.random() * 100 >= rate:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        start = time.perf_counter()
+
+        with profiling() as profile, connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        duration = time.perf_counter() - start
+
+        try:
+            self.record(request, response, duration, counter, profile)
+        except Exception as e:
+            # Profiling must not break the request
+            logger.error("Cannot record the request profile : %s", e)
+
+        return response
+
+    @staticmethod
+    def record(request, response, duration, counter, profile):
+        user = getattr(request, 'user', None)
+
+        # Savepoint : a database error doesn't break an outer transaction
+        with transaction.atomic():
+            SlowRequest.record(
+                method=request.method,
+                path=request.get_full_path()[:2048],
+                view_name=request.resolver_match.view_name if request.resolver_match else None,
+                user=user if user is not None and user.is_authenticated else None,
+                status_code=response.status_code,
+                duration=round(duration * 1000, 1),
+                queries=counter.queries,
+                db_duration=round(counter.duration * 1000, 1),
+                statements=counter.get_slowest_statements(),
+                **{
+                    f"{section}_duration": round(section_duration * 1000, 1)
+                    for section, section_duration in profile.durations.items()
+                }
+            )